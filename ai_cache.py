@@ -0,0 +1,278 @@
+"""
+Cache for AI-generated content in Tujali Telehealth
+
+Health education content for a topic and language does not change between
+requests, so generating it again for every submission only costs API quota
+and seconds of latency. ContentCache keeps generated content in two tiers:
+
+- an in-memory LRU for the most requested topics
+- a directory of JSON files (AI_CACHE_DIR), so content survives restarts
+  and is shared by every worker process on the host
+
+Keys combine the normalized topic, the language and a prompt version. Bumping
+the prompt version in the generating module makes every older entry miss
+without having to clear anything. Entries expire after AI_CACHE_TTL seconds
+(7 days by default) and can be dropped by hand with invalidate() or clear().
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Counter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = Counter('ai_content_cache_lookups',
+                        'AI content cache lookups by the tier that answered',
+                        ['result'])
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'ai_cache')
+
+
+def normalize_topic(topic):
+    """
+    Normalize a topic so trivially different spellings share an entry
+
+    "  Malaria ", "malaria" and "MALARIA?" all map to "malaria".
+
+    Args:
+        topic (str): Topic as typed by the user
+
+    Returns:
+        str: Lowercased topic with collapsed whitespace and no surrounding punctuation
+    """
+    topic = re.sub(r'\s+', ' ', (topic or '').lower())
+    return topic.strip(' .,;:!?"\'')
+
+
+class ContentCache:
+    """
+    Two-tier (memory and disk) cache of generated content
+
+    Args:
+        directory (str, optional): Directory for the disk tier; None keeps
+            the cache in memory only
+        max_entries (int): Entries kept in the in-memory LRU
+        ttl (float): Seconds an entry stays valid
+    """
+    def __init__(self, directory=None, max_entries=256, ttl=7 * 24 * 3600):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (created wall-clock time, JSON value), least recently used first
+        self._entries = OrderedDict()
+        if directory:
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                logger.error(f"AI content cache directory {directory} is unusable, "
+                             f"caching in memory only: {str(e)}")
+                self.directory = None
+
+    @staticmethod
+    def key(topic, language, version):
+        """
+        Cache key for a topic
+
+        Args:
+            topic (str): Topic as typed by the user
+            language (str): Language code
+            version (str): Prompt version of the generator
+
+        Returns:
+            str: The cache key
+        """
+        return f"{version}|{(language or 'en').lower()}|{normalize_topic(topic)}"
+
+    def get(self, key, now=None):
+        """
+        Look up content, from memory first and then from disk
+
+        Args:
+            key (str): Key from ContentCache.key()
+            now (float, optional): Current time.time(), for tests
+
+        Returns:
+            The cached value, or None if it is missing or expired
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    CACHE_LOOKUPS.inc(result='memory')
+                    return json.loads(entry[1])
+                del self._entries[key]
+
+        record = self._read(key)
+        if record is not None and now - record['created'] < self.ttl:
+            with self._lock:
+                self._remember(key, record['created'], json.dumps(record['value']))
+            CACHE_LOOKUPS.inc(result='disk')
+            return record['value']
+        if record is not None:
+            self._remove(key)
+
+        CACHE_LOOKUPS.inc(result='miss')
+        return None
+
+    def put(self, key, value, now=None):
+        """
+        Store content in both tiers
+
+        Args:
+            key (str): Key from ContentCache.key()
+            value: JSON-serializable content
+            now (float, optional): Current time.time(), for tests
+        """
+        now = time.time() if now is None else now
+        data = json.dumps(value)
+        with self._lock:
+            self._remember(key, now, data)
+        self._write(key, {'key': key, 'created': now, 'value': value})
+
+    def get_or_generate(self, key, generate, cacheable=None):
+        """
+        Return cached content, generating and storing it on a miss
+
+        Args:
+            key (str): Key from ContentCache.key()
+            generate (callable): Produces the content
+            cacheable (callable, optional): Returns False for generated values
+                that must not be cached, such as error placeholders
+
+        Returns:
+            The cached or freshly generated value
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = generate()
+        if value is not None and (cacheable is None or cacheable(value)):
+            self.put(key, value)
+        return value
+
+    def invalidate(self, topic=None, language=None):
+        """
+        Drop cached entries by hand
+
+        Args:
+            topic (str, optional): Only drop this topic; all topics if None
+            language (str, optional): Only drop this language; all languages if None
+
+        Returns:
+            int: Number of entries dropped from either tier
+        """
+        def matches(key):
+            _, key_language, key_topic = key.split('|', 2)
+            return ((topic is None or key_topic == normalize_topic(topic))
+                    and (language is None or key_language == language.lower()))
+
+        with self._lock:
+            dropped = [key for key in self._entries if matches(key)]
+            for key in dropped:
+                del self._entries[key]
+        dropped = set(dropped)
+
+        for path in self._files():
+            try:
+                with open(path, encoding='utf-8') as cache_file:
+                    key = json.load(cache_file)['key']
+            except (OSError, ValueError, KeyError):
+                continue
+            if matches(key):
+                self._unlink(path)
+                dropped.add(key)
+
+        if dropped:
+            logger.info(f"Invalidated {len(dropped)} cached AI content entries "
+                        f"(topic={topic!r}, language={language!r})")
+        return len(dropped)
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._entries.clear()
+        for path in self._files():
+            self._unlink(path)
+
+    def __len__(self):
+        """Number of entries in the in-memory tier"""
+        with self._lock:
+            return len(self._entries)
+
+    def _remember(self, key, created, data):
+        """Add an entry to the LRU, evicting the least recently used (lock held)"""
+        self._entries[key] = (created, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, digest + '.json')
+
+    def _files(self):
+        if not self.directory:
+            return []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if name.endswith('.json')]
+
+    def _read(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), encoding='utf-8') as cache_file:
+                record = json.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable AI content cache entry: {str(e)}")
+            return None
+        # Guard against hash prefix collisions
+        return record if record.get('key') == key else None
+
+    def _write(self, key, record):
+        if not self.directory:
+            return
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as cache_file:
+                json.dump(record, cache_file, ensure_ascii=False)
+            # Atomic, so other processes never read a half-written entry
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to write AI content cache entry: {str(e)}")
+            self._unlink(temp_path)
+
+    def _remove(self, key):
+        if self.directory:
+            self._unlink(self._path(key))
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Shared by ai_service and mock_ai_service; their prompt versions keep the entries apart
+education_cache = ContentCache(
+    directory=os.environ.get('AI_CACHE_DIR', DEFAULT_CACHE_DIR) or None,
+    max_entries=int(os.environ.get('AI_CACHE_MAX_ENTRIES', 256)),
+    ttl=float(os.environ.get('AI_CACHE_TTL', 7 * 24 * 3600))
+)
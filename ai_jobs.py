@@ -0,0 +1,202 @@
+"""
+Background jobs for AI content generation in Tujali Telehealth
+
+Generating health tips can take as long as the AI providers' deadline, and
+doing it inside the request ties up a web worker that USSD and dashboard
+traffic need. JobQueue runs the generation on a small worker pool instead:
+the request submits a job and gets its ID back immediately, the page polls
+/api/jobs/<id>, and the result is kept here on the server rather than in the
+cookie session.
+
+Streaming jobs also record each part of the answer as it is generated, and
+/api/jobs/<id>/events relays those parts to the page as server-sent events.
+
+Finished jobs are kept for AI_JOB_TTL seconds (an hour by default) and at
+most max_jobs are remembered, the oldest finished ones dropped first. Jobs
+still queued or running are never dropped, since their pages are polling
+for them.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import Counter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+AI_JOBS = Counter('ai_jobs', 'Background AI generation jobs by kind and outcome', ['kind', 'result'])
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueue:
+    """
+    Run AI generation jobs on a worker pool and keep their results
+
+    Args:
+        workers (int): Jobs run at the same time
+        max_jobs (int): Jobs remembered; only finished jobs are dropped to stay
+            under it
+        ttl (float): Seconds a finished job's result is kept
+    """
+    def __init__(self, workers=2, max_jobs=1000, ttl=3600):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._jobs = OrderedDict()  # job ID -> job dict, oldest first
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ai-job')
+
+    def submit(self, kind, func, *args, owner=None, meta=None, stream=False, **kwargs):
+        """
+        Queue a job
+
+        Args:
+            kind (str): Job kind, e.g. 'health_tips'
+            func (callable): Function producing the result
+            *args: Positional arguments for func
+            owner (int, optional): ID of the user allowed to see the job
+            meta (dict, optional): Extra details to keep with the job,
+                e.g. the patient it is for
+            stream (bool): Pass func an on_item callback and record each
+                (field, index, value) it reports as a job event
+            **kwargs: Keyword arguments for func
+
+        Returns:
+            str: The job ID
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'owner': owner,
+            'meta': dict(meta or {}),
+            'status': QUEUED,
+            'events': [],
+            'result': None,
+            'error': None,
+            'created': time.time(),
+            'finished': None
+        }
+        if stream:
+            kwargs['on_item'] = lambda field, index, value: self._emit(job, field, index, value)
+        with self._lock:
+            self._prune(time.time())
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job_id
+
+    def get(self, job_id, owner=None):
+        """
+        Look up a job
+
+        Args:
+            job_id (str): ID returned by submit()
+            owner (int, optional): Only return the job if it belongs to this user
+
+        Returns:
+            dict: A copy of the job, or None if it is unknown, expired or not the owner's
+        """
+        with self._lock:
+            self._prune(time.time())
+            job = self._jobs.get(job_id)
+            if job is None or (owner is not None and job['owner'] != owner):
+                return None
+            return dict(job, events=list(job['events']))
+
+    def wait_events(self, job_id, after=0, owner=None, timeout=15.0):
+        """
+        Wait for a job to report new parts or finish
+
+        Args:
+            job_id (str): ID returned by submit()
+            after (int): Number of events the caller has already seen
+            owner (int, optional): Only return the job if it belongs to this user
+            timeout (float): Seconds to wait for something new
+
+        Returns:
+            tuple: (job, events after the first `after`); job is None if it
+            is unknown, expired or not the owner's
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or (owner is not None and job['owner'] != owner):
+                    return None, []
+                if len(job['events']) > after or job['status'] in (DONE, FAILED):
+                    return dict(job, events=None), job['events'][after:]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return dict(job, events=None), []
+                self._changed.wait(remaining)
+
+    def wait(self, job_id, timeout=None):
+        """
+        Block until a job has finished, for scripts and tests
+
+        Returns:
+            dict: The job, or None if it is unknown
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in (DONE, FAILED):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(0.01)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def _emit(self, job, field, index, value):
+        with self._changed:
+            job['events'].append({'field': field, 'index': index, 'value': value})
+            self._changed.notify_all()
+
+    def _run(self, job, func, args, kwargs):
+        with self._lock:
+            job['status'] = RUNNING
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"AI job {job['id']} ({job['kind']}) failed: {str(e)}")
+            with self._changed:
+                job['status'] = FAILED
+                job['error'] = str(e)
+                job['finished'] = time.time()
+                self._changed.notify_all()
+            AI_JOBS.inc(kind=job['kind'], result='failed')
+            return
+        with self._changed:
+            job['status'] = DONE
+            job['result'] = result
+            job['finished'] = time.time()
+            self._changed.notify_all()
+        AI_JOBS.inc(kind=job['kind'], result='done')
+
+    def _prune(self, now):
+        """Drop expired finished jobs and the oldest finished jobs beyond max_jobs (lock held)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in (DONE, FAILED)]
+        excess = len(self._jobs) + 1 - self.max_jobs
+        for job_id in finished:
+            if excess > 0 or now - self._jobs[job_id]['finished'] > self.ttl:
+                del self._jobs[job_id]
+                excess -= 1
+
+
+ai_jobs = JobQueue(
+    workers=int(os.environ.get('AI_JOB_WORKERS', 2)),
+    ttl=float(os.environ.get('AI_JOB_TTL', 3600))
+)
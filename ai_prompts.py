@@ -0,0 +1,193 @@
+"""
+Prompt building for the AI service
+
+A patient's symptom history only grows: USSD reports, repeat visits and the
+same complaint reported again and again. Putting all of it into the health
+tips prompt makes the cost and latency of an AI call grow with the patient's
+history. The builder here keeps the prompt bounded:
+
+- symptoms are deduplicated by their normalized text, keeping the most
+  recent report, the worst severity and how often it was reported
+- the most recent distinct symptoms are listed in full; older ones are
+  summarized as counts per category
+- symptom lines are added newest first only while the prompt stays within
+  AI_MAX_INPUT_TOKENS
+
+Token counts are estimated at four characters per token, which is close
+enough for budgeting and needs no tokenizer.
+"""
+
+import os
+import re
+from collections import Counter as Tally
+from datetime import datetime
+
+# Input token budget for one request
+MAX_INPUT_TOKENS = int(os.environ.get('AI_MAX_INPUT_TOKENS', 1200))
+
+# Distinct symptoms listed in full before the rest are summarized
+MAX_LISTED_SYMPTOMS = 8
+
+SEVERITY_RANK = {'Unknown': 0, 'Mild': 1, 'Moderate': 2, 'Severe': 3}
+
+LANGUAGE_PROMPTS = {
+    "en": "Provide the response in English.",
+    "sw": "Provide the response in Swahili.",
+    "fr": "Provide the response in French.",
+    "or": "Provide the response in Oromo if possible, otherwise in English.",
+    "so": "Provide the response in Somali if possible, otherwise in English.",
+    "am": "Provide the response in Amharic if possible, otherwise in English."
+}
+
+# Durations the USSD symptom flow appends to the description ("... for Few days")
+DURATION_SUFFIX = re.compile(r'\s+for\s+(today only|few days|a week or more|a month or more)$', re.IGNORECASE)
+NON_WORD = re.compile(r'[^\w]+')
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens in a text
+
+    Args:
+        text (str): Prompt text
+
+    Returns:
+        int: Estimated token count
+    """
+    return (len(text) + 3) // 4
+
+
+def normalize_symptom(text):
+    """Key under which repeated reports of the same symptom are merged"""
+    text = DURATION_SUFFIX.sub('', (text or '').strip())
+    return NON_WORD.sub(' ', text.lower()).strip()
+
+
+def compact_symptoms(symptoms):
+    """
+    Merge repeated symptom reports
+
+    Args:
+        symptoms (list): Dicts with 'description', 'severity', 'category' and
+            optionally 'date'
+
+    Returns:
+        list: One dict per distinct symptom with 'description', 'severity'
+        (the worst reported), 'category', 'count' and 'date' (the latest
+        report), most recent first
+    """
+    merged = {}
+    for order, symptom in enumerate(symptoms or []):
+        description = (symptom.get('description') or '').strip()
+        key = normalize_symptom(description)
+        if not key:
+            continue
+        severity = symptom.get('severity') or 'Unknown'
+        # Reports without a date keep their order in the history
+        date = symptom.get('date') or datetime.min
+        entry = merged.get(key)
+        if entry is None:
+            merged[key] = {'description': description, 'severity': severity,
+                           'category': symptom.get('category') or 'General',
+                           'count': 1, 'date': date, 'order': order}
+            continue
+        entry['count'] += 1
+        if SEVERITY_RANK.get(severity, 0) > SEVERITY_RANK.get(entry['severity'], 0):
+            entry['severity'] = severity
+        if (date, order) >= (entry['date'], entry['order']):
+            # The latest wording usually carries the most detail (e.g. the duration)
+            entry['description'] = description
+            entry['date'] = date
+            entry['order'] = order
+
+    ordered = sorted(merged.values(), key=lambda entry: (entry['date'], entry['order']), reverse=True)
+    for entry in ordered:
+        del entry['order']
+    return ordered
+
+
+def symptom_line(symptom):
+    line = f"- {symptom['description']} (Severity: {symptom['severity']}, Category: {symptom['category']}"
+    if symptom['count'] > 1:
+        line += f", reported {symptom['count']} times"
+    return line + ")\n"
+
+
+def history_summary(symptoms):
+    """One line summarizing symptoms that were not listed in full"""
+    by_category = Tally(symptom['category'] for symptom in symptoms)
+    categories = ", ".join(f"{category} {count}" for category, count in by_category.most_common())
+    return f"- Earlier history: {len(symptoms)} other symptoms ({categories})\n"
+
+
+def build_health_tips_prompt(patient_data, symptoms=None, language="en", max_tokens=None):
+    """
+    Build the health tips prompt within the input token budget
+
+    Args:
+        patient_data (dict): Patient demographic information
+        symptoms (list, optional): Symptoms reported by the patient
+        language (str): Language code for the response
+        max_tokens (int, optional): Input token budget; MAX_INPUT_TOKENS by default
+
+    Returns:
+        str: The prompt
+    """
+    max_tokens = max_tokens or MAX_INPUT_TOKENS
+    patient_age = patient_data.get('age', 'unknown')
+    patient_gender = patient_data.get('gender', 'unknown')
+    patient_location = patient_data.get('location', 'unknown')
+
+    head = f"""
+    You are a medical assistant providing personalized health tips for a patient in Africa.
+
+    Patient Information:
+    - Age: {patient_age}
+    - Gender: {patient_gender}
+    - Location: {patient_location}
+    """
+
+    tail = """
+    Based on the above information, provide 3-5 personalized health tips and recommendations.
+    Consider:
+    1. Age-appropriate advice
+    2. Gender-specific health concerns if relevant
+    3. Regional health issues common in their location
+    4. Specific advice for managing reported symptoms
+    5. Simple lifestyle recommendations
+
+    Format your response as JSON with the following structure:
+    {
+        "health_tips": [
+            {"title": "Brief title", "description": "Detailed explanation of the health tip"}
+        ],
+        "symptom_management": [
+            {"symptom": "Specific symptom", "advice": "Advice for managing this symptom"}
+        ],
+        "follow_up": "Advice on when to seek further medical attention"
+    }
+
+    Keep all descriptions concise, clear, and culturally appropriate for the region.
+    """
+    tail += f"\n\n{LANGUAGE_PROMPTS.get(language, LANGUAGE_PROMPTS['en'])}"
+
+    distinct = compact_symptoms(symptoms)
+    if not distinct:
+        return head + tail
+
+    section = "\nReported Symptoms:\n"
+    # Leave room for the summary line so it always fits
+    budget = max_tokens - estimate_tokens(head + section + tail) - estimate_tokens(history_summary(distinct))
+    listed = []
+    for symptom in distinct[:MAX_LISTED_SYMPTOMS]:
+        line = symptom_line(symptom)
+        if estimate_tokens(line) > budget:
+            break
+        listed.append(line)
+        budget -= estimate_tokens(line)
+
+    section += "".join(listed)
+    rest = distinct[len(listed):]
+    if rest:
+        section += history_summary(rest)
+    return head + section + tail
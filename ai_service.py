@@ -4,6 +4,9 @@ AI Service for Tujali Telehealth
 This module provides AI-powered personalized health recommendations
 using OpenAI's API with Anthropic Claude as a fallback. It generates 
 health tips based on patient data, symptoms, and regional health concerns.
+
+When neither provider can answer (over quota, down, or its circuit breaker
+is open) the offline content from mock_ai_service is returned instead.
 """
 
 import os
@@ -12,12 +15,25 @@ import logging
 from openai import OpenAI
 from anthropic import Anthropic
 
+from ai_cache import education_cache
+from ai_prompts import build_health_tips_prompt
+from llm_dispatch import LlmDispatcher, LlmError, OpenAIProvider, AnthropicProvider, emit_items
+import mock_ai_service
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Setup OpenAI client
-openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+openai_key = os.environ.get("OPENAI_API_KEY")
+openai_client = None
+if openai_key:
+    try:
+        openai_client = OpenAI(api_key=openai_key)
+    except Exception as e:
+        logger.error(f"Error initializing OpenAI client: {str(e)}")
+else:
+    logger.warning("OPENAI_API_KEY not found in environment variables")
 
 # Setup Anthropic client as fallback
 anthropic_key = os.environ.get('ANTHROPIC_API_KEY')
@@ -31,7 +47,55 @@ if anthropic_key:
 else:
     logger.warning("ANTHROPIC_API_KEY not found in environment variables")
 
-def generate_health_tips(patient_data, symptoms=None, language="en"):
+# OpenAI first; Anthropic is started as a hedge when OpenAI is slow, or straight away when it
+# fails or its circuit is open
+providers = []
+if openai_client:
+    providers.append(OpenAIProvider(openai_client))
+if anthropic_client:
+    providers.append(AnthropicProvider(anthropic_client))
+dispatcher = LlmDispatcher(
+    providers,
+    deadline=float(os.environ.get('LLM_DEADLINE', 20)),
+    hedge_after=float(os.environ.get('LLM_HEDGE_AFTER', 3)),
+    breaker_options={
+        'failure_threshold': float(os.environ.get('LLM_CIRCUIT_FAILURE_RATE', 0.5)),
+        'open_seconds': float(os.environ.get('LLM_CIRCUIT_OPEN_SECONDS', 30))
+    }
+)
+
+# Bump whenever the health education prompt changes so cached content is regenerated
+EDUCATION_PROMPT_VERSION = "education-v2"
+
+# Answer fields for the caller, not for the reader; they are not streamed
+UNSTREAMED_FIELDS = ('language',)
+
+class ItemRelay:
+    """
+    Pass streamed answer parts on to an on_item callback, counting them
+
+    A provider can fail after part of its answer was streamed. The offline
+    answer must then not be streamed after those parts, or the page would
+    show both; it arrives with the finished job instead.
+
+    Args:
+        on_item (callable): on_item(field, index, value) of the caller
+    """
+    def __init__(self, on_item):
+        self.on_item = on_item
+        self.reported = 0
+
+    def __call__(self, field, index, value):
+        if field in UNSTREAMED_FIELDS:
+            return
+        self.reported += 1
+        self.on_item(field, index, value)
+
+    def for_fallback(self):
+        """Callback for a fallback answer: on_item while nothing was reported, else None"""
+        return None if self.reported else self.on_item
+
+def generate_health_tips(patient_data, symptoms=None, language="en", on_item=None):
     """
     Generate personalized health tips based on patient data and symptoms
     
@@ -39,141 +103,121 @@ def generate_health_tips(patient_data, symptoms=None, language="en"):
         patient_data (dict): Patient demographic information and medical history
         symptoms (list, optional): List of symptoms reported by the patient
         language (str): Language code for the response (e.g., 'en', 'sw', 'fr')
+        on_item (callable, optional): Stream the answer, calling
+            on_item(field, index, value) for each tip and field as it arrives.
+            If a provider fails after parts were streamed, the offline answer
+            is only returned, not streamed after them.
         
     Returns:
         dict: JSON response containing health tips and recommendations
     """
-    # Prepare prompt based on patient data and symptoms
-    patient_age = patient_data.get('age', 'unknown')
-    patient_gender = patient_data.get('gender', 'unknown')
-    patient_location = patient_data.get('location', 'unknown')
-    
-    prompt = f"""
-    You are a medical assistant providing personalized health tips for a patient in Africa.
-    
-    Patient Information:
-    - Age: {patient_age}
-    - Gender: {patient_gender}
-    - Location: {patient_location}
-    """
-    
-    if symptoms:
-        prompt += "\nReported Symptoms:\n"
-        for symptom in symptoms:
-            severity = symptom.get('severity', 'Unknown')
-            category = symptom.get('category', 'General')
-            prompt += f"- {symptom.get('description', 'Unknown symptom')} (Severity: {severity}, Category: {category})\n"
-    
-    prompt += """
-    Based on the above information, provide 3-5 personalized health tips and recommendations.
-    Consider:
-    1. Age-appropriate advice
-    2. Gender-specific health concerns if relevant
-    3. Regional health issues common in their location
-    4. Specific advice for managing reported symptoms
-    5. Simple lifestyle recommendations
-    
-    Format your response as JSON with the following structure:
-    {
-        "health_tips": [
-            {"title": "Brief title", "description": "Detailed explanation of the health tip"}
-        ],
-        "symptom_management": [
-            {"symptom": "Specific symptom", "advice": "Advice for managing this symptom"}
-        ],
-        "follow_up": "Advice on when to seek further medical attention"
-    }
-    
-    Keep all descriptions concise, clear, and culturally appropriate for the region.
-    """
-    
-    # Define appropriate language models for different languages
-    language_prompts = {
-        "en": "Provide the response in English.",
-        "sw": "Provide the response in Swahili.",
-        "fr": "Provide the response in French.",
-        "or": "Provide the response in Oromo if possible, otherwise in English.",
-        "so": "Provide the response in Somali if possible, otherwise in English.",
-        "am": "Provide the response in Amharic if possible, otherwise in English."
-    }
-    
-    # Add language instruction
-    lang_instruction = language_prompts.get(language, language_prompts["en"])
-    prompt += f"\n\n{lang_instruction}"
+    prompt = build_health_tips_prompt(patient_data, symptoms, language)
     
-    # Try OpenAI first
+    system = "You are a medical advisor with expertise in African healthcare contexts, providing culturally appropriate health advice."
+    relay = ItemRelay(on_item) if on_item else None
     try:
-        logger.info("Attempting to generate health tips with OpenAI")
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",  # Use the available model
-            messages=[
-                {"role": "system", "content": "You are a medical advisor with expertise in African healthcare contexts, providing culturally appropriate health advice."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.3
-        )
-        
-        # Extract and parse the JSON response
-        result = json.loads(response.choices[0].message.content)
-        logger.info("Successfully generated health tips with OpenAI")
+        if relay:
+            result = dispatcher.stream(system, prompt, relay)
+        else:
+            result = dispatcher.complete(system, prompt, parse=json.loads)
+        logger.info("Successfully generated health tips")
         return result
+    except LlmError as e:
+        logger.warning(f"Could not generate health tips, using offline content: {str(e)}")
+    on_item = relay.for_fallback() if relay else None
     
+    try:
+        return mock_ai_service.generate_health_tips(patient_data, symptoms, language, on_item=on_item)
     except Exception as e:
-        logger.warning(f"OpenAI error: {str(e)}")
-        
-        # Try Anthropic as fallback
-        if anthropic_client:
-            try:
-                logger.info("Attempting to generate health tips with Anthropic Claude")
-                response = anthropic_client.messages.create(
-                    model="claude-3-5-sonnet-20241022",  # The newest Anthropic model is "claude-3-5-sonnet-20241022" which was released October 22, 2024
-                    max_tokens=1024,
-                    system="You are a medical advisor with expertise in African healthcare contexts, providing culturally appropriate health advice. Always respond in valid JSON format.",
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                
-                # Extract and parse the JSON response
-                result = json.loads(response.content[0].text)
-                logger.info("Successfully generated health tips with Anthropic Claude")
-                return result
-            
-            except Exception as anthropic_error:
-                logger.error(f"Anthropic fallback error: {str(anthropic_error)}")
-        else:
-            logger.error("No Anthropic client available for fallback")
-        
-        # Return an error message if both APIs fail
-        return {
-            "health_tips": [
-                {"title": "Error", "description": "Unable to generate health tips at this time."}
-            ],
-            "follow_up": "Please consult with a healthcare provider for personalized advice."
-        }
+        logger.error(f"Offline health tips failed: {str(e)}")
 
-def generate_health_education(topic, language="en"):
+    # Return an error message if every source fails
+    result = {
+        "health_tips": [
+            {"title": "Error", "description": "Unable to generate health tips at this time."}
+        ],
+        "follow_up": "Please consult with a healthcare provider for personalized advice."
+    }
+    if on_item:
+        emit_items(result, on_item)
+    return result
+
+def generate_health_education(topic, language="en", on_item=None):
     """
     Generate general health education content on a specific topic
+
+    Content is cached per topic and language (see ai_cache), so only the
+    first request for a topic reaches the AI APIs.
     
     Args:
         topic (str): Health topic to generate information about
         language (str): Language code for the response
+        on_item (callable, optional): Stream the answer, calling
+            on_item(field, index, value) for each point and field as it arrives.
+            If a provider fails after parts were streamed, the offline answer
+            is only returned, not streamed after them.
         
     Returns:
         dict: JSON response containing educational content
     """
-    language_prompts = {
-        "en": "Provide the response in English.",
-        "sw": "Provide the response in Swahili.",
-        "fr": "Provide the response in French.",
-        "or": "Provide the response in Oromo if possible, otherwise in English.",
-        "so": "Provide the response in Somali if possible, otherwise in English.",
-        "am": "Provide the response in Amharic if possible, otherwise in English."
+    key = education_cache.key(topic, language, EDUCATION_PROMPT_VERSION)
+    content = education_cache.get(key)
+    if content is not None:
+        if on_item:
+            emit_items(content, ItemRelay(on_item))
+        return content
+
+    relay = ItemRelay(on_item) if on_item else None
+    content = _generate_health_education(topic, language, relay)
+    if content is not None:
+        # Streamed content is cached once it is complete
+        education_cache.put(key, content)
+        return content
+    on_item = relay.for_fallback() if relay else None
+
+    # Offline content is not cached here, so the AI providers are asked again next time
+    try:
+        return mock_ai_service.generate_health_education(topic, language, on_item=on_item)
+    except Exception as e:
+        logger.error(f"Offline health education failed: {str(e)}")
+
+    # Return a fallback message if every source fails
+    content = {
+        "title": topic,
+        "overview": "Information temporarily unavailable.",
+        "key_points": ["Please try again later."],
+        "prevention": ["Consult with a healthcare provider for advice."],
+        "when_to_seek_help": "If you have concerns, please contact a healthcare facility."
+    }
+    if on_item:
+        emit_items(content, on_item)
+    return content
+
+def _generate_health_education(topic, language, on_item=None):
+    """
+    Ask OpenAI, then Anthropic, for health education content
+
+    The answer's "language" field is the code of the language the model
+    actually wrote in, which may be English for the less common languages.
+
+    Returns:
+        dict: The generated content, or None if both APIs fail
+    """
+    language_names = {
+        "en": "English",
+        "sw": "Swahili",
+        "fr": "French",
+        "or": "Oromo",
+        "so": "Somali",
+        "am": "Amharic"
     }
     
-    lang_instruction = language_prompts.get(language, language_prompts["en"])
+    if language not in language_names:
+        language = "en"
+    lang_instruction = f"Provide the response in {language_names[language]}. Set \"language\" to \"{language}\""
+    if language != "en":
+        lang_instruction += f" if you wrote it in {language_names[language]}, or to \"en\" if you wrote it in English"
+    lang_instruction += "."
     
     prompt = f"""
     Generate educational health content about "{topic}" for patients in rural Africa.
@@ -196,61 +240,21 @@ def generate_health_education(topic, language="en"):
             "Prevention tip 1",
             "Prevention tip 2"
         ],
-        "when_to_seek_help": "Guidance on when to seek medical assistance"
+        "when_to_seek_help": "Guidance on when to seek medical assistance",
+        "language": "Code of the language the content is written in"
     }}
     
     {lang_instruction}
     """
     
-    # Try OpenAI first
+    system = "You are a health educator specializing in public health in African communities."
     try:
-        logger.info("Attempting to generate health education with OpenAI")
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",  # Use the available model
-            messages=[
-                {"role": "system", "content": "You are a health educator specializing in public health in African communities."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.3
-        )
-        
-        # Extract and parse the JSON response
-        result = json.loads(response.choices[0].message.content)
-        logger.info("Successfully generated health education with OpenAI")
-        return result
-    
-    except Exception as e:
-        logger.warning(f"OpenAI error: {str(e)}")
-        
-        # Try Anthropic as fallback
-        if anthropic_client:
-            try:
-                logger.info("Attempting to generate health education with Anthropic Claude")
-                response = anthropic_client.messages.create(
-                    model="claude-3-5-sonnet-20241022",  # The newest Anthropic model is "claude-3-5-sonnet-20241022" which was released October 22, 2024
-                    max_tokens=1024,
-                    system="You are a health educator specializing in public health in African communities. Always respond in valid JSON format.",
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                
-                # Extract and parse the JSON response
-                result = json.loads(response.content[0].text)
-                logger.info("Successfully generated health education with Anthropic Claude")
-                return result
-            
-            except Exception as anthropic_error:
-                logger.error(f"Anthropic fallback error: {str(anthropic_error)}")
+        if on_item:
+            result = dispatcher.stream(system, prompt, on_item)
         else:
-            logger.error("No Anthropic client available for fallback")
-        
-        # Return a fallback message if both APIs fail
-        return {
-            "title": topic,
-            "overview": "Information temporarily unavailable.",
-            "key_points": ["Please try again later."],
-            "prevention": ["Consult with a healthcare provider for advice."],
-            "when_to_seek_help": "If you have concerns, please contact a healthcare facility."
-        }
\ No newline at end of file
+            result = dispatcher.complete(system, prompt, parse=json.loads)
+        logger.info("Successfully generated health education")
+        return result
+    except LlmError as e:
+        logger.error(f"Could not generate health education: {str(e)}")
+        return None
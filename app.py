@@ -1,19 +1,39 @@
 import os
+import json
 import logging
-from flask import Flask, render_template, redirect, url_for, request, flash, session, jsonify
+from flask import Flask, render_template, redirect, url_for, request, flash, session, jsonify, g, Response, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from models import (User, Provider, Patient, Appointment, Message, HealthInfo, UserInteraction, Payment, 
-                   Prescription, WalkInPatient, LabTest, LabResult, Bill, db, init_db)
+                   Prescription, WalkInPatient, LabTest, LabResult, Bill, db, init_db, touch)
 from forms import (LoginForm, RegistrationForm, MessageForm, HealthInfoForm, HealthTipsForm, HealthEducationForm,
                   PrescriptionForm, WalkInForm, QuickPatientForm, LabTestForm, LabResultForm, 
                   BillItemForm, PaymentRecordForm, UserManagementForm, DepartmentForm)
-from ussd_handler import ussd_callback
+from ussd_handler import (ussd_callback, service_busy_response, cached_response, input_kinds,
+                          is_new_session)
+from ussd_admission import admission
+from ussd_trace import TraceRecorder
+from write_behind import write_queue
+from appointment_slots import slots, provider_availability, SlotUnavailable
+from dashboard_cache import dashboard_context
+from reminders import reminders
+from sms_outbox import outbox
+from metrics import Histogram, REGISTRY, CONTENT_TYPE
+from ai_cache import education_cache
+from ai_jobs import ai_jobs, DONE, FAILED
+from health_content import health_content, NightlyPregeneration, HEALTH_TOPICS
+from health_search import health_index
+from ussd_pages import info_pages
+import time
 import utils
 from utils import requires_permission, requires_department, get_navigation_items
-# Use mock AI service instead of the real one
-import mock_ai_service as ai_service  # Use mock AI service instead of the real one
-# import ai_service  # Commented out to use mock service
+# The real AI service skips providers whose circuit is open and falls back to the offline
+# engine, so it is safe to enable with USE_MOCK_AI=false
+if os.environ.get('USE_MOCK_AI', 'true').lower() in ('1', 'true', 'yes'):
+    import mock_ai_service as ai_service
+else:
+    import ai_service
+from circuit_breaker import all_breakers
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -34,6 +54,30 @@ def _jinja2_filter_now():
     """Return current datetime for templates"""
     return datetime.now()
 
+# Request latency per Flask route, exposed on /metrics
+REQUEST_LATENCY = Histogram('http_request_duration_seconds',
+                            'Time to handle an HTTP request, by route',
+                            ['method', 'endpoint', 'status'])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        REQUEST_LATENCY.observe(time.perf_counter() - started,
+                                method=request.method,
+                                endpoint=request.endpoint or 'unmatched',
+                                status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Expose application metrics in the Prometheus text format"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 # Initialize Login Manager
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -43,6 +87,25 @@ login_manager.login_view = 'login'
 # Double check database initialization
 init_db()
 
+# Re-apply side-effect writes left pending by a previous run
+write_queue.recover()
+outbox.recover()
+
+# Send appointment reminders from this process (disable on all but one worker)
+if os.environ.get('REMINDERS_ENABLED', '1') == '1':
+    reminders.start()
+
+# Pre-generate the USSD health information every night (disable on all but one worker)
+if os.environ.get('HEALTH_CONTENT_ENABLED', '1') == '1':
+    NightlyPregeneration(
+        health_content,
+        ai_service.generate_health_education,
+        hour=int(os.environ.get('HEALTH_CONTENT_HOUR', 2)),
+        workers=int(os.environ.get('HEALTH_CONTENT_WORKERS', 4))
+    ).start()
+else:
+    health_content.load()
+
 # For debugging user authentication
 print("Initial users:", [f"{u.username}:{u.password_hash}" for u in db['users']])
 
@@ -50,6 +113,12 @@ print("Initial users:", [f"{u.username}:{u.password_hash}" for u in db['users']]
 def load_user(user_id):
     return User.get_by_id(int(user_id))
 
+# Optional USSD trace recording for replay benchmarks (see ussd_trace.py)
+ussd_trace_file = os.environ.get("USSD_TRACE_FILE")
+ussd_recorder = None
+if ussd_trace_file:
+    ussd_recorder = TraceRecorder(ussd_trace_file, os.environ.get("USSD_TRACE_SALT", app.secret_key))
+
 # USSD simulator route
 @app.route('/ussd_simulator.html')
 def ussd_simulator():
@@ -70,14 +139,52 @@ def ussd():
     # Log USSD request details
     logger.debug(f"USSD Request: {phone_number}, {session_id}, {text}")
     
+    # Gateway retries of a hop we already answered are free
+    cached = cached_response(session_id, text)
+    if cached is not None:
+        return cached
+    
+    # Shed hops that cannot be answered within the gateway budget;
+    # hops of sessions in progress take priority over new dials
+    is_new = is_new_session(session_id)
+    deadline = admission.deadline(request.headers.get('X-Request-Start'), g.get('request_started'))
+    if not admission.acquire(is_new, deadline):
+        logger.warning(f"USSD hop shed under load: {session_id}")
+        return service_busy_response(session_id)
+    
     # Process USSD request and get response
-    response = ussd_callback(session_id, service_code, phone_number, text)
+    started = time.perf_counter()
+    try:
+        response = ussd_callback(session_id, service_code, phone_number, text)
+    finally:
+        admission.release(time.perf_counter() - started)
+    
+    if ussd_recorder:
+        ussd_recorder.record(session_id, service_code, phone_number, text, response, input_kinds(session_id))
     
     # Log response for debugging
     logger.debug(f"USSD Response: {response}")
     
     return response
 
+# SMS delivery reports (Twilio status callback)
+@app.route('/sms/status', methods=['POST'])
+def sms_status():
+    """Record delivery status updates for outbound SMS"""
+    auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
+    if auth_token:
+        from twilio.request_validator import RequestValidator
+        signature = request.headers.get('X-Twilio-Signature', '')
+        if not RequestValidator(auth_token).validate(request.url, request.form, signature):
+            return Response('Invalid signature', status=403)
+    
+    message_sid = request.form.get('MessageSid')
+    status = request.form.get('MessageStatus')
+    # Intermediate statuses (queued, sending, sent) add nothing to ours
+    if message_sid and status in ('delivered', 'undelivered', 'failed'):
+        outbox.update_delivery(message_sid, status, error=request.form.get('ErrorCode'))
+    return Response(status=204)
+
 # Web routes for provider dashboard
 @app.route('/')
 def index():
@@ -270,9 +377,15 @@ def update_appointment():
         flash('Invalid request. Appointment ID and status are required.', 'danger')
         return redirect(url_for('appointments'))
     
-    success = Appointment.update_status(int(appointment_id), status)
+    try:
+        success = slots.update_status(int(appointment_id), status)
+    except SlotUnavailable:
+        flash('That time slot has been booked by another patient since this appointment was cancelled.', 'danger')
+        return redirect(url_for('appointments'))
     
     if success:
+        # A revived appointment needs its reminder again
+        reminders.schedule(Appointment.get_by_id(int(appointment_id)))
         flash('Appointment updated successfully.', 'success')
     else:
         flash('Failed to update appointment.', 'danger')
@@ -325,14 +438,29 @@ def health_info():
     form = HealthInfoForm()
     
     if form.validate_on_submit():
-        HealthInfo.create(form.title.data, form.content.data, form.language.data)
+        info = HealthInfo.create(form.title.data, form.content.data, form.language.data)
+        # Split it into USSD screens now rather than on a caller's hop
+        info_pages.put(('article', info.id), info.language, info.title, info.content)
         flash('Health information added successfully.', 'success')
         return redirect(url_for('health_info'))
     elif request.method == 'POST':
         flash('All fields are required.', 'warning')
     
-    info_list = HealthInfo.get_all()
-    return render_template('health_info.html', provider=provider, info_list=info_list, form=form)
+    # Search the library, or filter it by USSD topic, within one language
+    query = request.args.get('q', '').strip()
+    topic = request.args.get('topic')
+    search_language = request.args.get('language', 'en')
+    if query or topic in HEALTH_TOPICS:
+        if query:
+            info_list = health_index.search(query, search_language, topic=topic or None, limit=50)
+        else:
+            info_list = health_index.for_topic(topic, search_language, limit=50)
+    else:
+        topic = None
+        info_list = HealthInfo.get_all()
+    return render_template('health_info.html', provider=provider, info_list=info_list, form=form,
+                          query=query, topic=topic, search_language=search_language,
+                          topic_counts=health_index.topic_counts())
 
 @app.route('/symptom-dashboard')
 @login_required
@@ -454,6 +582,22 @@ def health_tips():
     # Store generated tips
     generated_tips = None
     selected_patient = None
+    pending_job = None
+    
+    # Show the result of a generation job submitted earlier
+    job_id = request.args.get('job')
+    if job_id and request.method == 'GET':
+        job = ai_jobs.get(job_id, owner=current_user.id)
+        if job is None:
+            flash('These health tips have expired. Please generate them again.', 'warning')
+            return redirect(url_for('health_tips'))
+        selected_patient = Patient.get_by_id(job['meta'].get('patient_id'))
+        if job['status'] == DONE:
+            generated_tips = job['result']
+        elif job['status'] == FAILED:
+            flash(f"Error generating health tips: {job['error']}", 'danger')
+        else:
+            pending_job = job
     
     if form.validate_on_submit():
         patient_id = int(form.patient_id.data)
@@ -512,33 +656,73 @@ def health_tips():
                     'date': symptom_entry['date']
                 })
         
-        try:
-            # Generate personalized health tips
-            logger.debug(f"Generating health tips for patient {patient.id}")
-            
-            # Due to API quota limitations, we'll use the mock service directly
-            # This ensures the feature still works when APIs are unavailable
-            generated_tips = mock_ai_service.generate_health_tips(patient_data, symptoms, language)
-            logger.debug(f"Successfully generated health tips with mock service")
-            flash('Using Health AI Recommendations service (offline mode active).', 'info')
-            
-            # Store in session for shared with patient
-            session['last_generated_tips'] = generated_tips
-            session['last_tips_patient_id'] = patient.id
-            
-            # Log success
-            logger.debug(f"Health tips generated: {generated_tips}")
-            
-            flash('Health tips generated successfully.', 'success')
-        except Exception as e:
-            logger.error(f"Error generating health tips: {str(e)}")
-            flash(f'Error generating health tips: {str(e)}', 'danger')
+        # Generate on the AI worker pool so this web worker is free straight away
+        job_id = ai_jobs.submit('health_tips', ai_service.generate_health_tips, patient_data, symptoms, language,
+                                owner=current_user.id, meta={'patient_id': patient.id}, stream=True)
+        logger.debug(f"Queued health tips job {job_id} for patient {patient.id}")
+        
+        # Only the job ID goes into the session; the tips stay on the server
+        session['last_tips_job_id'] = job_id
+        return redirect(url_for('health_tips', job=job_id))
     
     return render_template('health_tips.html', 
                           provider=provider,
                           form=form,
                           generated_tips=generated_tips,
-                          selected_patient=selected_patient)
+                          selected_patient=selected_patient,
+                          pending_job=pending_job)
+
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def ai_job_status(job_id):
+    """API endpoint for the status and result of a background AI job"""
+    job = ai_jobs.get(job_id, owner=current_user.id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'result': job['result'],
+        'error': job['error']
+    })
+
+
+@app.route('/api/jobs/<job_id>/events')
+@login_required
+def ai_job_events(job_id):
+    """Server-sent events relaying a streaming AI job's parts as they are generated"""
+    owner = current_user.id
+    if ai_jobs.get(job_id, owner=owner) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def stream():
+        # Browsers reconnect with the ID of the last event they received
+        seen = int(request.headers.get('Last-Event-ID') or 0)
+        while True:
+            job, events = ai_jobs.wait_events(job_id, after=seen, owner=owner)
+            if job is None:
+                yield sse('failed', {'error': 'Job not found'})
+                return
+            for event in events:
+                seen += 1
+                yield f"id: {seen}\n" + sse('item', event)
+            if job['status'] == DONE:
+                yield sse('done', {'result': job['result']})
+                return
+            if job['status'] == FAILED:
+                yield sse('failed', {'error': job['error']})
+                return
+            if not events:
+                # Keep proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/health-tips/share/<int:patient_id>', methods=['POST'])
 @login_required
@@ -546,8 +730,9 @@ def share_health_tips(patient_id):
     """Share generated health tips with a patient via SMS"""
     provider = Provider.get_by_user_id(current_user.id)
     
-    # Check if there are tips in the session
-    if 'last_generated_tips' not in session or session.get('last_tips_patient_id') != patient_id:
+    # Check if there are tips from the last generation job
+    job = ai_jobs.get(session.get('last_tips_job_id', ''), owner=current_user.id)
+    if job is None or job['status'] != DONE or job['meta'].get('patient_id') != patient_id:
         flash('No health tips found to share. Please generate tips first.', 'warning')
         return redirect(url_for('health_tips'))
     
@@ -556,8 +741,7 @@ def share_health_tips(patient_id):
         flash('Patient not found.', 'danger')
         return redirect(url_for('health_tips'))
     
-    # Get tips from session
-    tips = session['last_generated_tips']
+    tips = job['result']
     
     # Create a simplified message version for SMS
     if tips and 'health_tips' in tips:
@@ -571,15 +755,55 @@ def share_health_tips(patient_id):
         if 'follow_up' in tips:
             message += f"Follow-up: {tips['follow_up']}"
         
-        # Save this as a message
+        # Save this as a message and send it to the patient's phone in the background
         Message.create(provider.id, patient_id, message, 'provider')
+        outbox.enqueue(patient.phone_number, message, kind='health_tips')
         
-        flash('Health tips shared with patient as a message.', 'success')
+        flash('Health tips shared with patient by SMS.', 'success')
     else:
         flash('Invalid health tips format.', 'danger')
     
     return redirect(url_for('health_tips'))
 
+def generate_health_education_info(topic, language, on_item=None):
+    """
+    Generate health education content and save it to the HealthInfo database
+
+    Runs as a background job for the health education page.
+
+    Returns:
+        dict: The generated content
+    """
+    generated_content = ai_service.generate_health_education(topic, language, on_item=on_item)
+    
+    # Save to HealthInfo database
+    if generated_content and 'title' in generated_content and 'overview' in generated_content:
+        # Create simplified content from the structured data
+        title = generated_content['title']
+        
+        # Combine overview and key points
+        content = generated_content['overview'] + "\n\n"
+        
+        if 'key_points' in generated_content:
+            content += "Key Points:\n"
+            for i, point in enumerate(generated_content['key_points'], 1):
+                content += f"{i}. {point}\n"
+            content += "\n"
+        
+        if 'prevention' in generated_content:
+            content += "Prevention:\n"
+            for i, tip in enumerate(generated_content['prevention'], 1):
+                content += f"{i}. {tip}\n"
+            content += "\n"
+        
+        if 'when_to_seek_help' in generated_content:
+            content += f"When to Seek Help:\n{generated_content['when_to_seek_help']}"
+        
+        info = HealthInfo.create(title, content, language)
+        info_pages.put(('article', info.id), info.language, info.title, info.content)
+    
+    return generated_content
+
 @app.route('/health-education', methods=['GET', 'POST'])
 @login_required
 def health_education():
@@ -588,60 +812,36 @@ def health_education():
     form = HealthEducationForm()
     
     generated_content = None
+    pending_job = None
+    related = []
+    
+    # Show the result of a generation job submitted earlier
+    job_id = request.args.get('job')
+    if job_id and request.method == 'GET':
+        job = ai_jobs.get(job_id, owner=current_user.id)
+        if job is None:
+            flash('This content has expired. Please generate it again.', 'warning')
+            return redirect(url_for('health_education'))
+        if job['status'] == DONE:
+            generated_content = job['result']
+        elif job['status'] == FAILED:
+            flash(f"Error generating health education content: {job['error']}", 'danger')
+        else:
+            pending_job = job
+        # Articles already in the library on the same topic; the generated one is among them once saved
+        title = (generated_content or {}).get('title')
+        matches = health_index.search(job['meta'].get('topic', ''), job['meta'].get('language', 'en'), limit=6)
+        related = [info for info in matches if info.title != title][:5]
     
     if form.validate_on_submit():
         topic = form.topic.data
         language = form.language.data
         
-        try:
-            # Generate health education content
-            logger.debug(f"Generating health education content on: {topic}")
-            
-            # Due to API quota limitations, we'll use the mock service directly
-            # This ensures the feature still works when APIs are unavailable
-            generated_content = mock_ai_service.generate_health_education(topic, language)
-            logger.debug(f"Successfully generated health education content with mock service")
-            flash('Using Health Education service (offline mode active).', 'info')
-            
-            # Store in session for later use
-            session['last_education_content'] = generated_content
-            
-            # Log success
-            logger.debug(f"Successfully generated health education content: {generated_content}")
-            
-            # Optionally save to HealthInfo database
-            if generated_content and 'title' in generated_content and 'overview' in generated_content:
-                # Create simplified content from the structured data
-                title = generated_content['title']
-                
-                # Combine overview and key points
-                content = generated_content['overview'] + "\n\n"
-                
-                if 'key_points' in generated_content:
-                    content += "Key Points:\n"
-                    for i, point in enumerate(generated_content['key_points'], 1):
-                        content += f"{i}. {point}\n"
-                    content += "\n"
-                
-                if 'prevention' in generated_content:
-                    content += "Prevention:\n"
-                    for i, tip in enumerate(generated_content['prevention'], 1):
-                        content += f"{i}. {tip}\n"
-                    content += "\n"
-                
-                if 'when_to_seek_help' in generated_content:
-                    content += f"When to Seek Help:\n{generated_content['when_to_seek_help']}"
-                
-                # Save to database
-                HealthInfo.create(title, content, language)
-                
-                flash('Health education content generated and saved to the database.', 'success')
-            else:
-                flash('Health education content generated.', 'success')
-                
-        except Exception as e:
-            logger.error(f"Error generating health education content: {str(e)}")
-            flash(f'Error generating health education content: {str(e)}', 'danger')
+        # Generate (streaming) on the AI worker pool; the page follows the job's events
+        logger.debug(f"Generating health education content on: {topic}")
+        job_id = ai_jobs.submit('health_education', generate_health_education_info, topic, language,
+                                owner=current_user.id, meta={'topic': topic, 'language': language}, stream=True)
+        return redirect(url_for('health_education', job=job_id))
     
     # Get existing health info
     info_list = HealthInfo.get_all()
@@ -649,7 +849,9 @@ def health_education():
     return render_template('health_education.html', 
                           provider=provider,
                           form=form,
-                          generated_content=generated_content,
+                          content=generated_content,
+                          pending_job=pending_job,
+                          related=related,
                           info_list=info_list)
 
 
@@ -698,12 +900,45 @@ def user_journey_api(patient_id):
     return jsonify(journey_data)
 
 
+@app.route('/api/providers/<int:provider_id>/availability')
+@login_required
+def provider_availability_api(provider_id):
+    """API endpoint for a provider's working, booked and free slots per day"""
+    start = request.args.get('start') or datetime.now().strftime('%Y-%m-%d')
+    try:
+        start = datetime.strptime(start, '%Y-%m-%d')
+        days = min(max(int(request.args.get('days', 7)), 1), 62)
+    except ValueError:
+        return jsonify({'error': 'Expected start=YYYY-MM-DD and a numeric days'}), 400
+
+    availability = provider_availability(provider_id, start, days)
+    if availability is None:
+        return jsonify({'error': 'Provider not found'}), 404
+    return jsonify(availability)
+
+
+@app.route('/api/health-education/cache', methods=['DELETE'])
+@login_required
+@requires_permission('user_management')
+def invalidate_health_education_cache():
+    """API endpoint to drop cached health education content, e.g. after a content review"""
+    if not hasattr(current_user, 'role') or current_user.role != 'super_admin':
+        return jsonify({'error': 'Super admin privileges required'}), 403
+    
+    topic = request.args.get('topic') or None
+    language = request.args.get('language') or None
+    removed = education_cache.invalidate(topic=topic, language=language)
+    logger.info(f"{current_user.username} invalidated {removed} cached health education entries")
+    return jsonify({'removed': removed})
+
+
 # Add interaction tracking hooks to existing functions
 
 def track_interaction(patient_id, interaction_type, description, metadata=None):
-    """Helper function to track user interactions"""
+    """Helper function to track user interactions (written in the background)"""
     try:
-        UserInteraction.create(patient_id, interaction_type, description, metadata)
+        write_queue.enqueue('interaction', patient_id=patient_id, interaction_type=interaction_type,
+                            description=description, metadata=metadata)
     except Exception as e:
         logger.error(f"Error tracking interaction: {str(e)}")
 
@@ -1302,11 +1537,7 @@ def record_payment():
             
             # Update bill status based on payment
             total_paid = float(form.amount.data)  # In real system, sum all payments for this bill
-            if total_paid >= bill.total_amount:
-                bill.status = 'paid'
-                bill.paid_at = datetime.now()
-            else:
-                bill.status = 'partially_paid'
+            Bill.update_status(bill.id, 'paid' if total_paid >= bill.total_amount else 'partially_paid')
             
             flash('Payment recorded successfully.', 'success')
             return redirect(url_for('finance'))
@@ -1332,9 +1563,7 @@ def update_bill_status():
             flash('Bill not found.', 'danger')
             return redirect(url_for('finance'))
         
-        bill.status = status
-        if status == 'paid':
-            bill.paid_at = datetime.now()
+        Bill.update_status(bill.id, status)
         
         flash(f'Bill #{bill_id} status updated to {status}.', 'success')
     except ValueError:
@@ -1355,30 +1584,7 @@ def admin_dashboard():
         flash('Access denied. Super admin privileges required.', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Get system statistics
-    total_users = len(db['users'])
-    total_patients = len(db['patients'])
-    total_appointments = len(db['appointments'])
-    total_bills = len(db['bills'])
-    
-    # Get department statistics
-    department_stats = {}
-    for user in db['users']:
-        dept = user.department
-        if dept not in department_stats:
-            department_stats[dept] = 0
-        department_stats[dept] += 1
-    
-    # Recent activities
-    recent_users = sorted(db['users'], key=lambda x: x.created_at, reverse=True)[:5]
-    
-    return render_template('admin_dashboard.html',
-                         total_users=total_users,
-                         total_patients=total_patients,
-                         total_appointments=total_appointments,
-                         total_bills=total_bills,
-                         department_stats=department_stats,
-                         recent_users=recent_users)
+    return render_template('admin_dashboard.html', **dashboard_context('admin'))
 
 @app.route('/manage_users')
 @login_required
@@ -1425,6 +1631,7 @@ def create_user():
         )
         
         db['users'].append(new_user)
+        touch('users')
         flash(f'User {form.username.data} created successfully.', 'success')
         return redirect(url_for('manage_users'))
     
@@ -1460,33 +1667,7 @@ def finance_dashboard():
         flash('Access denied. Finance department access required.', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Finance-specific statistics with safe handling
-    total_bills = len(db.get('bills', []))
-    total_payments = len(db.get('payments', []))
-    pending_bills = len([b for b in db.get('bills', []) if hasattr(b, 'status') and b.status == 'pending'])
-    paid_bills = len([b for b in db.get('bills', []) if hasattr(b, 'status') and b.status == 'paid'])
-    
-    # Calculate total revenue
-    total_revenue = sum([p.amount for p in db.get('payments', []) if hasattr(p, 'amount') and hasattr(p, 'status') and p.status == 'completed'])
-    pending_revenue = sum([b.total_amount for b in db.get('bills', []) if hasattr(b, 'total_amount') and hasattr(b, 'status') and b.status == 'pending'])
-    
-    # Recent financial activities with safe sorting
-    recent_bills = sorted([b for b in db.get('bills', []) if hasattr(b, 'created_at')], 
-                         key=lambda x: x.created_at if hasattr(x.created_at, 'date') else datetime.now(), 
-                         reverse=True)[:5]
-    recent_payments = sorted([p for p in db.get('payments', []) if hasattr(p, 'created_at')], 
-                            key=lambda x: x.created_at if hasattr(x.created_at, 'date') else datetime.now(), 
-                            reverse=True)[:5]
-    
-    return render_template('finance_dashboard.html',
-                         total_bills=total_bills,
-                         total_payments=total_payments,
-                         pending_bills=pending_bills,
-                         paid_bills=paid_bills,
-                         total_revenue=total_revenue,
-                         pending_revenue=pending_revenue,
-                         recent_bills=recent_bills,
-                         recent_payments=recent_payments)
+    return render_template('finance_dashboard.html', **dashboard_context('finance'))
 
 @app.route('/lab_dashboard')
 @login_required
@@ -1497,32 +1678,7 @@ def lab_dashboard():
         flash('Access denied. Laboratory department access required.', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Enhanced lab statistics with USSD data integration
-    total_tests = len(db.get('lab_tests', []))
-    pending_tests = len([t for t in db.get('lab_tests', []) if hasattr(t, 'status') and t.status == 'ordered'])
-    completed_tests = len([t for t in db.get('lab_tests', []) if hasattr(t, 'status') and t.status == 'completed'])
-    
-    # Tests ordered via USSD today
-    today = datetime.now().date()
-    ussd_tests_today = len([t for t in db.get('lab_tests', []) 
-                           if hasattr(t, 'ordered_at') and hasattr(t, 'source') and 
-                           t.source == 'ussd' and t.ordered_at.date() == today])
-    
-    # Recent lab activities from USSD
-    recent_tests = sorted([t for t in db.get('lab_tests', []) if hasattr(t, 'ordered_at')], 
-                         key=lambda x: x.ordered_at, reverse=True)[:5]
-    
-    # Sample collection queue
-    collection_queue = [t for t in db.get('lab_tests', []) 
-                       if hasattr(t, 'status') and t.status == 'ordered'][:10]
-    
-    return render_template('lab_dashboard.html',
-                         total_tests=total_tests,
-                         pending_tests=pending_tests,
-                         completed_tests=completed_tests,
-                         ussd_tests_today=ussd_tests_today,
-                         recent_tests=recent_tests,
-                         collection_queue=collection_queue)
+    return render_template('lab_dashboard.html', **dashboard_context('lab'))
 
 @app.route('/pharmacy_dashboard')
 @login_required
@@ -1533,68 +1689,7 @@ def pharmacy_dashboard():
         flash('Access denied. Pharmacy department access required.', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Pharmacy statistics with USSD integration
-    pending_prescriptions = len([p for p in db.get('prescriptions', []) if hasattr(p, 'status') and p.status == 'pending'])
-    
-    # Prescriptions dispensed today
-    today = datetime.now().date()
-    dispensed_today = len([p for p in db.get('prescriptions', []) 
-                          if hasattr(p, 'dispensed_at') and hasattr(p, 'status') and 
-                          p.status == 'dispensed' and p.dispensed_at.date() == today])
-    
-    # Mock inventory data for low stock alerts
-    low_stock_items = 5  # Would come from inventory system
-    delivery_requests = len([p for p in db.get('prescriptions', []) 
-                           if hasattr(p, 'delivery_method') and p.delivery_method == 'delivery'])
-    
-    # Recent prescriptions from USSD consultations
-    recent_prescriptions = sorted([p for p in db.get('prescriptions', []) if hasattr(p, 'created_at')], 
-                                 key=lambda x: x.created_at, reverse=True)[:5]
-    
-    # Sample drug interaction alerts
-    drug_interactions = [
-        {'patient_id': 1, 'warning': 'Warfarin and Aspirin interaction - bleeding risk'},
-        {'patient_id': 3, 'warning': 'ACE inhibitor and Potassium supplement - hyperkalemia risk'}
-    ]
-    
-    # Sample inventory items
-    inventory_items = [
-        {'id': 1, 'drug_name': 'Paracetamol 500mg', 'current_stock': 50, 'minimum_stock': 100, 'unit': 'tablets', 'last_restocked': '2025-06-20'},
-        {'id': 2, 'drug_name': 'Amoxicillin 250mg', 'current_stock': 200, 'minimum_stock': 150, 'unit': 'capsules', 'last_restocked': '2025-06-18'},
-        {'id': 3, 'drug_name': 'ORS Sachets', 'current_stock': 25, 'minimum_stock': 50, 'unit': 'sachets', 'last_restocked': '2025-06-15'},
-        {'id': 4, 'drug_name': 'Insulin (Human)', 'current_stock': 0, 'minimum_stock': 10, 'unit': 'vials', 'last_restocked': None}
-    ]
-    
-    return render_template('pharmacy_dashboard.html',
-                         pending_prescriptions=pending_prescriptions,
-                         dispensed_today=dispensed_today,
-                         low_stock_items=low_stock_items,
-                         delivery_requests=delivery_requests,
-                         recent_prescriptions=recent_prescriptions,
-                         drug_interactions=drug_interactions,
-                         inventory_items=inventory_items)
-    
-    # Lab-specific statistics with safe handling
-    total_tests = len(db.get('lab_tests', []))
-    pending_tests = len([t for t in db.get('lab_tests', []) if hasattr(t, 'status') and t.status == 'pending'])
-    completed_tests = len([t for t in db.get('lab_tests', []) if hasattr(t, 'status') and t.status == 'completed'])
-    in_progress_tests = len([t for t in db.get('lab_tests', []) if hasattr(t, 'status') and t.status == 'in_progress'])
-    
-    # Recent lab activities with safe sorting
-    recent_tests = sorted([t for t in db.get('lab_tests', []) if hasattr(t, 'created_at')], 
-                         key=lambda x: x.created_at if hasattr(x.created_at, 'date') else datetime.now(), 
-                         reverse=True)[:10]
-    
-    # Get lab results that need processing
-    pending_results = len([r for r in db.get('lab_results', []) if hasattr(r, 'status') and r.status == 'pending'])
-    
-    return render_template('lab_dashboard.html',
-                         total_tests=total_tests,
-                         pending_tests=pending_tests,
-                         completed_tests=completed_tests,
-                         in_progress_tests=in_progress_tests,
-                         pending_results=pending_results,
-                         recent_tests=recent_tests)
+    return render_template('pharmacy_dashboard.html', **dashboard_context('pharmacy'))
 
 @app.route('/clinical_dashboard')
 @login_required
@@ -1605,57 +1700,7 @@ def clinical_dashboard():
         flash('Access denied. Clinical department access required.', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Enhanced clinical statistics with USSD integration
-    total_patients = len(db['patients'])
-    total_appointments = len(db['appointments'])
-    
-    # USSD-originated consultations today
-    today = datetime.now().date()
-    today_appointments = 0
-    ussd_consultations_today = 0
-    try:
-        today_appointments = len([a for a in db['appointments'] if hasattr(a, 'date') and 
-                                 (a.date.date() == today if hasattr(a.date, 'date') else 
-                                  datetime.strptime(str(a.date), '%Y-%m-%d').date() == today)])
-        # Track USSD-originated consultations
-        ussd_consultations_today = len([a for a in db['appointments'] if hasattr(a, 'source') and 
-                                       a.source == 'ussd' and hasattr(a, 'date') and 
-                                       a.date.date() == today])
-    except:
-        today_appointments = 0
-        ussd_consultations_today = 0
-    
-    # Prescription management from USSD
-    pending_prescriptions = len([p for p in db.get('prescriptions', []) if hasattr(p, 'status') and p.status == 'pending'])
-    ussd_prescriptions = len([p for p in db.get('prescriptions', []) if hasattr(p, 'source') and p.source == 'ussd'])
-    
-    # Active USSD patient symptoms tracking
-    active_symptoms = len([p for p in db['patients'] if hasattr(p, 'symptoms') and p.symptoms])
-    
-    # Emergency alerts from USSD
-    emergency_alerts = len([p for p in db['patients'] if hasattr(p, 'symptoms') and 
-                           any('severe' in str(symptom).lower() or 'emergency' in str(symptom).lower() 
-                               for symptom in p.symptoms)])
-    
-    # Recent clinical activities with safe sorting
-    recent_appointments = sorted([a for a in db['appointments'] if hasattr(a, 'created_at')], 
-                                key=lambda x: x.created_at if hasattr(x.created_at, 'date') else datetime.now(), 
-                                reverse=True)[:5]
-    recent_prescriptions = sorted([p for p in db.get('prescriptions', []) if hasattr(p, 'created_at')], 
-                                 key=lambda x: x.created_at if hasattr(x.created_at, 'date') else datetime.now(), 
-                                 reverse=True)[:5]
-    
-    return render_template('clinical_dashboard.html',
-                         total_patients=total_patients,
-                         total_appointments=total_appointments,
-                         today_appointments=today_appointments,
-                         ussd_consultations_today=ussd_consultations_today,
-                         pending_prescriptions=pending_prescriptions,
-                         ussd_prescriptions=ussd_prescriptions,
-                         active_symptoms=active_symptoms,
-                         emergency_alerts=emergency_alerts,
-                         recent_appointments=recent_appointments,
-                         recent_prescriptions=recent_prescriptions)
+    return render_template('clinical_dashboard.html', **dashboard_context('clinical'))
 
 # ===== ROLE-BASED ACCESS CONTROL =====
 
@@ -1685,21 +1730,8 @@ def system_status():
         flash('Access denied. Super admin privileges required.', 'danger')
         return redirect(url_for('dashboard'))
     
-    # System health metrics
-    system_stats = {
-        'total_users': len(db['users']),
-        'total_patients': len(db['patients']),
-        'total_providers': len(db['providers']),
-        'total_appointments': len(db['appointments']),
-        'total_messages': len(db['messages']),
-        'total_bills': len(db['bills']),
-        'total_payments': len(db['payments']),
-        'total_prescriptions': len(db['prescriptions']),
-        'total_lab_tests': len(db['lab_tests']),
-        'active_walk_ins': len([w for w in db['walk_in_patients'] if w.status == 'waiting'])
-    }
-    
-    return render_template('system_status.html', system_stats=system_stats)
+    return render_template('system_status.html', ai_circuits=all_breakers(), ai_service_name=ai_service.__name__,
+                           **dashboard_context('system'))
 
 
 
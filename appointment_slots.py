@@ -0,0 +1,429 @@
+"""
+Appointment slot availability for Tujali Telehealth
+
+Every provider's day is a grid of fixed-length slots. Working hours
+(the `available_days` / `available_hours` columns of the shared providers
+schema) become one bitmap per weekday, and the appointments of a provider
+on a day become a booked bitmap, so the free slots of a day are
+`working & ~booked` and every query is linear in the number of slots.
+
+Appointment dates arrive as '%d-%m-%Y' strings from USSD, '%Y-%m-%d'
+strings or datetimes from the dashboard; date_key() and time_key()
+normalize them so all of them land in the same calendar.
+
+Bookings go through the engine so that two callers can never get the same
+slot. A USSD caller first places a short-lived hold on the slot while the
+confirmation screen is shown; the hold hides the slot from everyone else
+and expires on its own if the caller drops. commit() turns the hold into an
+appointment only if the slot still carries that hold (compare-and-set).
+Checks and writes are serialized per (provider, day) with striped locks, so
+bookings for different providers or days never wait for each other.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from datetime import date, datetime, time as dt_time, timedelta
+
+from models import db, Provider, Appointment
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+DATE_FORMATS = ('%d-%m-%Y', '%Y-%m-%d', '%d/%m/%Y')
+TIME_FORMATS = ('%H:%M', '%I:%M %p', '%I %p', '%H:%M:%S')
+
+# Appointments in these states do not occupy their slot
+FREE_STATUSES = {'cancelled'}
+
+
+class SlotUnavailable(Exception):
+    """The requested slot is booked, held by someone else or outside working hours"""
+
+
+def date_key(value):
+    """
+    Normalize an appointment date
+
+    Args:
+        value: date, datetime or a string in one of DATE_FORMATS
+
+    Returns:
+        date: The calendar day, or None if it cannot be parsed
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(value.strip(), fmt).date()
+            except ValueError:
+                continue
+    return None
+
+
+def time_key(value):
+    """
+    Normalize an appointment time to minutes after midnight
+
+    Args:
+        value: time, datetime or a string such as '09:00' or '2:30 PM'
+
+    Returns:
+        int: Minutes after midnight, or None if it cannot be parsed
+    """
+    if isinstance(value, (datetime, dt_time)):
+        return value.hour * 60 + value.minute
+    if isinstance(value, str):
+        for fmt in TIME_FORMATS:
+            try:
+                parsed = datetime.strptime(value.strip().upper(), fmt)
+                return parsed.hour * 60 + parsed.minute
+            except ValueError:
+                continue
+    return None
+
+
+def format_time(minutes):
+    """Format minutes after midnight as 'HH:MM'"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class SlotEngine:
+    """
+    Per-provider, per-day availability bitmaps
+
+    Args:
+        slot_minutes (int): Length of one appointment slot; must divide a day
+        stripes (int): Number of locks (provider, day) keys are spread over
+    """
+    def __init__(self, slot_minutes=60, stripes=64):
+        if (24 * 60) % slot_minutes:
+            raise ValueError("slot_minutes must divide 24 hours")
+        self.slot_minutes = slot_minutes
+        self.slots_per_day = (24 * 60) // slot_minutes
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._working = {}  # provider_id -> ((days, hours), 7 weekday masks)
+        self._by_day = {}  # (provider_id, date) -> appointments
+        self._holds = {}  # (provider_id, date) -> {slot: (token, expires_at)}
+        self._source = None
+        self._indexed = 0
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    # ---- working hours ----
+
+    def _parse_hours(self, hours):
+        """Bitmap of the slots that fit entirely inside 'HH:MM-HH:MM[,...]'"""
+        mask = 0
+        for span in (hours or '').split(','):
+            if '-' not in span:
+                continue
+            start, end = (time_key(part) for part in span.split('-', 1))
+            if start is None or end is None:
+                logger.warning(f"Ignoring invalid working hours {span!r}")
+                continue
+            if end <= start:
+                end = 24 * 60  # e.g. '20:00-00:00'
+            first = -(-start // self.slot_minutes)  # round up to a slot boundary
+            for slot in range(first, self.slots_per_day):
+                if (slot + 1) * self.slot_minutes > end:
+                    break
+                mask |= 1 << slot
+        return mask
+
+    def working_mask(self, provider, day):
+        """Bitmap of a provider's working slots on a day"""
+        schedule = (provider.available_days, provider.available_hours)
+        cached = self._working.get(provider.id)
+        if cached is None or cached[0] != schedule:
+            hours = self._parse_hours(provider.available_hours)
+            days = {name.strip().lower() for name in (provider.available_days or '').split(',')}
+            masks = tuple(hours if weekday in days else 0 for weekday in WEEKDAYS)
+            cached = self._working[provider.id] = (schedule, masks)
+        return cached[1][day.weekday()]
+
+    # ---- bookings ----
+
+    def _sync(self):
+        """Index appointments created since the last query"""
+        appointments = db['appointments']
+        with self._lock:
+            if appointments is not self._source or len(appointments) < self._indexed:
+                # The database was reseeded
+                self._by_day = {}
+                self._source = appointments
+                self._indexed = 0
+            for appointment in appointments[self._indexed:]:
+                day = date_key(appointment.date)
+                if day is not None:
+                    self._by_day.setdefault((appointment.provider_id, day), []).append(appointment)
+            self._indexed = len(appointments)
+
+    def slot_of(self, time_value):
+        """Slot index holding a time, or None"""
+        minutes = time_key(time_value)
+        if minutes is None:
+            return None
+        return minutes // self.slot_minutes
+
+    def booked_mask(self, provider_id, day):
+        """Bitmap of a provider's booked slots on a day"""
+        self._sync()
+        mask = 0
+        for appointment in self._by_day.get((provider_id, day), ()):
+            if appointment.status in FREE_STATUSES:
+                continue
+            slot = self.slot_of(appointment.time)
+            if slot is not None:
+                mask |= 1 << slot
+        return mask
+
+    def _held_mask(self, key, token=None):
+        """Bitmap of slots held by anyone but `token`, dropping expired holds (stripe lock held)"""
+        holds = self._holds.get(key)
+        if not holds:
+            return 0
+        now = time.monotonic()
+        mask = 0
+        for slot, (owner, expires_at) in list(holds.items()):
+            if expires_at <= now:
+                del holds[slot]
+            elif owner != token:
+                mask |= 1 << slot
+        if not holds:
+            del self._holds[key]
+        return mask
+
+    def free_mask(self, provider, day, token=None):
+        """
+        Bitmap of a provider's free slots on a day
+
+        Args:
+            token (str, optional): Hold token whose own held slot counts as free
+        """
+        key = (provider.id, day)
+        with self._stripe(key):
+            held = self._held_mask(key, token)
+        return self.working_mask(provider, day) & ~self.booked_mask(provider.id, day) & ~held
+
+    # ---- queries ----
+
+    def slot_times(self, mask):
+        """Start times ('HH:MM') of the slots set in a bitmap, in order"""
+        times = []
+        slot = 0
+        while mask:
+            if mask & 1:
+                times.append(format_time(slot * self.slot_minutes))
+            mask >>= 1
+            slot += 1
+        return times
+
+    def free_slots(self, provider, day):
+        """
+        Free slot start times of a provider on a day
+
+        Args:
+            provider (Provider): Provider to check
+            day: Anything date_key() accepts
+
+        Returns:
+            list: 'HH:MM' strings in order
+        """
+        day = date_key(day)
+        if day is None:
+            return []
+        return self.slot_times(self.free_mask(provider, day))
+
+    def is_free(self, provider, day, time_value):
+        """Whether a provider's slot holding a time is free on a day"""
+        day = date_key(day)
+        slot = self.slot_of(time_value)
+        if day is None or slot is None:
+            return False
+        return bool(self.free_mask(provider, day) >> slot & 1)
+
+    def free_slots_any(self, providers, day):
+        """Slot start times on a day at which at least one of the providers is free"""
+        day = date_key(day)
+        if day is None:
+            return []
+        mask = 0
+        for provider in providers:
+            mask |= self.free_mask(provider, day)
+        return self.slot_times(mask)
+
+    def free_providers(self, providers, day, time_value):
+        """The providers (in the given order) who are free at a time"""
+        return [provider for provider in providers if self.is_free(provider, day, time_value)]
+
+    def open_days(self, providers, start, count=7, horizon=28):
+        """
+        The first days on which at least one of the providers has a free slot
+
+        Args:
+            providers (list): Candidate providers
+            start: First day to consider
+            count (int): Number of days wanted
+            horizon (int): Days to look ahead at most
+
+        Returns:
+            list: Dates in order
+        """
+        start = date_key(start)
+        days = []
+        for offset in range(horizon):
+            day = start + timedelta(days=offset)
+            if any(self.free_mask(provider, day) for provider in providers):
+                days.append(day)
+                if len(days) == count:
+                    break
+        return days
+
+    # ---- reservations ----
+
+    def hold(self, provider, day, time_value, ttl=120):
+        """
+        Reserve a free slot for a short while, e.g. during a confirmation screen
+
+        Args:
+            provider (Provider): Provider to book
+            day: Anything date_key() accepts
+            time_value: Anything time_key() accepts
+            ttl (float): Seconds until the hold expires on its own
+
+        Returns:
+            dict: JSON-serializable hold to pass to commit() or release(),
+            or None if the slot is not free
+        """
+        day = date_key(day)
+        slot = self.slot_of(time_value)
+        if day is None or slot is None:
+            return None
+        key = (provider.id, day)
+        with self._stripe(key):
+            free = self.working_mask(provider, day) & ~self.booked_mask(provider.id, day)
+            if not (free & ~self._held_mask(key)) >> slot & 1:
+                return None
+            token = uuid.uuid4().hex
+            self._holds.setdefault(key, {})[slot] = (token, time.monotonic() + ttl)
+        return {
+            'token': token,
+            'provider_id': provider.id,
+            'date': day.strftime('%d-%m-%Y'),
+            'time': format_time(slot * self.slot_minutes)
+        }
+
+    def release(self, hold):
+        """Give up a hold before it expires"""
+        key = (hold['provider_id'], date_key(hold['date']))
+        slot = self.slot_of(hold['time'])
+        with self._stripe(key):
+            holds = self._holds.get(key, {})
+            if slot in holds and holds[slot][0] == hold['token']:
+                del holds[slot]
+
+    def commit(self, hold, patient_id, price=None, notes=None):
+        """
+        Turn a hold into an appointment
+
+        Succeeds while the slot is still held by this hold, or the hold
+        expired and nobody else took the slot in the meantime.
+
+        Returns:
+            Appointment: The new appointment, or None if the slot was lost
+        """
+        provider = Provider.get_by_id(hold['provider_id'])
+        day = date_key(hold['date'])
+        slot = self.slot_of(hold['time'])
+        if provider is None or day is None or slot is None:
+            return None
+        key = (provider.id, day)
+        with self._stripe(key):
+            free = (self.working_mask(provider, day) & ~self.booked_mask(provider.id, day)
+                    & ~self._held_mask(key, hold['token']))
+            if not free >> slot & 1:
+                return None
+            appointment = Appointment.create(patient_id, provider.id, hold['date'], hold['time'],
+                                             price=price, notes=notes)
+            self._holds.get(key, {}).pop(slot, None)
+        return appointment
+
+    def update_status(self, appointment_id, status, payment_status=None):
+        """
+        Change an appointment's status, refusing to revive it into a taken slot
+
+        Returns:
+            bool: True if updated, False if not found
+
+        Raises:
+            SlotUnavailable: If a cancelled appointment's slot has been taken since
+        """
+        appointment = Appointment.get_by_id(appointment_id)
+        if appointment is None:
+            return False
+        day = date_key(appointment.date)
+        slot = self.slot_of(appointment.time)
+        reviving = appointment.status in FREE_STATUSES and status not in FREE_STATUSES
+        if not reviving or day is None or slot is None:
+            return Appointment.update_status(appointment_id, status, payment_status)
+
+        key = (appointment.provider_id, day)
+        with self._stripe(key):
+            taken = self.booked_mask(appointment.provider_id, day) | self._held_mask(key)
+            if taken >> slot & 1:
+                raise SlotUnavailable(f"The {appointment.time} slot on {appointment.date} is no longer free")
+            return Appointment.update_status(appointment_id, status, payment_status)
+
+    def calendar(self, provider, start, end):
+        """
+        Free slots of a provider over a date range, for calendar views
+
+        Args:
+            provider (Provider): Provider to check
+            start: First day, inclusive
+            end: Last day, inclusive
+
+        Returns:
+            dict: {date: {'working': [...], 'booked': [...], 'free': [...]}}
+        """
+        start, end = date_key(start), date_key(end)
+        days = {}
+        day = start
+        while day <= end:
+            working = self.working_mask(provider, day)
+            booked = self.booked_mask(provider.id, day)
+            days[day] = {
+                'working': self.slot_times(working),
+                'booked': self.slot_times(booked),
+                'free': self.slot_times(working & ~booked)
+            }
+            day += timedelta(days=1)
+        return days
+
+
+slots = SlotEngine()
+
+
+def provider_availability(provider_id, start, days=7):
+    """
+    JSON-friendly calendar of a provider's slots
+
+    Returns:
+        dict: {'YYYY-MM-DD': {'working': [...], 'booked': [...], 'free': [...]}},
+        or None if the provider does not exist
+    """
+    provider = Provider.get_by_id(provider_id)
+    if provider is None:
+        return None
+    start = date_key(start)
+    calendar = slots.calendar(provider, start, start + timedelta(days=days - 1))
+    return {day.isoformat(): slot_lists for day, slot_lists in calendar.items()}
@@ -0,0 +1,216 @@
+"""
+Circuit breakers for external services in Tujali Telehealth
+
+A provider that is over quota or down fails every call, and every caller
+still waits for that failure before trying something else. A CircuitBreaker
+watches the outcomes of recent calls to one provider:
+
+- closed: calls go through; once at least min_calls calls in the last
+  `window` seconds have failed at failure_threshold or more, it opens
+- open: calls are refused straight away for open_seconds
+- half-open: a few probe calls are let through; a successful probe closes
+  the circuit, a failed one opens it again
+
+Breakers are registered by name so /system_status can show them all.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from metrics import Counter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CIRCUIT_TRANSITIONS = Counter('circuit_breaker_transitions', 'Circuit breaker state changes',
+                              ['breaker', 'state'])
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker for one provider
+
+    Args:
+        name (str): Provider name, shown on /system_status
+        failure_threshold (float): Failure rate that opens the circuit
+        window (float): Seconds of call outcomes the failure rate covers
+        min_calls (int): Calls in the window needed before it can open
+        open_seconds (float): Seconds the circuit stays open before probing
+        half_open_probes (int): Concurrent probe calls allowed while half-open
+    """
+    def __init__(self, name, failure_threshold=0.5, window=60.0, min_calls=5, open_seconds=30.0,
+                 half_open_probes=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._outcomes = deque()  # (time.monotonic(), succeeded)
+        self._opened_at = None
+        self._probes = 0
+        self._last_error = None
+        self._last_change = time.time()
+
+    @property
+    def state(self):
+        """Current state, moving from open to half-open once open_seconds have passed"""
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def allow(self):
+        """
+        Ask whether a call may go through
+
+        A True answer while half-open reserves a probe slot, so it must be
+        followed by record_success() or record_failure().
+
+        Returns:
+            bool: False if the circuit is open
+        """
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            return False
+
+    def record_success(self):
+        """Record a call that succeeded"""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+                self._outcomes.clear()
+                self._transition(CLOSED)
+            self._add(now, True)
+
+    def record_failure(self, error=None):
+        """
+        Record a call that failed
+
+        Args:
+            error (str, optional): Error message, shown on /system_status
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._last_error = error
+            if self._state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+                self._open(now)
+                return
+            self._add(now, False)
+            if self._state == CLOSED:
+                calls, failures = self._counts()
+                if calls >= self.min_calls and failures / calls >= self.failure_threshold:
+                    self._open(now)
+
+    def release(self):
+        """Give back a probe slot taken by allow() for a call that was abandoned"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+
+    def reset(self):
+        """Close the circuit and forget recorded outcomes"""
+        with self._lock:
+            self._outcomes.clear()
+            self._probes = 0
+            self._transition(CLOSED)
+
+    def snapshot(self):
+        """
+        State for display
+
+        Returns:
+            dict: name, state, calls and failures in the window, failure rate,
+            seconds until the next probe, last error and when the state changed
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            self._trim(now)
+            calls, failures = self._counts()
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = max(self._opened_at + self.open_seconds - now, 0)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'calls': calls,
+                'failures': failures,
+                'failure_rate': failures / calls if calls else 0.0,
+                'retry_in': retry_in,
+                'last_error': self._last_error,
+                'since': self._last_change
+            }
+
+    def _add(self, now, succeeded):
+        self._outcomes.append((now, succeeded))
+        self._trim(now)
+
+    def _trim(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _counts(self):
+        failures = sum(1 for _, succeeded in self._outcomes if not succeeded)
+        return len(self._outcomes), failures
+
+    def _open(self, now):
+        self._opened_at = now
+        self._probes = 0
+        self._transition(OPEN)
+
+    def _refresh(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._probes = 0
+            self._transition(HALF_OPEN)
+
+    def _transition(self, state):
+        if state == self._state:
+            return
+        logger.warning(f"Circuit for {self.name} is now {state.replace('_', '-')}")
+        self._state = state
+        self._last_change = time.time()
+        CIRCUIT_TRANSITIONS.inc(breaker=self.name, state=state)
+
+
+def get_breaker(name, **options):
+    """
+    Get the breaker registered under a name, creating it on first use
+
+    Args:
+        name (str): Provider name
+        **options: CircuitBreaker arguments, used only when creating it
+
+    Returns:
+        CircuitBreaker: The breaker
+    """
+    with _registry_lock:
+        breaker = _registry.get(name)
+        if breaker is None:
+            breaker = _registry[name] = CircuitBreaker(name, **options)
+        return breaker
+
+
+def all_breakers():
+    """Snapshots of every registered breaker, by name"""
+    with _registry_lock:
+        breakers = sorted(_registry.values(), key=lambda breaker: breaker.name)
+    return [breaker.snapshot() for breaker in breakers]
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Cached department dashboards for Tujali Telehealth
+
+Every department dashboard is a set of counts and "most recent" lists over
+whole collections of the in-memory database, and each open dashboard
+reloads every couple of minutes. The results only change when one of the
+collections behind them does, so they are computed once and kept until
+then: the models count writes per collection (models.touch), a cached
+result remembers the counts it was computed at, and it is served as long
+as they have not moved.
+
+After a write the next request recomputes the result. Requests arriving
+while that is in progress do not scan as well: they get the previous
+result, as long as it is at most DASHBOARD_CACHE_MAX_STALE seconds old,
+or else wait for the one recompute (stale-while-revalidate under load).
+With DASHBOARD_CACHE_SWR=always even the first request after a write gets
+the previous result while a background thread recomputes it, and with
+DASHBOARD_CACHE_SWR=off nobody is ever served an outdated result.
+
+Measure it against recomputing on every load:
+
+    python dashboard_cache.py --records 20000 --viewers 100
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+from metrics import Counter, Histogram
+from models import db, collection_version
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DASHBOARD_LOOKUPS = Counter('dashboard_cache_lookups',
+                            'Dashboard loads by how the cache answered them (hit, miss, stale, wait)',
+                            ['dashboard', 'result'])
+DASHBOARD_RECOMPUTE = Histogram('dashboard_recompute_duration_seconds',
+                                'Time to recompute a dashboard from the database',
+                                ['dashboard'])
+
+SWR_MODES = ('load', 'always', 'off')
+
+
+class _Entry:
+    """Cached result of one dashboard"""
+    __slots__ = ('value', 'version', 'computed_at', 'refreshing')
+
+    def __init__(self):
+        self.value = None
+        self.version = None  # (key, collection versions) the value was computed at
+        self.computed_at = None
+        self.refreshing = None  # Event while a recompute is in progress
+
+
+class DashboardCache:
+    """
+    Dashboard results invalidated by collection version
+
+    Args:
+        swr (str): When an outdated result may be served: 'load' while it is
+            being recomputed, 'always' (recompute in the background) or 'off'
+        max_stale (float): Seconds after computing it that a result may
+            still be served outdated
+    """
+    def __init__(self, swr='load', max_stale=300):
+        if swr not in SWR_MODES:
+            raise ValueError(f"Unknown stale-while-revalidate mode {swr!r}, expected one of {SWR_MODES}")
+        self.swr = swr
+        self.max_stale = max_stale
+        self._lock = threading.Lock()
+        self._entries = {}  # name -> _Entry
+
+    def get(self, name, collections, compute, key=None):
+        """
+        Result of a dashboard, computed only when it is out of date
+
+        Args:
+            name (str): Dashboard name
+            collections (tuple): Database collections the result is computed from
+            compute (callable): Computes the result
+            key: Anything else the result depends on (e.g. today's date);
+                a result for another key is never served
+
+        Returns:
+            The cached or newly computed result
+        """
+        while True:
+            version = (key, tuple(collection_version(collection) for collection in collections))
+            with self._lock:
+                entry = self._entries.setdefault(name, _Entry())
+                if entry.version == version:
+                    DASHBOARD_LOOKUPS.inc(dashboard=name, result='hit')
+                    return entry.value
+                servable = (self.swr != 'off' and entry.version is not None and entry.version[0] == key and
+                            time.monotonic() - entry.computed_at <= self.max_stale)
+                done = entry.refreshing
+                if done is None:
+                    done = entry.refreshing = threading.Event()
+                    if servable and self.swr == 'always':
+                        threading.Thread(target=self._refresh_quietly, args=(name, entry, collections, compute, key),
+                                         name=f'dashboard-{name}', daemon=True).start()
+                        DASHBOARD_LOOKUPS.inc(dashboard=name, result='stale')
+                        return entry.value
+                    owner = True
+                else:
+                    if servable:
+                        DASHBOARD_LOOKUPS.inc(dashboard=name, result='stale')
+                        return entry.value
+                    owner = False
+
+            if owner:
+                DASHBOARD_LOOKUPS.inc(dashboard=name, result='miss')
+                return self._refresh(name, entry, collections, compute, key)
+            # Someone else is computing it; look again once they are done
+            DASHBOARD_LOOKUPS.inc(dashboard=name, result='wait')
+            done.wait()
+
+    def _refresh(self, name, entry, collections, compute, key):
+        """Recompute a result and store it; the caller has set entry.refreshing"""
+        try:
+            # Versions are read first, so writes made during the scan leave the result out of date
+            version = (key, tuple(collection_version(collection) for collection in collections))
+            start = time.perf_counter()
+            value = compute()
+            DASHBOARD_RECOMPUTE.observe(time.perf_counter() - start, dashboard=name)
+            with self._lock:
+                entry.value = value
+                entry.version = version
+                entry.computed_at = time.monotonic()
+            return value
+        finally:
+            with self._lock:
+                done, entry.refreshing = entry.refreshing, None
+            done.set()
+
+    def _refresh_quietly(self, name, entry, collections, compute, key):
+        """Background recompute; a failure leaves the old result in place"""
+        try:
+            self._refresh(name, entry, collections, compute, key)
+        except Exception as e:
+            logger.error(f"Recomputing the {name} dashboard failed: {str(e)}")
+
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._entries.clear()
+
+
+def admin_stats():
+    """Super admin dashboard: system totals and users by department"""
+    department_stats = {}
+    for user in db['users']:
+        dept = user.department
+        if dept not in department_stats:
+            department_stats[dept] = 0
+        department_stats[dept] += 1
+
+    return {
+        'total_users': len(db['users']),
+        'total_patients': len(db['patients']),
+        'total_appointments': len(db['appointments']),
+        'total_bills': len(db['bills']),
+        'department_stats': department_stats,
+        'recent_users': sorted(db['users'], key=lambda x: x.created_at, reverse=True)[:5]
+    }
+
+
+def finance_stats():
+    """Finance dashboard: bill and payment totals, revenue and recent activity"""
+    bills = db.get('bills', [])
+    payments = db.get('payments', [])
+    return {
+        'total_bills': len(bills),
+        'total_payments': len(payments),
+        'pending_bills': len([b for b in bills if hasattr(b, 'status') and b.status == 'pending']),
+        'paid_bills': len([b for b in bills if hasattr(b, 'status') and b.status == 'paid']),
+        'total_revenue': sum([p.amount for p in payments
+                              if hasattr(p, 'amount') and hasattr(p, 'status') and p.status == 'completed']),
+        'pending_revenue': sum([b.total_amount for b in bills
+                                if hasattr(b, 'total_amount') and hasattr(b, 'status') and b.status == 'pending']),
+        'recent_bills': sorted([b for b in bills if hasattr(b, 'created_at')],
+                               key=lambda x: x.created_at if hasattr(x.created_at, 'date') else datetime.now(),
+                               reverse=True)[:5],
+        'recent_payments': sorted([p for p in payments if hasattr(p, 'created_at')],
+                                  key=lambda x: x.created_at if hasattr(x.created_at, 'date') else datetime.now(),
+                                  reverse=True)[:5]
+    }
+
+
+def lab_stats(today):
+    """Laboratory dashboard: test counts, today's USSD orders and the collection queue"""
+    tests = db.get('lab_tests', [])
+    return {
+        'total_tests': len(tests),
+        'pending_tests': len([t for t in tests if hasattr(t, 'status') and t.status == 'ordered']),
+        'completed_tests': len([t for t in tests if hasattr(t, 'status') and t.status == 'completed']),
+        # Tests ordered via USSD today
+        'ussd_tests_today': len([t for t in tests
+                                 if hasattr(t, 'ordered_at') and hasattr(t, 'source') and
+                                 t.source == 'ussd' and t.ordered_at.date() == today]),
+        'recent_tests': sorted([t for t in tests if hasattr(t, 'ordered_at')],
+                               key=lambda x: x.ordered_at, reverse=True)[:5],
+        # Sample collection queue
+        'collection_queue': [t for t in tests if hasattr(t, 'status') and t.status == 'ordered'][:10]
+    }
+
+
+def pharmacy_stats(today):
+    """Pharmacy dashboard: prescription queue, today's dispensing and stock alerts"""
+    prescriptions = db.get('prescriptions', [])
+    return {
+        'pending_prescriptions': len([p for p in prescriptions if hasattr(p, 'status') and p.status == 'pending']),
+        'dispensed_today': len([p for p in prescriptions
+                                if hasattr(p, 'dispensed_at') and hasattr(p, 'status') and
+                                p.status == 'dispensed' and p.dispensed_at.date() == today]),
+        # Mock inventory data for low stock alerts
+        'low_stock_items': 5,  # Would come from inventory system
+        'delivery_requests': len([p for p in prescriptions
+                                  if hasattr(p, 'delivery_method') and p.delivery_method == 'delivery']),
+        'recent_prescriptions': sorted([p for p in prescriptions if hasattr(p, 'created_at')],
+                                       key=lambda x: x.created_at, reverse=True)[:5],
+        # Sample drug interaction alerts
+        'drug_interactions': [
+            {'patient_id': 1, 'warning': 'Warfarin and Aspirin interaction - bleeding risk'},
+            {'patient_id': 3, 'warning': 'ACE inhibitor and Potassium supplement - hyperkalemia risk'}
+        ],
+        # Sample inventory items
+        'inventory_items': [
+            {'id': 1, 'drug_name': 'Paracetamol 500mg', 'current_stock': 50, 'minimum_stock': 100, 'unit': 'tablets', 'last_restocked': '2025-06-20'},
+            {'id': 2, 'drug_name': 'Amoxicillin 250mg', 'current_stock': 200, 'minimum_stock': 150, 'unit': 'capsules', 'last_restocked': '2025-06-18'},
+            {'id': 3, 'drug_name': 'ORS Sachets', 'current_stock': 25, 'minimum_stock': 50, 'unit': 'sachets', 'last_restocked': '2025-06-15'},
+            {'id': 4, 'drug_name': 'Insulin (Human)', 'current_stock': 0, 'minimum_stock': 10, 'unit': 'vials', 'last_restocked': None}
+        ]
+    }
+
+
+def clinical_stats(today):
+    """Clinical dashboard: today's appointments, prescriptions and USSD symptom alerts"""
+    appointments = db['appointments']
+    prescriptions = db.get('prescriptions', [])
+
+    # USSD-originated consultations today
+    try:
+        today_appointments = len([a for a in appointments if hasattr(a, 'date') and
+                                  (a.date.date() == today if hasattr(a.date, 'date') else
+                                   datetime.strptime(str(a.date), '%Y-%m-%d').date() == today)])
+        # Track USSD-originated consultations
+        ussd_consultations_today = len([a for a in appointments if hasattr(a, 'source') and
+                                        a.source == 'ussd' and hasattr(a, 'date') and
+                                        a.date.date() == today])
+    except:
+        today_appointments = 0
+        ussd_consultations_today = 0
+
+    return {
+        'total_patients': len(db['patients']),
+        'total_appointments': len(appointments),
+        'today_appointments': today_appointments,
+        'ussd_consultations_today': ussd_consultations_today,
+        # Prescription management from USSD
+        'pending_prescriptions': len([p for p in prescriptions if hasattr(p, 'status') and p.status == 'pending']),
+        'ussd_prescriptions': len([p for p in prescriptions if hasattr(p, 'source') and p.source == 'ussd']),
+        # Active USSD patient symptoms tracking
+        'active_symptoms': len([p for p in db['patients'] if hasattr(p, 'symptoms') and p.symptoms]),
+        # Emergency alerts from USSD
+        'emergency_alerts': len([p for p in db['patients'] if hasattr(p, 'symptoms') and
+                                 any('severe' in str(symptom).lower() or 'emergency' in str(symptom).lower()
+                                     for symptom in p.symptoms)]),
+        'recent_appointments': sorted([a for a in appointments if hasattr(a, 'created_at')],
+                                      key=lambda x: x.created_at if hasattr(x.created_at, 'date') else datetime.now(),
+                                      reverse=True)[:5],
+        'recent_prescriptions': sorted([p for p in prescriptions if hasattr(p, 'created_at')],
+                                       key=lambda x: x.created_at if hasattr(x.created_at, 'date') else datetime.now(),
+                                       reverse=True)[:5]
+    }
+
+
+def system_stats():
+    """System status page: size of every collection and waiting walk-ins"""
+    return {
+        'system_stats': {
+            'total_users': len(db['users']),
+            'total_patients': len(db['patients']),
+            'total_providers': len(db['providers']),
+            'total_appointments': len(db['appointments']),
+            'total_messages': len(db['messages']),
+            'total_bills': len(db['bills']),
+            'total_payments': len(db['payments']),
+            'total_prescriptions': len(db['prescriptions']),
+            'total_lab_tests': len(db['lab_tests']),
+            'active_walk_ins': len([w for w in db['walkin_patients'] if w.status == 'waiting'])
+        }
+    }
+
+
+# name -> (collections it reads, compute, whether it depends on today's date)
+DASHBOARDS = {
+    'admin': (('users', 'patients', 'appointments', 'bills'), admin_stats, False),
+    'finance': (('bills', 'payments'), finance_stats, False),
+    'lab': (('lab_tests',), lab_stats, True),
+    'pharmacy': (('prescriptions',), pharmacy_stats, True),
+    'clinical': (('patients', 'appointments', 'prescriptions'), clinical_stats, True),
+    'system': (('users', 'patients', 'providers', 'appointments', 'messages', 'bills', 'payments',
+                'prescriptions', 'lab_tests', 'walkin_patients'), system_stats, False)
+}
+
+dashboard_cache = DashboardCache(swr=os.environ.get('DASHBOARD_CACHE_SWR', 'load'),
+                                 max_stale=float(os.environ.get('DASHBOARD_CACHE_MAX_STALE', 300)))
+
+
+def dashboard_context(name):
+    """
+    Template variables of a department dashboard
+
+    Args:
+        name (str): Key of DASHBOARDS, e.g. 'finance'
+
+    Returns:
+        dict: Keyword arguments for render_template; shared between
+        requests, so callers must not modify it
+    """
+    collections, compute, daily = DASHBOARDS[name]
+    if daily:
+        today = datetime.now().date()
+        return dashboard_cache.get(name, collections, lambda: compute(today), key=today)
+    return dashboard_cache.get(name, collections, compute)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cached against uncached dashboard loads")
+    parser.add_argument('--records', type=int, default=20000, help="Records per collection (default: %(default)s)")
+    parser.add_argument('--viewers', type=int, default=100, help="Dashboards loaded at once (default: %(default)s)")
+    parser.add_argument('--rounds', type=int, default=10, help="Refresh rounds, each after a write (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    from models import init_db, Patient, Appointment, Prescription, LabTest, Bill, Payment
+    from metrics import percentile
+
+    logging.basicConfig(level=logging.ERROR)
+    init_db()
+    for number in range(args.records):
+        patient = Patient.create(f'+2547{number:08d}', f'Patient {number}', 20 + number % 60, 'Female', 'Nairobi', 'en')
+        patient.add_symptom('Severe cough' if number % 7 == 0 else 'Mild headache')
+        Appointment.create(patient.id, 1, datetime.now().strftime('%Y-%m-%d'), '09:00', price=500)
+        Prescription.create(patient.id, 1, None, [{'name': 'Paracetamol'}], 'Twice daily')
+        LabTest.create(patient.id, 1, None, 'Malaria test', 'blood', cost=300)
+        Bill.create(patient.id, 1).add_item('consultation', 'Consultation', 500)
+        Payment.create(None, 500, patient.phone_number)
+
+    def load(viewer):
+        return dashboard_context(list(DASHBOARDS)[viewer % len(DASHBOARDS)])
+
+    def uncached(viewer):
+        collections, compute, daily = DASHBOARDS[list(DASHBOARDS)[viewer % len(DASHBOARDS)]]
+        return compute(datetime.now().date()) if daily else compute()
+
+    def measure(view):
+        timings = []
+        timings_lock = threading.Lock()
+
+        def viewer(number):
+            start = time.perf_counter()
+            view(number)
+            with timings_lock:
+                timings.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for round_number in range(args.rounds):
+            # A new booking and a payment between refreshes
+            Appointment.update_status(round_number % args.records + 1, 'confirmed')
+            Payment.update_status(round_number % args.records + 1, 'completed')
+            threads = [threading.Thread(target=viewer, args=(number,)) for number in range(args.viewers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - start
+        timings.sort()
+        return elapsed, timings
+
+    def recomputes():
+        return sum(DASHBOARD_RECOMPUTE.get(dashboard=dashboard)[0] for dashboard in DASHBOARDS)
+
+    loads = args.rounds * args.viewers
+    for name, view in (('uncached', uncached), ('cached', load)):
+        before = recomputes()
+        elapsed, timings = measure(view)
+        scans = recomputes() - before if view is load else loads
+        print(f"{name:9} {loads / elapsed:8.0f} loads/s  p50 {percentile(timings, 50) * 1000:7.2f} ms  "
+              f"p95 {percentile(timings, 95) * 1000:7.2f} ms  {scans} scans for {loads} loads")
+    for result in ('hit', 'miss', 'stale', 'wait'):
+        print(f"  {result:6} {sum(DASHBOARD_LOOKUPS.get(dashboard=dashboard, result=result) for dashboard in DASHBOARDS):8.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
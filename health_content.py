@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Pre-generated health information for the USSD menu
+
+The USSD health information menu needs content for each of its topics in
+every language callers can choose, and it cannot wait for an AI provider
+mid-session. The pipeline here generates education content for every
+(topic, language) pair ahead of time, a few pairs at a time on a thread pool,
+through the configured AI service with the offline mock service as fallback.
+Results go into a ContentStore so a USSD lookup is a dictionary hit.
+
+Only content actually written in the pair's language is kept. The offline
+service answers in English whatever language it is asked for (and says so
+in a 'language_note'), so it only fills English pairs; the USSD menu serves
+the other languages from the health library until an AI provider has
+produced them.
+
+The store is saved to HEALTH_CONTENT_FILE, so a restart serves yesterday's
+content straight away. The app regenerates it every night at
+HEALTH_CONTENT_HOUR (02:00 by default); run it by hand with:
+
+    python health_content.py --workers 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import mock_ai_service
+from metrics import Counter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PREGENERATED = Counter('health_content_pregenerated', 'Health content pairs generated by the nightly pipeline',
+                       ['result'])
+
+# USSD topic key -> topic the content is generated about, in menu order
+HEALTH_TOPICS = {
+    'covid': 'COVID-19',
+    'maternal': 'maternal health',
+    'chronic': 'chronic diseases such as diabetes and hypertension',
+    'firstaid': 'first aid'
+}
+
+# Languages offered on the USSD language menu
+LANGUAGES = ('en', 'sw', 'fr', 'om', 'so', 'am')
+
+# The AI services know Oromo by its older code
+AI_LANGUAGE_CODES = {'om': 'or'}
+
+DEFAULT_CONTENT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'health_content.json')
+
+# Saved files of another format are ignored and regenerated. Format 1 and 2
+# files could hold English content under other languages.
+CONTENT_FORMAT = 3
+
+
+def is_localized(generated, language):
+    """
+    Whether generated content is in the language it was asked for
+
+    Args:
+        generated (dict): Content from generate_health_education()
+        language (str): Language code it was generated for
+
+    Returns:
+        bool: True only if the content reports being written in the
+        language (the AI service's 'language' field), so English answers
+        and offline content with a 'language_note' are not localized
+    """
+    if language == 'en':
+        return True
+    reported = str(generated.get('language') or '').strip().lower()
+    return not generated.get('language_note') and reported == language
+
+
+def format_content(generated):
+    """
+    Turn generated education content into plain text for USSD and SMS
+
+    Args:
+        generated (dict): Content from generate_health_education()
+
+    Returns:
+        dict: 'title', 'summary' (the overview) and 'content' (overview,
+        key points and prevention), or None if the content is unusable
+    """
+    if not generated or not generated.get('title') or not generated.get('overview'):
+        return None
+    content = generated['overview']
+    for heading, field in (('Key Points', 'key_points'), ('Prevention', 'prevention')):
+        items = generated.get(field) or []
+        if items:
+            content += f"\n\n{heading}:\n" + "\n".join(f"{i}. {item}" for i, item in enumerate(items, 1))
+    return {'title': generated['title'], 'summary': generated['overview'], 'content': content}
+
+
+class ContentStore:
+    """
+    Health content indexed by (topic, language)
+
+    Args:
+        path (str, optional): JSON file the content is saved to and loaded from
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.generated_at = None
+        self._content = {}
+
+    def get(self, topic, language):
+        """
+        Look up content
+
+        Returns:
+            dict: 'title', 'summary' and 'content', or None
+        """
+        return self._content.get((topic, language))
+
+    def replace(self, content, generated_at=None):
+        """
+        Swap in a complete set of content at once, so readers never see a half-built store
+
+        Args:
+            content (dict): (topic, language) -> formatted content
+            generated_at (float, optional): time.time() of the generation
+        """
+        self._content = dict(content)
+        self.generated_at = generated_at or time.time()
+
+    def load(self):
+        """
+        Load content saved by an earlier run
+
+        Returns:
+            bool: True if content was loaded
+        """
+        if not self.path:
+            return False
+        try:
+            with open(self.path, encoding='utf-8') as content_file:
+                saved = json.load(content_file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load health content from {self.path}: {str(e)}")
+            return False
+        if saved.get('format') != CONTENT_FORMAT:
+            logger.info(f"Ignoring health content in {self.path} saved in an older format")
+            return False
+        content = {(entry['topic'], entry['language']): entry['content'] for entry in saved['entries']}
+        self.replace(content, saved.get('generated_at'))
+        return True
+
+    def save(self):
+        """Write the content to the store's file"""
+        if not self.path:
+            return
+        entries = [{'topic': topic, 'language': language, 'content': content}
+                   for (topic, language), content in sorted(self._content.items())]
+        temp_path = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as content_file:
+                json.dump({'format': CONTENT_FORMAT, 'generated_at': self.generated_at, 'entries': entries},
+                          content_file,
+                          ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not save health content to {self.path}: {str(e)}")
+
+    def __len__(self):
+        return len(self._content)
+
+
+def generate_pair(generate, topic, language):
+    """
+    Generate the content for one (topic, language) pair
+
+    Falls back to the offline mock service if the AI service fails or
+    returns something unusable. Content that is not in the pair's language
+    (see is_localized) is not used.
+
+    Returns:
+        dict: Formatted content, or None
+    """
+    subject = HEALTH_TOPICS.get(topic, topic)
+    ai_language = AI_LANGUAGE_CODES.get(language, language)
+    try:
+        generated = generate(subject, ai_language)
+        content = format_content(generated)
+        if content is not None and is_localized(generated, ai_language):
+            PREGENERATED.inc(result='generated')
+            return content
+        if content is not None:
+            # The AI service answered in another language, usually English
+            PREGENERATED.inc(result='not_localized')
+            return None
+        logger.warning(f"Unusable health content for {topic}/{language}; using offline content")
+    except Exception as e:
+        logger.warning(f"Error generating health content for {topic}/{language}, using offline content: {str(e)}")
+    generated = mock_ai_service.generate_health_education(subject, ai_language)
+    if not is_localized(generated, ai_language):
+        PREGENERATED.inc(result='not_localized')
+        return None
+    content = format_content(generated)
+    PREGENERATED.inc(result='fallback' if content is not None else 'failed')
+    return content
+
+
+def pregenerate(store, generate, topics=None, languages=LANGUAGES, workers=4):
+    """
+    Generate content for every topic and language and swap it into the store
+
+    Args:
+        store (ContentStore): Store to fill
+        generate (callable): generate_health_education(topic, language) of the AI service
+        topics (iterable, optional): Topic keys; all HEALTH_TOPICS by default
+        languages (iterable): Language codes
+        workers (int): Pairs generated at the same time
+
+    Returns:
+        int: Number of pairs with content
+    """
+    pairs = [(topic, language) for topic in (topics or HEALTH_TOPICS) for language in languages]
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='health-content') as pool:
+        results = list(pool.map(lambda pair: generate_pair(generate, *pair), pairs))
+
+    content = {pair: result for pair, result in zip(pairs, results) if result is not None}
+    # Keep yesterday's content for any pair that failed completely
+    for pair in pairs:
+        if pair not in content and store.get(*pair) is not None:
+            content[pair] = store.get(*pair)
+    store.replace(content)
+    store.save()
+    logger.info(f"Pre-generated health content for {len(content)} of {len(pairs)} topic/language pairs "
+                f"in {time.monotonic() - start:.1f}s")
+    return len(content)
+
+
+class NightlyPregeneration:
+    """
+    Regenerate the health content once a day
+
+    Args:
+        store (ContentStore): Store to refresh
+        generate (callable): generate_health_education of the AI service
+        hour (int): Hour of the day (local time) to run at
+        workers (int): Pairs generated at the same time
+    """
+    def __init__(self, store, generate, hour=2, workers=4):
+        self.store = store
+        self.generate = generate
+        self.hour = hour
+        self.workers = workers
+        self._stopping = threading.Event()
+        self._worker = None
+
+    def next_run(self, now=None):
+        """The next datetime the pipeline runs at"""
+        now = now or datetime.now()
+        run_at = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        return run_at if run_at > now else run_at + timedelta(days=1)
+
+    def start(self):
+        """Load saved content (generating it now if there is none) and start the nightly thread"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stopping.clear()
+        self._worker = threading.Thread(target=self._run, name='health-content', daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._worker:
+            self._worker.join(timeout=5)
+
+    def _run(self):
+        if not self.store.load():
+            self._pregenerate()
+        while not self._stopping.wait((self.next_run() - datetime.now()).total_seconds()):
+            self._pregenerate()
+
+    def _pregenerate(self):
+        try:
+            pregenerate(self.store, self.generate, workers=self.workers)
+        except Exception as e:
+            logger.error(f"Health content pre-generation failed: {str(e)}")
+
+
+health_content = ContentStore(os.environ.get('HEALTH_CONTENT_FILE', DEFAULT_CONTENT_FILE))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate USSD health content for every topic and language")
+    parser.add_argument('--workers', type=int, default=4, help="Pairs generated at once (default: %(default)s)")
+    parser.add_argument('--mock', action='store_true', help="Use the offline mock service only")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.mock:
+        generate = mock_ai_service.generate_health_education
+    else:
+        import ai_service
+        generate = ai_service.generate_health_education
+    count = pregenerate(health_content, generate, workers=args.workers)
+    print(f"Wrote {count} topic/language pairs to {health_content.path}")
+    return 0 if count else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Full-text search over the health information library
+
+HealthInfo articles are indexed per language in an inverted index (term ->
+{article ID: term frequency}), so a search only touches the postings of the
+query's terms instead of filtering every article. Results are ranked with
+BM25, and titles count twice. Text is lowercased, split into words, stripped
+of stop words and stemmed: a light suffix stemmer for English and a noun
+class / infinitive prefix stemmer for Swahili, so "vaccines" finds
+"vaccination" and "watoto" finds "mtoto". Other languages are tokenized
+without stemming.
+
+Articles are also tagged with the USSD health topics (see health_content)
+whose keywords they contain, which the USSD menu and the dashboard
+categories use.
+
+Like the appointment slot calendar, the index follows db['health_info']:
+articles added with HealthInfo.create() are indexed on the next query, and
+a reseeded database is indexed from scratch.
+
+Measure query times on a synthetic library with:
+
+    python health_search.py --articles 5000
+"""
+
+import argparse
+import heapq
+import math
+import random
+import re
+import sys
+import threading
+import time
+
+from health_content import HEALTH_TOPICS
+from models import db
+
+WORD = re.compile(r'\w+')
+
+STOP_WORDS = {
+    'en': frozenset('a an and are as at be been by can do for from has have how if in into is it its of on '
+                    'or so than that the their them they this to was were what when which will with you '
+                    'your'.split()),
+    'sw': frozenset('au cha hii hivyo hiyo hizi huo ili juu kama katika kila kwa kwenye la lakini na ni pia '
+                    'sana tu vya wa ya yako yake za'.split())
+}
+
+# Keywords that tag an article with a USSD health topic, before analysis.
+# Languages without a list of their own use the English one.
+TOPIC_KEYWORDS = {
+    'en': {
+        'covid': 'covid coronavirus corona mask',
+        'maternal': 'maternal pregnancy pregnant prenatal antenatal birth breastfeeding newborn mother',
+        'chronic': 'chronic diabetes hypertension pressure asthma',
+        'firstaid': 'aid burns bleeding wound fracture choking cpr'
+    },
+    'sw': {
+        'covid': 'covid korona barakoa',
+        'maternal': 'uzazi ujauzito mjamzito kujifungua kunyonyesha mama',
+        'chronic': 'sugu kisukari shinikizo pumu',
+        'firstaid': 'jeraha kuungua kuvunjika kutokwa'
+    }
+}
+
+EN_SUFFIXES = ('ational', 'ations', 'ation', 'ators', 'ator', 'ments', 'ment', 'ness', 'ings', 'ing',
+               'ated', 'ates', 'ate', 'ies', 'ied', 'ed', 'es', 'ly', 's')
+
+# Noun class and infinitive prefixes, longest first
+SW_PREFIXES = ('wa', 'ma', 'mi', 'vi', 'ki', 'ku', 'm', 'u')
+
+VOWELS = frozenset('aeiou')
+
+
+def stem_english(word):
+    """Strip common English suffixes, e.g. vaccinated, vaccines -> vaccin"""
+    if len(word) <= 3:
+        return word
+    for suffix in EN_SUFFIXES:
+        if not word.endswith(suffix) or len(word) - len(suffix) < 3:
+            continue
+        if suffix == 's' and word[-2] in 'siu':  # glass, virus, diagnosis
+            break
+        word = word[:-len(suffix)] + ('y' if suffix in ('ies', 'ied') else '')
+        break
+    if len(word) > 4 and word.endswith('e'):
+        word = word[:-1]
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in VOWELS and word[-1] not in 'lsz':
+        word = word[:-1]  # running -> run
+    return word
+
+
+def stem_swahili(word):
+    """Strip one noun class or infinitive prefix, e.g. watoto, mtoto -> toto"""
+    for prefix in SW_PREFIXES:
+        rest = word[len(prefix):]
+        if word.startswith(prefix) and len(rest) >= 4:
+            # Single-letter prefixes only come before a consonant (mtoto, but not muhimu)
+            if len(prefix) == 1 and rest[0] in VOWELS:
+                continue
+            return rest
+    return word
+
+
+STEMMERS = {'en': stem_english, 'sw': stem_swahili}
+
+
+def analyze(text, language):
+    """
+    Turn text into index terms
+
+    Args:
+        text (str): Text to analyze
+        language (str): Language code of the text
+
+    Returns:
+        list: Terms in text order, stop words removed
+    """
+    stop_words = STOP_WORDS.get(language, frozenset())
+    stem = STEMMERS.get(language)
+    terms = []
+    for word in WORD.findall((text or '').lower()):
+        if word in stop_words:
+            continue
+        terms.append(stem(word) if stem else word)
+    return terms
+
+
+class HealthIndex:
+    """
+    Inverted index over HealthInfo articles with BM25 ranking
+
+    Args:
+        k1 (float): BM25 term frequency saturation
+        b (float): BM25 document length normalization
+    """
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._topic_terms = {}  # language -> {topic: set of terms}
+        self._reset()
+        self._source = None
+        self._indexed = 0
+
+    def _reset(self):
+        self._articles = {}  # article ID -> HealthInfo
+        self._postings = {}  # language -> {term: {article ID: term frequency}}
+        self._lengths = {}  # language -> {article ID: terms in the article}
+        self._total_lengths = {}  # language -> terms in all articles
+        self._topics = {}  # language -> {topic: set of article IDs}
+        # language -> {term: [(article ID, BM25 weight)]}, dropped when an article in the language is added
+        self._weights = {}
+
+    def _terms_for_topics(self, language):
+        if language not in self._topic_terms:
+            keywords = TOPIC_KEYWORDS.get(language, TOPIC_KEYWORDS['en'])
+            self._topic_terms[language] = {topic: set(analyze(keywords.get(topic, ''), language))
+                                           for topic in HEALTH_TOPICS}
+        return self._topic_terms[language]
+
+    def _add(self, info):
+        """Index one article (lock held)"""
+        # The title counts twice
+        terms = analyze(info.title, info.language) * 2 + analyze(info.content, info.language)
+        frequencies = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+
+        postings = self._postings.setdefault(info.language, {})
+        for term, frequency in frequencies.items():
+            postings.setdefault(term, {})[info.id] = frequency
+        self._lengths.setdefault(info.language, {})[info.id] = len(terms)
+        self._total_lengths[info.language] = self._total_lengths.get(info.language, 0) + len(terms)
+        self._articles[info.id] = info
+        # Document frequencies and the average length changed
+        self._weights.pop(info.language, None)
+
+        topics = self._topics.setdefault(info.language, {})
+        for topic, topic_terms in self._terms_for_topics(info.language).items():
+            if not topic_terms.isdisjoint(frequencies):
+                topics.setdefault(topic, set()).add(info.id)
+
+    def _sync(self):
+        """Index articles created since the last query (lock held)"""
+        articles = db['health_info']
+        if articles is not self._source or len(articles) < self._indexed:
+            # The database was reseeded
+            self._reset()
+            self._source = articles
+            self._indexed = 0
+        for info in articles[self._indexed:]:
+            self._add(info)
+        self._indexed = len(articles)
+
+    def search(self, query, language, topic=None, limit=10):
+        """
+        Find the articles that best match a query
+
+        Args:
+            query (str): Search text
+            language (str): Only search articles in this language
+            topic (str, optional): Only return articles tagged with this topic
+            limit (int): Maximum number of results
+
+        Returns:
+            list: HealthInfo articles, best match first
+        """
+        return self._rank(set(analyze(query, language)), language, topic, limit)
+
+    def _term_weights(self, term, language):
+        """BM25 weight of a term in each article containing it (lock held)"""
+        weights = self._weights.setdefault(language, {})
+        if term not in weights:
+            matches = self._postings.get(language, {}).get(term, {})
+            lengths = self._lengths[language]
+            count = len(lengths)
+            average_length = self._total_lengths[language] / count
+            idf = math.log(1 + (count - len(matches) + 0.5) / (len(matches) + 0.5))
+            weights[term] = [
+                (article_id, idf * frequency * (self.k1 + 1) /
+                 (frequency + self.k1 * (1 - self.b + self.b * lengths[article_id] / average_length)))
+                for article_id, frequency in matches.items()
+            ]
+        return weights[term]
+
+    def _rank(self, terms, language, topic, limit):
+        """BM25-rank the articles containing any of the terms"""
+        with self._lock:
+            self._sync()
+            if not self._lengths.get(language):
+                return []
+            allowed = self._topics.get(language, {}).get(topic, set()) if topic else None
+
+            scores = {}
+            for term in terms:
+                for article_id, weight in self._term_weights(term, language):
+                    if allowed is None or article_id in allowed:
+                        scores[article_id] = scores.get(article_id, 0.0) + weight
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+            return [self._articles[article_id] for article_id, _ in best]
+
+    def for_topic(self, topic, language, limit=10):
+        """
+        Articles tagged with a USSD health topic
+
+        Articles are ranked by how well they match the topic's keywords.
+
+        Args:
+            topic (str): Topic key, e.g. 'covid'
+            language (str): Language code
+            limit (int): Maximum number of results
+
+        Returns:
+            list: HealthInfo articles, best match first
+        """
+        with self._lock:
+            terms = self._terms_for_topics(language).get(topic, set())
+        return self._rank(terms, language, topic, limit)
+
+    def topics_of(self, info):
+        """Topic keys an article is tagged with"""
+        with self._lock:
+            self._sync()
+            topics = self._topics.get(info.language, {})
+            return [topic for topic in HEALTH_TOPICS if info.id in topics.get(topic, ())]
+
+    def topic_counts(self, language=None):
+        """
+        Number of articles tagged with each topic
+
+        Args:
+            language (str, optional): Only count articles in this language
+
+        Returns:
+            dict: Topic key -> number of articles
+        """
+        with self._lock:
+            self._sync()
+            counts = dict.fromkeys(HEALTH_TOPICS, 0)
+            for article_language, topics in self._topics.items():
+                if language is None or article_language == language:
+                    for topic, article_ids in topics.items():
+                        counts[topic] += len(article_ids)
+            return counts
+
+
+health_index = HealthIndex()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure health library search on a synthetic library")
+    parser.add_argument('--articles', type=int, default=5000, help="Articles to index (default: %(default)s)")
+    parser.add_argument('--queries', type=int, default=2000, help="Queries to run (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    from models import HealthInfo
+    from metrics import percentile
+
+    random.seed(1)
+    words = {
+        'en': ('malaria fever mosquito nets water hygiene hands washing vaccines children pregnancy '
+               'nutrition diet exercise blood pressure diabetes sugar cough breathing clinic rest sleep '
+               'wounds burns bleeding mask covid mothers newborn breastfeeding medicine doctor').split(),
+        'sw': ('malaria homa mbu chandarua maji usafi mikono kuosha chanjo watoto ujauzito lishe mazoezi '
+               'damu shinikizo kisukari sukari kikohozi kupumua kliniki kupumzika usingizi majeraha '
+               'kuungua barakoa korona mama mtoto kunyonyesha dawa daktari').split()
+    }
+
+    # Each article is about a few health words, padded with filler words of Zipf-like frequency
+    filler = [''.join(random.choices('abcdefghijklmnopqrstuvwxyz', k=random.randint(3, 9))) for _ in range(5000)]
+    filler_weights = [1 / rank for rank in range(1, len(filler) + 1)]
+
+    db['health_info'] = []
+    for number in range(args.articles):
+        language = 'sw' if number % 2 else 'en'
+        subject = random.sample(words[language], 3)
+        title = ' '.join(subject)
+        content = ' '.join(random.choices(subject, k=10) +
+                           random.choices(filler, filler_weights, k=random.randint(30, 120)))
+        HealthInfo.create(title, content, language)
+
+    start = time.perf_counter()
+    health_index.search('warm up', 'en')
+    print(f"Indexed {args.articles} articles in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    for name, run in (('search', lambda language: health_index.search(
+                          ' '.join(random.choices(words[language], k=3)), language, limit=5)),
+                      ('topic', lambda language: health_index.for_topic(
+                          random.choice(list(HEALTH_TOPICS)), language, limit=5))):
+        timings = []
+        for number in range(args.queries):
+            begin = time.perf_counter()
+            run('sw' if number % 2 else 'en')
+            timings.append(time.perf_counter() - begin)
+        timings.sort()
+        print(f"{name:7} p50 {percentile(timings, 50) * 1e6:6.0f} us, p95 {percentile(timings, 95) * 1e6:6.0f} us, "
+              f"p99 {percentile(timings, 99) * 1e6:6.0f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,788 @@
+#!/usr/bin/env python3
+"""
+Deadline-bound, hedged dispatch of LLM requests for Tujali Telehealth
+
+Calling OpenAI and only trying Anthropic after OpenAI has failed makes the
+worst case the sum of both providers' timeouts. LlmDispatcher runs provider
+calls on a thread pool instead:
+
+- every request has a deadline, and each provider call gets the time left
+  until it as its HTTP timeout
+- if the first provider has not answered within its recent p95 latency, the
+  next provider is started as a hedge and whichever answers first wins
+- a provider that fails hands over to the next one straight away
+- once there is a winner, calls that have not started yet are cancelled and
+  the answers of calls still in flight are discarded
+- providers whose circuit breaker is open are skipped, so an over-quota
+  provider costs nothing until a half-open probe finds it working again
+
+Answers are parsed inside the provider call, so a provider that returns
+malformed JSON counts as failed and the hedge can still win.
+
+LlmDispatcher.stream() streams the answer instead and reports each tip or
+point as soon as its part of the JSON has arrived (IncrementalJsonParser), so
+pages can show the first result long before the whole answer is complete.
+
+Benchmark against local stub servers that speak the OpenAI and Anthropic
+HTTP APIs:
+
+    python llm_dispatch.py --requests 200 --openai-latency 0.2 --slow-every 10
+    python llm_dispatch.py --requests 20 --stream
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ai_prompts import estimate_tokens
+from circuit_breaker import get_breaker
+from metrics import Counter, Histogram, percentile
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LLM_CALLS = Counter('llm_calls', 'LLM provider calls by outcome', ['provider', 'result'])
+LLM_LATENCY = Histogram('llm_call_seconds', 'Latency of successful LLM provider calls', ['provider'],
+                        buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0))
+LLM_HEDGES = Counter('llm_hedges', 'Fallback providers started before the first one answered', ['provider'])
+LLM_PROMPT_TOKENS = Histogram('llm_prompt_tokens', 'Estimated input tokens per LLM request',
+                              buckets=(250, 500, 1000, 1500, 2000, 4000, 8000))
+LLM_TOKENS = Counter('llm_tokens', 'Tokens used by successful LLM provider calls, as reported by the provider',
+                     ['provider', 'kind'])
+
+
+class LlmError(Exception):
+    """No provider produced an answer before the deadline"""
+
+
+class LlmProvider:
+    """
+    Base class for LLM providers
+
+    Providers turn a system prompt and a user prompt into the model's raw
+    text answer. They are called from the dispatcher's worker threads.
+    """
+    name = 'base'
+
+    def complete(self, system, prompt, timeout, usage=None, cancelled=None):
+        """
+        Ask the model for an answer
+
+        Reads the answer as a stream so that a cancelled call closes its
+        connection at the next chunk instead of running to its timeout.
+
+        Args:
+            system (str): System prompt
+            prompt (str): User prompt
+            timeout (float): Seconds the call may take
+            usage (dict, optional): Filled with the 'prompt_tokens' and
+                'completion_tokens' the provider reports
+            cancelled (threading.Event, optional): Once set, the call stops
+
+        Returns:
+            str: The model's answer
+
+        Raises:
+            LlmError: If the call was cancelled
+        """
+        deadline_at = time.monotonic() + timeout
+        pieces = []
+        chunks = self.stream(system, prompt, timeout, usage)
+        try:
+            for chunk in chunks:
+                if cancelled is not None and cancelled.is_set():
+                    raise LlmError("cancelled")
+                if time.monotonic() > deadline_at:
+                    raise LlmError("deadline exceeded")
+                pieces.append(chunk)
+        finally:
+            chunks.close()
+        return ''.join(pieces)
+
+    def stream(self, system, prompt, timeout, usage=None):
+        """
+        Ask the model for an answer and yield it as it is generated
+
+        Args:
+            system (str): System prompt
+            prompt (str): User prompt
+            timeout (float): Seconds the call may take
+            usage (dict, optional): Filled with the 'prompt_tokens' and
+                'completion_tokens' the provider reports, once it reports them
+
+        Yields:
+            str: Successive pieces of the answer
+        """
+        raise NotImplementedError
+
+
+class OpenAIProvider(LlmProvider):
+    """
+    Chat completions through the OpenAI API, in JSON mode
+
+    Args:
+        client (OpenAI): Configured OpenAI client
+        model (str): Model to use
+        temperature (float): Sampling temperature
+    """
+    name = 'openai'
+
+    def __init__(self, client, model="gpt-3.5-turbo", temperature=0.3):
+        # The dispatcher hedges instead of retrying, and retries would outlive the deadline
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.temperature = temperature
+
+    def stream(self, system, prompt, timeout, usage=None):
+        chunks = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=self.temperature,
+            timeout=timeout,
+            stream=True,
+            # The last chunk then carries the token counts
+            stream_options={"include_usage": True}
+        )
+        try:
+            for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if usage is not None and chunk.usage:
+                    usage['prompt_tokens'] = chunk.usage.prompt_tokens
+                    usage['completion_tokens'] = chunk.usage.completion_tokens
+        finally:
+            chunks.close()
+
+
+class AnthropicProvider(LlmProvider):
+    """
+    Messages through the Anthropic API, asked to answer in JSON
+
+    Args:
+        client (Anthropic): Configured Anthropic client
+        model (str): Model to use
+        max_tokens (int): Maximum tokens in the answer
+    """
+    name = 'anthropic'
+
+    def __init__(self, client, model="claude-3-5-sonnet-20241022", max_tokens=1024):
+        self.client = client.with_options(max_retries=0)
+        self.model = model
+        self.max_tokens = max_tokens
+
+    def stream(self, system, prompt, timeout, usage=None):
+        with self.client.messages.stream(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            system=f"{system} Always respond in valid JSON format.",
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            timeout=timeout
+        ) as stream:
+            for event in stream:
+                if event.type == 'message_start' and usage is not None:
+                    usage['prompt_tokens'] = event.message.usage.input_tokens
+                elif event.type == 'content_block_delta' and event.delta.type == 'text_delta':
+                    yield event.delta.text
+                elif event.type == 'message_delta' and usage is not None:
+                    usage['completion_tokens'] = event.usage.output_tokens
+
+
+class LlmDispatcher:
+    """
+    Send each request to the providers in order, hedging slow ones
+
+    Args:
+        providers (list): LlmProvider instances in order of preference
+        deadline (float): Seconds a request may take in total
+        hedge_after (float): Seconds before hedging while a provider has too
+            few samples for a p95
+        hedge_percentile (float): Latency percentile after which to hedge
+        min_samples (int): Successful calls needed before the percentile is used
+        max_workers (int): Threads making provider calls
+        breaker_options (dict, optional): CircuitBreaker arguments for the
+            providers' breakers
+    """
+    def __init__(self, providers, deadline=20.0, hedge_after=3.0, hedge_percentile=95, min_samples=20,
+                 max_workers=8, breaker_options=None):
+        self.providers = list(providers)
+        self.breakers = {provider.name: get_breaker(provider.name, **(breaker_options or {}))
+                         for provider in self.providers}
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies = {provider.name: deque(maxlen=200) for provider in self.providers}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm')
+
+    def hedge_delay(self, provider):
+        """
+        Seconds to wait for a provider before starting the next one
+
+        Returns:
+            float: The provider's recent p95 latency, or hedge_after while
+            there are too few samples
+        """
+        with self._lock:
+            samples = sorted(self._latencies.get(provider.name, ()))
+        if len(samples) < self.min_samples:
+            return self.hedge_after
+        return percentile(samples, self.hedge_percentile)
+
+    def complete(self, system, prompt, parse=None, deadline=None):
+        """
+        Get an answer from the first provider to produce one
+
+        Args:
+            system (str): System prompt
+            prompt (str): User prompt
+            parse (callable, optional): Applied to the answer, e.g. json.loads;
+                an exception counts as that provider failing
+            deadline (float, optional): Seconds allowed instead of the default
+
+        Returns:
+            The (parsed) answer of the winning provider
+
+        Raises:
+            LlmError: If every provider failed, was skipped by its open
+            circuit, or the deadline passed
+        """
+        deadline_at = time.monotonic() + (self.deadline if deadline is None else deadline)
+        LLM_PROMPT_TOKENS.observe(estimate_tokens(system) + estimate_tokens(prompt))
+        waiting = list(self.providers)
+        running = {}  # future -> (provider, its cancel flag)
+        errors = []
+
+        def start_next():
+            """Start the next provider whose circuit allows it; returns when to hedge, or None"""
+            while waiting:
+                provider = waiting.pop(0)
+                if not self.breakers[provider.name].allow():
+                    LLM_CALLS.inc(provider=provider.name, result='circuit_open')
+                    errors.append(f"{provider.name}: circuit open")
+                    continue
+                cancelled = threading.Event()
+                future = self._executor.submit(self._call, provider, system, prompt, parse, deadline_at,
+                                               cancelled)
+                running[future] = (provider, cancelled)
+                return time.monotonic() + self.hedge_delay(provider)
+            return None
+
+        try:
+            hedge_at = start_next()
+            while running:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    errors.append("deadline exceeded")
+                    break
+                wake_at = min(deadline_at, hedge_at) if waiting else deadline_at
+                done, _ = wait(running, timeout=max(wake_at - now, 0), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    provider, _ = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors.append(f"{provider.name}: {str(e)}")
+                        continue
+                    return result
+
+                if waiting and (not running or time.monotonic() >= hedge_at):
+                    if running:
+                        LLM_HEDGES.inc(provider=waiting[0].name)
+                        logger.info(f"Hedging LLM request with {waiting[0].name}")
+                    hedge_at = start_next()
+        finally:
+            # Losers: queued calls never start, running ones stop at their next chunk
+            for future, (provider, cancelled) in running.items():
+                cancelled.set()
+                if future.cancel():
+                    self.breakers[provider.name].release()
+
+        if not self.providers:
+            errors.append("no providers configured")
+        raise LlmError("; ".join(errors))
+
+    def stream(self, system, prompt, on_item, deadline=None):
+        """
+        Stream an answer, reporting its parts as they complete
+
+        Streams are not hedged, since the first part arrives quickly and a
+        second stream would double the cost. A provider that fails before
+        anything was reported hands over to the next one; once parts have
+        been reported the request fails instead, as the caller has shown
+        part of that answer already.
+
+        Args:
+            system (str): System prompt
+            prompt (str): User prompt
+            on_item (callable): Called as on_item(field, index, value) for each
+                top-level field of the JSON answer, and for each element of a
+                top-level list (index is None for fields that are not lists)
+            deadline (float, optional): Seconds allowed instead of the default
+
+        Returns:
+            dict: The complete parsed answer
+
+        Raises:
+            LlmError: If no provider produced a complete answer before the deadline
+        """
+        deadline_at = time.monotonic() + (self.deadline if deadline is None else deadline)
+        LLM_PROMPT_TOKENS.observe(estimate_tokens(system) + estimate_tokens(prompt))
+        errors = []
+        for provider in self.providers:
+            breaker = self.breakers[provider.name]
+            if not breaker.allow():
+                LLM_CALLS.inc(provider=provider.name, result='circuit_open')
+                errors.append(f"{provider.name}: circuit open")
+                continue
+            timeout = deadline_at - time.monotonic()
+            if timeout <= 0:
+                breaker.release()
+                errors.append("deadline exceeded")
+                break
+
+            parser = IncrementalJsonParser()
+            reported = 0
+            usage = {}
+            start = time.monotonic()
+            chunks = provider.stream(system, prompt, timeout, usage)
+            try:
+                # Read to the end of the stream even once the answer is complete, since the
+                # token counts come last
+                for chunk in chunks:
+                    if not parser.complete:
+                        for field, index, value in parser.feed(chunk):
+                            on_item(field, index, value)
+                            reported += 1
+                    if time.monotonic() > deadline_at:
+                        raise LlmError("deadline exceeded")
+                result = parser.result()
+            except Exception as e:
+                breaker.record_failure(str(e))
+                LLM_CALLS.inc(provider=provider.name, result='error')
+                logger.warning(f"{provider.name} streaming error: {str(e)}")
+                errors.append(f"{provider.name}: {str(e)}")
+                if reported:
+                    break
+                continue
+            finally:
+                chunks.close()
+
+            breaker.record_success()
+            self._record(provider, time.monotonic() - start, usage, 'ok')
+            return result
+
+        if not self.providers:
+            errors.append("no providers configured")
+        raise LlmError("; ".join(errors))
+
+    def close(self):
+        """Stop the worker threads"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _call(self, provider, system, prompt, parse, deadline_at, cancelled):
+        """Make one provider call on a worker thread, stopping once cancelled is set"""
+        breaker = self.breakers[provider.name]
+        timeout = deadline_at - time.monotonic()
+        if cancelled.is_set() or timeout <= 0:
+            breaker.release()
+            LLM_CALLS.inc(provider=provider.name, result='cancelled')
+            raise LlmError("cancelled")
+
+        usage = {}
+        start = time.monotonic()
+        try:
+            answer = provider.complete(system, prompt, timeout, usage, cancelled)
+            result = parse(answer) if parse else answer
+        except Exception as e:
+            if cancelled.is_set():
+                # Lost to another provider; says nothing about this one's health
+                breaker.release()
+                LLM_CALLS.inc(provider=provider.name, result='cancelled')
+            else:
+                breaker.record_failure(str(e))
+                LLM_CALLS.inc(provider=provider.name, result='error')
+                logger.warning(f"{provider.name} error: {str(e)}")
+            raise
+
+        elapsed = time.monotonic() - start
+        breaker.record_success()
+        with self._lock:
+            self._latencies[provider.name].append(elapsed)
+        self._record(provider, elapsed, usage, 'cancelled' if cancelled.is_set() else 'ok')
+        return result
+
+    def _record(self, provider, elapsed, usage, result):
+        """Count a successful call's latency and tokens and log them"""
+        LLM_LATENCY.observe(elapsed, provider=provider.name)
+        LLM_CALLS.inc(provider=provider.name, result=result)
+        for kind in ('prompt', 'completion'):
+            if usage.get(f'{kind}_tokens'):
+                LLM_TOKENS.inc(usage[f'{kind}_tokens'], provider=provider.name, kind=kind)
+        logger.info(f"{provider.name} answered in {elapsed:.2f}s "
+                    f"({usage.get('prompt_tokens', '?')} prompt / {usage.get('completion_tokens', '?')} "
+                    f"completion tokens{', discarded' if result == 'cancelled' else ''})")
+
+
+# ============== STREAMING ==============
+
+class IncrementalJsonParser:
+    """
+    Pull finished values out of a JSON object while it is still arriving
+
+    feed() scans only the new text and returns the values that completed in
+    it: each top-level field, except that lists are reported element by
+    element. Any text before the opening brace (such as a code fence) is
+    skipped.
+    """
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._root_start = None
+        self._root_end = None
+        self._stack = []  # open containers: kind, current key, element index, expecting a key, start record
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+        self._string_record = None  # start record of a string value; None for keys
+        self._scalar_record = None
+
+    @property
+    def complete(self):
+        """True once the closing brace of the object has arrived"""
+        return self._root_end is not None
+
+    def feed(self, text):
+        """
+        Add the next piece of the answer
+
+        Args:
+            text (str): Text received since the last call
+
+        Returns:
+            list: (field, index, value) tuples for values completed by this text
+
+        Raises:
+            ValueError: If a completed value is not valid JSON
+        """
+        self._buffer += text
+        buffer = self._buffer
+        items = []
+        i = self._pos
+        while i < len(buffer) and self._root_end is None:
+            ch = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string_record is None:
+                        self._stack[-1]['key'] = json.loads(buffer[self._string_start:i + 1])
+                    else:
+                        self._finish(self._string_record, i + 1, items)
+            elif not self._stack:
+                if ch == '{':
+                    self._root_start = i
+                    self._stack.append({'kind': '{', 'key': None, 'index': 0, 'expect_key': True, 'record': None})
+            else:
+                if self._scalar_record is not None and (ch in ',]}' or ch.isspace()):
+                    self._finish(self._scalar_record, i, items)
+                    self._scalar_record = None
+                top = self._stack[-1]
+                if ch == '"':
+                    self._in_string = True
+                    self._string_start = i
+                    is_key = top['kind'] == '{' and top['expect_key']
+                    self._string_record = None if is_key else self._start(i)
+                elif ch in '{[':
+                    self._stack.append({'kind': ch, 'key': None, 'index': 0, 'expect_key': ch == '{',
+                                        'record': self._start(i)})
+                elif ch in '}]':
+                    frame = self._stack.pop()
+                    if self._stack:
+                        self._finish(frame['record'], i + 1, items, kind=frame['kind'])
+                    else:
+                        self._root_end = i + 1
+                elif ch == ':':
+                    top['expect_key'] = False
+                elif ch == ',':
+                    if top['kind'] == '[':
+                        top['index'] += 1
+                    else:
+                        top['expect_key'] = True
+                elif not ch.isspace() and self._scalar_record is None:
+                    self._scalar_record = self._start(i)
+            i += 1
+        self._pos = i
+        return items
+
+    def result(self):
+        """
+        The complete object
+
+        Raises:
+            ValueError: If the object has not been completed
+        """
+        if self._root_end is None:
+            raise ValueError("Incomplete JSON answer")
+        return json.loads(self._buffer[self._root_start:self._root_end])
+
+    def _start(self, pos):
+        """Start record (position, (field, index)) of a value; the field is None below list elements"""
+        depth = len(self._stack)
+        if depth == 1:
+            return pos, (self._stack[0]['key'], None)
+        if depth == 2 and self._stack[1]['kind'] == '[':
+            return pos, (self._stack[0]['key'], self._stack[1]['index'])
+        return pos, None
+
+    def _finish(self, record, end, items, kind=None):
+        start, path = record
+        if path is None:
+            return
+        field, index = path
+        if index is None and kind == '[':
+            # Lists were reported element by element
+            return
+        items.append((field, index, json.loads(self._buffer[start:end])))
+
+
+def emit_items(result, on_item):
+    """
+    Report a complete answer part by part, as stream() would have
+
+    Used for answers from a cache or the offline service, so pages consume
+    every answer the same way.
+    """
+    for field, value in result.items():
+        if isinstance(value, list):
+            for index, element in enumerate(value):
+                on_item(field, index, element)
+        else:
+            on_item(field, None, value)
+
+
+# ============== STUB SERVERS ==============
+
+def start_stub_server(kind, latency, slow_every=0, slow_latency=5.0, fail_every=0):
+    """
+    Start a local HTTP server answering like the OpenAI or Anthropic API
+
+    Args:
+        kind (str): 'openai' or 'anthropic'
+        latency (float): Seconds each answer takes
+        slow_every (int): Make every Nth answer take slow_latency instead (0: never)
+        slow_latency (float): Seconds a slow answer takes
+        fail_every (int): Make every Nth request fail with HTTP 500 (0: never)
+
+    Returns:
+        ThreadingHTTPServer: The running server; its base URL is
+        http://127.0.0.1:<server.server_port>
+    """
+    lock = threading.Lock()
+    requests_seen = [0]
+    answer = json.dumps({
+        "title": "Stub",
+        "overview": f"Answered by the {kind} stub",
+        "health_tips": [{"title": f"Tip {i}", "description": f"Stub health tip number {i}."} for i in range(1, 4)],
+        "follow_up": "See a health worker if symptoms persist."
+    })
+    completion_tokens = estimate_tokens(answer)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+            with lock:
+                requests_seen[0] += 1
+                n = requests_seen[0]
+            if fail_every and n % fail_every == 0:
+                self._reply(500, {"error": {"message": "stub failure", "type": "server_error"}})
+                return
+            delay = slow_latency if slow_every and n % slow_every == 0 else latency
+            prompt_tokens = estimate_tokens(json.dumps(request.get('messages', [])) + str(request.get('system', '')))
+            if request.get('stream'):
+                include_usage = (request.get('stream_options') or {}).get('include_usage')
+                self._stream(n, delay, prompt_tokens, include_usage)
+                return
+            time.sleep(delay)
+            if kind == 'openai':
+                body = {"id": f"chatcmpl-{n}", "object": "chat.completion", "created": int(time.time()),
+                        "model": "stub", "choices": [{"index": 0, "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": answer}}],
+                        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens}}
+            else:
+                body = {"id": f"msg_{n}", "type": "message", "role": "assistant", "model": "stub",
+                        "content": [{"type": "text", "text": answer}], "stop_reason": "end_turn",
+                        "usage": {"input_tokens": prompt_tokens, "output_tokens": completion_tokens}}
+            self._reply(200, body)
+
+        def _stream(self, n, delay, prompt_tokens, include_usage):
+            """Send the answer as server-sent events, spread evenly over delay seconds"""
+            pieces = [answer[i:i + 12] for i in range(0, len(answer), 12)]
+            if kind == 'openai':
+                events = [(None, {"id": f"chatcmpl-{n}", "object": "chat.completion.chunk",
+                                  "created": int(time.time()), "model": "stub",
+                                  "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+                          for piece in pieces]
+                if include_usage:
+                    events.append((None, {"id": f"chatcmpl-{n}", "object": "chat.completion.chunk",
+                                          "created": int(time.time()), "model": "stub", "choices": [],
+                                          "usage": {"prompt_tokens": prompt_tokens,
+                                                    "completion_tokens": completion_tokens,
+                                                    "total_tokens": prompt_tokens + completion_tokens}}))
+                events.append((None, '[DONE]'))
+            else:
+                events = [('message_start', {"type": "message_start", "message": {
+                              "id": f"msg_{n}", "type": "message", "role": "assistant", "content": [],
+                              "model": "stub", "stop_reason": None, "stop_sequence": None,
+                              "usage": {"input_tokens": prompt_tokens, "output_tokens": 1}}}),
+                          ('content_block_start', {"type": "content_block_start", "index": 0,
+                                                   "content_block": {"type": "text", "text": ""}})]
+                events += [('content_block_delta', {"type": "content_block_delta", "index": 0,
+                                                    "delta": {"type": "text_delta", "text": piece}})
+                           for piece in pieces]
+                events += [('content_block_stop', {"type": "content_block_stop", "index": 0}),
+                           ('message_delta', {"type": "message_delta",
+                                              "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                              "usage": {"output_tokens": completion_tokens}}),
+                           ('message_stop', {"type": "message_stop"})]
+            try:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+                for name, data in events:
+                    time.sleep(delay / len(events))
+                    payload = data if isinstance(data, str) else json.dumps(data)
+                    self.wfile.write(((f"event: {name}\n" if name else '') + f"data: {payload}\n\n").encode('utf-8'))
+                    self.wfile.flush()
+            except OSError:
+                pass
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except OSError:
+                # The client gave up on this call (deadline or lost hedge)
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f'{kind}-stub', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure hedged LLM dispatch against local stub servers")
+    parser.add_argument('--requests', type=int, default=100, help="Requests to send (default: %(default)s)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent requests (default: %(default)s)")
+    parser.add_argument('--openai-latency', type=float, default=0.2,
+                        help="Seconds the OpenAI stub takes (default: %(default)s)")
+    parser.add_argument('--anthropic-latency', type=float, default=0.3,
+                        help="Seconds the Anthropic stub takes (default: %(default)s)")
+    parser.add_argument('--slow-every', type=int, default=10,
+                        help="Make every Nth OpenAI answer slow (default: %(default)s)")
+    parser.add_argument('--slow-latency', type=float, default=5.0,
+                        help="Seconds a slow OpenAI answer takes (default: %(default)s)")
+    parser.add_argument('--fail-every', type=int, default=0,
+                        help="Make every Nth OpenAI request fail (default: never)")
+    parser.add_argument('--deadline', type=float, default=3.0, help="Per-request deadline (default: %(default)s)")
+    parser.add_argument('--no-hedge', action='store_true', help="Only fall back after a failure")
+    parser.add_argument('--stream', action='store_true',
+                        help="Stream the answers and report the time to the first tip")
+    args = parser.parse_args(argv)
+
+    from openai import OpenAI
+    from anthropic import Anthropic
+
+    logging.basicConfig(level=logging.ERROR)
+    openai_stub = start_stub_server('openai', args.openai_latency, args.slow_every, args.slow_latency,
+                                    args.fail_every)
+    anthropic_stub = start_stub_server('anthropic', args.anthropic_latency)
+    providers = [
+        OpenAIProvider(OpenAI(api_key='stub', base_url=f"http://127.0.0.1:{openai_stub.server_port}/v1")),
+        AnthropicProvider(Anthropic(api_key='stub', base_url=f"http://127.0.0.1:{anthropic_stub.server_port}"))
+    ]
+    hedge_after = args.deadline if args.no_hedge else 1.0
+    dispatcher = LlmDispatcher(providers, deadline=args.deadline, hedge_after=hedge_after,
+                               min_samples=sys.maxsize if args.no_hedge else 20,
+                               max_workers=args.concurrency * 2)
+
+    latencies = []
+    winners = {}
+    failures = 0
+
+    first_items = []
+
+    def one(_):
+        start = time.monotonic()
+        first = []
+
+        def on_item(field, index, value):
+            if field == 'health_tips' and not first:
+                first.append(time.monotonic() - start)
+
+        try:
+            if args.stream:
+                result = dispatcher.stream("You are a stub.", "Say hello.", on_item)
+                first_items.extend(first)
+            else:
+                result = dispatcher.complete("You are a stub.", "Say hello.", parse=json.loads)
+        except LlmError:
+            return None, time.monotonic() - start
+        return result['overview'].split()[-2], time.monotonic() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for winner, elapsed in pool.map(one, range(args.requests)):
+            latencies.append(elapsed)
+            if winner is None:
+                failures += 1
+            else:
+                winners[winner] = winners.get(winner, 0) + 1
+    total = time.perf_counter() - start
+    dispatcher.close()
+
+    latencies.sort()
+    print(f"{args.requests} requests in {total:.2f}s; failures: {failures}; answered by: {winners}")
+    print(f"latency p50 {percentile(latencies, 50) * 1000:.0f} ms, p95 {percentile(latencies, 95) * 1000:.0f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+    if first_items:
+        first_items.sort()
+        print(f"first tip p50 {percentile(first_items, 50) * 1000:.0f} ms, "
+              f"p95 {percentile(first_items, 95) * 1000:.0f} ms")
+    hedges = sum(LLM_HEDGES.get(provider=provider.name) for provider in providers)
+    print(f"hedges started: {hedges}")
+    for provider in providers:
+        print(f"{provider.name} tokens: {LLM_TOKENS.get(provider=provider.name, kind='prompt'):.0f} prompt, "
+              f"{LLM_TOKENS.get(provider=provider.name, kind='completion'):.0f} completion")
+    openai_stub.shutdown()
+    anthropic_stub.shutdown()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
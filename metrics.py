@@ -0,0 +1,239 @@
+"""
+Lightweight metrics for Tujali Telehealth
+
+Counters and histograms rendered in the Prometheus text exposition format,
+so the /metrics endpoint can be scraped without extra dependencies.
+"""
+
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Latency buckets in seconds, tuned for USSD gateways that cut slow sessions
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list
+
+    Args:
+        sorted_values (list): Values in ascending order
+        pct (float): Percentile between 0 and 100
+
+    Returns:
+        float: The percentile, or 0.0 for an empty list
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class for labelled metrics"""
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        return tuple(zip(self.labelnames, key)) + tuple(extra)
+
+    def clear(self):
+        """Drop all recorded values"""
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}_total{_format_labels(self._labels(key))} {_format_value(value)}"]
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of a block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get(self, **labels):
+        """Return (count, sum) for a label set"""
+        state = self._values.get(self._key(labels))
+        if state is None:
+            return 0, 0.0
+        return state['count'], state['sum']
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state['counts']):
+            cumulative += count
+            labels = self._labels(key, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{_format_labels(labels)} {cumulative}")
+        labels = _format_labels(self._labels(key))
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics exposed together"""
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text format
+
+        Returns:
+            str: Exposition text ending with a newline
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+# ============== MODEL LOOKUP COUNTING ==============
+
+_lookups = threading.local()
+
+
+@contextmanager
+def count_lookups():
+    """
+    Count model lookups made by the current thread inside the block
+
+    Yields a dict whose 'count' key holds the number of lookups so far.
+    """
+    previous = getattr(_lookups, 'tally', None)
+    tally = {'count': 0}
+    _lookups.tally = tally
+    try:
+        yield tally
+    finally:
+        _lookups.tally = previous
+
+
+def _counted(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        tally = getattr(_lookups, 'tally', None)
+        if tally is not None:
+            tally['count'] += 1
+        return func(*args, **kwargs)
+    wrapper._counts_lookups = True
+    return wrapper
+
+
+def instrument_lookups(*classes, prefixes=('get', 'find')):
+    """
+    Make model accessors report to count_lookups()
+
+    Wraps every method whose name starts with one of the prefixes. Outside a
+    count_lookups() block the wrappers only cost a thread-local read.
+
+    Args:
+        *classes: Model classes to instrument
+        prefixes (tuple): Method name prefixes that count as lookups
+    """
+    for cls in classes:
+        for name, attr in list(vars(cls).items()):
+            if not name.startswith(prefixes):
+                continue
+            if isinstance(attr, staticmethod):
+                if not getattr(attr.__func__, '_counts_lookups', False):
+                    setattr(cls, name, staticmethod(_counted(attr.__func__)))
+            elif callable(attr) and not getattr(attr, '_counts_lookups', False):
+                setattr(cls, name, _counted(attr))
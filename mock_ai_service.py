@@ -10,11 +10,16 @@ import logging
 import json
 from datetime import datetime
 
+from ai_cache import education_cache
+from ai_prompts import compact_symptoms
+from llm_dispatch import emit_items
+from offline_tips import tip_engine
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_health_tips(patient_data, symptoms=None, language="en"):
+def generate_health_tips(patient_data, symptoms=None, language="en", on_item=None):
     """
     Generate mock personalized health tips based on patient data and symptoms
 
@@ -22,188 +27,43 @@ def generate_health_tips(patient_data, symptoms=None, language="en"):
         patient_data (dict): Patient demographic information and medical history
         symptoms (list, optional): List of symptoms reported by the patient
         language (str): Language code for the response (e.g., 'en', 'sw', 'fr')
+        on_item (callable, optional): Called as on_item(field, index, value)
+            for each tip and field, like the streaming AI service
 
     Returns:
         dict: JSON response containing health tips and recommendations
     """
     logger.info(f"Generating mock health tips for patient in language: {language}")
-
-    # Extract patient information
-    patient_age = patient_data.get('age', 'unknown')
-    patient_gender = patient_data.get('gender', 'unknown')
-    patient_location = patient_data.get('location', 'unknown')
-
-    # Create basic response structure
-    response = {
-        "health_tips": [],
-        "symptom_management": [],
-        "follow_up": ""
-    }
-
-    # General health tips for everyone
-    general_tips = [
-        {
-            "title": "Stay Hydrated",
-            "description": "Drink at least 8 glasses of clean water daily, especially in hot weather."
-        },
-        {
-            "title": "Balanced Diet",
-            "description": "Eat a variety of fruits, vegetables, and whole grains when available. Limit processed foods and excess sugar."
-        },
-        {
-            "title": "Regular Exercise",
-            "description": "Aim for at least 30 minutes of physical activity most days, even if it's just walking or household chores."
-        },
-        {
-            "title": "Hand Hygiene",
-            "description": "Wash hands frequently with soap and water for at least 20 seconds to prevent infections."
-        },
-        {
-            "title": "Adequate Sleep",
-            "description": "Try to get 7-8 hours of sleep per night to support your immune system and overall health."
-        }
-    ]
-
-    # Add age-specific tips
-    age_tips = {}
-    try:
-        patient_age_int = int(patient_age)
-        if patient_age_int < 18:
-            age_tips = {
-                "title": "Childhood Health",
-                "description": "Ensure children receive all recommended vaccinations and have regular health check-ups."
-            }
-        elif patient_age_int >= 18 and patient_age_int < 50:
-            age_tips = {
-                "title": "Adult Preventive Care",
-                "description": "Have regular health screenings appropriate for your age and risk factors."
-            }
-        else:
-            age_tips = {
-                "title": "Senior Health",
-                "description": "Pay special attention to blood pressure monitoring and joint health. Stay mentally active."
-            }
-    except:
-        age_tips = {
-            "title": "Regular Check-ups",
-            "description": "Have regular health check-ups regardless of your age."
-        }
-
-    # Add gender-specific tips
-    gender_tips = {}
-    if patient_gender.lower() == 'female':
-        gender_tips = {
-            "title": "Women's Health",
-            "description": "Consider regular breast examinations and reproductive health check-ups."
-        }
-    elif patient_gender.lower() == 'male':
-        gender_tips = {
-            "title": "Men's Health",
-            "description": "Be aware of risks for heart disease and consider regular prostate health check-ups."
-        }
-    else:
-        gender_tips = {
-            "title": "General Health Monitoring",
-            "description": "Monitor your body for unexpected changes and consult healthcare providers when needed."
-        }
-
-    # Location-specific tips
-    location_tips = {}
-    if "rural" in patient_location.lower():
-        location_tips = {
-            "title": "Rural Health Access",
-            "description": "Know the nearest health facility and keep emergency contact numbers readily available."
-        }
-    elif "urban" in patient_location.lower():
-        location_tips = {
-            "title": "Urban Health",
-            "description": "Be mindful of air quality and take steps to reduce exposure to pollution when possible."
-        }
-    else:
-        location_tips = {
-            "title": "Local Health Resources",
-            "description": "Familiarize yourself with health resources available in your community."
-        }
-
-    # Add symptom management advice if symptoms:
-    if symptoms:
-        # Group symptoms by category for better organization
-        symptom_groups = {}
-        for symptom in symptoms:
-            description = symptom.get('description', '').lower()
-            severity = symptom.get('severity', 'Unknown')
-            category = symptom.get('category', 'General')
-
-            if category not in symptom_groups:
-                symptom_groups[category] = []
-            symptom_groups[category].append((description, severity))
-
-        # Generate advice for each symptom category
-        for category, symptom_list in symptom_groups.items():
-            if category == 'respiratory':
-                severe = any(sev == 'Severe' for _, sev in symptom_list)
-                response["symptom_management"].append({
-                    "symptom": "Respiratory symptoms",
-                    "advice": "Rest, stay hydrated, and use a humidifier if available. " + 
-                            ("Seek immediate medical attention." if severe else "Monitor symptoms and seek medical help if they worsen.")
-                })
-            elif category == 'digestive':
-                response["symptom_management"].append({
-                    "symptom": "Digestive issues",
-                    "advice": "Stay hydrated, eat bland foods, and consider oral rehydration. Avoid spicy or heavy foods."
-                })
-            elif category == 'pain':
-                locations = [desc for desc, _ in symptom_list]
-                response["symptom_management"].append({
-                    "symptom": f"Pain management ({', '.join(locations)})",
-                    "advice": "Rest affected areas, use appropriate pain relief if available, apply cold/hot compress as needed."
-                })
-            elif category == 'fever':
-                severe = any(sev == 'Severe' for _, sev in symptom_list)
-                response["symptom_management"].append({
-                    "symptom": "Fever management",
-                    "advice": "Stay hydrated, rest, and monitor temperature. " +
-                            ("Seek immediate medical attention if fever is very high." if severe else "Use fever reducers if available.")
-                })
-            elif category == 'skin':
-                response["symptom_management"].append({
-                    "symptom": "Skin conditions",
-                    "advice": "Keep affected areas clean and dry. Avoid scratching. Use appropriate topical treatments if available."
-                })
-
-    # Add tips to response
-    response["health_tips"] = [general_tips[0], general_tips[1], age_tips, gender_tips, location_tips]
-
-    # Add follow-up advice
-    response["follow_up"] = "If symptoms persist or worsen after 48-72 hours, please seek medical attention at your nearest health facility."
-
-    # Translate response based on language if needed
-    # For the mock service, we'll just add a note about the language
-    if language != "en":
-        language_names = {
-            "sw": "Swahili",
-            "fr": "French",
-            "or": "Oromo",
-            "so": "Somali",
-            "am": "Amharic"
-        }
-        lang_name = language_names.get(language, language)
-        response["language_note"] = f"These recommendations would normally be provided in {lang_name}."
-
+    response = tip_engine.generate(patient_data, compact_symptoms(symptoms), language)
     logger.info("Successfully generated mock health tips")
+    if on_item:
+        emit_items(response, on_item)
     return response
 
-def generate_health_education(topic, language="en"):
+# Kept apart from ai_service's entries in the shared content cache
+EDUCATION_PROMPT_VERSION = "mock-education-v1"
+
+def generate_health_education(topic, language="en", on_item=None):
     """
     Generate mock health education content on a specific topic
 
     Args:
         topic (str): Health topic to generate information about
         language (str): Language code for the response
+        on_item (callable, optional): Called as on_item(field, index, value)
+            for each point and field, like the streaming AI service
 
     Returns:
         dict: JSON response containing educational content
     """
+    key = education_cache.key(topic, language, EDUCATION_PROMPT_VERSION)
+    content = education_cache.get_or_generate(key, lambda: _generate_health_education(topic, language))
+    if on_item:
+        emit_items(content, on_item)
+    return content
+
+def _generate_health_education(topic, language):
+    """Build the mock health education content for a topic"""
     logger.info(f"Generating mock health education about '{topic}' in language: {language}")
 
     # Clean and lowercase the topic for matching
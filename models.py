@@ -2,6 +2,7 @@ from flask_login import UserMixin
 from datetime import datetime, timedelta
 from math import radians, cos, sin, asin, sqrt
 import uuid
+import threading
 
 # In-memory database for prototype
 db = {
@@ -15,6 +16,26 @@ db = {
     'payments': []
 }
 
+# Write count per collection. Results derived from a collection (see dashboard_cache)
+# remember the version they were computed at and are recomputed once it moves on.
+db_versions = {}
+_versions_lock = threading.Lock()
+
+def touch(*collections):
+    """
+    Record a write to collections of the in-memory database
+
+    Args:
+        *collections (str): Names of the changed collections, e.g. 'bills'
+    """
+    with _versions_lock:
+        for name in collections:
+            db_versions[name] = db_versions.get(name, 0) + 1
+
+def collection_version(name):
+    """Current write count of a collection"""
+    return db_versions.get(name, 0)
+
 def init_db():
     """Initialize demo data for the in-memory database"""
     # Always reset users to have consistent state
@@ -288,6 +309,9 @@ def init_db():
     db['payments'].append(payment2)
     db['payments'].append(payment3)
 
+    # Everything derived from the old collections is out of date
+    touch(*db)
+
 def generate_password_hash(password):
     """Mock password hashing for prototype"""
     return f"hashed_{password}"
@@ -359,6 +383,7 @@ class User(UserMixin):
         user_id = len(db['users']) + 1
         user = User(user_id, username, email, password_hash, role, department, permissions)
         db['users'].append(user)
+        touch('users')
         return user
     
     @staticmethod
@@ -376,6 +401,16 @@ class User(UserMixin):
         """Get all users"""
         return db['users']
 
+# Language names providers list, by USSD language code
+LANGUAGE_NAMES = {
+    'en': 'English',
+    'sw': 'Swahili',
+    'fr': 'French',
+    'om': 'Oromo',
+    'so': 'Somali',
+    'am': 'Amharic'
+}
+
 def haversine(lat1, lon1, lat2, lon2):
     """
     Calculate the great circle distance in kilometers between two points 
@@ -394,7 +429,8 @@ def haversine(lat1, lon1, lat2, lon2):
 
 class Provider:
     """Healthcare provider model"""
-    def __init__(self, id, user_id, name, specialization, languages, location=None, coordinates=None):
+    def __init__(self, id, user_id, name, specialization, languages, location=None, coordinates=None,
+                 available_days='Monday,Tuesday,Wednesday,Thursday,Friday', available_hours='09:00-17:00'):
         self.id = id
         self.user_id = user_id
         self.name = name
@@ -402,6 +438,9 @@ class Provider:
         self.languages = languages
         self.location = location  # Text description of location (e.g., "Nairobi, Kenya")
         self.coordinates = coordinates  # Tuple (latitude, longitude) for distance calculations
+        # Working hours, in the same format as the shared providers schema
+        self.available_days = available_days  # Comma-separated weekday names
+        self.available_hours = available_hours  # Comma-separated 'HH:MM-HH:MM' ranges
     
     @staticmethod
     def get_by_user_id(user_id):
@@ -442,6 +481,7 @@ class Provider:
         provider.phone_number = phone_number
         provider.years_experience = years_experience
         db['providers'].append(provider)
+        touch('providers')
         return provider
     
     @staticmethod
@@ -522,6 +562,7 @@ class Patient:
         patient_id = len(db['patients']) + 1
         patient = Patient(patient_id, phone_number, name, age, gender, location, language, coordinates)
         db['patients'].append(patient)
+        touch('patients')
         return patient
     
     @staticmethod
@@ -601,10 +642,12 @@ class Patient:
             'severity': severity,
             'category': category
         })
+        touch('patients')
         
     def update_coordinates(self, latitude, longitude):
         """Update patient's geographical coordinates"""
         self.coordinates = (latitude, longitude)
+        touch('patients')
         return True
         
     def find_nearby_providers(self, max_distance=50, specialization=None):
@@ -625,9 +668,12 @@ class Patient:
             self.coordinates, 
             max_distance=max_distance,
             specialization=specialization,
-            languages=self.language
+            languages=LANGUAGE_NAMES.get(self.language, self.language)
         )
 
+# Appointment IDs are allocated from the list length, so creation must not interleave
+_appointment_lock = threading.Lock()
+
 class Appointment:
     """Appointment model"""
     def __init__(self, id, patient_id, provider_id, date, time, status, price=None, payment_status=None, notes=None, created_at=None, reminder_sent=False):
@@ -646,19 +692,21 @@ class Appointment:
     @staticmethod
     def create(patient_id, provider_id, date, time, price=None, notes=None):
         """Create a new appointment"""
-        appointment_id = len(db['appointments']) + 1
-        appointment = Appointment(
-            appointment_id, 
-            patient_id, 
-            provider_id, 
-            date, 
-            time, 
-            'pending', 
-            price=price,
-            payment_status='pending' if price else 'waived',
-            notes=notes
-        )
-        db['appointments'].append(appointment)
+        with _appointment_lock:
+            appointment_id = len(db['appointments']) + 1
+            appointment = Appointment(
+                appointment_id, 
+                patient_id, 
+                provider_id, 
+                date, 
+                time, 
+                'pending', 
+                price=price,
+                payment_status='pending' if price else 'waived',
+                notes=notes
+            )
+            db['appointments'].append(appointment)
+        touch('appointments')
         return appointment
     
     @staticmethod
@@ -692,6 +740,25 @@ class Appointment:
         """Get count of appointments by status"""
         return len([a for a in db['appointments'] if a.provider_id == provider_id and a.status == status])
     
+    @staticmethod
+    def mark_reminder_sent(appointment_id):
+        """
+        Record that the reminder for an appointment went out
+
+        Args:
+            appointment_id (int): ID of the appointment
+
+        Returns:
+            bool: True if it was newly marked, False if already marked or not found
+        """
+        with _appointment_lock:
+            appointment = Appointment.get_by_id(appointment_id)
+            if appointment is None or appointment.reminder_sent:
+                return False
+            appointment.reminder_sent = True
+        touch('appointments')
+        return True
+    
     @staticmethod
     def update_status(appointment_id, status, payment_status=None):
         """
@@ -710,6 +777,7 @@ class Appointment:
                 appointment.status = status
                 if payment_status:
                     appointment.payment_status = payment_status
+                touch('appointments')
                 return True
         return False
 
@@ -730,6 +798,7 @@ class Message:
         message_id = len(db['messages']) + 1
         message = Message(message_id, provider_id, patient_id, content, sender_type)
         db['messages'].append(message)
+        touch('messages')
         return message
     
     @staticmethod
@@ -775,6 +844,7 @@ class Message:
                 message.provider_id == provider_id and 
                 message.sender_type == 'patient'):
                 message.is_read = True
+        touch('messages')
     
     @staticmethod
     def get_recent_by_provider(provider_id, limit=5):
@@ -806,8 +876,17 @@ class HealthInfo:
         info_id = len(db['health_info']) + 1
         info = HealthInfo(info_id, title, content, language)
         db['health_info'].append(info)
+        touch('health_info')
         return info
     
+    @staticmethod
+    def get_by_id(info_id):
+        """Get health information by ID"""
+        for info in db['health_info']:
+            if info.id == info_id:
+                return info
+        return None
+    
     @staticmethod
     def get_by_language(language):
         """Get health information by language"""
@@ -849,6 +928,7 @@ class UserInteraction:
         interaction_id = len(db['user_interactions']) + 1
         interaction = UserInteraction(interaction_id, patient_id, interaction_type, description, metadata)
         db['user_interactions'].append(interaction)
+        touch('user_interactions')
         return interaction
     
     @staticmethod
@@ -979,6 +1059,7 @@ class Payment:
         payment_id = len(db['payments']) + 1
         payment = Payment(payment_id, appointment_id, amount, phone_number, payment_method=payment_method)
         db['payments'].append(payment)
+        touch('payments')
         return payment
     
     @staticmethod
@@ -1036,6 +1117,7 @@ class Payment:
                     payment.mpesa_reference = mpesa_reference
                 if status == "completed":
                     payment.paid_at = datetime.now()
+                touch('payments')
                 return True
         return False
     
@@ -1118,6 +1200,7 @@ class Prescription:
             medications, instructions, delivery_method, delivery_address, delivery_fee
         )
         db['prescriptions'].append(prescription)
+        touch('prescriptions')
         return prescription
 
     @staticmethod
@@ -1146,6 +1229,7 @@ class Prescription:
                 prescription.status = status
                 if status == "dispensed" and dispensed_at:
                     prescription.dispensed_at = dispensed_at
+                touch('prescriptions')
                 return True
         return False
 
@@ -1183,6 +1267,7 @@ class WalkInPatient:
             priority=priority, notes=notes
         )
         db['walkin_patients'].append(walkin)
+        touch('walkin_patients')
         return walkin
 
     @staticmethod
@@ -1211,6 +1296,7 @@ class WalkInPatient:
                     walkin.consultation_start = datetime.now()
                 elif status == "completed":
                     walkin.consultation_end = datetime.now()
+                touch('walkin_patients')
                 return True
         return False
 
@@ -1254,6 +1340,7 @@ class LabTest:
             test_name, test_type, cost=cost, instructions=instructions
         )
         db['lab_tests'].append(lab_test)
+        touch('lab_tests')
         return lab_test
 
     @staticmethod
@@ -1284,6 +1371,7 @@ class LabTest:
                     test.sample_collected_at = datetime.now()
                 elif status == "completed":
                     test.completed_at = datetime.now()
+                touch('lab_tests')
                 return True
         return False
 
@@ -1315,6 +1403,7 @@ class LabResult:
             notes, technician_name
         )
         db['lab_results'].append(lab_result)
+        touch('lab_results')
         
         # Update the lab test status to completed
         LabTest.update_status(lab_test_id, "completed")
@@ -1347,6 +1436,7 @@ class LabResult:
     def mark_reviewed(self):
         """Mark result as reviewed by provider"""
         self.reviewed_by_provider = True
+        touch('lab_results')
 
 
 class Bill:
@@ -1369,6 +1459,7 @@ class Bill:
         bill_id = len(db['bills']) + 1
         bill = Bill(bill_id, patient_id, provider_id, appointment_id)
         db['bills'].append(bill)
+        touch('bills')
         return bill
 
     def add_item(self, item_type, description, amount, quantity=1):
@@ -1382,11 +1473,33 @@ class Bill:
         }
         self.items.append(item)
         self.calculate_total()
+        touch('bills')
 
     def calculate_total(self):
         """Calculate total bill amount"""
         self.total_amount = sum(item['total'] for item in self.items)
 
+    @staticmethod
+    def update_status(bill_id, status):
+        """
+        Update bill status
+
+        Args:
+            bill_id (int): ID of the bill
+            status (str): New status (pending, partially_paid, paid, cancelled)
+
+        Returns:
+            bool: True if updated, False if not found
+        """
+        for bill in db['bills']:
+            if bill.id == bill_id:
+                bill.status = status
+                if status == "paid":
+                    bill.paid_at = datetime.now()
+                touch('bills')
+                return True
+        return False
+
     @staticmethod
     def get_by_id(bill_id):
         """Get bill by ID"""
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Offline health tip engine for Tujali Telehealth
+
+While the AI providers are unavailable the offline tips are what patients
+get, so they have to be cheap. The rules live in offline_tips.json and are
+loaded once: tips indexed by age band, gender and region, and symptom advice
+indexed by symptom category. For every language a bundle is built up front
+holding the health tips for each (age band, gender, region) combination and
+the advice for each (category, severe) pair, so answering is a handful of
+dictionary lookups.
+
+A language block in the data file may carry a "text" mapping from the
+English strings to their translation; strings without one stay in English,
+and the block's "note" is added to every answer.
+
+Measure its throughput, alone and behind mock_ai_service:
+
+    python offline_tips.py --requests 50000
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offline_tips.json')
+
+DEFAULT_LANGUAGE = 'en'
+
+
+class TipEngine:
+    """
+    Health tips from rules indexed by patient profile and symptom category
+
+    Args:
+        rules (dict): Parsed contents of offline_tips.json
+    """
+    def __init__(self, rules):
+        self.age_bands = [(band['band'], band.get('below')) for band in rules['age_bands']
+                          if band['band'] != 'unknown']
+        self._bundles = {language: self._build_bundle(rules, block)
+                         for language, block in rules['languages'].items()}
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_DATA_FILE):
+        """Load the rules from a JSON data file"""
+        with open(path, encoding='utf-8') as rules_file:
+            return cls(json.load(rules_file))
+
+    @staticmethod
+    def _build_bundle(rules, block):
+        """Precompute every answer part for one language"""
+        text = block.get('text', {})
+
+        def translate(tip):
+            return {field: text.get(value, value) for field, value in tip.items()}
+
+        general = [translate(tip) for tip in rules['general']]
+        age_tips = {band['band']: translate(band['tip']) for band in rules['age_bands']}
+        tips = {}
+        for age, gender, region in itertools.product(age_tips, rules['gender'], rules['region']):
+            tips[(age, gender, region)] = tuple(general + [age_tips[age], translate(rules['gender'][gender]),
+                                                           translate(rules['region'][region])])
+
+        advice = {}
+        for category, rule in rules['symptom_categories'].items():
+            for severe in (False, True):
+                entry = translate({'symptom': rule['symptom'],
+                                   'advice': rule.get('severe_advice', rule['advice']) if severe else rule['advice']})
+                # Only some rules name the patient's symptoms, e.g. "Pain management ({symptoms})"
+                advice[(category, severe)] = (entry, '{symptoms}' in entry['symptom'])
+
+        return {
+            'tips': tips,
+            'advice': advice,
+            'follow_up': text.get(rules['follow_up'], rules['follow_up']),
+            'note': block.get('note')
+        }
+
+    def age_band(self, age):
+        """Age band of a patient's age, or 'unknown' if it is not a number"""
+        try:
+            age = int(age)
+        except (TypeError, ValueError):
+            return 'unknown'
+        for band, below in self.age_bands:
+            if below is None or age < below:
+                return band
+        return 'unknown'
+
+    def generate(self, patient_data, symptoms=None, language=DEFAULT_LANGUAGE):
+        """
+        Health tips for a patient
+
+        Args:
+            patient_data (dict): 'age', 'gender' and 'location' of the patient
+            symptoms (list, optional): Deduplicated symptoms (see
+                ai_prompts.compact_symptoms) with 'description', 'severity'
+                and 'category'
+            language (str): Language code for the response
+
+        Returns:
+            dict: 'health_tips', 'symptom_management', 'follow_up' and, for
+            languages other than English, 'language_note'
+        """
+        bundle = self._bundles.get(language) or self._bundles[DEFAULT_LANGUAGE]
+
+        gender = (patient_data.get('gender') or '').lower()
+        if gender not in ('female', 'male'):
+            gender = 'other'
+        location = (patient_data.get('location') or '').lower()
+        region = 'rural' if 'rural' in location else 'urban' if 'urban' in location else 'other'
+        tips = bundle['tips'][(self.age_band(patient_data.get('age')), gender, region)]
+
+        # Group by category, in the order the categories first appear
+        groups = {}
+        for symptom in symptoms or ():
+            group = groups.setdefault(symptom.get('category', 'General'), [False, []])
+            group[0] = group[0] or symptom.get('severity') == 'Severe'
+            group[1].append((symptom.get('description') or '').lower())
+
+        management = []
+        for category, (severe, descriptions) in groups.items():
+            rule = bundle['advice'].get((category, severe))
+            if rule is None:
+                continue
+            entry, names_symptoms = rule
+            if names_symptoms:
+                entry = dict(entry, symptom=entry['symptom'].format(symptoms=', '.join(descriptions)))
+            management.append(dict(entry))
+
+        response = {
+            "health_tips": [dict(tip) for tip in tips],
+            "symptom_management": management,
+            "follow_up": bundle['follow_up']
+        }
+        if language != DEFAULT_LANGUAGE:
+            response["language_note"] = bundle['note'] or \
+                f"These recommendations would normally be provided in {language}."
+        return response
+
+
+tip_engine = TipEngine.from_file(os.environ.get('OFFLINE_TIPS_FILE', DEFAULT_DATA_FILE))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure offline health tip throughput")
+    parser.add_argument('--requests', type=int, default=50000, help="Answers to generate (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    import mock_ai_service
+
+    # Quiet the per-call log lines of the mock service
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger('mock_ai_service').setLevel(logging.ERROR)
+
+    profiles = [{'age': age, 'gender': gender, 'location': location}
+                for age in (7, 34, 71, 'unknown')
+                for gender in ('female', 'male', 'unknown')
+                for location in ('Rural Kisumu', 'Urban Nairobi', 'Mombasa')]
+    symptom_sets = [
+        [],
+        [{'description': 'Dry cough', 'severity': 'Severe', 'category': 'respiratory'}],
+        [{'description': 'Headache', 'severity': 'Mild', 'category': 'pain'},
+         {'description': 'High fever', 'severity': 'Moderate', 'category': 'fever'},
+         {'description': 'Stomach pain', 'severity': 'Mild', 'category': 'pain'}]
+    ]
+    languages = ('en', 'sw', 'fr')
+    cases = list(itertools.product(profiles, symptom_sets, languages))
+
+    def measure(generate):
+        start = time.perf_counter()
+        for i in range(args.requests):
+            profile, symptoms, language = cases[i % len(cases)]
+            generate(profile, symptoms, language)
+        return time.perf_counter() - start
+
+    engine_time = measure(tip_engine.generate)
+    service_time = measure(mock_ai_service.generate_health_tips)
+
+    for name, elapsed in (('tip engine', engine_time),
+                          ('mock_ai_service (+ dedupe)', service_time)):
+        print(f"{name:28} {args.requests / elapsed:10.0f} answers/s  "
+              f"{elapsed / args.requests * 1e6:7.1f} us per answer")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
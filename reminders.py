@@ -0,0 +1,317 @@
+"""
+Appointment reminder scheduler
+
+Keeps a timer heap of upcoming appointments keyed by the time their
+reminder is due (REMINDER_LEAD_HOURS before the appointment, 24 by
+default). The worker thread sleeps until the earliest reminder is due,
+collects everything due at that point and hands it in batches to the SMS
+outbox, which delivers them within the gateway's rate limits.
+
+The heap is never searched or rebuilt: rescheduling pushes a new entry and
+stale entries are skipped when they come up. Before sending, each
+appointment is re-checked, so cancelled appointments, appointments that
+already got their reminder and appointments that have passed are dropped
+at that point.
+
+An appointment is only marked as reminded once the outbox reports that
+the gateway accepted its SMS; if the outbox gives up, the reminder is
+retried here up to max_attempts times.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import db, Appointment, Patient, Provider
+from appointment_slots import date_key, time_key
+from sms_outbox import outbox
+from ussd_messages import catalog
+from metrics import Counter
+import utils
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+REMINDERS = Counter('appointment_reminders',
+                    'Appointment reminders processed by the scheduler',
+                    ['result'])
+
+# Appointments in these states get a reminder
+REMINDER_STATUSES = {'pending', 'confirmed'}
+
+
+def appointment_start(appointment):
+    """
+    Start of an appointment as a datetime
+
+    Returns:
+        datetime: The start, or None if the date or time cannot be parsed
+    """
+    day = date_key(appointment.date)
+    minutes = time_key(appointment.time)
+    if day is None or minutes is None:
+        return None
+    return datetime(day.year, day.month, day.day) + timedelta(minutes=minutes)
+
+
+class ReminderScheduler:
+    """
+    Send appointment reminders when they fall due
+
+    Args:
+        gateway: SmsGateway or SmsOutbox the reminders are sent through
+        lead_time (timedelta): How long before the appointment to remind
+        batch_size (int): Maximum reminders per gateway batch
+        retry_delay (float): Seconds before a failed reminder is retried
+        max_attempts (int): Sends attempted before a reminder is given up
+    """
+    def __init__(self, gateway, lead_time=timedelta(hours=24), batch_size=50, retry_delay=300,
+                 max_attempts=3):
+        self.gateway = gateway
+        self.lead_time = lead_time
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+
+        self._heap = []  # (due timestamp, seq, appointment_id)
+        self._due = {}  # appointment_id -> due timestamp of its live heap entry
+        self._attempts = {}
+        self._in_flight = set()  # appointment IDs queued in the outbox, outcome pending
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._worker = None
+        self._stopping = False
+
+    def schedule(self, appointment, now=None):
+        """
+        Queue the reminder for an appointment, replacing any earlier one
+
+        Args:
+            appointment (Appointment): Appointment to remind about
+            now (float, optional): Current time.time(), for tests
+
+        Returns:
+            bool: True if a reminder was queued
+        """
+        if appointment.reminder_sent or appointment.status not in REMINDER_STATUSES:
+            return False
+        start = appointment_start(appointment)
+        now = time.time() if now is None else now
+        if start is None or start.timestamp() <= now:
+            return False
+
+        # Booked inside the lead time: remind straight away
+        due = max((start - self.lead_time).timestamp(), now)
+        with self._cond:
+            self._push(appointment.id, due)
+        return True
+
+    def load(self, now=None):
+        """
+        Queue reminders for every upcoming appointment in the database
+
+        Returns:
+            int: Number of reminders queued
+        """
+        return sum(1 for appointment in list(db['appointments']) if self.schedule(appointment, now))
+
+    def pending(self):
+        """Number of reminders waiting to be sent"""
+        with self._cond:
+            return len(self._due)
+
+    def next_due(self):
+        """time.time() at which the next reminder is due, or None"""
+        with self._cond:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def run_due(self, now=None):
+        """
+        Send every reminder that is due, in batches
+
+        Args:
+            now (float, optional): Current time.time(), for tests
+
+        Returns:
+            int: Number of reminders sent, or queued in the outbox
+        """
+        now = time.time() if now is None else now
+        sent = 0
+        while True:
+            with self._cond:
+                batch = self._pop_due(now)
+            if not batch:
+                return sent
+            sent += self._dispatch(batch, now)
+
+    def start(self):
+        """Queue the upcoming appointments and start the worker thread"""
+        queued = self.load()
+        logger.info(f"Reminder scheduler started with {queued} pending reminders "
+                    f"(gateway: {self.gateway.name})")
+        with self._cond:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stopping = False
+            self._worker = threading.Thread(target=self._run, name='reminders', daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        """Stop the worker thread"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._worker:
+            self._worker.join(timeout=5)
+
+    def _push(self, appointment_id, due):
+        """Add a heap entry (lock held); wakes the worker if it is now the earliest"""
+        self._due[appointment_id] = due
+        heapq.heappush(self._heap, (due, next(self._seq), appointment_id))
+        if self._heap[0][2] == appointment_id:
+            self._cond.notify()
+
+    def _drop_stale(self):
+        """Pop entries superseded by a later schedule() call (lock held)"""
+        while self._heap:
+            due, _, appointment_id = self._heap[0]
+            if self._due.get(appointment_id) == due:
+                return
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        """Take up to batch_size due appointment IDs off the heap (lock held)"""
+        batch = []
+        while len(batch) < self.batch_size:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, _, appointment_id = heapq.heappop(self._heap)
+            del self._due[appointment_id]
+            batch.append(appointment_id)
+        return batch
+
+    def _dispatch(self, appointment_ids, now):
+        """Send one batch of reminders; returns the number sent"""
+        messages = []
+        for appointment_id in appointment_ids:
+            message = self._build(appointment_id, now)
+            if message is None:
+                REMINDERS.inc(result='skipped')
+                continue
+            messages.append(message)
+        if not messages:
+            return 0
+
+        with self._cond:
+            for message in messages:
+                # The outbox only queues the message and reports the outcome once it is sent;
+                # until then the reminder is neither built again nor marked
+                self._in_flight.add(message['appointment_id'])
+                message['on_result'] = self._result_callback(message['appointment_id'])
+        try:
+            results = self.gateway.send_batch(messages)
+        except Exception as e:
+            logger.error(f"SMS gateway failed for a batch of {len(messages)} reminders: {str(e)}")
+            results = [{'ok': False, 'error': str(e)} for _ in messages]
+
+        sent = 0
+        for message, result in zip(messages, results):
+            if result.get('queued'):
+                sent += 1
+            elif self._settle(message['appointment_id'], result['ok'], result['error'], now):
+                sent += 1
+        return sent
+
+    def _result_callback(self, appointment_id):
+        """on_result callback settling an appointment's reminder once the outbox has sent it"""
+        def on_result(ok, error):
+            self._settle(appointment_id, ok, error, time.time())
+        return on_result
+
+    def _settle(self, appointment_id, ok, error, now):
+        """
+        Record the outcome of sending a reminder
+
+        Marks the appointment on success; on failure queues a retry until
+        max_attempts is reached.
+
+        Returns:
+            bool: True if the appointment was newly marked as reminded
+        """
+        if ok:
+            # Marking is idempotent, so a duplicate send never counts twice
+            marked = Appointment.mark_reminder_sent(appointment_id)
+            with self._cond:
+                self._in_flight.discard(appointment_id)
+                self._attempts.pop(appointment_id, None)
+            if marked:
+                REMINDERS.inc(result='sent')
+            return marked
+
+        with self._cond:
+            self._in_flight.discard(appointment_id)
+            attempts = self._attempts.get(appointment_id, 0) + 1
+            if attempts >= self.max_attempts:
+                self._attempts.pop(appointment_id, None)
+            else:
+                self._attempts[appointment_id] = attempts
+                if appointment_id not in self._due:
+                    self._push(appointment_id, now + self.retry_delay)
+        if attempts >= self.max_attempts:
+            logger.error(f"Giving up on reminder for appointment #{appointment_id}: {error}")
+            REMINDERS.inc(result='failed')
+        else:
+            REMINDERS.inc(result='retried')
+        return False
+
+    def _build(self, appointment_id, now):
+        """Reminder SMS for an appointment, or None if it no longer needs one"""
+        with self._cond:
+            if appointment_id in self._in_flight:
+                return None
+        appointment = Appointment.get_by_id(appointment_id)
+        if (appointment is None or appointment.reminder_sent
+                or appointment.status not in REMINDER_STATUSES):
+            return None
+        start = appointment_start(appointment)
+        patient = Patient.get_by_id(appointment.patient_id)
+        provider = Provider.get_by_id(appointment.provider_id)
+        if start is None or start.timestamp() <= now or patient is None or provider is None:
+            return None
+
+        language = patient.language or 'en'
+        body = catalog.text('appointment_reminder', language,
+                            provider=provider.name,
+                            date=utils.format_date(start.strftime('%d-%m-%Y'), language),
+                            time=start.strftime('%H:%M'))
+        return {'to': patient.phone_number, 'body': body, 'kind': 'reminder', 'appointment_id': appointment_id}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    self._drop_stale()
+                    now = time.time()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    # Sleep until the next reminder is due; re-check hourly in case the clock jumps
+                    timeout = min(self._heap[0][0] - now, 3600) if self._heap else None
+                    self._cond.wait(timeout)
+                if self._stopping:
+                    return
+            try:
+                self.run_due()
+            except Exception as e:
+                logger.error(f"Error sending appointment reminders: {str(e)}")
+
+
+reminders = ReminderScheduler(
+    outbox,
+    lead_time=timedelta(hours=float(os.environ.get('REMINDER_LEAD_HOURS', 24)))
+)
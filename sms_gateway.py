@@ -0,0 +1,180 @@
+"""
+SMS gateways for Tujali Telehealth
+
+Outbound SMS (appointment reminders and the like) goes through a small
+gateway interface so the provider can be swapped, and so the whole flow can
+run against FakeGateway locally and in tests:
+
+    gateway.send(to, body)          -> provider message ID, raises SmsError
+    gateway.send_batch(messages)    -> one result dict per message
+
+TwilioGateway is used when TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN and
+TWILIO_PHONE_NUMBER are set; otherwise gateway_from_env() falls back to
+FakeGateway, which only records and logs the messages.
+
+Each gateway declares the send rate its provider allows (rate_limit, in
+messages per second, None for unlimited); the SMS outbox paces itself to it.
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class SmsError(Exception):
+    """An SMS could not be handed to the gateway"""
+
+
+class SmsGateway:
+    """Base class for SMS gateways"""
+    name = 'base'
+    rate_limit = None
+
+    def send(self, to, body):
+        """
+        Send one SMS
+
+        Args:
+            to (str): Recipient phone number in E.164 format
+            body (str): Message text
+
+        Returns:
+            str: The gateway's message ID
+
+        Raises:
+            SmsError: If the gateway rejected the message
+        """
+        raise NotImplementedError
+
+    def send_batch(self, messages):
+        """
+        Send several SMS
+
+        Gateways with a bulk API override this; the default sends one by one
+        so that one failed message does not fail the rest. Any error,
+        including network errors the provider's client does not wrap, only
+        fails the message it happened on, since the ones before it were
+        already accepted.
+
+        Args:
+            messages (list): Dicts with 'to' and 'body'
+
+        Returns:
+            list: Dicts with 'to', 'ok', 'id' and 'error', in the same order
+        """
+        results = []
+        for message in messages:
+            try:
+                message_id = self.send(message['to'], message['body'])
+                results.append({'to': message['to'], 'ok': True, 'id': message_id, 'error': None})
+            except Exception as e:
+                logger.warning(f"{self.name} could not send SMS to {message['to']}: {e}")
+                results.append({'to': message['to'], 'ok': False, 'id': None, 'error': str(e)})
+        return results
+
+
+class TwilioGateway(SmsGateway):
+    """
+    Send SMS through Twilio
+
+    Args:
+        account_sid (str): Twilio account SID
+        auth_token (str): Twilio auth token
+        from_number (str): Twilio phone number or messaging service SID to send from
+        status_callback (str, optional): URL Twilio posts delivery status updates to
+    """
+    name = 'twilio'
+    # A long code number sends one message per second
+    rate_limit = 1.0
+
+    def __init__(self, account_sid, auth_token, from_number, status_callback=None):
+        from twilio.rest import Client
+        from twilio.base.exceptions import TwilioException
+        self._client = Client(account_sid, auth_token)
+        self._errors = TwilioException
+        self.from_number = from_number
+        self.status_callback = status_callback
+
+    def send(self, to, body):
+        options = {'to': to, 'body': body}
+        if self.from_number.startswith('MG'):
+            options['messaging_service_sid'] = self.from_number
+        else:
+            options['from_'] = self.from_number
+        if self.status_callback:
+            options['status_callback'] = self.status_callback
+        try:
+            message = self._client.messages.create(**options)
+        except self._errors as e:
+            raise SmsError(str(e)) from e
+        return message.sid
+
+
+class FakeGateway(SmsGateway):
+    """
+    Record SMS instead of sending them
+
+    Args:
+        failing_numbers (iterable, optional): Recipients whose messages fail,
+            for exercising retry paths
+        latency (float): Seconds each batch takes, to simulate a remote API
+        rate_limit (float, optional): Messages per second to declare
+        record (bool): Keep sent messages in `sent`; turn off for benchmarks
+    """
+    name = 'fake'
+
+    def __init__(self, failing_numbers=None, latency=0.0, rate_limit=None, record=True):
+        self.failing_numbers = set(failing_numbers or ())
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.record = record
+        self.sent = []
+        self.sent_count = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def send(self, to, body):
+        if to in self.failing_numbers:
+            raise SmsError(f"Fake delivery failure for {to}")
+        with self._lock:
+            message_id = f"fake-{next(self._ids)}"
+            self.sent_count += 1
+            if self.record:
+                self.sent.append({'id': message_id, 'to': to, 'body': body})
+        if self.record:
+            logger.info(f"[fake SMS] to {to}: {body}")
+        return message_id
+
+    def send_batch(self, messages):
+        with self._lock:
+            self.batches += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return super().send_batch(messages)
+
+
+def gateway_from_env():
+    """
+    Build the gateway configured in the environment
+
+    Returns:
+        SmsGateway: TwilioGateway if Twilio is configured, else FakeGateway
+    """
+    account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
+    auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
+    from_number = os.environ.get('TWILIO_PHONE_NUMBER')
+    if account_sid and auth_token and from_number:
+        try:
+            return TwilioGateway(account_sid, auth_token, from_number,
+                                 status_callback=os.environ.get('SMS_STATUS_CALLBACK_URL'))
+        except Exception as e:
+            logger.error(f"Error initializing Twilio gateway: {str(e)}")
+    else:
+        logger.warning("Twilio is not configured; SMS will only be logged")
+    return FakeGateway()
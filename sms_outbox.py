@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+Outbound SMS pipeline for Tujali Telehealth
+
+Request handlers and schedulers call outbox.enqueue() and return at once.
+Background workers then:
+- group queued messages per gateway and send them in batches
+- pace each gateway with a token bucket sized to its provider quota
+  (the gateway's rate_limit, or SMS_RATE_LIMIT messages per second)
+- retry failed sends with exponential backoff, then mark them failed
+- track every message through queued -> sending -> sent -> delivered /
+  undelivered / failed; gateways that report delivery (Twilio's status
+  callback, see /sms/status) update the last step
+
+With SMS_OUTBOX_JOURNAL set, every message and status change is appended
+to a JSON-lines journal, and messages that were not handed to the gateway
+before a crash are queued again by recover() on the next start.
+
+Throughput against the fake gateway:
+    python sms_outbox.py --messages 20000 --batch-size 100 --latency 0.05 --workers 4
+"""
+
+import argparse
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque, OrderedDict
+
+from sms_gateway import FakeGateway, gateway_from_env
+from metrics import Counter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SMS_MESSAGES = Counter('sms_messages',
+                       'Outbound SMS by gateway and the status they reached',
+                       ['gateway', 'status'])
+
+# Statuses after which a message is no longer queued
+FINAL_STATUSES = {'sent', 'delivered', 'undelivered', 'failed'}
+
+# Statuses no delivery report can change any more
+SETTLED_STATUSES = {'delivered', 'undelivered', 'failed'}
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter
+
+    Args:
+        rate (float): Tokens added per second; None for no limit
+        burst (float, optional): Bucket size; defaults to one second of tokens
+        clock (callable): Returns the current time in seconds, for tests
+    """
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate or 0)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, count):
+        """
+        Take up to `count` whole tokens without waiting
+
+        Returns:
+            int: Tokens granted, possibly 0
+        """
+        if self.rate is None:
+            return count
+        with self._lock:
+            self._refill(self.clock())
+            granted = min(count, int(self._tokens))
+            self._tokens -= granted
+            return granted
+
+    def wait_time(self):
+        """Seconds until at least one token is available"""
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            self._refill(self.clock())
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class SmsOutbox:
+    """
+    Durable, rate-limited queue of outbound SMS
+
+    Args:
+        gateway (SmsGateway): Default gateway
+        batch_size (int): Maximum messages per gateway call
+        max_retries (int): Retries before a message is marked failed
+        retry_backoff (float): Initial retry delay in seconds, doubled per attempt
+        workers (int): Sending threads
+        journal_path (str, optional): JSON-lines journal for durability
+        max_history (int): Finished messages kept for status lookups
+        delivery_grace (float): Seconds a sent message is kept for its delivery
+            report before it may be dropped to stay under max_history
+        clock (callable): Returns the current time in seconds for rate limits
+            and backoff, for tests
+    """
+    name = 'outbox'
+
+    def __init__(self, gateway, batch_size=50, max_retries=5, retry_backoff=2.0, workers=1,
+                 journal_path=None, max_history=10000, delivery_grace=3600, clock=time.monotonic):
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.workers = workers
+        self.journal_path = journal_path
+        self.max_history = max_history
+        self.delivery_grace = delivery_grace
+        self.clock = clock
+        self.default_gateway = gateway.name
+
+        self._gateways = {}  # name -> (gateway, TokenBucket)
+        self._ready = {}  # gateway name -> deque of message IDs
+        self._delayed = []  # heap of (due, id)
+        self._records = OrderedDict()  # id -> message record
+        self._by_gateway_id = {}  # gateway message ID -> id
+        self._callbacks = {}  # id -> on_result callable
+        self._cond = threading.Condition()
+        self._journal_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._threads = []
+        self._stopping = False
+        self._journal = open(journal_path, 'a', encoding='utf-8') if journal_path else None
+        self.add_gateway(gateway)
+
+    def add_gateway(self, gateway, rate_limit=None, burst=None):
+        """
+        Register a gateway messages can be routed to
+
+        Args:
+            gateway (SmsGateway): The gateway; messages pick it by gateway.name
+            rate_limit (float, optional): Messages per second, overriding the
+                gateway's own rate_limit
+            burst (float, optional): Token bucket size
+        """
+        rate = rate_limit if rate_limit is not None else gateway.rate_limit
+        with self._cond:
+            self._gateways[gateway.name] = (gateway, TokenBucket(rate, burst, clock=self.clock))
+            self._ready.setdefault(gateway.name, deque())
+
+    # ---- public API ----
+
+    def enqueue(self, to, body, kind='sms', gateway=None, on_result=None):
+        """
+        Queue an SMS for background delivery
+
+        Args:
+            to (str): Recipient phone number
+            body (str): Message text
+            kind (str): What the message is, e.g. 'reminder' or 'health_tips'
+            gateway (str, optional): Gateway name; defaults to the default gateway
+            on_result (callable, optional): Called from a worker thread as
+                on_result(ok, error) once the gateway accepted the message or
+                it was given up; not kept across a restart
+
+        Returns:
+            int: Outbox message ID for status lookups
+        """
+        gateway = gateway or self.default_gateway
+        if gateway not in self._gateways:
+            raise ValueError(f"Unknown SMS gateway: {gateway}")
+
+        record = {'id': next(self._ids), 'to': to, 'body': body, 'kind': kind, 'gateway': gateway,
+                  'status': 'queued', 'attempts': 0, 'gateway_id': None, 'error': None,
+                  'updated_at': time.time()}
+        self._write_journal([{'op': 'enqueue', 'id': record['id'], 'to': to, 'body': body,
+                              'kind': kind, 'gateway': gateway}])
+        with self._cond:
+            self._records[record['id']] = record
+            if on_result is not None:
+                self._callbacks[record['id']] = on_result
+            self._ready[gateway].append(record['id'])
+            self._cond.notify()
+        SMS_MESSAGES.inc(gateway=gateway, status='queued')
+        self._ensure_workers()
+        return record['id']
+
+    def send_batch(self, messages):
+        """
+        Gateway-compatible entry point: queue messages and report them accepted
+
+        Lets code written against SmsGateway (such as the reminder scheduler)
+        send through the outbox and its rate limits. The results carry
+        'queued': True, as the messages have not been sent yet; a message's
+        'on_result' callable, if any, reports the outcome later.
+        """
+        results = []
+        for message in messages:
+            message_id = self.enqueue(message['to'], message['body'], kind=message.get('kind', 'sms'),
+                                      on_result=message.get('on_result'))
+            results.append({'to': message['to'], 'ok': True, 'queued': True, 'id': message_id,
+                            'error': None})
+        return results
+
+    def status(self, message_id):
+        """
+        Delivery status of a message
+
+        Returns:
+            dict: Copy of the message record, or None if unknown or forgotten
+        """
+        with self._cond:
+            record = self._records.get(message_id)
+            return dict(record) if record else None
+
+    def update_delivery(self, gateway_id, status, error=None):
+        """
+        Apply a delivery report from the gateway
+
+        Args:
+            gateway_id (str): The gateway's message ID
+            status (str): 'delivered', 'undelivered' or 'failed'
+            error (str, optional): Gateway error code or description
+
+        Returns:
+            bool: True if the message is known
+        """
+        with self._cond:
+            message_id = self._by_gateway_id.get(gateway_id)
+            record = self._records.get(message_id)
+            if record is None:
+                return False
+            self._set_status(record, status, error=error)
+        return True
+
+    def pending(self):
+        """Number of messages waiting to be sent (including ones backing off)"""
+        with self._cond:
+            return sum(len(queue) for queue in self._ready.values()) + len(self._delayed)
+
+    def stats(self):
+        """Message counts by status"""
+        with self._cond:
+            counts = {}
+            for record in self._records.values():
+                counts[record['status']] = counts.get(record['status'], 0) + 1
+            return counts
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued message has been handed to its gateway
+
+        Returns:
+            bool: True if the queue drained within the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._ensure_workers()
+        while self.pending() or self._in_flight():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def recover(self):
+        """
+        Re-queue messages the journal shows as never handed to a gateway
+
+        Returns:
+            int: Number of recovered messages
+        """
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return 0
+
+        pending = OrderedDict()
+        with self._journal_lock:
+            with open(self.journal_path, encoding='utf-8') as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn write at crash time
+                    if entry['op'] == 'enqueue':
+                        pending[entry['id']] = entry
+                    elif entry.get('status') in FINAL_STATUSES:
+                        pending.pop(entry['id'], None)
+
+            # Compact the journal to the messages that are still pending
+            self._journal.close()
+            with open(self.journal_path, 'w', encoding='utf-8') as journal:
+                for entry in pending.values():
+                    journal.write(json.dumps(entry) + '\n')
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+        highest = max(pending, default=0)
+        self._ids = itertools.count(max(highest + 1, next(self._ids)))
+        with self._cond:
+            for entry in pending.values():
+                gateway = entry['gateway'] if entry['gateway'] in self._gateways else self.default_gateway
+                self._records[entry['id']] = {
+                    'id': entry['id'], 'to': entry['to'], 'body': entry['body'], 'kind': entry['kind'],
+                    'gateway': gateway, 'status': 'queued', 'attempts': 0, 'gateway_id': None,
+                    'error': None, 'updated_at': time.time()
+                }
+                self._ready[gateway].append(entry['id'])
+            self._cond.notify_all()
+        if pending:
+            logger.info(f"Recovered {len(pending)} pending SMS")
+            self._ensure_workers()
+        return len(pending)
+
+    def close(self):
+        """Stop the workers and close the journal; unsent messages stay journaled"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self._journal:
+            with self._journal_lock:
+                self._journal.close()
+                self._journal = None
+
+    # ---- internals ----
+
+    def _in_flight(self):
+        with self._cond:
+            return any(record['status'] == 'sending' for record in self._records.values())
+
+    def _ensure_workers(self):
+        with self._cond:
+            if self._stopping:
+                return
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'sms-outbox-{len(self._threads)}',
+                                          daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def _write_journal(self, entries):
+        if not self._journal:
+            return
+        lines = ''.join(json.dumps(entry) + '\n' for entry in entries)
+        with self._journal_lock:
+            if self._journal:
+                self._journal.write(lines)
+                self._journal.flush()
+
+    def _set_status(self, record, status, error=None, gateway_id=None):
+        """Move a message to a new status (lock held)"""
+        record['status'] = status
+        record['updated_at'] = time.time()
+        if error is not None:
+            record['error'] = error
+        if gateway_id is not None:
+            record['gateway_id'] = gateway_id
+            self._by_gateway_id[gateway_id] = record['id']
+        if status != 'sending':
+            self._write_journal([{'op': 'status', 'id': record['id'], 'status': status}])
+        SMS_MESSAGES.inc(gateway=record['gateway'], status=status)
+        if status in FINAL_STATUSES:
+            self._forget_old()
+
+    def _forget_old(self):
+        """
+        Drop the oldest finished records beyond max_history (lock held)
+
+        Sent messages are kept for delivery_grace seconds first, so that the
+        gateway's delivery report still finds them.
+        """
+        excess = len(self._records) - self.max_history
+        if excess <= 0:
+            return
+        sent_before = time.time() - self.delivery_grace
+        for message_id in list(self._records):
+            if excess <= 0:
+                break
+            record = self._records[message_id]
+            if (record['status'] in SETTLED_STATUSES
+                    or record['status'] == 'sent' and record['updated_at'] < sent_before):
+                del self._records[message_id]
+                self._by_gateway_id.pop(record['gateway_id'], None)
+                excess -= 1
+
+    def _promote_due(self):
+        """Move retries whose backoff has expired to their ready queue (lock held)"""
+        now = self.clock()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, message_id = heapq.heappop(self._delayed)
+            record = self._records.get(message_id)
+            if record is not None:
+                self._ready[record['gateway']].append(message_id)
+
+    def _take_batch(self):
+        """
+        Claim a batch for one gateway, within its rate limit (lock held)
+
+        Returns:
+            tuple: (gateway, records) or (None, seconds to wait before trying again)
+        """
+        self._promote_due()
+        wait = None
+        for name, queue in self._ready.items():
+            if not queue:
+                continue
+            gateway, bucket = self._gateways[name]
+            granted = bucket.take(min(self.batch_size, len(queue)))
+            if not granted:
+                retry_in = bucket.wait_time()
+                wait = retry_in if wait is None else min(wait, retry_in)
+                continue
+            records = [self._records[queue.popleft()] for _ in range(granted)]
+            for record in records:
+                self._set_status(record, 'sending')
+            return gateway, records
+        if self._delayed:
+            retry_in = max(0.0, self._delayed[0][0] - self.clock())
+            wait = retry_in if wait is None else min(wait, retry_in)
+        return None, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    gateway, batch = self._take_batch()
+                    if gateway is not None:
+                        break
+                    self._cond.wait(batch)
+            self._send(gateway, batch)
+
+    def _send(self, gateway, records):
+        """Hand one batch to a gateway and record the outcome"""
+        try:
+            results = gateway.send_batch([{'to': record['to'], 'body': record['body']}
+                                          for record in records])
+        except Exception as e:
+            # send_batch reports per-message errors in its results, so an exception
+            # means the gateway took none of the batch and all of it can be retried
+            logger.error(f"SMS gateway {gateway.name} failed for a batch of {len(records)}: {str(e)}")
+            results = [{'ok': False, 'id': None, 'error': str(e)} for _ in records]
+
+        outcomes = []
+        with self._cond:
+            for record, result in zip(records, results):
+                record['attempts'] += 1
+                if result['ok']:
+                    self._set_status(record, 'sent', gateway_id=result['id'])
+                elif record['attempts'] > self.max_retries:
+                    logger.error(f"Giving up on SMS #{record['id']} to {record['to']}: {result['error']}")
+                    self._set_status(record, 'failed', error=result['error'])
+                else:
+                    delay = self.retry_backoff * (2 ** (record['attempts'] - 1))
+                    self._set_status(record, 'queued', error=result['error'])
+                    heapq.heappush(self._delayed, (self.clock() + delay, record['id']))
+                    continue
+                callback = self._callbacks.pop(record['id'], None)
+                if callback is not None:
+                    outcomes.append((callback, result))
+            self._cond.notify_all()
+
+        for callback, result in outcomes:
+            try:
+                callback(result['ok'], result['error'])
+            except Exception as e:
+                logger.error(f"Error in SMS result callback: {str(e)}")
+
+
+def outbox_from_env():
+    """Build the outbox for the gateway configured in the environment"""
+    outbox = SmsOutbox(gateway_from_env(), journal_path=os.environ.get('SMS_OUTBOX_JOURNAL'))
+    rate_limit = os.environ.get('SMS_RATE_LIMIT')
+    if rate_limit:
+        gateway, _ = outbox._gateways[outbox.default_gateway]
+        outbox.add_gateway(gateway, rate_limit=float(rate_limit))
+    return outbox
+
+
+outbox = outbox_from_env()
+atexit.register(outbox.close)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure outbox throughput against the fake SMS gateway")
+    parser.add_argument('--messages', type=int, default=10000, help="Messages to send (default: %(default)s)")
+    parser.add_argument('--batch-size', type=int, default=50, help="Messages per gateway call (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=1, help="Sending threads (default: %(default)s)")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Simulated seconds per gateway call (default: %(default)s)")
+    parser.add_argument('--rate', type=float, default=None,
+                        help="Token bucket rate in messages per second (default: unlimited)")
+    parser.add_argument('--fail-every', type=int, default=0,
+                        help="Make every Nth recipient fail permanently (default: never)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+    recipients = [f"+2547{i:08d}" for i in range(args.messages)]
+    failing = recipients[::args.fail_every] if args.fail_every else ()
+    gateway = FakeGateway(failing_numbers=failing, latency=args.latency, rate_limit=args.rate, record=False)
+    bench = SmsOutbox(gateway, batch_size=args.batch_size, workers=args.workers, max_retries=1,
+                      retry_backoff=0.01, max_history=args.messages)
+
+    start = time.perf_counter()
+    for to in recipients:
+        bench.enqueue(to, "Benchmark message from Tujali Telehealth", kind='benchmark')
+    enqueued = time.perf_counter() - start
+    bench.flush()
+    elapsed = time.perf_counter() - start
+    bench.close()
+
+    print(f"Enqueued {args.messages} messages in {enqueued * 1000:.1f} ms "
+          f"({enqueued / args.messages * 1e6:.1f} us each)")
+    print(f"Delivered to the gateway in {elapsed:.2f}s: {gateway.sent_count / elapsed:.0f} msg/s, "
+          f"{gateway.batches} gateway calls")
+    print(f"Statuses: {bench.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+/**
+ * ai-stream.js
+ * Shows AI-generated content part by part while a background job streams it
+ *
+ * A page with an element carrying data-job-id follows /api/jobs/<id>/events and
+ * renders each part into its [data-stream-items] child as it arrives. When the
+ * job has finished the page reloads, so the server renders the complete result.
+ */
+
+document.addEventListener('DOMContentLoaded', function() {
+    const pendingJob = document.querySelector('[data-job-id]');
+    if (!pendingJob || !window.EventSource) {
+        return;
+    }
+
+    const container = pendingJob.querySelector('[data-stream-items]');
+    const sections = {};
+
+    function label(field) {
+        const text = field.replace(/_/g, ' ');
+        return text.charAt(0).toUpperCase() + text.slice(1);
+    }
+
+    function section(field, isList) {
+        if (!sections[field]) {
+            const wrapper = document.createElement('div');
+            wrapper.className = 'mb-3 text-start';
+            const heading = document.createElement('h6');
+            heading.className = 'text-secondary';
+            heading.textContent = label(field);
+            wrapper.appendChild(heading);
+            const body = document.createElement(isList ? 'ul' : 'p');
+            wrapper.appendChild(body);
+            container.appendChild(wrapper);
+            sections[field] = body;
+        }
+        return sections[field];
+    }
+
+    function render(value) {
+        // Objects such as {"title": ..., "description": ...}: first value in bold
+        if (value !== null && typeof value === 'object') {
+            const fragment = document.createDocumentFragment();
+            Object.values(value).forEach(function(part, i) {
+                const element = document.createElement(i === 0 ? 'strong' : 'span');
+                element.textContent = (i === 0 ? '' : ' ') + part;
+                fragment.appendChild(element);
+            });
+            return fragment;
+        }
+        return document.createTextNode(String(value));
+    }
+
+    const events = new EventSource('/api/jobs/' + pendingJob.dataset.jobId + '/events');
+
+    events.addEventListener('item', function(message) {
+        const item = JSON.parse(message.data);
+        if (item.index === null) {
+            section(item.field, false).replaceChildren(render(item.value));
+        } else {
+            const entry = document.createElement('li');
+            entry.className = 'mb-2';
+            entry.appendChild(render(item.value));
+            section(item.field, true).appendChild(entry);
+        }
+    });
+
+    function finish() {
+        events.close();
+        window.location.reload();
+    }
+    events.addEventListener('done', finish);
+    events.addEventListener('failed', finish);
+});
@@ -215,6 +215,11 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Auto-refresh dashboard data every 2 minutes
     function refreshDashboardData() {
+        // Background tabs wait until they are looked at again
+        if (document.hidden) {
+            return;
+        }
+
         // Show loading animation while refreshing
         if (window.culturalLoader) {
             window.culturalLoader.showSpecific('maasai', 'Refreshing dashboard data...');
@@ -235,6 +240,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Set up periodic refresh
     setInterval(refreshDashboardData, 120000); // 2 minutes
+    document.addEventListener('visibilitychange', refreshDashboardData);
     
     // Responsive behavior for small screens
     function handleResponsiveLayout() {
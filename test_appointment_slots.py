@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that slot holds never double-book and expire on their own
+"""
+import threading
+import time
+from datetime import date, timedelta
+
+from models import init_db, Provider, Appointment
+from appointment_slots import SlotEngine
+
+
+def next_weekday(weekday):
+    """The first future date falling on a weekday (0 = Monday)"""
+    day = date.today() + timedelta(days=1)
+    while day.weekday() != weekday:
+        day += timedelta(days=1)
+    return day
+
+
+def test_concurrent_holds_on_one_slot():
+    print("Testing concurrent holds on the same slot...")
+    init_db()
+    engine = SlotEngine()
+    provider = Provider.get_by_id(1)
+    day = next_weekday(0)
+    start = threading.Barrier(16)
+    holds = []
+
+    def grab():
+        start.wait()
+        hold = engine.hold(provider, day, '10:00')
+        if hold is not None:
+            holds.append(hold)
+
+    threads = [threading.Thread(target=grab) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"  {len(holds)} of {len(threads)} holds succeeded")
+    assert len(holds) == 1
+    assert '10:00' not in engine.free_slots(provider, day)
+
+    appointment = engine.commit(holds[0], patient_id=1)
+    assert appointment is not None
+    assert engine.hold(provider, day, '10:00') is None
+
+
+def test_expired_hold_frees_the_slot():
+    print("Testing that an expired hold frees its slot...")
+    init_db()
+    engine = SlotEngine()
+    provider = Provider.get_by_id(1)
+    day = next_weekday(1)
+
+    first = engine.hold(provider, day, '11:00', ttl=0.1)
+    assert first is not None
+    assert engine.hold(provider, day, '11:00') is None
+
+    time.sleep(0.2)
+    assert '11:00' in engine.free_slots(provider, day)
+    second = engine.hold(provider, day, '11:00')
+    assert second is not None
+
+    # The expired hold lost the slot to the new one
+    booked = len(Appointment.get_by_provider(provider.id))
+    assert engine.commit(first, patient_id=1) is None
+    appointment = engine.commit(second, patient_id=2)
+    assert appointment is not None and appointment.patient_id == 2
+    assert len(Appointment.get_by_provider(provider.id)) == booked + 1
+    print("  the expired hold could not commit; the new hold booked the slot")
+
+
+if __name__ == "__main__":
+    test_concurrent_holds_on_one_slot()
+    test_expired_hold_frees_the_slot()
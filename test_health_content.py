@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that pre-generated health content is kept only in the language it was asked for
+"""
+import health_content
+
+
+def answer(language):
+    """A generate() stand-in whose answer reports the given language"""
+    def generate(topic, requested):
+        return {
+            "title": f"About {topic}",
+            "overview": "An overview.",
+            "key_points": ["A key point"],
+            "prevention": ["A prevention tip"],
+            "when_to_seek_help": "When to seek help.",
+            "language": language
+        }
+    return generate
+
+
+def test_answers_in_another_language_are_not_stored():
+    print("Testing the language the AI service reports...")
+    assert health_content.generate_pair(answer('so'), 'malaria', 'so') is not None
+    assert health_content.generate_pair(answer('or'), 'malaria', 'om') is not None
+    assert health_content.generate_pair(answer('en'), 'malaria', 'en') is not None
+
+    # English instead of Somali or Oromo, or no language at all, is not kept
+    assert health_content.generate_pair(answer('en'), 'malaria', 'so') is None
+    assert health_content.generate_pair(answer('en'), 'malaria', 'om') is None
+    assert health_content.generate_pair(answer(None), 'malaria', 'am') is None
+    print("  only answers reported in the requested language were kept")
+
+
+if __name__ == "__main__":
+    test_answers_in_another_language_are_not_stored()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script to verify hedged LLM dispatch against the local stub servers
+"""
+import json
+import time
+
+from anthropic import Anthropic
+from openai import OpenAI
+
+from llm_dispatch import (LlmDispatcher, LlmError, OpenAIProvider, AnthropicProvider, LLM_CALLS,
+                          start_stub_server)
+
+
+def make_dispatcher(openai_latency, anthropic_latency, fail_every=0, **options):
+    openai_stub = start_stub_server('openai', openai_latency, fail_every=fail_every)
+    anthropic_stub = start_stub_server('anthropic', anthropic_latency)
+    providers = [
+        OpenAIProvider(OpenAI(api_key='stub', base_url=f"http://127.0.0.1:{openai_stub.server_port}/v1")),
+        AnthropicProvider(Anthropic(api_key='stub', base_url=f"http://127.0.0.1:{anthropic_stub.server_port}"))
+    ]
+    dispatcher = LlmDispatcher(providers, **options)
+    # The breakers are shared by name; start each check with them closed
+    for breaker in dispatcher.breakers.values():
+        breaker.reset()
+    return dispatcher, [openai_stub, anthropic_stub]
+
+
+def answered_by(result):
+    return result['overview'].split()[-2]
+
+
+def test_hedge_wins_when_primary_is_slow():
+    print("Testing hedging a slow provider...")
+    dispatcher, stubs = make_dispatcher(3.0, 0.1, deadline=2.0, hedge_after=0.2, max_workers=4)
+    try:
+        start = time.monotonic()
+        result = dispatcher.complete("You are a stub.", "Say hello.", parse=json.loads)
+        elapsed = time.monotonic() - start
+        print(f"  answered by {answered_by(result)} in {elapsed:.2f}s")
+        assert answered_by(result) == 'anthropic'
+        assert elapsed < 1.0
+    finally:
+        dispatcher.close()
+        for stub in stubs:
+            stub.shutdown()
+
+
+def test_hedge_losers_free_their_workers():
+    print("Testing that lost hedges stop instead of holding workers...")
+    # Two workers: a loser that ran to its timeout would leave no worker for the next hedge
+    dispatcher, stubs = make_dispatcher(3.0, 0.1, deadline=2.0, hedge_after=0.2, max_workers=2)
+    cancelled_before = LLM_CALLS.get(provider='openai', result='cancelled')
+    try:
+        start = time.monotonic()
+        for _ in range(4):
+            result = dispatcher.complete("You are a stub.", "Say hello.", parse=json.loads)
+            assert answered_by(result) == 'anthropic'
+        elapsed = time.monotonic() - start
+        # The last loser notices its cancel flag at its next chunk
+        time.sleep(0.5)
+        cancelled = LLM_CALLS.get(provider='openai', result='cancelled') - cancelled_before
+        print(f"  4 requests in {elapsed:.2f}s, {cancelled:.0f} lost calls stopped")
+        assert elapsed < 3.0
+        assert cancelled == 4
+    finally:
+        dispatcher.close()
+        for stub in stubs:
+            stub.shutdown()
+
+
+def test_failed_provider_falls_back():
+    print("Testing fallback after a failed call...")
+    dispatcher, stubs = make_dispatcher(0.1, 0.1, fail_every=1, deadline=2.0, hedge_after=1.5, max_workers=4)
+    try:
+        start = time.monotonic()
+        result = dispatcher.complete("You are a stub.", "Say hello.", parse=json.loads)
+        elapsed = time.monotonic() - start
+        print(f"  answered by {answered_by(result)} in {elapsed:.2f}s")
+        assert answered_by(result) == 'anthropic'
+        # The fallback starts on the failure, not after hedge_after
+        assert elapsed < 1.0
+    finally:
+        dispatcher.close()
+        for stub in stubs:
+            stub.shutdown()
+
+
+def test_deadline_raises():
+    print("Testing the deadline...")
+    dispatcher, stubs = make_dispatcher(3.0, 3.0, deadline=0.5, hedge_after=0.1, max_workers=4)
+    try:
+        start = time.monotonic()
+        try:
+            dispatcher.complete("You are a stub.", "Say hello.", parse=json.loads)
+        except LlmError as e:
+            print(f"  failed after {time.monotonic() - start:.2f}s: {e}")
+        else:
+            raise AssertionError("expected LlmError")
+        assert time.monotonic() - start < 1.0
+    finally:
+        dispatcher.close()
+        for stub in stubs:
+            stub.shutdown()
+
+
+if __name__ == "__main__":
+    test_hedge_wins_when_primary_is_slow()
+    test_hedge_losers_free_their_workers()
+    test_failed_provider_falls_back()
+    test_deadline_raises()
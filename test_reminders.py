@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that each appointment reminder is sent exactly once
+"""
+from datetime import datetime, timedelta
+
+from models import init_db, Appointment, Patient
+from reminders import ReminderScheduler
+from sms_gateway import FakeGateway
+from sms_outbox import SmsOutbox
+
+
+class RecordingGateway:
+    """Accepts every message and remembers it"""
+    name = 'recording'
+
+    def __init__(self):
+        self.sent = []
+
+    def send_batch(self, messages):
+        self.sent.extend(messages)
+        return [{'ok': True, 'error': None} for _ in messages]
+
+
+def test_reminder_sent_once_after_reschedule_and_reload():
+    print("Testing reminders across a reschedule and a reload...")
+    init_db()
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    first_start = now + timedelta(days=3, hours=1)
+    appointment = Appointment.create(1, 1, first_start.strftime('%d-%m-%Y'), first_start.strftime('%H:%M'))
+
+    gateway = RecordingGateway()
+    scheduler = ReminderScheduler(gateway, lead_time=timedelta(hours=24))
+    assert scheduler.schedule(appointment, now=now.timestamp())
+
+    # Moved two days later; the first heap entry goes stale
+    second_start = first_start + timedelta(days=2)
+    appointment.date = second_start.strftime('%d-%m-%Y')
+    appointment.time = second_start.strftime('%H:%M')
+    assert scheduler.schedule(appointment, now=now.timestamp())
+
+    # A reload pushes the same due time again; it is still one reminder
+    assert scheduler.load(now=now.timestamp()) == 1
+    assert scheduler.pending() == 1
+
+    first_due = (first_start - timedelta(hours=24)).timestamp()
+    second_due = (second_start - timedelta(hours=24)).timestamp()
+    assert scheduler.run_due(now=first_due + 1) == 0
+    assert not gateway.sent
+
+    assert scheduler.run_due(now=second_due + 1) == 1
+    assert scheduler.run_due(now=second_due + 2) == 0
+    print(f"  {len(gateway.sent)} reminder sent for appointment #{appointment.id}")
+    assert [message['appointment_id'] for message in gateway.sent] == [appointment.id]
+    assert Appointment.get_by_id(appointment.id).reminder_sent
+
+    # Neither this scheduler nor one started after a restart queues it again
+    assert not scheduler.schedule(appointment, now=now.timestamp())
+    restarted = ReminderScheduler(gateway, lead_time=timedelta(hours=24))
+    restarted.load(now=now.timestamp())
+    restarted.run_due(now=second_due + 3)
+    assert len(gateway.sent) == 1
+
+
+
+def drain(outbox):
+    """Send everything the outbox would send right now, as its worker would"""
+    while True:
+        with outbox._cond:
+            gateway, batch = outbox._take_batch()
+        if gateway is None:
+            return
+        outbox._send(gateway, batch)
+
+
+def test_reminder_marked_only_once_the_outbox_sends_it():
+    print("Testing reminders sent through the outbox...")
+    init_db()
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = now + timedelta(hours=30)
+    appointment = Appointment.create(1, 1, start.strftime('%d-%m-%Y'), start.strftime('%H:%M'))
+    phone_number = Patient.get_by_id(1).phone_number
+
+    gateway = FakeGateway(failing_numbers=[phone_number])
+    outbox = SmsOutbox(gateway, max_retries=0, workers=0)
+    scheduler = ReminderScheduler(outbox, lead_time=timedelta(hours=24), retry_delay=60)
+    assert scheduler.schedule(appointment, now=now.timestamp())
+
+    # Queued, not yet sent: not marked, and not queued a second time
+    due = (start - timedelta(hours=24)).timestamp()
+    assert scheduler.run_due(now=due + 1) == 1
+    assert not Appointment.get_by_id(appointment.id).reminder_sent
+    scheduler.schedule(appointment, now=now.timestamp())
+    assert scheduler.run_due(now=due + 2) == 0
+    assert outbox.pending() == 1
+
+    # The outbox gives up: the reminder stays unmarked and is retried here
+    drain(outbox)
+    assert outbox.stats() == {'failed': 1}
+    assert not Appointment.get_by_id(appointment.id).reminder_sent
+    assert scheduler.pending() == 1
+
+    gateway.failing_numbers.clear()
+    scheduler.run_due(now=scheduler.next_due() + 1)
+    drain(outbox)
+    print(f"  outbox statuses {outbox.stats()}, {len(gateway.sent)} reminder delivered")
+    assert Appointment.get_by_id(appointment.id).reminder_sent
+    assert len(gateway.sent) == 1
+    assert scheduler.pending() == 0
+
+
+if __name__ == "__main__":
+    test_reminder_sent_once_after_reschedule_and_reload()
+    test_reminder_marked_only_once_the_outbox_sends_it()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test script to verify SMS outbox rate limiting and retries with a fake clock
+"""
+from sms_gateway import FakeGateway
+from sms_outbox import SmsOutbox
+
+
+class FakeClock:
+    """Time that only moves when told to"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TimedGateway(FakeGateway):
+    """FakeGateway that notes the fake time of every send attempt per recipient"""
+    def __init__(self, clock, **options):
+        super().__init__(**options)
+        self.clock = clock
+        self.attempts = {}
+
+    def send(self, to, body):
+        self.attempts.setdefault(to, []).append(self.clock())
+        return super().send(to, body)
+
+
+def drain(outbox):
+    """Send every batch the outbox would send right now, as its worker would"""
+    while True:
+        with outbox._cond:
+            gateway, batch = outbox._take_batch()
+        if gateway is None:
+            return
+        outbox._send(gateway, batch)
+
+
+def test_token_bucket_caps_throughput():
+    print("Testing that the token bucket caps throughput...")
+    clock = FakeClock()
+    gateway = TimedGateway(clock, rate_limit=10)
+    # No workers: the test sends, so only the fake clock decides what is allowed
+    outbox = SmsOutbox(gateway, batch_size=50, workers=0, clock=clock)
+    for i in range(100):
+        outbox.enqueue(f"+2547{i:08d}", "Rate limit test")
+
+    drain(outbox)
+    assert gateway.sent_count == 10  # one second of burst
+    for step in range(1, 51):
+        clock.advance(0.1)
+        drain(outbox)
+        elapsed = step * 0.1
+        assert gateway.sent_count <= 10 + 10 * elapsed + 1e-9
+    print(f"  {gateway.sent_count} messages in 5 simulated seconds at 10/s with a burst of 10")
+    assert gateway.sent_count == 60
+    assert outbox.pending() == 40
+
+
+def test_failed_messages_back_off_then_fail():
+    print("Testing retries with exponential backoff...")
+    clock = FakeClock()
+    gateway = TimedGateway(clock, failing_numbers=['+254700000002'])
+    outbox = SmsOutbox(gateway, max_retries=3, retry_backoff=1.0, workers=0, clock=clock)
+    good = outbox.enqueue('+254700000001', "Retry test")
+    bad = outbox.enqueue('+254700000002', "Retry test")
+
+    start = clock()
+    for _ in range(40):
+        drain(outbox)
+        clock.advance(0.25)
+
+    offsets = [round(at - start, 2) for at in gateway.attempts['+254700000002']]
+    print(f"  failing message attempted at +{offsets}s, then {outbox.status(bad)['status']}")
+    # First attempt plus max_retries retries, 1s, 2s and 4s apart
+    assert offsets == [0.0, 1.0, 3.0, 7.0]
+    assert outbox.status(bad)['status'] == 'failed'
+    assert outbox.status(bad)['attempts'] == 4
+    assert outbox.status(good)['status'] == 'sent'
+    assert outbox.pending() == 0
+
+
+
+class FlakyNetworkGateway(FakeGateway):
+    """FakeGateway whose connection drops on the second send of each batch"""
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.calls = 0
+        self.received = []
+
+    def send(self, to, body):
+        self.calls += 1
+        if self.calls % 3 == 2:
+            raise ConnectionError("Connection reset by peer")
+        self.received.append(to)
+        return super().send(to, body)
+
+
+def test_network_error_only_retries_that_message():
+    print("Testing a network error partway through a batch...")
+    clock = FakeClock()
+    gateway = FlakyNetworkGateway()
+    outbox = SmsOutbox(gateway, max_retries=3, retry_backoff=1.0, workers=0, clock=clock)
+    ids = {to: outbox.enqueue(to, "Network error test") for to in ('a', 'b', 'c')}
+
+    drain(outbox)
+    assert gateway.received == ['a', 'c']
+    assert outbox.status(ids['b'])['status'] == 'queued'
+    clock.advance(1.0)
+    drain(outbox)
+
+    print(f"  gateway received {gateway.received}")
+    assert gateway.received == ['a', 'c', 'b']
+    assert all(outbox.status(message_id)['status'] == 'sent' for message_id in ids.values())
+
+
+
+def test_sent_messages_wait_for_their_delivery_report():
+    print("Testing that history limits keep sent messages for their delivery report...")
+    clock = FakeClock()
+    gateway = FakeGateway()
+    outbox = SmsOutbox(gateway, workers=0, max_history=2, clock=clock)
+    ids = [outbox.enqueue(f"+2547{i:08d}", "History test") for i in range(4)]
+    drain(outbox)
+
+    # Over max_history, but no report has come in yet
+    assert all(outbox.status(message_id)['status'] == 'sent' for message_id in ids)
+    for message_id in ids:
+        assert outbox.update_delivery(outbox.status(message_id)['gateway_id'], 'delivered')
+
+    # Settled records beyond max_history then make room
+    print(f"  every delivery report found its message; {len(outbox._records)} records kept")
+    assert [outbox.status(message_id) and outbox.status(message_id)['status'] for message_id in ids] == \
+        [None, None, 'delivered', 'delivered']
+
+
+if __name__ == "__main__":
+    test_token_bucket_caps_throughput()
+    test_failed_messages_back_off_then_fail()
+    test_network_error_only_retries_that_message()
+    test_sent_messages_wait_for_their_delivery_report()
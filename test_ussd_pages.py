@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that long health information fills its USSD pages
+"""
+import re
+
+import health_content
+from mock_ai_service import generate_health_education
+from ussd_messages import catalog
+from ussd_pages import paginate, SCREEN_CHARS, MIN_LAST_WORDS
+
+PAGE = re.compile(r'^CON (?:.*\(1/\d+\):\n|\(\d+/\d+\) )(.*)\n\n', re.S)
+
+
+def page_contents(pages):
+    contents = []
+    for page in pages:
+        match = PAGE.match(page)
+        assert match, page
+        contents.append(match.group(1))
+    return contents
+
+
+def test_multi_page_article_fills_its_pages():
+    print("Testing page fill of multi-page articles...")
+    for language in ('en', 'sw', 'om', 'am'):
+        for topic in ('covid', 'malaria', 'nutrition'):
+            info = health_content.format_content(generate_health_education(topic, language))
+            pages = paginate(info['title'], info['content'], language)
+            navigation = catalog.text('info_next', language) + "\n" + catalog.text('info_previous', language) + "\n"
+            room = SCREEN_CHARS - len(catalog.text('info_page', language, counter=f"{len(pages)}/{len(pages)}",
+                                                   content='', navigation=navigation))
+            contents = page_contents(pages)
+            print(f"  {topic}/{language}: {len(pages)} pages, content per page {[len(c) for c in contents]}")
+
+            assert len(pages) > 1
+            assert all(len(page) - len('CON ') <= SCREEN_CHARS for page in pages)
+            # Nothing lost or reordered
+            assert ' '.join(' '.join(contents).split()) == ' '.join(info['content'].split())
+            # Pages after the first are mostly content, and no page holds a stray word or two
+            assert room >= SCREEN_CHARS * 0.7
+            assert all(len(content) >= room * 0.6 for content in contents[1:-1])
+            first_lines = [content.split('\n')[0] for content in contents[1:]]
+            assert all(line.endswith(':') or len(line.split()) >= 3 for line in first_lines)
+            assert len(contents[-1].split()) >= MIN_LAST_WORDS
+
+
+if __name__ == "__main__":
+    test_multi_page_article_fills_its_pages()
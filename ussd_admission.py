@@ -0,0 +1,159 @@
+"""
+Deadline-aware admission control for the USSD endpoint
+
+The gateway abandons a hop that is not answered within its time budget, so
+work that cannot finish in time only steals capacity from hops that can.
+Every /ussd request gets a deadline (arrival time plus the gateway budget)
+and must win a slot before it is processed:
+
+- hops of sessions already in progress may use every slot, while new dials
+  may only use a share of them, and new dials never overtake waiting
+  in-progress hops
+- a request waits for a slot only while it could still finish before its
+  deadline, judged by a moving average of recent hop service times
+- anything else is shed immediately with the cached "service busy" screen
+
+Configure with USSD_MAX_IN_FLIGHT, USSD_GATEWAY_BUDGET (seconds) and
+USSD_NEW_SESSION_SHARE.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from metrics import Counter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SHED_REQUESTS = Counter('ussd_shed_requests',
+                        'USSD hops answered with the service busy screen',
+                        ['kind', 'reason'])
+
+
+def parse_request_start(header_value):
+    """
+    Parse an X-Request-Start header set by the proxy
+
+    Accepts 't=<seconds>' or a bare timestamp in seconds, milliseconds or
+    microseconds since the epoch.
+
+    Returns:
+        float: Arrival time as a time.time() timestamp, or None
+    """
+    if not header_value:
+        return None
+    value = header_value.strip()
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        timestamp = float(value)
+    except ValueError:
+        return None
+    # Normalize milliseconds and microseconds to seconds
+    while timestamp > 1e11:
+        timestamp /= 1000.0
+    return timestamp
+
+
+class AdmissionController:
+    """
+    Bounded, priority-aware slots for USSD hops
+
+    Args:
+        max_in_flight (int): Hops processed concurrently
+        budget (float): Gateway time budget per hop in seconds
+        new_session_share (float): Fraction of slots new dials may use
+        safety_margin (float): Seconds kept in reserve for sending the response
+    """
+    def __init__(self, max_in_flight=32, budget=5.0, new_session_share=0.75, safety_margin=0.25):
+        self.max_in_flight = max_in_flight
+        self.budget = budget
+        self.new_session_limit = max(1, int(max_in_flight * new_session_share))
+        self.safety_margin = safety_margin
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting_in_progress = 0
+        self._service_time = 0.05  # moving average, seconds
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def deadline(self, request_start_header=None, started=None):
+        """
+        Monotonic deadline for a hop
+
+        Args:
+            request_start_header (str, optional): X-Request-Start header value
+            started (float, optional): time.perf_counter() when Flask received it
+        """
+        now_monotonic = time.monotonic()
+        arrival = parse_request_start(request_start_header)
+        if arrival is not None:
+            # Include time spent queued in front of the app
+            waited = max(0.0, time.time() - arrival)
+        elif started is not None:
+            waited = max(0.0, time.perf_counter() - started)
+        else:
+            waited = 0.0
+        return now_monotonic - waited + self.budget
+
+    def expected_service_time(self):
+        return self._service_time
+
+    def acquire(self, is_new, deadline):
+        """
+        Wait for a processing slot
+
+        Args:
+            is_new (bool): Whether this hop starts a new session
+            deadline (float): time.monotonic() by which the response is due
+
+        Returns:
+            bool: True if admitted (call release() afterwards), False to shed
+        """
+        kind = 'new' if is_new else 'in_progress'
+        limit = self.new_session_limit if is_new else self.max_in_flight
+        with self._cond:
+            while True:
+                has_slot = self._in_flight < limit
+                if is_new and self._waiting_in_progress:
+                    # In-progress sessions go first
+                    has_slot = False
+
+                slack = deadline - time.monotonic() - self._service_time - self.safety_margin
+                if slack <= 0:
+                    SHED_REQUESTS.inc(kind=kind, reason='deadline')
+                    return False
+                if has_slot:
+                    self._in_flight += 1
+                    return True
+
+                if not is_new:
+                    self._waiting_in_progress += 1
+                try:
+                    self._cond.wait(slack)
+                finally:
+                    if not is_new:
+                        self._waiting_in_progress -= 1
+
+    def release(self, elapsed):
+        """
+        Free a slot and update the service time estimate
+
+        Args:
+            elapsed (float): Seconds the hop took to process
+        """
+        with self._cond:
+            self._in_flight -= 1
+            self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+            self._cond.notify_all()
+
+
+admission = AdmissionController(
+    max_in_flight=int(os.environ.get('USSD_MAX_IN_FLIGHT', 32)),
+    budget=float(os.environ.get('USSD_GATEWAY_BUDGET', 5.0)),
+    new_session_share=float(os.environ.get('USSD_NEW_SESSION_SHARE', 0.75))
+)
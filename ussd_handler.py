@@ -1,15 +1,155 @@
 import logging
+import os
+import time
 from models import Patient, Provider, Appointment, Message, HealthInfo
 from datetime import datetime, timedelta
+from ussd_sessions import SessionStore, ResponseCache, ResumeStore
+from ussd_messages import catalog, ussd_prefix
+from metrics import Counter, Histogram, count_lookups, instrument_lookups
+from write_behind import write_queue
+from appointment_slots import slots
+from reminders import reminders
+from health_content import health_content, HEALTH_TOPICS
+from health_search import health_index
+from ussd_pages import info_pages
 import utils
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Session storage for USSD
-# This is used to keep track of user state between USSD requests
-# In production, this should be stored in a database or cache
-sessions = {}
+# This is used to keep track of user state between USSD requests.
+# Sessions are stored as JSON so the store can be swapped for a shared cache.
+sessions = SessionStore()
+
+# Responses by (session_id, text), so gateway retries never re-run a handler
+responses = ResponseCache(ttl=120)
+
+# Unfinished flows by phone number, offered again when a dropped caller redials
+resumable = ResumeStore(window=int(os.environ.get('USSD_RESUME_WINDOW', 300)))
+
+# Seconds a slot stays reserved while the caller is on the confirmation screen
+SLOT_HOLD_SECONDS = int(os.environ.get('USSD_SLOT_HOLD_SECONDS', 120))
+
+# USSD metrics, exposed on /metrics
+HOP_LATENCY = Histogram('ussd_hop_duration_seconds',
+                        'Time to answer a USSD hop, by the state that handled it',
+                        ['state', 'language'])
+HANDLER_LATENCY = Histogram('ussd_handler_duration_seconds',
+                            'Time spent in a USSD state handler',
+                            ['state', 'handler', 'language'])
+INVALID_INPUTS = Counter('ussd_invalid_input',
+                         'USSD inputs rejected by a state validator',
+                         ['state', 'language'])
+ERRORS = Counter('ussd_errors',
+                 'USSD hops that failed with an unexpected error',
+                 ['state', 'language'])
+RETRIED_HOPS = Counter('ussd_retried_hops',
+                       'USSD hops answered from the response cache because the gateway retried them')
+MODEL_LOOKUPS = Histogram('ussd_model_lookups_per_hop',
+                          'Model lookups made while answering a USSD hop',
+                          ['state'], buckets=(0, 1, 2, 3, 5, 8, 13, 21))
+RESUME_CHOICES = Counter('ussd_resume_choices',
+                         'Answers to the offer to resume an unfinished USSD flow',
+                         ['choice'])
+
+instrument_lookups(Patient, Provider, Appointment, Message, HealthInfo)
+
+# Language selection options on the welcome screen
+LANGUAGE_OPTIONS = {
+    '1': 'en',
+    '2': 'sw',
+    '3': 'fr',
+    '4': 'om',
+    '5': 'so',
+    '6': 'am'
+}
+
+
+class InvalidInput(ValueError):
+    """Raised by a state validator when the user's input is not acceptable"""
+
+
+class HopContext:
+    """
+    Per-request context for a single USSD hop
+
+    Wraps the session being processed and loads the patient record at most
+    once per hop, so handlers and screens can share it freely.
+    """
+    def __init__(self, session_id, session, text):
+        self.session_id = session_id
+        self.session = session
+        self.text = text
+        self.state_name = session['state']
+        self._patient = None
+        self._patient_loaded = False
+
+    @property
+    def patient(self):
+        """Patient registered with the session's phone number (or None)"""
+        if not self._patient_loaded:
+            self._patient = Patient.get_by_phone(self.session['phone_number'])
+            self._patient_loaded = True
+        return self._patient
+
+    @patient.setter
+    def patient(self, patient):
+        self._patient = patient
+        self._patient_loaded = True
+
+    @property
+    def language(self):
+        return self.session['language']
+
+    @property
+    def data(self):
+        return self.session['data']
+
+    def screen(self, key, **slots):
+        """Render a catalog screen in the session's language as a USSD response"""
+        return catalog.respond(key, self.language, **slots)
+
+    def message(self, key, **slots):
+        """Get catalog text in the session's language, without a USSD prefix"""
+        return catalog.text(key, self.language, **slots)
+
+
+class UssdState:
+    """
+    Declarative description of a USSD state
+
+    Args:
+        handler (callable): handler(ctx, value) called with the validated input
+        validator (callable, optional): validator(ctx, raw_input) returning the
+            parsed value or raising InvalidInput
+        on_invalid (callable, optional): screen(ctx) shown when validation fails;
+            defaults to the generic invalid option screen
+        allow_back (bool): Whether a trailing '*0' returns to the main menu
+            instead of being passed to the handler
+        prompt (callable, optional): screen(ctx) asking for this state's input
+            again; states with a prompt can be resumed after a dropped session
+    """
+    def __init__(self, handler, validator=None, on_invalid=None, allow_back=True, prompt=None):
+        self.handler = handler
+        self.validator = validator
+        self.on_invalid = on_invalid
+        self.allow_back = allow_back
+        self.prompt = prompt
+
+
+def new_session(session_id, phone_number):
+    """Create the initial state for a USSD session"""
+    return {
+        'session_id': session_id,
+        'phone_number': phone_number,
+        'state': 'start',
+        'language': 'en',  # Default language
+        'consumed': 0,  # Input segments already processed
+        'input_kinds': [],  # Kind of input each processed segment was (see INPUT_KINDS)
+        'data': {}
+    }
+
 
 def ussd_callback(session_id, service_code, phone_number, text):
     """
@@ -24,1143 +164,902 @@ def ussd_callback(session_id, service_code, phone_number, text):
     Returns:
         str: USSD response with appropriate prefix
     """
+    response, cached = responses.get_or_compute(
+        session_id, text, lambda: process_hop(session_id, phone_number, text))
+    if cached:
+        RETRIED_HOPS.inc()
+    return response
+
+
+def cached_response(session_id, text):
+    """Response already sent for this hop if the gateway is retrying it, else None"""
+    response = responses.peek(session_id, text)
+    if response is not None:
+        RETRIED_HOPS.inc()
+    return response
+
+
+def is_new_session(session_id):
+    """Whether a hop opens a session the store does not hold yet"""
+    return session_id not in sessions
+
+
+def process_hop(session_id, phone_number, text):
+    """Run the state machine for one hop and persist the session"""
     # Initialize session if needed
-    if session_id not in sessions:
-        sessions[session_id] = {
-            'phone_number': phone_number,
-            'state': 'start',
-            'language': 'en',  # Default language
-            'data': {}
-        }
+    session = sessions.get(session_id)
+    if session is None:
+        session = new_session(session_id, phone_number)
     
-    session = sessions[session_id]
+    ctx = HopContext(session_id, session, text)
+    language = ctx.language
+    start = time.perf_counter()
+    with count_lookups() as lookups:
+        response = dispatch(ctx)
+    HOP_LATENCY.observe(time.perf_counter() - start, state=ctx.state_name, language=language)
+    MODEL_LOOKUPS.observe(lookups['count'], state=ctx.state_name)
+    
+    sessions.save(session_id, session)
+    remember_flow(session)
+    return response
+
+
+def remember_flow(session):
+    """Keep the caller's place in a resumable flow, or forget it once the flow is left"""
+    state = STATES.get(session['state'])
+    if session['state'] == 'resume_offer':
+        return
+    if state is not None and state.prompt is not None:
+        resumable.save(session['phone_number'], {
+            'state': session['state'],
+            'language': session['language'],
+            'data': session['data']
+        })
+    else:
+        resumable.discard(session['phone_number'])
+
+
+def service_busy_response(session_id):
+    """
+    Pre-rendered "service busy" screen for a shed hop
+
+    Uses the caller's language when their session is known and never runs
+    a handler or changes the session.
+    """
+    session = sessions.get(session_id)
+    language = session['language'] if session else 'en'
+    return catalog.respond('service_busy', language)
+
+
+def dispatch(ctx):
+    """
+    Route a hop to the handlers registered for the session's states
+
+    The gateway sends the whole '*'-joined input chain on every hop. Normally
+    one new segment arrives per hop, but a caller can pre-type several, for
+    example by dialling *384*4040*1*2# to pick English and then "Schedule
+    appointment". Every segment the session has not consumed yet is fed
+    through the state machine in order, so such shortcuts resolve in a
+    single round trip.
+    """
+    session = ctx.session
     
     # Check if we need to start over
-    if text == '':
+    if ctx.text == '':
         session['state'] = 'start'
         session['data'] = {}
+        session['consumed'] = 0
+        session['input_kinds'] = []
+        ctx.state_name = 'start'
+        snapshot = resumable.get(session['phone_number'])
+        if snapshot is not None:
+            # The caller dropped out of a flow recently; offer to pick it up again
+            session['state'] = 'resume_offer'
+            session['language'] = snapshot['language']
+            return ctx.screen('resume_offer')
+        response, _ = run_step(ctx, '')
+        return response
     
-    # Handle language selection first if not already set
+    segments = ctx.text.split('*')
+    consumed = session.get('consumed')
+    if consumed is None or consumed >= len(segments):
+        # Out of step with the gateway; only the latest input is new
+        consumed = len(segments) - 1
+    session['consumed'] = len(segments)
+    
+    ctx.state_name = session['state']
+    response = None
     if session['state'] == 'start':
-        response = "Welcome to Tujali Telehealth\n"
-        response += "Karibu kwenye Tujali Telehealth\n"
-        response += "Bienvenue sur Tujali Telehealth\n"
-        response += "Soo dhawow Tujali Telehealth\n"
-        response += "1. English\n"
-        response += "2. Kiswahili\n"
-        response += "3. Français (French)\n"
-        response += "4. Afaan Oromoo (Oromo)\n"
-        response += "5. Soomaali (Somali)\n"
-        response += "6. Amharic (አማርኛ)"
-        session['state'] = 'select_language'
-        return respond(response)
+        # Dialled with inputs already attached: show the first screen and carry on
+        response, _ = run_step(ctx, '')
     
-    elif session['state'] == 'select_language':
-        if text == '1' or text.endswith('*1'):
-            session['language'] = 'en'
-            return show_main_menu(session)
-        elif text == '2' or text.endswith('*2'):
-            session['language'] = 'sw'
-            return show_main_menu(session)
-        elif text == '3' or text.endswith('*3'):
-            session['language'] = 'fr'
-            return show_main_menu(session)
-        elif text == '4' or text.endswith('*4'):
-            session['language'] = 'om'
-            return show_main_menu(session)
-        elif text == '5' or text.endswith('*5'):
-            session['language'] = 'so'
-            return show_main_menu(session)
-        elif text == '6' or text.endswith('*6'):
-            session['language'] = 'am'
-            return show_main_menu(session)
+    for index in range(consumed, len(segments)):
+        # A '0' after earlier input means "back to main menu"
+        go_back = index > 0 and segments[index] == '0'
+        note_input_kind(session, index, go_back)
+        response, accepted = run_step(ctx, segments[index], go_back)
+        if not accepted:
+            break
+    return response
+
+def note_input_kind(session, index, go_back=False):
+    """Remember what kind of input segment `index` is, from the state about to consume it"""
+    kinds = session.setdefault('input_kinds', [])
+    del kinds[index:]
+    kinds.extend([None] * (index - len(kinds)))
+    state = STATES.get(session['state'])
+    if go_back or state is None:
+        kinds.append('menu')
+    else:
+        kinds.append(INPUT_KINDS.get(state.validator, 'menu'))
+
+def input_kinds(session_id):
+    """
+    Kinds of the input segments a session has processed, for anonymized traces
+
+    Returns:
+        list: 'menu', 'text', 'number', 'location' or None (not processed)
+        per segment of the session's input chain
+    """
+    session = sessions.get(session_id)
+    return list(session.get('input_kinds') or []) if session else []
+
+def run_step(ctx, raw, go_back=False):
+    """
+    Feed one input segment to the handler of the session's current state
+
+    Args:
+        ctx (HopContext): Current hop
+        raw (str): The input segment
+        go_back (bool): Whether a '0' here means "back to main menu"
+
+    Returns:
+        tuple: (USSD response, whether the input was accepted)
+    """
+    session = ctx.session
+    state_name = session['state']
+    state = STATES.get(state_name)
+    accepted = False
+    
+    try:
+        if state is None:
+            # Unknown state, return to main menu
+            response = show_main_menu(ctx)
+        elif state.allow_back and go_back:
+            # Return to main menu from anywhere
+            response = show_main_menu(ctx)
+            accepted = True
         else:
-            return respond(get_invalid_option_text(session))
+            try:
+                value = state.validator(ctx, raw) if state.validator else raw
+            except InvalidInput:
+                INVALID_INPUTS.inc(state=state_name, language=ctx.language)
+                screen = state.on_invalid or show_invalid_option
+                response = screen(ctx)
+            else:
+                with HANDLER_LATENCY.time(state=state_name, handler=state.handler.__name__,
+                                          language=ctx.language):
+                    response = state.handler(ctx, value)
+                accepted = True
+    except Exception as e:
+        ERRORS.inc(state=state_name, language=ctx.language)
+        logger.error(f"Error processing USSD request in state {state_name}: {e}")
+        response = ctx.screen('error')
+        accepted = False
     
-    # Process based on current state
-    if text.endswith('*0'):  # Return to main menu from anywhere
-        return show_main_menu(session)
+    return response, accepted
+
+# ============== INPUT VALIDATORS ==============
+
+def screen_prompt(key):
+    """Prompt that shows a fixed catalog screen"""
+    return lambda ctx: ctx.screen(key)
+
+def choice(*options):
+    """Build a validator accepting only the given menu options"""
+    def validate(ctx, raw):
+        if raw not in options:
+            raise InvalidInput(raw)
+        return raw
+    return validate
+
+def text_input(ctx, raw):
+    """Accept any non-empty free text"""
+    value = raw.strip()
+    if not value:
+        raise InvalidInput(raw)
+    return value
+
+def integer_input(ctx, raw):
+    """Accept a whole number"""
+    try:
+        return int(raw)
+    except ValueError:
+        raise InvalidInput(raw)
+
+def menu_item(data_key):
+    """Build a validator mapping a 1-based selection to an item of session['data'][data_key]"""
+    def validate(ctx, raw):
+        items = ctx.data.get(data_key) or []
+        try:
+            selection = int(raw)
+        except ValueError:
+            raise InvalidInput(raw)
+        if not 1 <= selection <= len(items):
+            raise InvalidInput(raw)
+        return items[selection - 1]
+    return validate
+
+def coordinates_input(ctx, raw):
+    """
+    Accept 'latitude,longitude' or '0' to skip
+
+    Returns:
+        tuple: (latitude, longitude), or None when the user entered '0'
+    """
+    if raw == '0':
+        return None
     
-    # Get the last input from the user
-    parts = text.split('*')
-    last_input = parts[-1] if parts else ''
+    # Parse latitude and longitude from input
+    coords = raw.strip().split(',')
+    if len(coords) != 2:
+        raise InvalidInput(raw)
     
-    # Route to appropriate handler based on state
     try:
-        if session['state'] == 'main_menu':
-            return handle_main_menu(session, last_input)
-        elif session['state'].startswith('register'):
-            return handle_registration(session, last_input)
-        elif session['state'].startswith('symptom'):
-            return handle_symptoms(session, last_input)
-        elif session['state'].startswith('appointment'):
-            return handle_appointments(session, last_input)
-        elif session['state'].startswith('message'):
-            return handle_messages(session, last_input)
-        elif session['state'].startswith('profile') or session['state'].startswith('update_coordinates') or session['state'].startswith('coordinates_updated'):
-            return handle_messages(session, last_input)
-        elif session['state'].startswith('info'):
-            return handle_health_info(session, last_input)
-        else:
-            # Unknown state, return to main menu
-            return show_main_menu(session)
-    except Exception as e:
-        logger.error(f"Error processing USSD request: {e}")
-        
-        # Provide error messages in all supported languages
-        if session['language'] == 'en':
-            error_msg = "Sorry, an error occurred. Please try again."
-        elif session['language'] == 'sw':
-            error_msg = "Samahani, kuna hitilafu imetokea. Tafadhali jaribu tena."
-        elif session['language'] == 'fr':
-            error_msg = "Désolé, une erreur s'est produite. Veuillez réessayer."
-        elif session['language'] == 'om':
-            error_msg = "Dhiifama, dogoggora uumame. Maaloo irra deebi'ii yaali."
-        elif session['language'] == 'so':
-            error_msg = "Waan xumaatay, khalad ayaa dhacay. Fadlan isku day mar kale."
-        elif session['language'] == 'am':
-            error_msg = "ይቅርታ፣ ስህተት ተከስቷል። እባክዎ እንደገና ይሞክሩ።"
-        else:
-            error_msg = "Sorry, an error occurred. Please try again."
-            
-        return respond(error_msg)
+        latitude = float(coords[0].strip())
+        longitude = float(coords[1].strip())
+    except ValueError:
+        raise InvalidInput(raw)
+    
+    # Validate latitude and longitude ranges
+    if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
+        raise InvalidInput(raw)
+    
+    return (latitude, longitude)
+
+# Inputs that are not menu selections, by the validator that accepts them
+INPUT_KINDS = {
+    text_input: 'text',
+    integer_input: 'number',
+    coordinates_input: 'location'
+}
+
+def main_menu_choice(ctx, raw):
+    """Accept the main menu options available to this caller"""
+    if ctx.patient:
+        options = ('1', '2', '3', '4', '5', '0')
+    else:
+        options = ('1', '2', '0')
+    if raw not in options:
+        raise InvalidInput(raw)
+    return raw
+
+# ============== LANGUAGE AND MAIN MENU ==============
 
-def show_main_menu(session):
+def handle_resume_offer(ctx, selection):
+    """Restore the caller's unfinished flow or start over"""
+    phone_number = ctx.session['phone_number']
+    snapshot = resumable.get(phone_number)
+    if selection == '2' or snapshot is None:
+        RESUME_CHOICES.inc(choice='restart')
+        resumable.discard(phone_number)
+        return show_language_menu(ctx)
+
+    RESUME_CHOICES.inc(choice='continue')
+    ctx.session['state'] = snapshot['state']
+    ctx.session['language'] = snapshot['language']
+    ctx.session['data'] = snapshot['data']
+    return STATES[snapshot['state']].prompt(ctx)
+
+def show_language_menu(ctx, value=None):
+    """Display the welcome screen with language options"""
+    ctx.session['state'] = 'select_language'
+    ctx.session['data'] = {}
+    return ctx.screen('language_menu')
+
+def handle_language_selection(ctx, selection):
+    """Store the selected language and show the main menu"""
+    ctx.session['language'] = LANGUAGE_OPTIONS[selection]
+    return show_main_menu(ctx)
+
+def show_main_menu(ctx):
     """Display the main menu based on user's language and registration status"""
-    patient = Patient.get_by_phone(session['phone_number'])
-    
+    patient = ctx.patient
+    ctx.session['state'] = 'main_menu'
+
     if patient:
         # User is registered, show main menu
-        if session['language'] == 'en':
-            response = f"Welcome back, {patient.name}\n"
-            response += "1. Report symptoms\n"
-            response += "2. Schedule appointment\n"
-            response += "3. Messages\n"
-            response += "4. Health information\n"
-            response += "5. My profile\n"
-            response += "0. Back to language selection"
-        elif session['language'] == 'sw':
-            response = f"Karibu tena, {patient.name}\n"
-            response += "1. Ripoti dalili\n"
-            response += "2. Panga miadi\n"
-            response += "3. Ujumbe\n"
-            response += "4. Habari za afya\n"
-            response += "5. Wasifu wangu\n"
-            response += "0. Rudi kwa uchaguzi wa lugha"
-        elif session['language'] == 'fr':
-            response = f"Bon retour, {patient.name}\n"
-            response += "1. Signaler des symptômes\n"
-            response += "2. Planifier un rendez-vous\n"
-            response += "3. Messages\n"
-            response += "4. Informations de santé\n"
-            response += "5. Mon profil\n"
-            response += "0. Retour à la sélection de langue"
-        elif session['language'] == 'om':
-            response = f"Baga nagaan dhufte, {patient.name}\n"
-            response += "1. Mallattoo gabaasi\n"
-            response += "2. Qabsoo walhitti dhufeenyaa karoorsii\n"
-            response += "3. Ergaawwan\n"
-            response += "4. Odeeffannoo fayyaa\n"
-            response += "5. Profaayilii koo\n"
-            response += "0. Gara filannoo afaaniitti deebi'i"
-        elif session['language'] == 'so':
-            response = f"Ku soo dhawow, {patient.name}\n"
-            response += "1. Warbixin calaamadaha\n"
-            response += "2. Jadwalka ballanta\n"
-            response += "3. Fariimaha\n"
-            response += "4. Macluumaadka caafimaadka\n"
-            response += "5. Astaantayda\n"
-            response += "0. Ku noqo xulashada luuqadda"
-        elif session['language'] == 'am':
-            response = f"እንደገና እንኳን ደህና መጡ, {patient.name}\n"
-            response += "1. የህመም ምልክቶችን ሪፖርት ያድርጉ\n"
-            response += "2. ቀጠሮ ያስይዙ\n"
-            response += "3. መልዕክቶች\n"
-            response += "4. የጤና መረጃ\n"
-            response += "5. የግል መገለጫዬ\n"
-            response += "0. ወደ ቋንቋ ምርጫ ይመለሱ"
-        else:
-            # Default to English if language code not recognized
-            response = f"Welcome back, {patient.name}\n"
-            response += "1. Report symptoms\n"
-            response += "2. Schedule appointment\n"
-            response += "3. Messages\n"
-            response += "4. Health information\n"
-            response += "5. My profile\n"
-            response += "0. Back to language selection"
-    else:
-        # User is not registered, prompt for registration
-        if session['language'] == 'en':
-            response = "Welcome to Tujali Telehealth\n"
-            response += "1. Register\n"
-            response += "2. Health information\n"
-            response += "0. Back to language selection"
-        elif session['language'] == 'sw':
-            response = "Karibu kwenye Tujali Telehealth\n"
-            response += "1. Jisajili\n"
-            response += "2. Habari za afya\n"
-            response += "0. Rudi kwa uchaguzi wa lugha"
-        elif session['language'] == 'fr':
-            response = "Bienvenue sur Tujali Telehealth\n"
-            response += "1. S'inscrire\n"
-            response += "2. Informations de santé\n"
-            response += "0. Retour à la sélection de langue"
-        elif session['language'] == 'om':
-            response = "Tujali Telehealth dhuferra baga nagaan dhufte\n"
-            response += "1. Galmaa'i\n"
-            response += "2. Odeeffannoo fayyaa\n"
-            response += "0. Gara filannoo afaaniitti deebi'i"
-        elif session['language'] == 'so':
-            response = "Ku soo dhawow Tujali Telehealth\n"
-            response += "1. Isdiiwaangeli\n"
-            response += "2. Macluumaadka caafimaadka\n"
-            response += "0. Ku noqo xulashada luuqadda"
-        elif session['language'] == 'am':
-            response = "ወደ ቱጃሊ ቴሌሄልዝ እንኳን ደህና መጡ\n"
-            response += "1. ይመዝገቡ\n"
-            response += "2. የጤና መረጃ\n"
-            response += "0. ወደ ቋንቋ ምርጫ ይመለሱ"
-        else:
-            # Default to English if language code not recognized
-            response = "Welcome to Tujali Telehealth\n"
-            response += "1. Register\n"
-            response += "2. Health information\n"
-            response += "0. Back to language selection"
-    
-    session['state'] = 'main_menu'
-    return respond(response)
+        return ctx.screen('main_menu_registered', name=patient.name)
+    # User is not registered, prompt for registration
+    return ctx.screen('main_menu_guest')
 
-def handle_main_menu(session, selection):
+def handle_main_menu(ctx, selection):
     """Process main menu selection"""
-    patient = Patient.get_by_phone(session['phone_number'])
-    
-    if patient:
+    if selection == '0':
+        return show_language_menu(ctx)
+
+    if ctx.patient:
         # Registered user menu options
         if selection == '1':
-            return start_symptoms_report(session)
+            return start_symptoms_report(ctx)
         elif selection == '2':
-            return start_appointment_scheduling(session)
+            return start_appointment_scheduling(ctx)
         elif selection == '3':
-            return show_messages(session)
+            return show_messages(ctx)
         elif selection == '4':
-            return show_health_info_menu(session)
-        elif selection == '5':
-            return show_profile(session, patient)
-        elif selection == '0':
-            session['state'] = 'start'
-            return ussd_callback(session['session_id'], '', session['phone_number'], '')
+            return show_health_info_menu(ctx)
         else:
-            return respond(get_invalid_option_text(session))
+            return show_profile(ctx)
     else:
         # Unregistered user menu options
         if selection == '1':
-            return start_registration(session)
-        elif selection == '2':
-            return show_health_info_menu(session)
-        elif selection == '0':
-            session['state'] = 'start'
-            return ussd_callback(session['session_id'], '', session['phone_number'], '')
+            return start_registration(ctx)
         else:
-            return respond(get_invalid_option_text(session))
+            return show_health_info_menu(ctx)
 
-def start_registration(session):
+# ============== REGISTRATION ==============
+
+def start_registration(ctx):
     """Begin patient registration process"""
-    if session['language'] == 'en':
-        response = "Please enter your full name:"
-    elif session['language'] == 'sw':
-        response = "Tafadhali ingiza jina lako kamili:"
-    elif session['language'] == 'fr':
-        response = "Veuillez entrer votre nom complet:"
-    elif session['language'] == 'om':
-        response = "Maaloo maqaa guutuu keessan galchaa:"
-    elif session['language'] == 'so':
-        response = "Fadlan geli magacaaga oo buuxa:"
-    elif session['language'] == 'am':
-        response = "እባክዎ ሙሉ ስምዎን ያስገቡ:"
-    else:
-        response = "Please enter your full name:"
-    
-    session['state'] = 'register_name'
-    return respond(response)
+    ctx.session['state'] = 'register_name'
+    return ctx.screen('enter_name')
 
-def handle_registration(session, input_text):
-    """Process registration steps"""
-    state = session['state']
-    
-    if state == 'register_name':
-        session['data']['name'] = input_text
-        if session['language'] == 'en':
-            response = "Enter your age:"
-        else:
-            response = "Ingiza umri wako:"
-        session['state'] = 'register_age'
-        return respond(response)
-    
-    elif state == 'register_age':
-        try:
-            age = int(input_text)
-            session['data']['age'] = age
-            if session['language'] == 'en':
-                response = "Select your gender:\n"
-                response += "1. Male\n"
-                response += "2. Female\n"
-                response += "3. Other"
-            else:
-                response = "Chagua jinsia yako:\n"
-                response += "1. Mume\n"
-                response += "2. Mke\n"
-                response += "3. Nyingine"
-            session['state'] = 'register_gender'
-            return respond(response)
-        except ValueError:
-            if session['language'] == 'en':
-                return respond("Please enter a valid age (numbers only).")
-            else:
-                return respond("Tafadhali ingiza umri halali (namba tu).")
-    
-    elif state == 'register_gender':
-        if input_text == '1':
-            session['data']['gender'] = 'Male'
-        elif input_text == '2':
-            session['data']['gender'] = 'Female'
-        elif input_text == '3':
-            session['data']['gender'] = 'Other'
-        else:
-            return respond(get_invalid_option_text(session))
-        
-        if session['language'] == 'en':
-            response = "Enter your location (county/city):"
-        else:
-            response = "Ingiza eneo lako (kaunti/mji):"
-        session['state'] = 'register_location'
-        return respond(response)
-    
-    elif state == 'register_location':
-        session['data']['location'] = input_text
-        
-        # Ask if the user wants to provide coordinates for location-based provider matching
-        if session['language'] == 'en':
-            response = "Would you like to provide your location coordinates for better provider matching?\n"
-            response += "1. Yes\n"
-            response += "2. No, complete registration without coordinates"
-        elif session['language'] == 'sw':
-            response = "Je, ungependa kutoa mahali pa eneo lako kwa uwianishaji bora wa mtoa huduma?\n"
-            response += "1. Ndio\n"
-            response += "2. Hapana, kamilisha usajili bila mahali"
-        elif session['language'] == 'fr':
-            response = "Souhaitez-vous fournir vos coordonnées de localisation pour une meilleure correspondance avec les prestataires?\n"
-            response += "1. Oui\n"
-            response += "2. Non, terminer l'inscription sans coordonnées"
-        else:
-            response = "Would you like to provide your location coordinates for better provider matching?\n"
-            response += "1. Yes\n"
-            response += "2. No, complete registration without coordinates"
-        
-        session['state'] = 'register_coordinates_choice'
-        return respond(response)
-        
-    elif state == 'register_coordinates_choice':
-        if input_text == '1':
-            # User wants to provide coordinates
-            if session['language'] == 'en':
-                response = "Please enter your latitude and longitude separated by a comma (e.g., -1.2921,36.8219):"
-            elif session['language'] == 'sw':
-                response = "Tafadhali ingiza latitudo na longitudo iliyotenganishwa kwa koma (mfano, -1.2921,36.8219):"
-            elif session['language'] == 'fr':
-                response = "Veuillez entrer votre latitude et longitude séparées par une virgule (exemple, -1.2921,36.8219):"
-            else:
-                response = "Please enter your latitude and longitude separated by a comma (e.g., -1.2921,36.8219):"
-            
-            session['state'] = 'register_coordinates'
-            return respond(response)
-        elif input_text == '2':
-            # Complete registration without coordinates
-            patient = Patient.create(
-                phone_number=session['phone_number'],
-                name=session['data']['name'],
-                age=session['data']['age'],
-                gender=session['data']['gender'],
-                location=session['data']['location'],
-                language=session['language']
-            )
-            
-            # Show confirmation
-            if session['language'] == 'en':
-                response = f"Registration successful!\n"
-                response += f"Name: {patient.name}\n"
-                response += f"ID: {patient.id}\n"
-                response += "Select 0 to continue to main menu."
-            else:
-                response = f"Usajili umefaulu!\n"
-                response += f"Jina: {patient.name}\n"
-                response += f"Kitambulisho: {patient.id}\n"
-                response += "Chagua 0 kuendelea kwenye menyu kuu."
-            
-            session['state'] = 'registration_complete'
-            return respond(response)
-        else:
-            return respond(get_invalid_option_text(session))
-            
-    elif state == 'register_coordinates':
-        try:
-            # Parse latitude and longitude from input
-            coords = input_text.strip().split(',')
-            if len(coords) != 2:
-                raise ValueError("Invalid format")
-                
-            latitude = float(coords[0].strip())
-            longitude = float(coords[1].strip())
-            
-            # Validate latitude and longitude ranges
-            if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
-                raise ValueError("Coordinates out of range")
-                
-            # Create patient record with coordinates
-            patient = Patient.create(
-                phone_number=session['phone_number'],
-                name=session['data']['name'],
-                age=session['data']['age'],
-                gender=session['data']['gender'],
-                location=session['data']['location'],
-                language=session['language'],
-                coordinates=(latitude, longitude)
-            )
-            
-            # Show confirmation
-            if session['language'] == 'en':
-                response = f"Registration successful!\n"
-                response += f"Name: {patient.name}\n"
-                response += f"Location: {patient.location}\n"
-                response += f"Coordinates saved for location-based provider matching.\n"
-                response += f"ID: {patient.id}\n"
-                response += "Select 0 to continue to main menu."
-            elif session['language'] == 'sw':
-                response = f"Usajili umefaulu!\n"
-                response += f"Jina: {patient.name}\n"
-                response += f"Eneo: {patient.location}\n"
-                response += f"Mahali pamehifadhiwa kwa uwianishaji wa mtoa huduma kulingana na eneo.\n"
-                response += f"Kitambulisho: {patient.id}\n"
-                response += "Chagua 0 kuendelea kwenye menyu kuu."
-            elif session['language'] == 'fr':
-                response = f"Inscription réussie!\n"
-                response += f"Nom: {patient.name}\n"
-                response += f"Emplacement: {patient.location}\n"
-                response += f"Coordonnées enregistrées pour la correspondance des prestataires basée sur la localisation.\n"
-                response += f"ID: {patient.id}\n"
-                response += "Sélectionnez 0 pour continuer vers le menu principal."
-            else:
-                response = f"Registration successful!\n"
-                response += f"Name: {patient.name}\n"
-                response += f"Location: {patient.location}\n"
-                response += f"Coordinates saved for location-based provider matching.\n"
-                response += f"ID: {patient.id}\n"
-                response += "Select 0 to continue to main menu."
-            
-            session['state'] = 'registration_complete'
-            return respond(response)
-        except ValueError as e:
-            # Invalid coordinate format
-            if session['language'] == 'en':
-                response = "Invalid coordinates format. Please enter latitude and longitude separated by a comma (e.g., -1.2921,36.8219).\n"
-                response += "Try again or press 0 to cancel and complete registration without coordinates."
-            elif session['language'] == 'sw':
-                response = "Umbali si sahihi. Tafadhali ingiza latitudo na longitudo iliyotenganishwa kwa koma (mfano, -1.2921,36.8219).\n"
-                response += "Jaribu tena au bonyeza 0 kughairi na kukamilisha usajili bila mahali."
-            elif session['language'] == 'fr':
-                response = "Format de coordonnées invalide. Veuillez entrer la latitude et la longitude séparées par une virgule (exemple, -1.2921,36.8219).\n"
-                response += "Réessayez ou appuyez sur 0 pour annuler et terminer l'inscription sans coordonnées."
-            else:
-                response = "Invalid coordinates format. Please enter latitude and longitude separated by a comma (e.g., -1.2921,36.8219).\n"
-                response += "Try again or press 0 to cancel and complete registration without coordinates."
-            
-            if input_text == '0':
-                # Create patient record without coordinates
-                patient = Patient.create(
-                    phone_number=session['phone_number'],
-                    name=session['data']['name'],
-                    age=session['data']['age'],
-                    gender=session['data']['gender'],
-                    location=session['data']['location'],
-                    language=session['language']
-                )
-                
-                # Show confirmation
-                if session['language'] == 'en':
-                    response = f"Registration successful!\n"
-                    response += f"Name: {patient.name}\n"
-                    response += f"ID: {patient.id}\n"
-                    response += "Select 0 to continue to main menu."
-                else:
-                    response = f"Usajili umefaulu!\n"
-                    response += f"Jina: {patient.name}\n"
-                    response += f"Kitambulisho: {patient.id}\n"
-                    response += "Chagua 0 kuendelea kwenye menyu kuu."
-                
-                session['state'] = 'registration_complete'
-                return respond(response)
-            else:
-                return respond(response)
-    
-    elif state == 'registration_complete':
-        if input_text == '0':
-            return show_main_menu(session)
-        else:
-            return respond(get_invalid_option_text(session))
-    
-    else:
-        # Unknown registration state, return to main menu
-        return show_main_menu(session)
+def handle_register_name(ctx, name):
+    """Store the patient's name and ask for their age"""
+    ctx.data['name'] = name
+    ctx.session['state'] = 'register_age'
+    return ctx.screen('enter_age')
+
+def show_invalid_age(ctx):
+    """Ask again for a numeric age"""
+    return ctx.screen('invalid_age')
+
+def handle_register_age(ctx, age):
+    """Store the patient's age and ask for their gender"""
+    ctx.data['age'] = age
+    ctx.session['state'] = 'register_gender'
+    return ctx.screen('select_gender')
 
-def start_symptoms_report(session):
+def handle_register_gender(ctx, selection):
+    """Store the patient's gender and ask for their location"""
+    genders = {
+        '1': 'Male',
+        '2': 'Female',
+        '3': 'Other'
+    }
+    ctx.data['gender'] = genders[selection]
+    ctx.session['state'] = 'register_location'
+    return ctx.screen('enter_location')
+
+def handle_register_location(ctx, location):
+    """Store the patient's location and offer to capture coordinates"""
+    ctx.data['location'] = location
+
+    # Ask if the user wants to provide coordinates for location-based provider matching
+    ctx.session['state'] = 'register_coordinates_choice'
+    return ctx.screen('coordinates_choice')
+
+def handle_register_coordinates_choice(ctx, selection):
+    """Either ask for coordinates or complete registration without them"""
+    if selection == '1':
+        # User wants to provide coordinates
+        ctx.session['state'] = 'register_coordinates'
+        return ctx.screen('enter_coordinates')
+
+    # Complete registration without coordinates
+    return complete_registration(ctx)
+
+def show_invalid_registration_coordinates(ctx):
+    """Explain the expected coordinate format during registration"""
+    return ctx.screen('invalid_registration_coordinates')
+
+def handle_register_coordinates(ctx, coordinates):
+    """Complete registration, with coordinates unless the user entered 0"""
+    return complete_registration(ctx, coordinates)
+
+def complete_registration(ctx, coordinates=None):
+    """Create the patient record from the collected registration data"""
+    session = ctx.session
+    patient = Patient.create(
+        phone_number=session['phone_number'],
+        name=session['data']['name'],
+        age=session['data']['age'],
+        gender=session['data']['gender'],
+        location=session['data']['location'],
+        language=session['language'],
+        coordinates=tuple(coordinates) if coordinates else None
+    )
+    ctx.patient = patient
+    session['state'] = 'registration_complete'
+
+    # Show confirmation
+    if coordinates:
+        return ctx.screen('registration_complete_coordinates', name=patient.name,
+                          location=patient.location, patient_id=patient.id)
+    return ctx.screen('registration_complete', name=patient.name, patient_id=patient.id)
+
+def return_to_main_menu(ctx, value):
+    """Handler for confirmation screens whose only option is 0"""
+    return show_main_menu(ctx)
+
+# ============== SYMPTOM REPORTING ==============
+
+def start_symptoms_report(ctx):
     """Begin symptom reporting process"""
-    if session['language'] == 'en':
-        response = "Please describe your symptoms:"
-    else:
-        response = "Tafadhali eleza dalili zako:"
-    
-    session['state'] = 'symptom_description'
-    return respond(response)
+    ctx.session['state'] = 'symptom_description'
+    return ctx.screen('describe_symptoms')
+
+def handle_symptom_description(ctx, description):
+    """Record the symptom description and ask about duration"""
+    # Recorded once the severity is known, in handle_symptom_severity
+    ctx.data['symptoms'] = description
+
+    # Ask about symptom duration
+    ctx.session['state'] = 'symptom_duration'
+    return ctx.screen('symptom_duration')
+
+def handle_symptom_duration(ctx, selection):
+    """Record how long the symptoms have lasted and ask about severity"""
+    durations = {
+        '1': 'Today only',
+        '2': 'Few days',
+        '3': 'A week or more',
+        '4': 'A month or more'
+    }
+    ctx.data['duration'] = durations[selection]
+
+    # Ask about symptom severity
+    ctx.session['state'] = 'symptom_severity'
+    return ctx.screen('symptom_severity')
+
+def handle_symptom_severity(ctx, selection):
+    """Record severity, notify a provider and show next steps"""
+    session = ctx.session
+    patient = ctx.patient
+    severities = {
+        '1': 'Mild',
+        '2': 'Moderate',
+        '3': 'Severe'
+    }
+    session['data']['severity'] = severities[selection]
+
+    # Record the symptom with enhanced metadata
+    symptom_text = session['data']['symptoms']
+    symptom_severity = session['data']['severity']
+    symptom_duration = session['data']['duration']
+
+    # Update the symptom text to include duration for better categorization
+    enhanced_symptom_text = f"{symptom_text} for {symptom_duration}"
+
+    # Add the symptom to patient record with severity. This is clinical data, so it is
+    # written before we answer rather than on the write-behind queue.
+    patient.add_symptom(enhanced_symptom_text, severity=symptom_severity)
+
+    # Find an available provider
+    provider = Provider.get_all()[0]  # For simplicity, get the first provider
+
+    # Create a message for the provider with symptom details
+    message_content = f"Symptoms: {symptom_text}\n"
+    message_content += f"Duration: {symptom_duration}\n"
+    message_content += f"Severity: {symptom_severity}"
+
+    # Notifying the provider and logging the report can happen after we answer
+    write_queue.enqueue('message',
+                        provider_id=provider.id,
+                        patient_id=patient.id,
+                        content=message_content,
+                        sender_type='patient')
+    write_queue.enqueue('interaction', patient_id=patient.id, interaction_type='symptom',
+                        description=f"Reported symptoms via USSD: {symptom_text}",
+                        metadata={'severity': symptom_severity, 'duration': symptom_duration})
+
+    # Show confirmation and next steps
+    session['state'] = 'symptom_next_steps'
+    return ctx.screen('symptom_reported')
+
+def handle_symptom_next_steps(ctx, selection):
+    """Offer to schedule an appointment after a symptom report"""
+    if selection == '1':
+        return start_appointment_scheduling(ctx)
+    return show_main_menu(ctx)
+
+# ============== APPOINTMENTS ==============
+
+def appointment_candidates(ctx):
+    """
+    Providers the patient can book with
+
+    Returns:
+        tuple: (providers, True if they are the nearby providers sorted by distance)
+    """
+    patient = ctx.patient
+    if patient.coordinates:
+        providers = patient.find_nearby_providers(max_distance=50)
+        if providers:
+            return providers, True
+    return Provider.get_all(), False
+
+def start_appointment_scheduling(ctx, notice=None):
+    """Begin appointment scheduling process, optionally explaining why it restarted"""
+    session = ctx.session
+    providers, _ = appointment_candidates(ctx)
+
+    # Offer the next 7 days on which a candidate provider has a free slot
+    tomorrow = datetime.now() + timedelta(days=1)
+    dates = [day.strftime('%d-%m-%Y') for day in slots.open_days(providers, tomorrow, count=7)]
 
-def handle_symptoms(session, input_text):
-    """Process symptom reporting steps"""
-    state = session['state']
-    patient = Patient.get_by_phone(session['phone_number'])
-    
-    if state == 'symptom_description':
-        session['data']['symptoms'] = input_text
-        patient.add_symptom(input_text)
-        
-        # Ask about symptom duration
-        if session['language'] == 'en':
-            response = "How long have you had these symptoms?\n"
-            response += "1. Today only\n"
-            response += "2. Few days\n"
-            response += "3. A week or more\n"
-            response += "4. A month or more"
-        else:
-            response = "Umepatwa na dalili hizi kwa muda gani?\n"
-            response += "1. Leo tu\n"
-            response += "2. Siku chache\n"
-            response += "3. Wiki moja au zaidi\n"
-            response += "4. Mwezi mmoja au zaidi"
-        
-        session['state'] = 'symptom_duration'
-        return respond(response)
-    
-    elif state == 'symptom_duration':
-        if input_text in ['1', '2', '3', '4']:
-            durations = {
-                '1': 'Today only',
-                '2': 'Few days',
-                '3': 'A week or more',
-                '4': 'A month or more'
-            }
-            session['data']['duration'] = durations[input_text]
-            
-            # Ask about symptom severity
-            if session['language'] == 'en':
-                response = "How severe are your symptoms?\n"
-                response += "1. Mild - I can function normally\n"
-                response += "2. Moderate - Affecting daily activities\n"
-                response += "3. Severe - Cannot function normally"
-            else:
-                response = "Dalili zako ni kali kiasi gani?\n"
-                response += "1. Kidogo - Ninaweza kufanya kazi kama kawaida\n"
-                response += "2. Wastani - Zinaathiri shughuli za kila siku\n"
-                response += "3. Kali - Siwezi kufanya kazi kama kawaida"
-            
-            session['state'] = 'symptom_severity'
-            return respond(response)
-        else:
-            return respond(get_invalid_option_text(session))
-    
-    elif state == 'symptom_severity':
-        if input_text in ['1', '2', '3']:
-            severities = {
-                '1': 'Mild',
-                '2': 'Moderate',
-                '3': 'Severe'
-            }
-            session['data']['severity'] = severities[input_text]
-            
-            # Record the symptom with enhanced metadata
-            symptom_text = session['data']['symptoms']
-            symptom_severity = session['data']['severity']
-            symptom_duration = session['data']['duration']
-            
-            # Update the symptom text to include duration for better categorization
-            enhanced_symptom_text = f"{symptom_text} for {symptom_duration}"
-            
-            # Add the symptom to patient record with severity
-            patient.add_symptom(enhanced_symptom_text, severity=symptom_severity)
-            
-            # Find an available provider
-            provider = Provider.get_all()[0]  # For simplicity, get the first provider
-            
-            # Create a message for the provider with symptom details
-            message_content = f"Symptoms: {symptom_text}\n"
-            message_content += f"Duration: {symptom_duration}\n"
-            message_content += f"Severity: {symptom_severity}"
-            
-            Message.create(
-                provider_id=provider.id,
-                patient_id=patient.id,
-                content=message_content,
-                sender_type='patient'
-            )
-            
-            # Show confirmation and next steps
-            if session['language'] == 'en':
-                response = "Thank you for reporting your symptoms.\n"
-                response += "A healthcare provider will review your symptoms and respond shortly.\n"
-                response += "1. Schedule an appointment\n"
-                response += "0. Return to main menu"
-            else:
-                response = "Asante kwa kuripoti dalili zako.\n"
-                response += "Mtoa huduma ya afya atakagua dalili zako na kujibu hivi karibuni.\n"
-                response += "1. Panga miadi\n"
-                response += "0. Rudi kwenye menyu kuu"
-            
-            session['state'] = 'symptom_next_steps'
-            return respond(response)
-        else:
-            return respond(get_invalid_option_text(session))
-    
-    elif state == 'symptom_next_steps':
-        if input_text == '1':
-            return start_appointment_scheduling(session)
-        elif input_text == '0':
-            return show_main_menu(session)
-        else:
-            return respond(get_invalid_option_text(session))
-    
-    else:
-        # Unknown symptom state, return to main menu
-        return show_main_menu(session)
-
-def start_appointment_scheduling(session):
-    """Begin appointment scheduling process"""
-    # Get available dates (next 7 days)
-    today = datetime.now()
-    dates = [(today + timedelta(days=i)).strftime('%d-%m-%Y') for i in range(1, 8)]
-    
     session['data']['available_dates'] = dates
-    
-    if session['language'] == 'en':
-        response = "Select preferred date:\n"
-    else:
-        response = "Chagua tarehe unayopendelea:\n"
-    
+
+    response = (notice + "\n" if notice else "") + ctx.message('select_date') + "\n"
+
     # Show dates
     for i, date in enumerate(dates, 1):
         # Format the date in a user-friendly way
         formatted_date = utils.format_date(date, session['language'])
         response += f"{i}. {formatted_date}\n"
-    
+
     session['state'] = 'appointment_date'
     return respond(response)
 
-def handle_appointments(session, input_text):
-    """Process appointment scheduling steps"""
-    state = session['state']
-    patient = Patient.get_by_phone(session['phone_number'])
-    
-    if state == 'appointment_date':
-        try:
-            selection = int(input_text)
-            if 1 <= selection <= len(session['data']['available_dates']):
-                selected_date = session['data']['available_dates'][selection - 1]
-                session['data']['selected_date'] = selected_date
-                
-                # Get available time slots
-                time_slots = ['09:00', '10:00', '11:00', '14:00', '15:00', '16:00']
-                session['data']['available_times'] = time_slots
-                
-                if session['language'] == 'en':
-                    response = "Select preferred time:\n"
-                else:
-                    response = "Chagua wakati unaopendelea:\n"
-                
-                # Show time slots
-                for i, time in enumerate(time_slots, 1):
-                    response += f"{i}. {time}\n"
-                
-                session['state'] = 'appointment_time'
-                return respond(response)
-            else:
-                return respond(get_invalid_option_text(session))
-        except ValueError:
-            return respond(get_invalid_option_text(session))
-    
-    elif state == 'appointment_time':
-        try:
-            selection = int(input_text)
-            if 1 <= selection <= len(session['data']['available_times']):
-                selected_time = session['data']['available_times'][selection - 1]
-                session['data']['selected_time'] = selected_time
-                
-                # Get patient object
-                patient = Patient.get_by_phone(session['phone_number'])
-                
-                # Find nearby providers if patient has location data
-                if patient.coordinates:
-                    providers = patient.find_nearby_providers(max_distance=50)
-                    session['data']['using_location'] = True
-                else:
-                    providers = Provider.get_all()
-                    session['data']['using_location'] = False
-                
-                session['data']['available_providers'] = providers
-                
-                if session['language'] == 'en':
-                    if patient.coordinates:
-                        response = "Select healthcare provider (sorted by distance):\n"
-                    else:
-                        response = "Select healthcare provider:\n"
-                elif session['language'] == 'sw':
-                    if patient.coordinates:
-                        response = "Chagua mtoa huduma ya afya (imepangwa kwa umbali):\n"
-                    else:
-                        response = "Chagua mtoa huduma ya afya:\n"
-                elif session['language'] == 'fr':
-                    if patient.coordinates:
-                        response = "Sélectionnez un prestataire de soins de santé (classé par distance):\n"
-                    else:
-                        response = "Sélectionnez un prestataire de soins de santé:\n"
-                else:
-                    if patient.coordinates:
-                        response = "Select healthcare provider (sorted by distance):\n"
-                    else: 
-                        response = "Select healthcare provider:\n"
-                
-                # Show providers with distance information if available
-                for i, provider in enumerate(providers, 1):
-                    if hasattr(provider, 'distance') and provider.distance is not None:
-                        # Show distance to provider rounded to one decimal place
-                        distance_km = round(provider.distance, 1)
-                        response += f"{i}. {provider.name} ({provider.specialization}) - {distance_km} km\n"
-                    else:
-                        response += f"{i}. {provider.name} ({provider.specialization})\n"
-                
-                session['state'] = 'appointment_provider'
-                return respond(response)
-            else:
-                return respond(get_invalid_option_text(session))
-        except ValueError:
-            return respond(get_invalid_option_text(session))
-    
-    elif state == 'appointment_provider':
-        try:
-            selection = int(input_text)
-            if 1 <= selection <= len(session['data']['available_providers']):
-                selected_provider = session['data']['available_providers'][selection - 1]
-                
-                # Create appointment
-                appointment = Appointment.create(
-                    patient_id=patient.id,
-                    provider_id=selected_provider.id,
-                    date=session['data']['selected_date'],
-                    time=session['data']['selected_time']
-                )
-                
-                # Show confirmation
-                formatted_date = utils.format_date(
-                    session['data']['selected_date'], 
-                    session['language']
-                )
-                
-                if session['language'] == 'en':
-                    response = "Appointment scheduled successfully!\n"
-                    response += f"Date: {formatted_date}\n"
-                    response += f"Time: {session['data']['selected_time']}\n"
-                    response += f"Provider: {selected_provider.name}\n"
-                    response += f"Appointment ID: {appointment.id}\n"
-                    response += "0. Return to main menu"
-                else:
-                    response = "Miadi imepangwa kwa mafanikio!\n"
-                    response += f"Tarehe: {formatted_date}\n"
-                    response += f"Wakati: {session['data']['selected_time']}\n"
-                    response += f"Mtoa huduma: {selected_provider.name}\n"
-                    response += f"Kitambulisho cha miadi: {appointment.id}\n"
-                    response += "0. Rudi kwenye menyu kuu"
-                
-                session['state'] = 'appointment_complete'
-                return respond(response)
-            else:
-                return respond(get_invalid_option_text(session))
-        except ValueError:
-            return respond(get_invalid_option_text(session))
-    
-    elif state == 'appointment_complete':
-        if input_text == '0':
-            return show_main_menu(session)
-        else:
-            return respond(get_invalid_option_text(session))
-    
+def handle_appointment_date(ctx, selected_date, notice=None):
+    """Store the selected date and offer the free time slots"""
+    session = ctx.session
+    session['data']['selected_date'] = selected_date
+
+    # Slots at which at least one candidate provider is still free
+    providers, _ = appointment_candidates(ctx)
+    time_slots = slots.free_slots_any(providers, selected_date)
+    if not time_slots:
+        # The day filled up since the dates were shown
+        return start_appointment_scheduling(ctx, notice=ctx.message('slot_unavailable'))
+    session['data']['available_times'] = time_slots
+
+    response = (notice + "\n" if notice else "") + ctx.message('select_time') + "\n"
+
+    # Show time slots
+    for i, time in enumerate(time_slots, 1):
+        response += f"{i}. {time}\n"
+
+    session['state'] = 'appointment_time'
+    return respond(response)
+
+def handle_appointment_time(ctx, selected_time, notice=None):
+    """Store the selected time and offer the providers free at that time"""
+    session = ctx.session
+    session['data']['selected_time'] = selected_time
+
+    # Nearby providers are sorted by distance when the patient has location data
+    providers, using_location = appointment_candidates(ctx)
+    providers = slots.free_providers(providers, session['data']['selected_date'], selected_time)
+    if not providers:
+        # Booked by another caller since the times were shown
+        return handle_appointment_date(ctx, session['data']['selected_date'],
+                                       notice=ctx.message('slot_unavailable'))
+    session['data']['using_location'] = using_location
+    response = notice + "\n" if notice else ""
+    if using_location:
+        response += ctx.message('select_provider_nearby') + "\n"
     else:
-        # Unknown appointment state, return to main menu
-        return show_main_menu(session)
+        response += ctx.message('select_provider') + "\n"
 
-def show_messages(session):
+    # Only provider IDs go into the session so it stays serializable
+    session['data']['available_providers'] = [provider.id for provider in providers]
+
+    # Show providers with distance information if available
+    for i, provider in enumerate(providers, 1):
+        if using_location and getattr(provider, 'distance', None) is not None:
+            # Show distance to provider rounded to one decimal place
+            distance_km = round(provider.distance, 1)
+            response += f"{i}. {provider.name} ({provider.specialization}) - {distance_km} km\n"
+        else:
+            response += f"{i}. {provider.name} ({provider.specialization})\n"
+
+    session['state'] = 'appointment_provider'
+    return respond(response)
+
+def handle_appointment_provider(ctx, provider_id):
+    """Hold the slot with the selected provider and ask for confirmation"""
+    session = ctx.session
+    selected_provider = Provider.get_by_id(provider_id)
+    session['data']['selected_provider'] = provider_id
+    previous = session['data'].pop('slot_hold', None)
+    if previous:
+        # Shown again after a resume; hold the slot afresh
+        slots.release(previous)
+
+    hold = slots.hold(selected_provider, session['data']['selected_date'],
+                      session['data']['selected_time'], ttl=SLOT_HOLD_SECONDS)
+    if hold is None:
+        # Taken by another caller since the providers were shown
+        return handle_appointment_time(ctx, session['data']['selected_time'],
+                                       notice=ctx.message('slot_unavailable'))
+    session['data']['slot_hold'] = hold
+
+    session['state'] = 'appointment_confirm'
+    return ctx.screen('confirm_appointment',
+                      date=utils.format_date(hold['date'], session['language']),
+                      time=hold['time'],
+                      provider=selected_provider.name)
+
+def handle_appointment_confirm(ctx, selection):
+    """Book the held slot, or let it go"""
+    session = ctx.session
+    hold = session['data'].pop('slot_hold', None)
+    if selection == '2':
+        if hold:
+            slots.release(hold)
+        return show_main_menu(ctx)
+
+    # Only succeeds if the slot is still ours
+    appointment = slots.commit(hold, patient_id=ctx.patient.id) if hold else None
+    if appointment is None:
+        return handle_appointment_date(ctx, session['data']['selected_date'],
+                                       notice=ctx.message('slot_unavailable'))
+    reminders.schedule(appointment)
+    selected_provider = Provider.get_by_id(hold['provider_id'])
+    write_queue.enqueue('interaction', patient_id=ctx.patient.id, interaction_type='appointment',
+                        description=f"Booked appointment #{appointment.id} via USSD",
+                        metadata={'appointment_id': appointment.id, 'provider_id': selected_provider.id})
+
+    # Show confirmation
+    formatted_date = utils.format_date(
+        session['data']['selected_date'],
+        session['language']
+    )
+
+    session['state'] = 'appointment_complete'
+    return ctx.screen('appointment_scheduled',
+                      date=formatted_date,
+                      time=session['data']['selected_time'],
+                      provider=selected_provider.name,
+                      appointment_id=appointment.id)
+
+# ============== MESSAGES ==============
+
+def show_messages(ctx):
     """Show messages for the patient"""
-    patient = Patient.get_by_phone(session['phone_number'])
     provider = Provider.get_all()[0]  # For simplicity, get the first provider
-    
+
     # Get conversation
-    messages = Message.get_conversation(provider.id, patient.id)
-    
+    messages = Message.get_conversation(provider.id, ctx.patient.id)
+
     if messages:
         # Show the last few messages
         recent_messages = messages[-3:] if len(messages) > 3 else messages
-        
-        if session['language'] == 'en':
-            response = "Recent messages:\n"
-            for i, msg in enumerate(recent_messages, 1):
-                sender = "You" if msg.sender_type == 'patient' else "Doctor"
-                response += f"{i}. {sender}: {msg.content[:30]}...\n"
-            
-            response += "\n1. Send new message\n"
-            response += "0. Return to main menu"
-        else:
-            response = "Ujumbe wa hivi karibuni:\n"
-            for i, msg in enumerate(recent_messages, 1):
-                sender = "Wewe" if msg.sender_type == 'patient' else "Daktari"
-                response += f"{i}. {sender}: {msg.content[:30]}...\n"
-            
-            response += "\n1. Tuma ujumbe mpya\n"
-            response += "0. Rudi kwenye menyu kuu"
+
+        senders = {
+            'patient': ctx.message('sender_patient'),
+            'provider': ctx.message('sender_provider')
+        }
+        response = ctx.message('recent_messages') + "\n"
+        for i, msg in enumerate(recent_messages, 1):
+            sender = senders['patient'] if msg.sender_type == 'patient' else senders['provider']
+            response += f"{i}. {sender}: {msg.content[:30]}...\n"
+        response += "\n"
     else:
-        if session['language'] == 'en':
-            response = "You have no messages yet.\n"
-            response += "1. Send new message\n"
-            response += "0. Return to main menu"
-        else:
-            response = "Bado huna ujumbe.\n"
-            response += "1. Tuma ujumbe mpya\n"
-            response += "0. Rudi kwenye menyu kuu"
-    
-    session['state'] = 'message_menu'
+        response = ctx.message('no_messages') + "\n"
+
+    response += ctx.message('message_options')
+
+    ctx.session['state'] = 'message_menu'
     return respond(response)
 
-def handle_messages(session, input_text):
-    """Process messaging steps"""
-    state = session['state']
-    patient = Patient.get_by_phone(session['phone_number'])
+def handle_message_menu(ctx, selection):
+    """Start composing a message or return to the main menu"""
+    if selection == '0':
+        return show_main_menu(ctx)
+
+    ctx.session['state'] = 'message_compose'
+    return ctx.screen('type_message')
+
+def handle_message_compose(ctx, content):
+    """Send the patient's message to their provider"""
     provider = Provider.get_all()[0]  # For simplicity, get the first provider
-    
-    if state == 'message_menu':
-        if input_text == '1':
-            if session['language'] == 'en':
-                response = "Type your message:"
-            else:
-                response = "Andika ujumbe wako:"
-            
-            session['state'] = 'message_compose'
-            return respond(response)
-        elif input_text == '0':
-            return show_main_menu(session)
-        else:
-            return respond(get_invalid_option_text(session))
-    
-    elif state == 'message_compose':
-        # Create message
-        Message.create(
-            provider_id=provider.id,
-            patient_id=patient.id,
-            content=input_text,
-            sender_type='patient'
-        )
-        
-        if session['language'] == 'en':
-            response = "Message sent successfully.\n"
-            response += "The healthcare provider will respond soon.\n"
-            response += "0. Return to main menu"
-        else:
-            response = "Ujumbe umetumwa kwa mafanikio.\n"
-            response += "Mtoa huduma ya afya atajibu hivi karibuni.\n"
-            response += "0. Rudi kwenye menyu kuu"
-        
-        session['state'] = 'message_sent'
-        return respond(response)
-    
-    elif state == 'message_sent':
-        if input_text == '0':
-            return show_main_menu(session)
-        else:
-            return respond(get_invalid_option_text(session))
-    
-    elif state == 'profile_view':
-        patient = Patient.get_by_phone(session['phone_number'])
-        
-        if input_text == '1':
-            # Update location coordinates option selected
-            if session['language'] == 'en':
-                response = "To update your location coordinates, please enter latitude and longitude separated by a comma (e.g., -1.2921,36.8219):"
-            elif session['language'] == 'sw':
-                response = "Kusasisha mahali pako, tafadhali ingiza latitudo na longitudo iliyotenganishwa kwa koma (mfano, -1.2921,36.8219):"
-            elif session['language'] == 'fr':
-                response = "Pour mettre à jour vos coordonnées de localisation, veuillez entrer la latitude et la longitude séparées par une virgule (exemple, -1.2921,36.8219):"
-            else:
-                response = "To update your location coordinates, please enter latitude and longitude separated by a comma (e.g., -1.2921,36.8219):"
-            
-            session['state'] = 'update_coordinates'
-            return respond(response)
-        elif input_text == '0':
-            return show_main_menu(session)
-        else:
-            return respond(get_invalid_option_text(session))
-    
-    elif state == 'update_coordinates':
-        try:
-            # Parse latitude and longitude from input
-            coords = input_text.strip().split(',')
-            if len(coords) != 2:
-                raise ValueError("Invalid format")
-                
-            latitude = float(coords[0].strip())
-            longitude = float(coords[1].strip())
-            
-            # Validate latitude and longitude ranges
-            if latitude < -90 or latitude > 90 or longitude < -180 or longitude > 180:
-                raise ValueError("Coordinates out of range")
-                
-            patient = Patient.get_by_phone(session['phone_number'])
-            patient.update_coordinates(latitude, longitude)
-            
-            if session['language'] == 'en':
-                response = "Location coordinates updated successfully!\n"
-                response += "You will now receive location-based provider recommendations.\n"
-                response += "0. Return to main menu"
-            elif session['language'] == 'sw':
-                response = "Mahali pako pamewekwa kwa mafanikio!\n"
-                response += "Sasa utapata mapendekezo ya watoa huduma kulingana na eneo lako.\n"
-                response += "0. Rudi kwenye menyu kuu"
-            elif session['language'] == 'fr':
-                response = "Coordonnées de localisation mises à jour avec succès!\n"
-                response += "Vous recevrez désormais des recommandations de prestataires basées sur la localisation.\n"
-                response += "0. Retour au menu principal"
-            else:
-                response = "Location coordinates updated successfully!\n"
-                response += "You will now receive location-based provider recommendations.\n"
-                response += "0. Return to main menu"
-            
-            session['state'] = 'coordinates_updated'
-            return respond(response)
-        except ValueError as e:
-            # Invalid coordinate format
-            if session['language'] == 'en':
-                response = "Invalid coordinates format. Please enter latitude and longitude separated by a comma (e.g., -1.2921,36.8219).\n"
-                response += "Try again or press 0 to cancel."
-            elif session['language'] == 'sw':
-                response = "Umbali si sahihi. Tafadhali ingiza latitudo na longitudo iliyotenganishwa kwa koma (mfano, -1.2921,36.8219).\n"
-                response += "Jaribu tena au bonyeza 0 kughairi."
-            elif session['language'] == 'fr':
-                response = "Format de coordonnées invalide. Veuillez entrer la latitude et la longitude séparées par une virgule (exemple, -1.2921,36.8219).\n"
-                response += "Réessayez ou appuyez sur 0 pour annuler."
-            else:
-                response = "Invalid coordinates format. Please enter latitude and longitude separated by a comma (e.g., -1.2921,36.8219).\n"
-                response += "Try again or press 0 to cancel."
-            
-            if input_text == '0':
-                return show_main_menu(session)
-            else:
-                return respond(response)
-    
-    elif state == 'coordinates_updated':
-        if input_text == '0':
-            return show_main_menu(session)
-        else:
-            return respond(get_invalid_option_text(session))
-    
+
+    # Create message
+    write_queue.enqueue('message',
+                        provider_id=provider.id,
+                        patient_id=ctx.patient.id,
+                        content=content,
+                        sender_type='patient')
+
+    ctx.session['state'] = 'message_sent'
+    return ctx.screen('message_sent')
+
+# ============== PROFILE ==============
+
+def show_profile(ctx):
+    """Show patient profile"""
+    patient = ctx.patient
+
+    # Show whether coordinates are available
+    if patient.coordinates is not None:
+        gps = ctx.message('gps_available')
     else:
-        # Unknown message state, return to main menu
-        return show_main_menu(session)
+        gps = ctx.message('gps_not_set')
+
+    ctx.session['state'] = 'profile_view'
+    return ctx.screen('profile',
+                      name=patient.name,
+                      age=patient.age,
+                      gender=patient.gender,
+                      location=patient.location,
+                      gps=gps,
+                      patient_id=patient.id)
+
+def handle_profile_view(ctx, selection):
+    """Offer to update the patient's coordinates"""
+    if selection == '0':
+        return show_main_menu(ctx)
+
+    # Update location coordinates option selected
+    ctx.session['state'] = 'update_coordinates'
+    return ctx.screen('update_coordinates')
+
+def show_invalid_profile_coordinates(ctx):
+    """Explain the expected coordinate format when updating the profile"""
+    return ctx.screen('invalid_profile_coordinates')
+
+def handle_update_coordinates(ctx, coordinates):
+    """Save the patient's new coordinates (0 cancels)"""
+    if coordinates is None:
+        return show_main_menu(ctx)
+
+    latitude, longitude = coordinates
+    ctx.patient.update_coordinates(latitude, longitude)
+
+    ctx.session['state'] = 'coordinates_updated'
+    return ctx.screen('coordinates_updated')
+
+# ============== HEALTH INFORMATION ==============
 
-def show_health_info_menu(session):
+# Health information menu choice -> topic, in menu order
+INFO_TOPICS = {str(number): topic for number, topic in enumerate(HEALTH_TOPICS, 1)}
+
+def show_health_info_menu(ctx):
     """Show health information menu"""
-    if session['language'] == 'en':
-        response = "Health Information:\n"
-        response += "1. COVID-19 Information\n"
-        response += "2. Maternal Health\n"
-        response += "3. Chronic Diseases\n"
-        response += "4. First Aid\n"
-        response += "0. Return to main menu"
-    else:
-        response = "Habari za Afya:\n"
-        response += "1. Habari za COVID-19\n"
-        response += "2. Afya ya Uzazi\n"
-        response += "3. Magonjwa ya Muda Mrefu\n"
-        response += "4. Huduma ya Kwanza\n"
-        response += "0. Rudi kwenye menyu kuu"
-    
-    session['state'] = 'info_menu'
-    return respond(response)
+    ctx.session['state'] = 'info_menu'
+    return ctx.screen('health_info_menu')
 
-def handle_health_info(session, input_text):
+def handle_info_menu(ctx, selection):
     """Process health information selection"""
-    state = session['state']
-    
-    if state == 'info_menu':
-        if input_text == '0':
-            return show_main_menu(session)
-        
-        topics = {
-            '1': 'covid',
-            '2': 'maternal',
-            '3': 'chronic',
-            '4': 'firstaid'
-        }
-        
-        if input_text in topics:
-            topic = topics[input_text]
-            session['data']['selected_topic'] = topic
-            
-            # Get health info from database based on language and topic
-            health_info_list = HealthInfo.get_by_language(session['language'])
-            
-            # In a real application, you'd filter by topic as well
-            if health_info_list:
-                info = health_info_list[0]  # Just get the first one for demo
-                
-                if session['language'] == 'en':
-                    response = f"{info.title}:\n"
-                    response += f"{info.content}\n\n"
-                    response += "0. Return to health information menu"
-                else:
-                    response = f"{info.title}:\n"
-                    response += f"{info.content}\n\n"
-                    response += "0. Rudi kwenye menyu ya habari za afya"
-            else:
-                if session['language'] == 'en':
-                    response = "Information not available at this time.\n"
-                    response += "0. Return to health information menu"
-                else:
-                    response = "Habari haipatikani kwa sasa.\n"
-                    response += "0. Rudi kwenye menyu ya habari za afya"
-            
-            session['state'] = 'info_detail'
-            return respond(response)
-        else:
-            return respond(get_invalid_option_text(session))
-    
-    elif state == 'info_detail':
-        if input_text == '0':
-            return show_health_info_menu(session)
-        else:
-            return respond(get_invalid_option_text(session))
-    
-    else:
-        # Unknown info state, return to main menu
-        return show_main_menu(session)
+    session = ctx.session
+    if selection == '0':
+        return show_main_menu(ctx)
 
-def show_profile(session, patient):
-    """Show patient profile"""
-    has_coordinates = patient.coordinates is not None
-    
-    if session['language'] == 'en':
-        response = f"Your Profile:\n"
-        response += f"Name: {patient.name}\n"
-        response += f"Age: {patient.age}\n"
-        response += f"Gender: {patient.gender}\n"
-        response += f"Location: {patient.location}\n"
-        
-        # Show coordinates if available
-        if has_coordinates:
-            response += f"GPS Location: Available\n"
-        else:
-            response += f"GPS Location: Not set\n"
-            
-        response += f"ID: {patient.id}\n\n"
-        response += "1. Update location coordinates\n"
-        response += "0. Return to main menu"
-    elif session['language'] == 'sw':
-        response = f"Wasifu Wako:\n"
-        response += f"Jina: {patient.name}\n"
-        response += f"Umri: {patient.age}\n"
-        response += f"Jinsia: {patient.gender}\n"
-        response += f"Eneo: {patient.location}\n"
-        
-        # Show coordinates if available
-        if has_coordinates:
-            response += f"Eneo la GPS: Linapatikana\n"
-        else:
-            response += f"Eneo la GPS: Halijawekwa\n"
-            
-        response += f"Kitambulisho: {patient.id}\n\n"
-        response += "1. Sasisha mahali pa eneo\n"
-        response += "0. Rudi kwenye menyu kuu"
-    elif session['language'] == 'fr':
-        response = f"Votre Profil:\n"
-        response += f"Nom: {patient.name}\n"
-        response += f"Âge: {patient.age}\n"
-        response += f"Sexe: {patient.gender}\n"
-        response += f"Emplacement: {patient.location}\n"
-        
-        # Show coordinates if available
-        if has_coordinates:
-            response += f"Localisation GPS: Disponible\n"
-        else:
-            response += f"Localisation GPS: Non définie\n"
-            
-        response += f"ID: {patient.id}\n\n"
-        response += "1. Mettre à jour les coordonnées de localisation\n"
-        response += "0. Retour au menu principal"
+    topic = INFO_TOPICS[selection]
+    session['data']['selected_topic'] = topic
+    session['state'] = 'info_detail'
+
+    # Content is pre-generated for every topic and language an AI provider could write it in
+    # (see health_content). Otherwise, and until the first pre-generation has finished, use the
+    # library's best article on the topic in the caller's language.
+    source = None
+    if health_content.get(topic, session['language']) is not None:
+        source = ['content', topic]
     else:
-        response = f"Your Profile:\n"
-        response += f"Name: {patient.name}\n"
-        response += f"Age: {patient.age}\n"
-        response += f"Gender: {patient.gender}\n"
-        response += f"Location: {patient.location}\n"
-        
-        # Show coordinates if available
-        if has_coordinates:
-            response += f"GPS Location: Available\n"
-        else:
-            response += f"GPS Location: Not set\n"
-            
-        response += f"ID: {patient.id}\n\n"
-        response += "1. Update location coordinates\n"
-        response += "0. Return to main menu"
-    
-    session['state'] = 'profile_view'
-    return respond(response)
+        articles = health_index.for_topic(topic, session['language'], limit=1)
+        if articles:
+            source = ['article', articles[0].id]
+    session['data']['info_source'] = source
+    session['data']['info_page'] = 0
+    return show_info_page(ctx)
+
+def info_pages_of(ctx):
+    """Pre-rendered pages of the health information the caller opened, or None"""
+    source = ctx.data.get('info_source')
+    if not source:
+        return None
+    kind, ref = source
+    if kind == 'content':
+        def load():
+            info = health_content.get(ref, ctx.language)
+            return (info['title'], info['content']) if info else None
+        # A new generation of content gets new pages
+        return info_pages.get(('content', ref, health_content.generated_at), ctx.language, load)
+
+    def load():
+        info = HealthInfo.get_by_id(ref)
+        return (info.title, info.content) if info else None
+    return info_pages.get(('article', ref), ctx.language, load)
+
+def show_info_page(ctx):
+    """Show the current page of the selected health information"""
+    pages = info_pages_of(ctx)
+    if not pages:
+        ctx.data['info_page_count'] = 0
+        return ctx.screen('info_unavailable')
+    page = min(ctx.data.get('info_page', 0), len(pages) - 1)
+    ctx.data['info_page'] = page
+    ctx.data['info_page_count'] = len(pages)
+    return pages[page]
+
+def info_page_choice(ctx, raw):
+    """Accept 0, 1 when there is a next page and 2 when there is a previous one"""
+    page = ctx.data.get('info_page', 0)
+    if raw == '0' or (raw == '1' and page + 1 < ctx.data.get('info_page_count', 0)) or (raw == '2' and page > 0):
+        return raw
+    raise InvalidInput(raw)
+
+def handle_info_detail(ctx, value):
+    """Turn the page, or return to the health information menu"""
+    if value == '0':
+        return show_health_info_menu(ctx)
+    ctx.data['info_page'] += 1 if value == '1' else -1
+    return show_info_page(ctx)
+
+def show_invalid_option(ctx):
+    """Show the invalid option message and keep the current state"""
+    return ctx.screen('invalid_option')
 
 def get_invalid_option_text(session):
     """Get invalid option text based on language"""
-    if session['language'] == 'en':
-        return "Invalid option. Please try again."
-    elif session['language'] == 'sw':
-        return "Chaguo batili. Tafadhali jaribu tena."
-    elif session['language'] == 'fr':
-        return "Option invalide. Veuillez réessayer."
-    elif session['language'] == 'om':
-        return "Filannoon sirrii miti. Maaloo irra deebi'ii yaali."
-    elif session['language'] == 'so':
-        return "Doorasho aan shaqeyneyn. Fadlan mar kale isku day."
-    elif session['language'] == 'am':
-        return "ልክ ያልሆነ ምርጫ። እባክዎ እንደገና ይሞክሩ።"
-    else:
-        return "Invalid option. Please try again."
+    return catalog.text('invalid_option', session['language'])
 
-def respond(text):
-    """Format USSD response with appropriate prefix"""
-    # Africa's Talking expects responses to be prefixed
-    # CON: Expects more input
-    # END: End of session
+def respond(text, end=False):
+    """
+    Format USSD response with appropriate prefix
+
+    Screens from the message catalog are already prefixed; this is for
+    screens assembled from dynamic lists.
+    """
+    return ussd_prefix(end) + text
+
+
+# ============== STATE TABLE ==============
+
+# Every USSD state maps to exactly one handler. Validators run before the
+# handler, so handlers only ever see well-formed input.
+STATES = {
+    'start': UssdState(show_language_menu, allow_back=False),
+    'resume_offer': UssdState(handle_resume_offer, choice('1', '2'), allow_back=False),
+    'select_language': UssdState(handle_language_selection, choice(*LANGUAGE_OPTIONS), allow_back=False),
+    'main_menu': UssdState(handle_main_menu, main_menu_choice, allow_back=False),
     
-    # Check for specific end conditions
-    end_conditions = [
-        "successful", "thank you", "asante", "finished", "completed", 
-        "error occurred", "hitilafu", "umekamilika", "umefaulu"
-    ]
+    'register_name': UssdState(handle_register_name, text_input,
+                               prompt=screen_prompt('enter_name')),
+    'register_age': UssdState(handle_register_age, integer_input, on_invalid=show_invalid_age,
+                              prompt=screen_prompt('enter_age')),
+    'register_gender': UssdState(handle_register_gender, choice('1', '2', '3'),
+                                 prompt=screen_prompt('select_gender')),
+    'register_location': UssdState(handle_register_location, text_input,
+                                   prompt=screen_prompt('enter_location')),
+    'register_coordinates_choice': UssdState(handle_register_coordinates_choice, choice('1', '2'),
+                                             prompt=screen_prompt('coordinates_choice')),
+    'register_coordinates': UssdState(handle_register_coordinates, coordinates_input,
+                                      on_invalid=show_invalid_registration_coordinates, allow_back=False,
+                                      prompt=screen_prompt('enter_coordinates')),
+    'registration_complete': UssdState(return_to_main_menu, choice('0')),
     
-    # Most USSD responses should expect more input
-    # Only end the session for specific end conditions
-    if any(condition in text.lower() for condition in end_conditions) and not any(prompt in text.lower() for prompt in ["select", "enter", "choose", "chagua", "ingiza"]):
-        # End session only when we're done and not asking for more input
-        prefix = "END "
-    else:
-        # Continue the session for navigation, input prompts, and menu displays
-        prefix = "CON "
+    'symptom_description': UssdState(handle_symptom_description, text_input,
+                                     prompt=screen_prompt('describe_symptoms')),
+    'symptom_duration': UssdState(handle_symptom_duration, choice('1', '2', '3', '4'),
+                                  prompt=screen_prompt('symptom_duration')),
+    'symptom_severity': UssdState(handle_symptom_severity, choice('1', '2', '3'),
+                                  prompt=screen_prompt('symptom_severity')),
+    'symptom_next_steps': UssdState(handle_symptom_next_steps, choice('1', '0')),
+    
+    'appointment_date': UssdState(handle_appointment_date, menu_item('available_dates'),
+                                  prompt=start_appointment_scheduling),
+    'appointment_time': UssdState(handle_appointment_time, menu_item('available_times'),
+                                  prompt=lambda ctx: handle_appointment_date(ctx, ctx.data['selected_date'])),
+    'appointment_provider': UssdState(handle_appointment_provider, menu_item('available_providers'),
+                                      prompt=lambda ctx: handle_appointment_time(ctx, ctx.data['selected_time'])),
+    'appointment_confirm': UssdState(handle_appointment_confirm, choice('1', '2'),
+                                     prompt=lambda ctx: handle_appointment_provider(ctx, ctx.data['selected_provider'])),
+    'appointment_complete': UssdState(return_to_main_menu, choice('0')),
+    
+    'message_menu': UssdState(handle_message_menu, choice('1', '0')),
+    'message_compose': UssdState(handle_message_compose, text_input,
+                                 prompt=screen_prompt('type_message')),
+    'message_sent': UssdState(return_to_main_menu, choice('0')),
+    
+    'profile_view': UssdState(handle_profile_view, choice('1', '0')),
+    'update_coordinates': UssdState(handle_update_coordinates, coordinates_input,
+                                    on_invalid=show_invalid_profile_coordinates,
+                                    prompt=screen_prompt('update_coordinates')),
+    'coordinates_updated': UssdState(return_to_main_menu, choice('0')),
     
-    return prefix + text
+    'info_menu': UssdState(handle_info_menu, choice(*INFO_TOPICS, '0')),
+    'info_detail': UssdState(handle_info_detail, info_page_choice, allow_back=False),
+}
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+USSD Load Test - Concurrent load generator for the Tujali Telehealth USSD flow
+
+Simulates many phones dialling in at once. Every virtual phone registers,
+reports symptoms and books an appointment, each in its own USSD session, the
+way a real caller would. Concurrency is ramped through a list of stages and
+each stage reports throughput and p50/p95/p99 latency per USSD state.
+
+Run it against a local server:
+    python ussd_load_test.py --url http://localhost:5000/ussd --stages 10,50,200
+
+or fully in-process through the Flask test client (no server needed):
+    python ussd_load_test.py --in-process --stages 10,50,200
+"""
+
+import argparse
+import itertools
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import percentile
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Base URL for the USSD endpoint
+BASE_URL = "http://localhost:5000/ussd"
+
+SERVICE_CODE = "*384*4255#"
+
+# Scripted journeys: (state that handles the input, input)
+# The first hop of every session is the empty dial string.
+REGISTER_JOURNEY = [
+    ('start', ''),
+    ('select_language', '1'),
+    ('main_menu', '1'),
+    ('register_name', 'Load Tester {phone_suffix}'),
+    ('register_age', '34'),
+    ('register_gender', '2'),
+    ('register_location', 'Nairobi'),
+    ('register_coordinates_choice', '2'),
+]
+
+SYMPTOMS_JOURNEY = [
+    ('start', ''),
+    ('select_language', '1'),
+    ('main_menu', '1'),
+    ('symptom_description', 'fever and headache'),
+    ('symptom_duration', '2'),
+    ('symptom_severity', '2'),
+]
+
+APPOINTMENT_JOURNEY = [
+    ('start', ''),
+    ('select_language', '1'),
+    ('main_menu', '2'),
+    ('appointment_date', '1'),
+    ('appointment_time', '1'),
+    ('appointment_provider', '1'),
+    ('appointment_confirm', '1'),
+]
+
+# Every virtual phone runs these journeys in order
+PHONE_SCRIPT = [
+    ('register', REGISTER_JOURNEY),
+    ('symptoms', SYMPTOMS_JOURNEY),
+    ('appointment', APPOINTMENT_JOURNEY),
+]
+
+# Responses that mean the hop failed even though the request succeeded
+FAILURE_MARKERS = ("END ", "CON Invalid option")
+
+
+class HttpTransport:
+    """Send USSD hops to a running server over HTTP"""
+    def __init__(self, url=BASE_URL, timeout=10):
+        import requests
+        self._requests = requests
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        return session
+
+    def post(self, payload):
+        """Return (status_code, response_text) for one hop"""
+        try:
+            response = self._session().post(self.url, data=payload, timeout=self.timeout)
+            return response.status_code, response.text
+        except self._requests.RequestException as e:
+            return 0, f"Error: {str(e)}"
+
+
+class InProcessTransport:
+    """Send USSD hops straight into the Flask app through its test client"""
+    def __init__(self):
+        from app import app
+        # The app logs every USSD hop at DEBUG, which would dominate the timings
+        logging.getLogger().setLevel(logging.WARNING)
+        self.app = app
+        self._local = threading.local()
+
+    def post(self, payload):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.post('/ussd', data=payload)
+        return response.status_code, response.get_data(as_text=True)
+
+
+class LoadStats:
+    """Thread-safe collection of hop latencies for one stage"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.failures = {}
+        self.hops = 0
+        self.journeys = 0
+        self.failed_journeys = 0
+
+    def record_hop(self, state, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(state, []).append(seconds)
+            self.hops += 1
+            if not ok:
+                self.failures[state] = self.failures.get(state, 0) + 1
+
+    def record_journey(self, ok):
+        with self._lock:
+            self.journeys += 1
+            if not ok:
+                self.failed_journeys += 1
+
+    def summary(self):
+        """Per-state latency summary in milliseconds"""
+        rows = []
+        for state, values in self.latencies.items():
+            values = sorted(values)
+            rows.append({
+                'state': state,
+                'count': len(values),
+                'failures': self.failures.get(state, 0),
+                'p50': percentile(values, 50) * 1000,
+                'p95': percentile(values, 95) * 1000,
+                'p99': percentile(values, 99) * 1000,
+                'max': values[-1] * 1000
+            })
+        return sorted(rows, key=lambda row: row['p95'], reverse=True)
+
+
+class LoadGenerator:
+    """
+    Run scripted USSD journeys from many concurrent virtual phones
+
+    Args:
+        transport: Object with post(payload) -> (status_code, text)
+        think_time (float): Maximum random pause between hops in seconds
+    """
+    def __init__(self, transport, think_time=0.0):
+        self.transport = transport
+        self.think_time = think_time
+        self._phone_numbers = itertools.count(random.randint(10000000, 50000000))
+
+    def next_phone(self):
+        return f"+2547{next(self._phone_numbers):08d}"
+
+    def run_journey(self, phone_number, steps, stats):
+        """Run one USSD session; returns True if every hop succeeded"""
+        session_id = str(uuid.uuid4())
+        text = ""
+        ok = True
+
+        for state, user_input in steps:
+            user_input = user_input.format(phone_suffix=phone_number[-4:])
+            if state != 'start':
+                text = f"{text}*{user_input}" if text else user_input
+
+            payload = {
+                "sessionId": session_id,
+                "serviceCode": SERVICE_CODE,
+                "phoneNumber": phone_number,
+                "text": text
+            }
+
+            start = time.perf_counter()
+            status, response_text = self.transport.post(payload)
+            elapsed = time.perf_counter() - start
+
+            hop_ok = status == 200 and not response_text.startswith(FAILURE_MARKERS)
+            stats.record_hop(state, elapsed, hop_ok)
+            if not hop_ok:
+                logger.debug(f"{phone_number} failed in {state}: {response_text[:80]!r}")
+                ok = False
+                break
+
+            if self.think_time:
+                time.sleep(random.uniform(0, self.think_time))
+
+        stats.record_journey(ok)
+        return ok
+
+    def run_phone(self, stats):
+        """Run the full script for one new virtual phone"""
+        phone_number = self.next_phone()
+        for _, steps in PHONE_SCRIPT:
+            if not self.run_journey(phone_number, steps, stats):
+                return False
+        return True
+
+    def run_stage(self, concurrency, phones):
+        """
+        Run `phones` virtual phones with at most `concurrency` in flight
+
+        Returns:
+            tuple: (LoadStats, elapsed seconds)
+        """
+        stats = LoadStats()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in pool.map(lambda _: self.run_phone(stats), range(phones)):
+                pass
+        return stats, time.perf_counter() - start
+
+
+def print_stage_report(concurrency, stats, elapsed):
+    """Print throughput and per-state percentiles for one stage"""
+    print(f"\n=== Concurrency {concurrency} ===")
+    print(f"Journeys: {stats.journeys} ({stats.failed_journeys} failed)  "
+          f"Hops: {stats.hops}  Elapsed: {elapsed:.2f}s")
+    print(f"Throughput: {stats.hops / elapsed:.1f} hops/s, "
+          f"{stats.journeys / elapsed:.1f} journeys/s")
+    print(f"{'state':<30}{'count':>8}{'fail':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for row in stats.summary():
+        print(f"{row['state']:<30}{row['count']:>8}{row['failures']:>6}"
+              f"{row['p50']:>10.2f}{row['p95']:>10.2f}{row['p99']:>10.2f}{row['max']:>10.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load generator for the USSD endpoint")
+    parser.add_argument('--url', default=BASE_URL, help="USSD endpoint to load (default: %(default)s)")
+    parser.add_argument('--in-process', action='store_true',
+                        help="Drive the Flask app through its test client instead of HTTP")
+    parser.add_argument('--stages', default='10,50,100',
+                        help="Comma-separated concurrency levels to ramp through (default: %(default)s)")
+    parser.add_argument('--phones', type=int, default=None,
+                        help="Virtual phones per stage (default: 5x the stage concurrency)")
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help="Maximum random pause between hops in seconds (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    stages = [int(level) for level in args.stages.split(',') if level.strip()]
+    transport = InProcessTransport() if args.in_process else HttpTransport(args.url)
+    generator = LoadGenerator(transport, think_time=args.think_time)
+
+    target = "in-process Flask app" if args.in_process else args.url
+    print(f"Load testing {target} with stages {stages}")
+
+    for concurrency in stages:
+        phones = args.phones or concurrency * 5
+        stats, elapsed = generator.run_stage(concurrency, phones)
+        print_stage_report(concurrency, stats, elapsed)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
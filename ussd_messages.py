@@ -0,0 +1,1122 @@
+"""
+USSD message catalog for Tujali Telehealth
+
+All text shown on USSD screens lives here, one entry per screen and language.
+The catalog is compiled once at import time: multi-line screens are joined,
+static screens are rendered to their final USSD response (including the
+CON/END prefix) and dynamic screens keep a template whose slots such as the
+patient's name are filled in per request.
+
+Adding a language means adding one more block to MESSAGES.
+"""
+
+import logging
+from string import Formatter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANGUAGE = 'en'
+
+# Screens shared by every language
+COMMON_MESSAGES = {
+    'language_menu': [
+        "Welcome to Tujali Telehealth",
+        "Karibu kwenye Tujali Telehealth",
+        "Bienvenue sur Tujali Telehealth",
+        "Soo dhawow Tujali Telehealth",
+        "1. English",
+        "2. Kiswahili",
+        "3. Français (French)",
+        "4. Afaan Oromoo (Oromo)",
+        "5. Soomaali (Somali)",
+        "6. Amharic (አማርኛ)"
+    ]
+}
+
+# Screens that close the USSD session; every other screen expects more input
+END_SCREENS = {'error', 'service_busy'}
+
+MESSAGES = {
+    'en': {
+        'main_menu_registered': [
+            "Welcome back, {name}",
+            "1. Report symptoms",
+            "2. Schedule appointment",
+            "3. Messages",
+            "4. Health information",
+            "5. My profile",
+            "0. Back to language selection"
+        ],
+        'main_menu_guest': [
+            "Welcome to Tujali Telehealth",
+            "1. Register",
+            "2. Health information",
+            "0. Back to language selection"
+        ],
+        'enter_name': "Please enter your full name:",
+        'enter_age': "Enter your age:",
+        'invalid_age': "Please enter a valid age (numbers only).",
+        'select_gender': [
+            "Select your gender:",
+            "1. Male",
+            "2. Female",
+            "3. Other"
+        ],
+        'enter_location': "Enter your location (county/city):",
+        'coordinates_choice': [
+            "Would you like to provide your location coordinates for better provider matching?",
+            "1. Yes",
+            "2. No, complete registration without coordinates"
+        ],
+        'enter_coordinates': "Please enter your latitude and longitude separated by a comma (e.g., -1.2921,36.8219):",
+        'invalid_registration_coordinates': [
+            "Invalid coordinates format. Please enter latitude and longitude separated by a comma (e.g., -1.2921,36.8219).",
+            "Try again or press 0 to cancel and complete registration without coordinates."
+        ],
+        'registration_complete': [
+            "Registration successful!",
+            "Name: {name}",
+            "ID: {patient_id}",
+            "Select 0 to continue to main menu."
+        ],
+        'registration_complete_coordinates': [
+            "Registration successful!",
+            "Name: {name}",
+            "Location: {location}",
+            "Coordinates saved for location-based provider matching.",
+            "ID: {patient_id}",
+            "Select 0 to continue to main menu."
+        ],
+        'describe_symptoms': "Please describe your symptoms:",
+        'symptom_duration': [
+            "How long have you had these symptoms?",
+            "1. Today only",
+            "2. Few days",
+            "3. A week or more",
+            "4. A month or more"
+        ],
+        'symptom_severity': [
+            "How severe are your symptoms?",
+            "1. Mild - I can function normally",
+            "2. Moderate - Affecting daily activities",
+            "3. Severe - Cannot function normally"
+        ],
+        'symptom_reported': [
+            "Thank you for reporting your symptoms.",
+            "A healthcare provider will review your symptoms and respond shortly.",
+            "1. Schedule an appointment",
+            "0. Return to main menu"
+        ],
+        'select_date': "Select preferred date:",
+        'select_time': "Select preferred time:",
+        'select_provider': "Select healthcare provider:",
+        'select_provider_nearby': "Select healthcare provider (sorted by distance):",
+        'confirm_appointment': [
+            "Confirm appointment:",
+            "Date: {date}",
+            "Time: {time}",
+            "Provider: {provider}",
+            "1. Confirm",
+            "2. Cancel"
+        ],
+        'appointment_scheduled': [
+            "Appointment scheduled successfully!",
+            "Date: {date}",
+            "Time: {time}",
+            "Provider: {provider}",
+            "Appointment ID: {appointment_id}",
+            "0. Return to main menu"
+        ],
+        'slot_unavailable': "Sorry, that slot was just taken.",
+        'appointment_reminder': "Reminder: your appointment with {provider} is on {date} at {time}.",
+        'recent_messages': "Recent messages:",
+        'sender_patient': "You",
+        'sender_provider': "Doctor",
+        'message_options': [
+            "1. Send new message",
+            "0. Return to main menu"
+        ],
+        'no_messages': "You have no messages yet.",
+        'type_message': "Type your message:",
+        'message_sent': [
+            "Message sent successfully.",
+            "The healthcare provider will respond soon.",
+            "0. Return to main menu"
+        ],
+        'profile': [
+            "Your Profile:",
+            "Name: {name}",
+            "Age: {age}",
+            "Gender: {gender}",
+            "Location: {location}",
+            "GPS Location: {gps}",
+            "ID: {patient_id}",
+            "",
+            "1. Update location coordinates",
+            "0. Return to main menu"
+        ],
+        'gps_available': "Available",
+        'gps_not_set': "Not set",
+        'update_coordinates': "To update your location coordinates, please enter latitude and longitude separated by a comma (e.g., -1.2921,36.8219):",
+        'invalid_profile_coordinates': [
+            "Invalid coordinates format. Please enter latitude and longitude separated by a comma (e.g., -1.2921,36.8219).",
+            "Try again or press 0 to cancel."
+        ],
+        'coordinates_updated': [
+            "Location coordinates updated successfully!",
+            "You will now receive location-based provider recommendations.",
+            "0. Return to main menu"
+        ],
+        'health_info_menu': [
+            "Health Information:",
+            "1. COVID-19 Information",
+            "2. Maternal Health",
+            "3. Chronic Diseases",
+            "4. First Aid",
+            "0. Return to main menu"
+        ],
+        'info_detail': [
+            "{title}:",
+            "{content}",
+            "",
+            "{navigation}0. Return to health information menu"
+        ],
+        'info_page': [
+            "({counter}) {content}",
+            "",
+            "{navigation}0. Menu"
+        ],
+        'info_next': "1. Next",
+        'info_previous': "2. Previous",
+        'info_unavailable': [
+            "Information not available at this time.",
+            "0. Return to health information menu"
+        ],
+        'invalid_option': "Invalid option. Please try again.",
+        'error': "Sorry, an error occurred. Please try again.",
+        'service_busy': "Service is busy right now. Please try again in a few minutes.",
+        'resume_offer': [
+            "You have an unfinished session.",
+            "1. Continue where you left off",
+            "2. Start over"
+        ]
+    },
+    'sw': {
+        'main_menu_registered': [
+            "Karibu tena, {name}",
+            "1. Ripoti dalili",
+            "2. Panga miadi",
+            "3. Ujumbe",
+            "4. Habari za afya",
+            "5. Wasifu wangu",
+            "0. Rudi kwa uchaguzi wa lugha"
+        ],
+        'main_menu_guest': [
+            "Karibu kwenye Tujali Telehealth",
+            "1. Jisajili",
+            "2. Habari za afya",
+            "0. Rudi kwa uchaguzi wa lugha"
+        ],
+        'enter_name': "Tafadhali ingiza jina lako kamili:",
+        'enter_age': "Ingiza umri wako:",
+        'invalid_age': "Tafadhali ingiza umri halali (namba tu).",
+        'select_gender': [
+            "Chagua jinsia yako:",
+            "1. Mume",
+            "2. Mke",
+            "3. Nyingine"
+        ],
+        'enter_location': "Ingiza eneo lako (kaunti/mji):",
+        'coordinates_choice': [
+            "Je, ungependa kutoa mahali pa eneo lako kwa uwianishaji bora wa mtoa huduma?",
+            "1. Ndio",
+            "2. Hapana, kamilisha usajili bila mahali"
+        ],
+        'enter_coordinates': "Tafadhali ingiza latitudo na longitudo iliyotenganishwa kwa koma (mfano, -1.2921,36.8219):",
+        'invalid_registration_coordinates': [
+            "Umbali si sahihi. Tafadhali ingiza latitudo na longitudo iliyotenganishwa kwa koma (mfano, -1.2921,36.8219).",
+            "Jaribu tena au bonyeza 0 kughairi na kukamilisha usajili bila mahali."
+        ],
+        'registration_complete': [
+            "Usajili umefaulu!",
+            "Jina: {name}",
+            "Kitambulisho: {patient_id}",
+            "Chagua 0 kuendelea kwenye menyu kuu."
+        ],
+        'registration_complete_coordinates': [
+            "Usajili umefaulu!",
+            "Jina: {name}",
+            "Eneo: {location}",
+            "Mahali pamehifadhiwa kwa uwianishaji wa mtoa huduma kulingana na eneo.",
+            "Kitambulisho: {patient_id}",
+            "Chagua 0 kuendelea kwenye menyu kuu."
+        ],
+        'describe_symptoms': "Tafadhali eleza dalili zako:",
+        'symptom_duration': [
+            "Umepatwa na dalili hizi kwa muda gani?",
+            "1. Leo tu",
+            "2. Siku chache",
+            "3. Wiki moja au zaidi",
+            "4. Mwezi mmoja au zaidi"
+        ],
+        'symptom_severity': [
+            "Dalili zako ni kali kiasi gani?",
+            "1. Kidogo - Ninaweza kufanya kazi kama kawaida",
+            "2. Wastani - Zinaathiri shughuli za kila siku",
+            "3. Kali - Siwezi kufanya kazi kama kawaida"
+        ],
+        'symptom_reported': [
+            "Asante kwa kuripoti dalili zako.",
+            "Mtoa huduma ya afya atakagua dalili zako na kujibu hivi karibuni.",
+            "1. Panga miadi",
+            "0. Rudi kwenye menyu kuu"
+        ],
+        'select_date': "Chagua tarehe unayopendelea:",
+        'select_time': "Chagua wakati unaopendelea:",
+        'select_provider': "Chagua mtoa huduma ya afya:",
+        'select_provider_nearby': "Chagua mtoa huduma ya afya (imepangwa kwa umbali):",
+        'confirm_appointment': [
+            "Thibitisha miadi:",
+            "Tarehe: {date}",
+            "Wakati: {time}",
+            "Mtoa huduma: {provider}",
+            "1. Thibitisha",
+            "2. Ghairi"
+        ],
+        'appointment_scheduled': [
+            "Miadi imepangwa kwa mafanikio!",
+            "Tarehe: {date}",
+            "Wakati: {time}",
+            "Mtoa huduma: {provider}",
+            "Kitambulisho cha miadi: {appointment_id}",
+            "0. Rudi kwenye menyu kuu"
+        ],
+        'slot_unavailable': "Samahani, nafasi hiyo imechukuliwa sasa hivi.",
+        'appointment_reminder': "Kikumbusho: miadi yako na {provider} ni tarehe {date} saa {time}.",
+        'recent_messages': "Ujumbe wa hivi karibuni:",
+        'sender_patient': "Wewe",
+        'sender_provider': "Daktari",
+        'message_options': [
+            "1. Tuma ujumbe mpya",
+            "0. Rudi kwenye menyu kuu"
+        ],
+        'no_messages': "Bado huna ujumbe.",
+        'type_message': "Andika ujumbe wako:",
+        'message_sent': [
+            "Ujumbe umetumwa kwa mafanikio.",
+            "Mtoa huduma ya afya atajibu hivi karibuni.",
+            "0. Rudi kwenye menyu kuu"
+        ],
+        'profile': [
+            "Wasifu Wako:",
+            "Jina: {name}",
+            "Umri: {age}",
+            "Jinsia: {gender}",
+            "Eneo: {location}",
+            "Eneo la GPS: {gps}",
+            "Kitambulisho: {patient_id}",
+            "",
+            "1. Sasisha mahali pa eneo",
+            "0. Rudi kwenye menyu kuu"
+        ],
+        'gps_available': "Linapatikana",
+        'gps_not_set': "Halijawekwa",
+        'update_coordinates': "Kusasisha mahali pako, tafadhali ingiza latitudo na longitudo iliyotenganishwa kwa koma (mfano, -1.2921,36.8219):",
+        'invalid_profile_coordinates': [
+            "Umbali si sahihi. Tafadhali ingiza latitudo na longitudo iliyotenganishwa kwa koma (mfano, -1.2921,36.8219).",
+            "Jaribu tena au bonyeza 0 kughairi."
+        ],
+        'coordinates_updated': [
+            "Mahali pako pamewekwa kwa mafanikio!",
+            "Sasa utapata mapendekezo ya watoa huduma kulingana na eneo lako.",
+            "0. Rudi kwenye menyu kuu"
+        ],
+        'health_info_menu': [
+            "Habari za Afya:",
+            "1. Habari za COVID-19",
+            "2. Afya ya Uzazi",
+            "3. Magonjwa ya Muda Mrefu",
+            "4. Huduma ya Kwanza",
+            "0. Rudi kwenye menyu kuu"
+        ],
+        'info_detail': [
+            "{title}:",
+            "{content}",
+            "",
+            "{navigation}0. Rudi kwenye menyu ya habari za afya"
+        ],
+        'info_page': [
+            "({counter}) {content}",
+            "",
+            "{navigation}0. Menyu"
+        ],
+        'info_next': "1. Endelea",
+        'info_previous': "2. Rudi nyuma",
+        'info_unavailable': [
+            "Habari haipatikani kwa sasa.",
+            "0. Rudi kwenye menyu ya habari za afya"
+        ],
+        'invalid_option': "Chaguo batili. Tafadhali jaribu tena.",
+        'error': "Samahani, kuna hitilafu imetokea. Tafadhali jaribu tena.",
+        'service_busy': "Huduma ina shughuli nyingi kwa sasa. Tafadhali jaribu tena baada ya dakika chache.",
+        'resume_offer': [
+            "Una kikao ambacho hukukamilisha.",
+            "1. Endelea ulipoachia",
+            "2. Anza upya"
+        ]
+    },
+    'fr': {
+        'main_menu_registered': [
+            "Bon retour, {name}",
+            "1. Signaler des symptômes",
+            "2. Planifier un rendez-vous",
+            "3. Messages",
+            "4. Informations de santé",
+            "5. Mon profil",
+            "0. Retour à la sélection de langue"
+        ],
+        'main_menu_guest': [
+            "Bienvenue sur Tujali Telehealth",
+            "1. S'inscrire",
+            "2. Informations de santé",
+            "0. Retour à la sélection de langue"
+        ],
+        'enter_name': "Veuillez entrer votre nom complet:",
+        'enter_age': "Entrez votre âge:",
+        'invalid_age': "Veuillez entrer un âge valide (chiffres uniquement).",
+        'select_gender': [
+            "Sélectionnez votre sexe:",
+            "1. Homme",
+            "2. Femme",
+            "3. Autre"
+        ],
+        'enter_location': "Entrez votre localisation (comté/ville):",
+        'coordinates_choice': [
+            "Souhaitez-vous fournir vos coordonnées de localisation pour une meilleure correspondance avec les prestataires?",
+            "1. Oui",
+            "2. Non, terminer l'inscription sans coordonnées"
+        ],
+        'enter_coordinates': "Veuillez entrer votre latitude et longitude séparées par une virgule (exemple, -1.2921,36.8219):",
+        'invalid_registration_coordinates': [
+            "Format de coordonnées invalide. Veuillez entrer la latitude et la longitude séparées par une virgule (exemple, -1.2921,36.8219).",
+            "Réessayez ou appuyez sur 0 pour annuler et terminer l'inscription sans coordonnées."
+        ],
+        'registration_complete': [
+            "Inscription réussie!",
+            "Nom: {name}",
+            "ID: {patient_id}",
+            "Sélectionnez 0 pour continuer vers le menu principal."
+        ],
+        'registration_complete_coordinates': [
+            "Inscription réussie!",
+            "Nom: {name}",
+            "Emplacement: {location}",
+            "Coordonnées enregistrées pour la correspondance des prestataires basée sur la localisation.",
+            "ID: {patient_id}",
+            "Sélectionnez 0 pour continuer vers le menu principal."
+        ],
+        'describe_symptoms': "Veuillez décrire vos symptômes:",
+        'symptom_duration': [
+            "Depuis combien de temps avez-vous ces symptômes?",
+            "1. Aujourd'hui seulement",
+            "2. Quelques jours",
+            "3. Une semaine ou plus",
+            "4. Un mois ou plus"
+        ],
+        'symptom_severity': [
+            "Quelle est la gravité de vos symptômes?",
+            "1. Légers - Je peux fonctionner normalement",
+            "2. Modérés - Ils affectent mes activités quotidiennes",
+            "3. Graves - Je ne peux pas fonctionner normalement"
+        ],
+        'symptom_reported': [
+            "Merci d'avoir signalé vos symptômes.",
+            "Un professionnel de santé examinera vos symptômes et vous répondra rapidement.",
+            "1. Planifier un rendez-vous",
+            "0. Retour au menu principal"
+        ],
+        'select_date': "Sélectionnez la date souhaitée:",
+        'select_time': "Sélectionnez l'heure souhaitée:",
+        'select_provider': "Sélectionnez un prestataire de soins de santé:",
+        'select_provider_nearby': "Sélectionnez un prestataire de soins de santé (classé par distance):",
+        'confirm_appointment': [
+            "Confirmez le rendez-vous:",
+            "Date: {date}",
+            "Heure: {time}",
+            "Prestataire: {provider}",
+            "1. Confirmer",
+            "2. Annuler"
+        ],
+        'appointment_scheduled': [
+            "Rendez-vous planifié avec succès!",
+            "Date: {date}",
+            "Heure: {time}",
+            "Prestataire: {provider}",
+            "ID du rendez-vous: {appointment_id}",
+            "0. Retour au menu principal"
+        ],
+        'slot_unavailable': "Désolé, ce créneau vient d'être pris.",
+        'appointment_reminder': "Rappel : votre rendez-vous avec {provider} est le {date} à {time}.",
+        'recent_messages': "Messages récents:",
+        'sender_patient': "Vous",
+        'sender_provider': "Médecin",
+        'message_options': [
+            "1. Envoyer un nouveau message",
+            "0. Retour au menu principal"
+        ],
+        'no_messages': "Vous n'avez encore aucun message.",
+        'type_message': "Tapez votre message:",
+        'message_sent': [
+            "Message envoyé avec succès.",
+            "Le professionnel de santé vous répondra bientôt.",
+            "0. Retour au menu principal"
+        ],
+        'profile': [
+            "Votre Profil:",
+            "Nom: {name}",
+            "Âge: {age}",
+            "Sexe: {gender}",
+            "Emplacement: {location}",
+            "Localisation GPS: {gps}",
+            "ID: {patient_id}",
+            "",
+            "1. Mettre à jour les coordonnées de localisation",
+            "0. Retour au menu principal"
+        ],
+        'gps_available': "Disponible",
+        'gps_not_set': "Non définie",
+        'update_coordinates': "Pour mettre à jour vos coordonnées de localisation, veuillez entrer la latitude et la longitude séparées par une virgule (exemple, -1.2921,36.8219):",
+        'invalid_profile_coordinates': [
+            "Format de coordonnées invalide. Veuillez entrer la latitude et la longitude séparées par une virgule (exemple, -1.2921,36.8219).",
+            "Réessayez ou appuyez sur 0 pour annuler."
+        ],
+        'coordinates_updated': [
+            "Coordonnées de localisation mises à jour avec succès!",
+            "Vous recevrez désormais des recommandations de prestataires basées sur la localisation.",
+            "0. Retour au menu principal"
+        ],
+        'health_info_menu': [
+            "Informations de santé:",
+            "1. Informations sur la COVID-19",
+            "2. Santé maternelle",
+            "3. Maladies chroniques",
+            "4. Premiers secours",
+            "0. Retour au menu principal"
+        ],
+        'info_detail': [
+            "{title}:",
+            "{content}",
+            "",
+            "{navigation}0. Retour au menu des informations de santé"
+        ],
+        'info_page': [
+            "({counter}) {content}",
+            "",
+            "{navigation}0. Menu"
+        ],
+        'info_next': "1. Suivant",
+        'info_previous': "2. Précédent",
+        'info_unavailable': [
+            "Informations non disponibles pour le moment.",
+            "0. Retour au menu des informations de santé"
+        ],
+        'invalid_option': "Option invalide. Veuillez réessayer.",
+        'error': "Désolé, une erreur s'est produite. Veuillez réessayer.",
+        'service_busy': "Le service est très sollicité en ce moment. Veuillez réessayer dans quelques minutes.",
+        'resume_offer': [
+            "Vous avez une session inachevée.",
+            "1. Reprendre là où vous vous êtes arrêté",
+            "2. Recommencer"
+        ]
+    },
+    'om': {
+        'main_menu_registered': [
+            "Baga nagaan dhufte, {name}",
+            "1. Mallattoo gabaasi",
+            "2. Qabsoo walhitti dhufeenyaa karoorsii",
+            "3. Ergaawwan",
+            "4. Odeeffannoo fayyaa",
+            "5. Profaayilii koo",
+            "0. Gara filannoo afaaniitti deebi'i"
+        ],
+        'main_menu_guest': [
+            "Tujali Telehealth dhuferra baga nagaan dhufte",
+            "1. Galmaa'i",
+            "2. Odeeffannoo fayyaa",
+            "0. Gara filannoo afaaniitti deebi'i"
+        ],
+        'enter_name': "Maaloo maqaa guutuu keessan galchaa:",
+        'enter_age': "Umurii keessan galchaa:",
+        'invalid_age': "Maaloo umurii sirrii galchaa (lakkoofsa qofa).",
+        'select_gender': [
+            "Saala keessan filadhaa:",
+            "1. Dhiira",
+            "2. Dubartii",
+            "3. Kan biraa"
+        ],
+        'enter_location': "Bakka jireenya keessanii galchaa (godina/magaalaa):",
+        'coordinates_choice': [
+            "Ogeessa fayyaa dhihoo argachuuf koordineetii bakka keessanii kennuu barbaadduu?",
+            "1. Eeyyee",
+            "2. Lakki, koordineetii malee galmee xumuri"
+        ],
+        'enter_coordinates': "Maaloo latitude fi longitude keessan koomaan addaan baasaa galchaa (fkn, -1.2921,36.8219):",
+        'invalid_registration_coordinates': [
+            "Bifti koordineetii sirrii miti. Maaloo latitude fi longitude koomaan addaan baasaa galchaa (fkn, -1.2921,36.8219).",
+            "Irra deebi'ii yaalaa ykn koordineetii malee galmee xumuruuf 0 tuqaa."
+        ],
+        'registration_complete': [
+            "Galmeen milkaa'eera!",
+            "Maqaa: {name}",
+            "ID: {patient_id}",
+            "Gara baafata guddaatti itti fufuuf 0 filadhaa."
+        ],
+        'registration_complete_coordinates': [
+            "Galmeen milkaa'eera!",
+            "Maqaa: {name}",
+            "Bakka: {location}",
+            "Koordineetiin ogeessa dhihoo argachuuf kuufameera.",
+            "ID: {patient_id}",
+            "Gara baafata guddaatti itti fufuuf 0 filadhaa."
+        ],
+        'describe_symptoms': "Maaloo mallattoo dhukkuba keessanii ibsaa:",
+        'symptom_duration': [
+            "Mallattoon kun yeroo hammamiif isin qabe?",
+            "1. Har'a qofa",
+            "2. Guyyoota muraasa",
+            "3. Torban tokko ykn isaa ol",
+            "4. Ji'a tokko ykn isaa ol"
+        ],
+        'symptom_severity': [
+            "Mallattoon keessan hammam cimaa dha?",
+            "1. Salphaa - Akka idileetti hojjechuu nan danda'a",
+            "2. Giddugaleessa - Hojii guyyaa guyyaa natti gufachiisa",
+            "3. Cimaa - Akka idileetti hojjechuu hin danda'u"
+        ],
+        'symptom_reported': [
+            "Mallattoo keessan gabaasuu keessaniif galatoomaa.",
+            "Ogeessi fayyaa mallattoo keessan ilaalee dafee deebii isiniif kenna.",
+            "1. Beellama qabadhu",
+            "0. Gara baafata guddaatti deebi'i"
+        ],
+        'select_date': "Guyyaa barbaaddan filadhaa:",
+        'select_time': "Sa'aatii barbaaddan filadhaa:",
+        'select_provider': "Ogeessa fayyaa filadhaa:",
+        'select_provider_nearby': "Ogeessa fayyaa filadhaa (fageenyaan tarreeffame):",
+        'confirm_appointment': [
+            "Beellama mirkaneessi:",
+            "Guyyaa: {date}",
+            "Sa'aatii: {time}",
+            "Ogeessa: {provider}",
+            "1. Mirkaneessi",
+            "2. Haqi"
+        ],
+        'appointment_scheduled': [
+            "Beellamni milkaa'inaan qabameera!",
+            "Guyyaa: {date}",
+            "Sa'aatii: {time}",
+            "Ogeessa: {provider}",
+            "ID beellamaa: {appointment_id}",
+            "0. Gara baafata guddaatti deebi'i"
+        ],
+        'slot_unavailable': "Dhiifama, yeroon sun amma qabameera.",
+        'appointment_reminder': "Yaadachiisa: beellamni kee {provider} waliin guyyaa {date} sa'aatii {time}.",
+        'recent_messages': "Ergaawwan dhiyoo:",
+        'sender_patient': "Isin",
+        'sender_provider': "Doktara",
+        'message_options': [
+            "1. Ergaa haaraa ergi",
+            "0. Gara baafata guddaatti deebi'i"
+        ],
+        'no_messages': "Hanga ammaatti ergaan isiniif hin jiru.",
+        'type_message': "Ergaa keessan barreessaa:",
+        'message_sent': [
+            "Ergaan milkaa'inaan ergameera.",
+            "Ogeessi fayyaa dafee deebii isiniif kenna.",
+            "0. Gara baafata guddaatti deebi'i"
+        ],
+        'profile': [
+            "Profaayilii Keessan:",
+            "Maqaa: {name}",
+            "Umurii: {age}",
+            "Saala: {gender}",
+            "Bakka: {location}",
+            "Bakka GPS: {gps}",
+            "ID: {patient_id}",
+            "",
+            "1. Koordineetii bakkaa haaromsi",
+            "0. Gara baafata guddaatti deebi'i"
+        ],
+        'gps_available': "Ni jira",
+        'gps_not_set': "Hin galmoofne",
+        'update_coordinates': "Koordineetii bakka keessanii haaromsuuf, latitude fi longitude koomaan addaan baasaa galchaa (fkn, -1.2921,36.8219):",
+        'invalid_profile_coordinates': [
+            "Bifti koordineetii sirrii miti. Maaloo latitude fi longitude koomaan addaan baasaa galchaa (fkn, -1.2921,36.8219).",
+            "Irra deebi'ii yaalaa ykn haquuf 0 tuqaa."
+        ],
+        'coordinates_updated': [
+            "Koordineetiin bakkaa milkaa'inaan haaromfameera!",
+            "Amma ogeeyyii fayyaa bakka keessan irratti hundaa'an ni argattu.",
+            "0. Gara baafata guddaatti deebi'i"
+        ],
+        'health_info_menu': [
+            "Odeeffannoo Fayyaa:",
+            "1. Odeeffannoo COVID-19",
+            "2. Fayyaa Haadholii",
+            "3. Dhukkuboota Yeroo Dheeraa",
+            "4. Gargaarsa Jalqabaa",
+            "0. Gara baafata guddaatti deebi'i"
+        ],
+        'info_detail': [
+            "{title}:",
+            "{content}",
+            "",
+            "{navigation}0. Gara odeeffannoo fayyaatti deebi'i"
+        ],
+        'info_page': [
+            "({counter}) {content}",
+            "",
+            "{navigation}0. Deebi'i"
+        ],
+        'info_next': "1. Kan itti aanu",
+        'info_previous': "2. Kan duraa",
+        'info_unavailable': [
+            "Odeeffannoon amma hin argamu.",
+            "0. Gara odeeffannoo fayyaatti deebi'i"
+        ],
+        'invalid_option': "Filannoon sirrii miti. Maaloo irra deebi'ii yaali.",
+        'error': "Dhiifama, dogoggora uumame. Maaloo irra deebi'ii yaali.",
+        'service_busy': "Tajaajilli amma baay'ee qabameera. Maaloo daqiiqaa muraasa booda irra deebi'ii yaali.",
+        'resume_offer': [
+            "Hojii hin xumuramne qabdu.",
+            "1. Bakka dhaabde irraa itti fufi",
+            "2. Jalqabaa eegali"
+        ]
+    },
+    'so': {
+        'main_menu_registered': [
+            "Ku soo dhawow, {name}",
+            "1. Warbixin calaamadaha",
+            "2. Jadwalka ballanta",
+            "3. Fariimaha",
+            "4. Macluumaadka caafimaadka",
+            "5. Astaantayda",
+            "0. Ku noqo xulashada luuqadda"
+        ],
+        'main_menu_guest': [
+            "Ku soo dhawow Tujali Telehealth",
+            "1. Isdiiwaangeli",
+            "2. Macluumaadka caafimaadka",
+            "0. Ku noqo xulashada luuqadda"
+        ],
+        'enter_name': "Fadlan geli magacaaga oo buuxa:",
+        'enter_age': "Geli da'daada:",
+        'invalid_age': "Fadlan geli da' sax ah (tirooyin keliya).",
+        'select_gender': [
+            "Dooro jinsigaaga:",
+            "1. Lab",
+            "2. Dheddig",
+            "3. Kale"
+        ],
+        'enter_location': "Geli goobtaada (gobol/magaalo):",
+        'coordinates_choice': [
+            "Ma jeclaan lahayd inaad bixiso isku-duwayaasha goobtaada si laguugu helo bixiye kuu dhow?",
+            "1. Haa",
+            "2. Maya, dhammaystir diiwaangelinta isku-duwayaal la'aan"
+        ],
+        'enter_coordinates': "Fadlan geli latitude iyo longitude oo hakad lagu kala saaray (tusaale, -1.2921,36.8219):",
+        'invalid_registration_coordinates': [
+            "Qaabka isku-duwayaashu waa khalad. Fadlan geli latitude iyo longitude oo hakad lagu kala saaray (tusaale, -1.2921,36.8219).",
+            "Isku day mar kale ama riix 0 si aad u dhammaystirto diiwaangelinta isku-duwayaal la'aan."
+        ],
+        'registration_complete': [
+            "Diiwaangelintu way guulaysatay!",
+            "Magaca: {name}",
+            "Aqoonsiga: {patient_id}",
+            "Dooro 0 si aad ugu gudubto menu-ga ugu weyn."
+        ],
+        'registration_complete_coordinates': [
+            "Diiwaangelintu way guulaysatay!",
+            "Magaca: {name}",
+            "Goobta: {location}",
+            "Isku-duwayaasha waa la kaydiyay si laguugu helo bixiye kuu dhow.",
+            "Aqoonsiga: {patient_id}",
+            "Dooro 0 si aad ugu gudubto menu-ga ugu weyn."
+        ],
+        'describe_symptoms': "Fadlan sharax calaamadahaaga:",
+        'symptom_duration': [
+            "Muddo intee le'eg ayaad qabtay calaamadahan?",
+            "1. Maanta oo keliya",
+            "2. Dhowr maalmood",
+            "3. Toddobaad ama ka badan",
+            "4. Bil ama ka badan"
+        ],
+        'symptom_severity': [
+            "Calaamadahaagu intee in le'eg ayay u daran yihiin?",
+            "1. Fudud - Si caadi ah ayaan u shaqayn karaa",
+            "2. Dhexdhexaad - Waxay saameeyaan hawlaha maalinlaha",
+            "3. Daran - Si caadi ah uma shaqayn karo"
+        ],
+        'symptom_reported': [
+            "Waad ku mahadsan tahay soo sheegidda calaamadahaaga.",
+            "Bixiye caafimaad ayaa dib u eegi doona calaamadahaaga oo dhowaan kuu jawaabi doona.",
+            "1. Qabso ballan",
+            "0. Ku noqo menu-ga ugu weyn"
+        ],
+        'select_date': "Dooro taariikhda aad doorbidayso:",
+        'select_time': "Dooro waqtiga aad doorbidayso:",
+        'select_provider': "Dooro bixiyaha caafimaadka:",
+        'select_provider_nearby': "Dooro bixiyaha caafimaadka (loo kala horreysiiyay masaafada):",
+        'confirm_appointment': [
+            "Xaqiiji ballanta:",
+            "Taariikhda: {date}",
+            "Waqtiga: {time}",
+            "Bixiyaha: {provider}",
+            "1. Xaqiiji",
+            "2. Jooji"
+        ],
+        'appointment_scheduled': [
+            "Ballanta si guul leh ayaa loo qabtay!",
+            "Taariikhda: {date}",
+            "Waqtiga: {time}",
+            "Bixiyaha: {provider}",
+            "Aqoonsiga ballanta: {appointment_id}",
+            "0. Ku noqo menu-ga ugu weyn"
+        ],
+        'slot_unavailable': "Waan ka xunnahay, waqtigaas hadda waa la qaatay.",
+        'appointment_reminder': "Xasuusin: ballantaada {provider} waa {date} saacadda {time}.",
+        'recent_messages': "Fariimaha dhowaan:",
+        'sender_patient': "Adiga",
+        'sender_provider': "Dhakhtarka",
+        'message_options': [
+            "1. Dir fariin cusub",
+            "0. Ku noqo menu-ga ugu weyn"
+        ],
+        'no_messages': "Weli fariin ma haysatid.",
+        'type_message': "Qor fariintaada:",
+        'message_sent': [
+            "Fariinta si guul leh ayaa loo diray.",
+            "Bixiyaha caafimaadka ayaa dhowaan kuu jawaabi doona.",
+            "0. Ku noqo menu-ga ugu weyn"
+        ],
+        'profile': [
+            "Astaantaada:",
+            "Magaca: {name}",
+            "Da'da: {age}",
+            "Jinsiga: {gender}",
+            "Goobta: {location}",
+            "Goobta GPS: {gps}",
+            "Aqoonsiga: {patient_id}",
+            "",
+            "1. Cusboonaysii isku-duwayaasha goobta",
+            "0. Ku noqo menu-ga ugu weyn"
+        ],
+        'gps_available': "Waa la hayaa",
+        'gps_not_set': "Lama dejin",
+        'update_coordinates': "Si aad u cusboonaysiiso isku-duwayaasha goobtaada, fadlan geli latitude iyo longitude oo hakad lagu kala saaray (tusaale, -1.2921,36.8219):",
+        'invalid_profile_coordinates': [
+            "Qaabka isku-duwayaashu waa khalad. Fadlan geli latitude iyo longitude oo hakad lagu kala saaray (tusaale, -1.2921,36.8219).",
+            "Isku day mar kale ama riix 0 si aad u joojiso."
+        ],
+        'coordinates_updated': [
+            "Isku-duwayaasha goobta si guul leh ayaa loo cusboonaysiiyay!",
+            "Hadda waxaad heli doontaa bixiyeyaal caafimaad oo ku saleysan goobtaada.",
+            "0. Ku noqo menu-ga ugu weyn"
+        ],
+        'health_info_menu': [
+            "Macluumaadka Caafimaadka:",
+            "1. Macluumaadka COVID-19",
+            "2. Caafimaadka Hooyada",
+            "3. Cudurrada Daba-dheeraada",
+            "4. Gargaarka Degdegga ah",
+            "0. Ku noqo menu-ga ugu weyn"
+        ],
+        'info_detail': [
+            "{title}:",
+            "{content}",
+            "",
+            "{navigation}0. Ku noqo macluumaadka caafimaadka"
+        ],
+        'info_page': [
+            "({counter}) {content}",
+            "",
+            "{navigation}0. Ku noqo"
+        ],
+        'info_next': "1. Xiga",
+        'info_previous': "2. Hore",
+        'info_unavailable': [
+            "Macluumaadku hadda lama heli karo.",
+            "0. Ku noqo macluumaadka caafimaadka"
+        ],
+        'invalid_option': "Doorasho aan shaqeyneyn. Fadlan mar kale isku day.",
+        'error': "Waan xumaatay, khalad ayaa dhacay. Fadlan isku day mar kale.",
+        'service_busy': "Adeeggu hadda waa mashquul. Fadlan isku day mar kale dhowr daqiiqo kadib.",
+        'resume_offer': [
+            "Waxaad leedahay fadhi aan dhammaan.",
+            "1. Ka sii wad meeshii aad ka joogsatay",
+            "2. Dib u bilow"
+        ]
+    },
+    'am': {
+        'main_menu_registered': [
+            "እንደገና እንኳን ደህና መጡ, {name}",
+            "1. የህመም ምልክቶችን ሪፖርት ያድርጉ",
+            "2. ቀጠሮ ያስይዙ",
+            "3. መልዕክቶች",
+            "4. የጤና መረጃ",
+            "5. የግል መገለጫዬ",
+            "0. ወደ ቋንቋ ምርጫ ይመለሱ"
+        ],
+        'main_menu_guest': [
+            "ወደ ቱጃሊ ቴሌሄልዝ እንኳን ደህና መጡ",
+            "1. ይመዝገቡ",
+            "2. የጤና መረጃ",
+            "0. ወደ ቋንቋ ምርጫ ይመለሱ"
+        ],
+        'enter_name': "እባክዎ ሙሉ ስምዎን ያስገቡ:",
+        'enter_age': "ዕድሜዎን ያስገቡ:",
+        'invalid_age': "እባክዎ ትክክለኛ ዕድሜ ያስገቡ (ቁጥሮች ብቻ)።",
+        'select_gender': [
+            "ጾታዎን ይምረጡ:",
+            "1. ወንድ",
+            "2. ሴት",
+            "3. ሌላ"
+        ],
+        'enter_location': "አካባቢዎን ያስገቡ (ክልል/ከተማ):",
+        'coordinates_choice': [
+            "በአቅራቢያዎ ያለ የጤና ባለሙያ ለማግኘት የአካባቢዎን መጋጠሚያዎች መስጠት ይፈልጋሉ?",
+            "1. አዎ",
+            "2. አይ፣ ያለ መጋጠሚያዎች ምዝገባውን ያጠናቅቁ"
+        ],
+        'enter_coordinates': "እባክዎ ኬክሮስ እና ኬንትሮስዎን በኮማ ለይተው ያስገቡ (ለምሳሌ -1.2921,36.8219):",
+        'invalid_registration_coordinates': [
+            "የመጋጠሚያ ቅርጸት ትክክል አይደለም። እባክዎ ኬክሮስ እና ኬንትሮስ በኮማ ለይተው ያስገቡ (ለምሳሌ -1.2921,36.8219)።",
+            "እንደገና ይሞክሩ ወይም ያለ መጋጠሚያዎች ምዝገባውን ለማጠናቀቅ 0 ይጫኑ።"
+        ],
+        'registration_complete': [
+            "ምዝገባው ተሳክቷል!",
+            "ስም: {name}",
+            "መታወቂያ: {patient_id}",
+            "ወደ ዋናው ምናሌ ለመቀጠል 0 ይምረጡ።"
+        ],
+        'registration_complete_coordinates': [
+            "ምዝገባው ተሳክቷል!",
+            "ስም: {name}",
+            "አካባቢ: {location}",
+            "በአቅራቢያ ያለ ባለሙያ ለማግኘት መጋጠሚያዎች ተቀምጠዋል።",
+            "መታወቂያ: {patient_id}",
+            "ወደ ዋናው ምናሌ ለመቀጠል 0 ይምረጡ።"
+        ],
+        'describe_symptoms': "እባክዎ የህመም ምልክቶችዎን ይግለጹ:",
+        'symptom_duration': [
+            "እነዚህ ምልክቶች ለምን ያህል ጊዜ ቆይተዋል?",
+            "1. ዛሬ ብቻ",
+            "2. ጥቂት ቀናት",
+            "3. አንድ ሳምንት ወይም ከዚያ በላይ",
+            "4. አንድ ወር ወይም ከዚያ በላይ"
+        ],
+        'symptom_severity': [
+            "ምልክቶችዎ ምን ያህል ከባድ ናቸው?",
+            "1. ቀላል - በመደበኛነት መሥራት እችላለሁ",
+            "2. መካከለኛ - የዕለት ተዕለት እንቅስቃሴን ይጎዳል",
+            "3. ከባድ - በመደበኛነት መሥራት አልችልም"
+        ],
+        'symptom_reported': [
+            "ምልክቶችዎን ስላሳወቁ እናመሰግናለን።",
+            "የጤና ባለሙያ ምልክቶችዎን ገምግሞ በቅርቡ ምላሽ ይሰጣል።",
+            "1. ቀጠሮ ያስይዙ",
+            "0. ወደ ዋናው ምናሌ ይመለሱ"
+        ],
+        'select_date': "የሚመርጡትን ቀን ይምረጡ:",
+        'select_time': "የሚመርጡትን ሰዓት ይምረጡ:",
+        'select_provider': "የጤና ባለሙያ ይምረጡ:",
+        'select_provider_nearby': "የጤና ባለሙያ ይምረጡ (በርቀት የተደረደሩ):",
+        'confirm_appointment': [
+            "ቀጠሮውን ያረጋግጡ:",
+            "ቀን: {date}",
+            "ሰዓት: {time}",
+            "ባለሙያ: {provider}",
+            "1. አረጋግጥ",
+            "2. ሰርዝ"
+        ],
+        'appointment_scheduled': [
+            "ቀጠሮው በተሳካ ሁኔታ ተይዟል!",
+            "ቀን: {date}",
+            "ሰዓት: {time}",
+            "ባለሙያ: {provider}",
+            "የቀጠሮ መታወቂያ: {appointment_id}",
+            "0. ወደ ዋናው ምናሌ ይመለሱ"
+        ],
+        'slot_unavailable': "ይቅርታ፣ ያ ጊዜ አሁን ተይዟል።",
+        'appointment_reminder': "ማስታወሻ: ከ{provider} ጋር ያለዎት ቀጠሮ {date} በ{time} ነው።",
+        'recent_messages': "የቅርብ ጊዜ መልዕክቶች:",
+        'sender_patient': "እርስዎ",
+        'sender_provider': "ሐኪም",
+        'message_options': [
+            "1. አዲስ መልዕክት ይላኩ",
+            "0. ወደ ዋናው ምናሌ ይመለሱ"
+        ],
+        'no_messages': "እስካሁን ምንም መልዕክት የለዎትም።",
+        'type_message': "መልዕክትዎን ይጻፉ:",
+        'message_sent': [
+            "መልዕክቱ በተሳካ ሁኔታ ተልኳል።",
+            "የጤና ባለሙያው በቅርቡ ምላሽ ይሰጣል።",
+            "0. ወደ ዋናው ምናሌ ይመለሱ"
+        ],
+        'profile': [
+            "የእርስዎ መገለጫ:",
+            "ስም: {name}",
+            "ዕድሜ: {age}",
+            "ጾታ: {gender}",
+            "አካባቢ: {location}",
+            "የጂፒኤስ አካባቢ: {gps}",
+            "መታወቂያ: {patient_id}",
+            "",
+            "1. የአካባቢ መጋጠሚያዎችን ያዘምኑ",
+            "0. ወደ ዋናው ምናሌ ይመለሱ"
+        ],
+        'gps_available': "አለ",
+        'gps_not_set': "አልተቀመጠም",
+        'update_coordinates': "የአካባቢ መጋጠሚያዎችዎን ለማዘመን እባክዎ ኬክሮስ እና ኬንትሮስ በኮማ ለይተው ያስገቡ (ለምሳሌ -1.2921,36.8219):",
+        'invalid_profile_coordinates': [
+            "የመጋጠሚያ ቅርጸት ትክክል አይደለም። እባክዎ ኬክሮስ እና ኬንትሮስ በኮማ ለይተው ያስገቡ (ለምሳሌ -1.2921,36.8219)።",
+            "እንደገና ይሞክሩ ወይም ለመሰረዝ 0 ይጫኑ።"
+        ],
+        'coordinates_updated': [
+            "የአካባቢ መጋጠሚያዎች በተሳካ ሁኔታ ተዘምነዋል!",
+            "አሁን በአካባቢዎ ላይ የተመሰረቱ የባለሙያ ምክሮችን ያገኛሉ።",
+            "0. ወደ ዋናው ምናሌ ይመለሱ"
+        ],
+        'health_info_menu': [
+            "የጤና መረጃ:",
+            "1. የኮቪድ-19 መረጃ",
+            "2. የእናቶች ጤና",
+            "3. ሥር የሰደዱ በሽታዎች",
+            "4. የመጀመሪያ እርዳታ",
+            "0. ወደ ዋናው ምናሌ ይመለሱ"
+        ],
+        'info_detail': [
+            "{title}:",
+            "{content}",
+            "",
+            "{navigation}0. ወደ የጤና መረጃ ምናሌ ይመለሱ"
+        ],
+        'info_page': [
+            "({counter}) {content}",
+            "",
+            "{navigation}0. ምናሌ"
+        ],
+        'info_next': "1. ቀጣይ",
+        'info_previous': "2. ቀዳሚ",
+        'info_unavailable': [
+            "መረጃው በአሁኑ ጊዜ አይገኝም።",
+            "0. ወደ የጤና መረጃ ምናሌ ይመለሱ"
+        ],
+        'invalid_option': "ልክ ያልሆነ ምርጫ። እባክዎ እንደገና ይሞክሩ።",
+        'error': "ይቅርታ፣ ስህተት ተከስቷል። እባክዎ እንደገና ይሞክሩ።",
+        'service_busy': "አገልግሎቱ አሁን ተጨናንቋል። እባክዎ ከጥቂት ደቂቃዎች በኋላ እንደገና ይሞክሩ።",
+        'resume_offer': [
+            "ያላጠናቀቁት ክፍለ ጊዜ አለዎት።",
+            "1. ካቆሙበት ይቀጥሉ",
+            "2. እንደገና ይጀምሩ"
+        ]
+    }
+}
+
+
+def ussd_prefix(end=False):
+    """
+    Africa's Talking response prefix
+
+    CON: Expects more input
+    END: End of session
+    """
+    return "END " if end else "CON "
+
+
+class MessageCatalog:
+    """
+    Compiled USSD message catalog
+
+    Every (screen, language) pair is compiled once. Static screens are stored
+    as finished USSD responses; screens with slots keep their template and
+    are formatted per request.
+    """
+    def __init__(self, messages, common=None, end_screens=None, default_language=DEFAULT_LANGUAGE):
+        self.default_language = default_language
+        self.end_screens = set(end_screens or ())
+        self._text = {}       # (key, language) -> text or template
+        self._slotted = set() # (key, language) pairs that need formatting
+        self._rendered = {}   # (key, language) -> finished response for static screens
+        self._compile(messages, common or {})
+
+    @property
+    def languages(self):
+        return list(self._languages)
+
+    def _compile(self, messages, common):
+        self._languages = tuple(messages)
+        keys = set(common)
+        for entries in messages.values():
+            keys.update(entries)
+
+        for language, entries in messages.items():
+            missing = sorted(keys - set(entries) - set(common))
+            if missing:
+                logger.warning(f"USSD catalog: language '{language}' is missing {missing}, "
+                               f"using '{self.default_language}' text instead")
+
+            for key in keys:
+                template = entries.get(key, common.get(key))
+                if template is None:
+                    template = messages[self.default_language].get(key)
+                if template is None:
+                    continue
+                if isinstance(template, (list, tuple)):
+                    template = "\n".join(template)
+
+                self._text[(key, language)] = template
+                if any(field for _, field, _, _ in Formatter().parse(template)):
+                    self._slotted.add((key, language))
+                else:
+                    self._rendered[(key, language)] = ussd_prefix(key in self.end_screens) + template
+
+    def _resolve(self, key, language):
+        if (key, language) in self._text:
+            return (key, language)
+        return (key, self.default_language)
+
+    def text(self, key, language, **slots):
+        """
+        Get the text of a screen without a USSD prefix
+
+        Args:
+            key (str): Screen key, e.g. 'main_menu_guest'
+            language (str): Language code
+            **slots: Values for the screen's dynamic slots
+
+        Returns:
+            str: Screen text
+        """
+        ref = self._resolve(key, language)
+        template = self._text[ref]
+        if ref in self._slotted:
+            return template.format(**slots)
+        return template
+
+    def respond(self, key, language, **slots):
+        """
+        Get a screen as a finished USSD response
+
+        Static screens come straight from the render cache.
+        """
+        ref = self._resolve(key, language)
+        rendered = self._rendered.get(ref)
+        if rendered is not None:
+            return rendered
+        return ussd_prefix(key in self.end_screens) + self._text[ref].format(**slots)
+
+
+# Compiled once at startup
+catalog = MessageCatalog(MESSAGES, COMMON_MESSAGES, END_SCREENS)
@@ -0,0 +1,292 @@
+"""
+Screen-sized pages of long USSD content
+
+Africa's Talking rejects or truncates USSD screens longer than 182
+characters, and health information is usually longer than that. Content is
+split once into pages that fit a screen together with the page counter and
+the Next / Previous options (and, on the first page, the title), and each
+page is stored as a finished USSD response. A hop then serves one of them
+as it is.
+
+Pages are cached per (content, language) in a PageCache, oldest dropped
+first beyond max_entries. Articles are paged when they are created; other
+content is paged the first time a caller opens it.
+"""
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from ussd_messages import catalog
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Characters a USSD screen may hold, not counting the CON/END prefix
+SCREEN_CHARS = int(os.environ.get('USSD_SCREEN_CHARS', 182))
+
+# Content never gets less room than this per page; longer titles are shortened instead
+MIN_PAGE_CHARS = 60
+
+# A last line this short moves to the next page rather than end a page on its own
+ORPHAN_CHARS = 20
+
+# Fewest words a page starts a line with, or holds at all as the last page
+MIN_LAST_WORDS = 4
+
+TOKEN = re.compile(r'\n+|\S+')
+
+
+def carry_point(chunk):
+    """
+    Where to end a full chunk so that its short last line moves to the next one
+
+    A heading just above that line ("Prevention:") moves along with it.
+
+    Returns:
+        int: Index of the line break to cut at, or -1 to keep the chunk whole
+    """
+    cut = chunk.rfind('\n')
+    if cut <= 0 or len(chunk) - cut - 1 > ORPHAN_CHARS:
+        return -1
+    head = chunk[:cut].rstrip('\n')
+    above = head.rfind('\n')
+    if above > 0 and head.endswith(':') and len(head) - above - 1 <= ORPHAN_CHARS:
+        return above
+    return cut
+
+
+def line_words(tokens, index):
+    """Number of words from tokens[index] to the end of its line"""
+    words = 0
+    for token in tokens[index:]:
+        if token[0] == '\n':
+            break
+        words += 1
+    return words
+
+
+def split_text(text, size, first_size=None, last_size=None):
+    """
+    Split text into chunks of at most size characters
+
+    Chunks break between words where possible and keep the text's line
+    breaks (at most one blank line) inside a chunk.
+
+    Args:
+        text (str): Text to split
+        size (int): Maximum chunk length
+        first_size (int, optional): Maximum length of the first chunk; size by default
+        last_size (int, optional): Room for the last chunk; the last chunk
+            is merged into the one before when both fit in it, and otherwise
+            gets words from it until it has MIN_LAST_WORDS
+
+    Returns:
+        list: The chunks, at least one
+    """
+    chunks = []
+    joins = []  # what separated each chunk from the one before it in the text
+    current = ''
+    separator = ''
+    current_join = ''
+    tokens = TOKEN.findall(text or '')
+    for index, token in enumerate(tokens):
+        if token[0] == '\n':
+            separator = '\n' if len(token) == 1 else '\n\n'
+            continue
+        limit = first_size if first_size and not chunks else size
+        joiner = separator or ' '
+        separator = ''
+        # Words longer than a whole chunk are cut
+        while len(token) > limit:
+            if current:
+                chunks.append(current)
+                joins.append(current_join)
+                current = ''
+            chunks.append(token[:limit])
+            joins.append(joiner)
+            joiner = ''
+            token = token[limit:]
+            limit = size
+        candidate = current + joiner + token if current else token
+        if len(candidate) <= limit:
+            if not current:
+                current_join = joiner
+            current = candidate
+            continue
+        # Rather than leave the start of a line (e.g. "2. Wash") at the bottom of a page,
+        # move a short last line over to the next page
+        cut = carry_point(current)
+        tail = current[cut + 1:]
+        if cut > 0 and len(tail) + len(joiner) + len(token) <= size:
+            head = current[:cut].rstrip('\n')
+            chunks.append(head)
+            joins.append(current_join)
+            current_join = current[len(head):cut + 1]
+            current = tail + joiner + token
+        else:
+            # Nor start a page with the last word or two of a line: take a few more along
+            cut = len(current)
+            if joiner == ' ':
+                line_start = current.rfind('\n') + 1
+                words = line_words(tokens, index)
+                while words < MIN_LAST_WORDS:
+                    space = current.rfind(' ', line_start, cut)
+                    if space <= line_start or len(current) - space + len(token) > size:
+                        break
+                    cut = space
+                    words += 1
+            chunks.append(current[:cut])
+            joins.append(current_join)
+            if cut < len(current):
+                current_join = ' '
+                current = current[cut + 1:] + ' ' + token
+            else:
+                current_join = joiner
+                current = token
+    if current or not chunks:
+        chunks.append(current)
+        joins.append(current_join)
+
+    if last_size and len(chunks) > 1:
+        # The page before the last has room to spare once it no longer needs a Next option
+        merged = chunks[-2] + joins[-1] + chunks[-1]
+        if len(merged) <= last_size:
+            chunks[-2:] = [merged]
+            return chunks
+        # Too full to take it all: give a last chunk of a word or two company instead
+        while len(chunks[-1].split()) < MIN_LAST_WORDS:
+            cut = max(chunks[-2].rfind(' '), chunks[-2].rfind('\n'))
+            moved = chunks[-2][cut + 1:] + joins[-1] + chunks[-1]
+            if cut <= 0 or len(moved) > last_size:
+                break
+            head = chunks[-2][:cut].rstrip()
+            joins[-1] = chunks[-2][len(head):cut + 1]
+            chunks[-2] = head
+            chunks[-1] = moved
+    return chunks
+
+
+def paginate(title, content, language, size=None):
+    """
+    Render content as USSD info_detail screens
+
+    Only the first page shows the title and the full way back to the menu;
+    the pages after it carry just a short page counter and back option, so
+    that most of each screen is content.
+
+    Args:
+        title (str): Content title
+        content (str): Text to page
+        language (str): Session language for the navigation options
+        size (int, optional): Screen size; SCREEN_CHARS by default
+
+    Returns:
+        tuple: Finished USSD responses, one per page
+    """
+    size = size or SCREEN_CHARS
+    next_option = catalog.text('info_next', language) + "\n"
+    previous_option = catalog.text('info_previous', language) + "\n"
+
+    def first_room(page_title, navigation):
+        return size - len(catalog.text('info_detail', language, title=page_title, content='',
+                                       navigation=navigation))
+
+    def later_room(navigation):
+        return size - len(catalog.text('info_page', language, counter='99/99', content='',
+                                       navigation=navigation))
+
+    room = first_room(f"{title} (99/99)", next_option)
+    if room < MIN_PAGE_CHARS:
+        keep = max(len(title) - (MIN_PAGE_CHARS - room) - 1, 0)
+        title = title[:keep].rstrip() + '…'
+        room = first_room(f"{title} (99/99)", next_option)
+
+    single_room = first_room(title, '')
+    if len(content or '') <= single_room:
+        return (catalog.respond('info_detail', language, title=title, content=content or '', navigation=''),)
+
+    later = later_room(next_option + previous_option)
+    chunks = split_text(content, later, first_size=room, last_size=later_room(previous_option))
+    if len(chunks) == 1 and len(chunks[0]) > single_room:
+        # The last page was merged into the first, which then has to hold it on its own
+        chunks = split_text(content, later, first_size=room,
+                            last_size=min(single_room, later_room(previous_option)))
+    if len(chunks) == 1:
+        return (catalog.respond('info_detail', language, title=title, content=chunks[0], navigation=''),)
+
+    count = len(chunks)
+    pages = [catalog.respond('info_detail', language, title=f"{title} (1/{count})", content=chunks[0],
+                             navigation=next_option)]
+    for number, chunk in enumerate(chunks[1:], 2):
+        navigation = (next_option if number < count else '') + previous_option
+        pages.append(catalog.respond('info_page', language, counter=f"{number}/{count}", content=chunk,
+                                     navigation=navigation))
+    return tuple(pages)
+
+
+class PageCache:
+    """
+    Paged content by key and language
+
+    Args:
+        max_entries (int): Paged items kept, least recently used dropped first
+    """
+    def __init__(self, max_entries=2000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()  # (key, language) -> tuple of pages
+
+    def put(self, key, language, title, content):
+        """
+        Page content and keep the pages
+
+        Args:
+            key (tuple): Identifies the content, including anything that
+                changes when it does (e.g. a generation time)
+            language (str): Session language
+            title (str): Content title
+            content (str): Text to page
+
+        Returns:
+            tuple: Finished USSD responses
+        """
+        pages = paginate(title, content, language)
+        with self._lock:
+            self._pages[(key, language)] = pages
+            self._pages.move_to_end((key, language))
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+        return pages
+
+    def get(self, key, language, load=None):
+        """
+        Look up paged content
+
+        Args:
+            key (tuple): Key given to put()
+            language (str): Session language
+            load (callable, optional): Returns (title, content), or None if
+                the content is gone, for paging it on a miss
+
+        Returns:
+            tuple: Finished USSD responses, or None
+        """
+        with self._lock:
+            pages = self._pages.get((key, language))
+            if pages is not None:
+                self._pages.move_to_end((key, language))
+                return pages
+        loaded = load() if load else None
+        if loaded is None:
+            return None
+        return self.put(key, language, *loaded)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pages)
+
+
+info_pages = PageCache()
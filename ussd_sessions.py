@@ -0,0 +1,220 @@
+"""
+Session storage for the Tujali USSD service
+
+USSD sessions are kept as JSON documents so the same session state can live
+in process memory during development or in a shared cache in production.
+Anything a state handler puts in a session must therefore be JSON-serializable
+(strings, numbers, lists and dicts - store model IDs, not model objects).
+
+Responses are also remembered for a short while per (sessionId, text), so a
+gateway retry of a hop gets the original answer without re-running handlers.
+
+Unfinished flows are kept per phone number for a configurable window, so a
+caller whose session dropped can continue where they left off on redial.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """In-memory USSD session store holding JSON-serialized sessions"""
+    def __init__(self):
+        self._sessions = {}
+
+    def get(self, session_id):
+        """
+        Load a session
+
+        Args:
+            session_id (str): Gateway session identifier
+
+        Returns:
+            dict: The session, or None if it does not exist
+        """
+        raw = self._sessions.get(session_id)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def save(self, session_id, session):
+        """
+        Store a session, replacing any previous version
+
+        Args:
+            session_id (str): Gateway session identifier
+            session (dict): Session state to persist
+        """
+        self._sessions[session_id] = json.dumps(session)
+
+    def delete(self, session_id):
+        """Remove a session if present"""
+        self._sessions.pop(session_id, None)
+
+    def clear(self):
+        """Remove all sessions"""
+        self._sessions.clear()
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class ResumeStore:
+    """
+    Last unfinished flow per phone number, kept for a limited window
+
+    Args:
+        window (float): Seconds a flow can be resumed after its last hop
+    """
+    def __init__(self, window=300):
+        self.window = window
+        self._lock = threading.Lock()
+        self._flows = OrderedDict()  # phone -> (saved_at, JSON snapshot), oldest first
+
+    def _purge(self, now):
+        while self._flows:
+            saved_at, _ = next(iter(self._flows.values()))
+            if now - saved_at < self.window:
+                break
+            self._flows.popitem(last=False)
+
+    def save(self, phone_number, snapshot):
+        """
+        Remember the flow a caller is in
+
+        Args:
+            phone_number (str): Caller's phone number
+            snapshot (dict): JSON-serializable session state to restore
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._flows.pop(phone_number, None)
+            self._flows[phone_number] = (now, json.dumps(snapshot))
+            self._purge(now)
+
+    def get(self, phone_number):
+        """
+        Get a caller's unfinished flow
+
+        Returns:
+            dict: The snapshot, or None if there is none within the window
+        """
+        with self._lock:
+            self._purge(time.monotonic())
+            entry = self._flows.get(phone_number)
+        if entry is None:
+            return None
+        return json.loads(entry[1])
+
+    def discard(self, phone_number):
+        """Forget a caller's unfinished flow"""
+        with self._lock:
+            self._flows.pop(phone_number, None)
+
+    def clear(self):
+        """Forget all unfinished flows"""
+        with self._lock:
+            self._flows.clear()
+
+    def __len__(self):
+        return len(self._flows)
+
+
+class ResponseCache:
+    """
+    Short-lived cache of USSD responses keyed by (session_id, text)
+
+    The text of a USSD session grows with every hop, so the same key only
+    reappears when the gateway retries a hop. A retry that arrives while the
+    original hop is still being processed waits for that result instead of
+    running the handler a second time.
+
+    Args:
+        ttl (float): Seconds a response is kept
+        max_entries (int): Upper bound on cached responses
+    """
+    def __init__(self, ttl=120, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()  # key -> (expires_at, response), oldest first
+        self._pending = {}  # key -> threading.Event for hops being processed
+
+    def _purge(self, now):
+        while self._responses:
+            key, (expires_at, _) = next(iter(self._responses.items()))
+            if expires_at > now and len(self._responses) <= self.max_entries:
+                break
+            self._responses.popitem(last=False)
+
+    def peek(self, session_id, text):
+        """
+        Get a completed response without waiting
+
+        Returns:
+            str: The cached response, or None
+        """
+        key = (session_id, text)
+        with self._lock:
+            entry = self._responses.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+        return None
+
+    def get_or_compute(self, session_id, text, compute, wait_timeout=10):
+        """
+        Return the response for a hop, computing it at most once
+
+        Args:
+            session_id (str): Gateway session identifier
+            text (str): Full USSD input chain of the hop
+            compute (callable): Produces the response when it is not cached
+            wait_timeout (float): Seconds a retry waits for the original hop
+
+        Returns:
+            tuple: (response, True if it came from the cache)
+        """
+        key = (session_id, text)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                entry = self._responses.get(key)
+                if entry and entry[0] > now:
+                    return entry[1], True
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+
+            # Another thread is processing this hop; wait for its answer
+            if not pending.wait(wait_timeout):
+                logger.warning(f"Timed out waiting for in-flight USSD hop {session_id}")
+                return compute(), False
+
+        try:
+            response = compute()
+            with self._lock:
+                self._responses[key] = (time.monotonic() + self.ttl, response)
+                self._purge(time.monotonic())
+            return response, False
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def clear(self):
+        """Remove all cached responses"""
+        with self._lock:
+            self._responses.clear()
+
+    def __len__(self):
+        return len(self._responses)
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+USSD trace recording and replay for Tujali Telehealth
+
+The recorder writes every /ussd hop to a compact JSON-lines trace (gzipped
+when the file name ends in .gz). Personal data never reaches the trace:
+- phone numbers and session IDs are replaced by keyed hashes
+- only menu selections are kept verbatim. Free-text inputs such as names
+  and symptom descriptions become hash tokens, numbers (ages) become keyed
+  pseudonym numbers and coordinates are rounded to about 10 km, so every
+  input is still valid and the journey stays replayable
+- inputs of unknown kind (not processed by the state machine) are hashed
+- responses are stored as a short hash of the anonymized response
+
+Enable recording by setting USSD_TRACE_FILE before starting the app.
+
+The replay harness feeds a trace straight into ussd_callback (no HTTP) on a
+freshly seeded database, measures per-hop CPU time by state and reports hops
+whose response differs from the trace:
+
+    python ussd_trace.py traces/ussd.jsonl.gz
+    python ussd_trace.py traces/ussd.jsonl.gz --rebase traces/baseline.jsonl.gz
+
+Replayed callers only exist in the database if their registration is part of
+the trace, and date menus depend on the day of the replay. So the most useful
+comparison is against a baseline rebased from the same trace with the
+current code (--rebase), rather than against the recorded production
+responses.
+"""
+
+import argparse
+import contextlib
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import logging
+import re
+import sys
+import threading
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Menu selections are short numbers
+MENU_INPUT = re.compile(r'^\d{1,2}$')
+
+# Decimal places coordinates are rounded to (0.1 degree is about 11 km)
+COORDINATE_DECIMALS = 1
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def response_hash(response):
+    """Short, stable fingerprint of a USSD response"""
+    return hashlib.sha1(response.encode('utf-8')).hexdigest()[:16]
+
+
+class TraceAnonymizer:
+    """
+    Deterministically replace personal data with keyed hash tokens
+
+    Args:
+        salt (str): Secret key for the hashes; the same salt always maps a
+            value to the same token
+    """
+    def __init__(self, salt):
+        self._key = salt.encode('utf-8')
+
+    def token(self, prefix, value, length=12):
+        digest = hmac.new(self._key, value.encode('utf-8'), hashlib.sha256).hexdigest()
+        return prefix + digest[:length]
+
+    def phone(self, phone_number):
+        return self.token('p', phone_number or '')
+
+    def session(self, session_id):
+        return self.token('s', session_id or '')
+
+    def number(self, value):
+        """Keyed pseudonym for a whole number, itself a whole number from 1 to 99"""
+        digest = hmac.new(self._key, value.strip().encode('utf-8'), hashlib.sha256).hexdigest()
+        return str(1 + int(digest[:8], 16) % 99)
+
+    @staticmethod
+    def location(value):
+        """Coordinates rounded to COORDINATE_DECIMALS, or None if value is not 'latitude,longitude'"""
+        parts = value.split(',')
+        if len(parts) != 2:
+            return None
+        try:
+            latitude, longitude = float(parts[0]), float(parts[1])
+        except ValueError:
+            return None
+        return f"{round(latitude, COORDINATE_DECIMALS)},{round(longitude, COORDINATE_DECIMALS)}"
+
+    def segment(self, segment, kind):
+        """
+        Anonymize one input segment
+
+        Args:
+            segment (str): Raw input
+            kind (str): 'menu', 'text', 'number' or 'location' (see
+                ussd_handler.INPUT_KINDS), or None if unknown
+
+        Returns:
+            str: The replacement, or the segment itself for menu selections
+        """
+        if kind in ('menu', 'location') and MENU_INPUT.match(segment):
+            # Menu selections, and '0' to skip entering coordinates
+            return segment
+        if kind == 'number':
+            try:
+                int(segment)
+            except ValueError:
+                pass
+            else:
+                return self.number(segment)
+        if kind == 'location':
+            coarse = self.location(segment)
+            if coarse is not None:
+                return coarse
+        # Free text, and anything that is not valid input for its kind
+        return self.token('t', segment, 10)
+
+    def text(self, text, kinds=None):
+        """
+        Anonymize a '*'-joined USSD input chain
+
+        Args:
+            text (str): Input chain
+            kinds (list, optional): Kind of each segment (see segment())
+
+        Returns:
+            tuple: (anonymized text, {raw segment: replacement} for replaced segments)
+        """
+        kinds = kinds or []
+        replacements = {}
+        segments = []
+        for index, segment in enumerate((text or '').split('*')):
+            if segment == '' and index == 0:
+                segments.append(segment)
+                continue
+            replacement = self.segment(segment, kinds[index] if index < len(kinds) else None)
+            if replacement != segment:
+                replacements.setdefault(segment, replacement)
+            segments.append(replacement)
+        return '*'.join(segments), replacements
+
+    def response(self, response, phone_number, replacements):
+        """Apply the input replacements to a response so it matches a replay"""
+        if phone_number:
+            response = response.replace(phone_number, self.phone(phone_number))
+        # Longest first so a value containing another is replaced whole
+        for raw in sorted(replacements, key=len, reverse=True):
+            if raw.strip().isdigit():
+                # Only whole numbers, not digits of times, dates or other numbers
+                response = re.sub(rf'(?<![\d.:/-]){re.escape(raw.strip())}(?![\d.:/-])', replacements[raw], response)
+            else:
+                response = response.replace(raw, replacements[raw])
+        return response
+
+
+class TraceRecorder:
+    """
+    Append anonymized USSD hops to a trace file
+
+    Args:
+        path (str): Trace file; gzipped if it ends in .gz
+        salt (str): Secret key for the anonymizing hashes
+    """
+    def __init__(self, path, salt):
+        self.path = path
+        self.anonymizer = TraceAnonymizer(salt)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._file = _open(path, 'a')
+        logger.info(f"Recording USSD traces to {path}")
+
+    def record(self, session_id, service_code, phone_number, text, response, input_kinds=None):
+        """
+        Write one hop to the trace
+
+        Args:
+            input_kinds (list, optional): Kind of each input segment, from
+                ussd_handler.input_kinds(); segments of unknown kind are hashed
+        """
+        anonymizer = self.anonymizer
+        anonymized_text, replacements = anonymizer.text(text, input_kinds)
+        entry = {
+            't': int((time.monotonic() - self._started) * 1000),
+            's': anonymizer.session(session_id),
+            'c': service_code,
+            'p': anonymizer.phone(phone_number),
+            'x': anonymized_text,
+            'r': response_hash(anonymizer.response(response, phone_number, replacements))
+        }
+        line = json.dumps(entry, separators=(',', ':'))
+        try:
+            with self._lock:
+                self._file.write(line + '\n')
+                self._file.flush()
+        except Exception as e:
+            # Tracing must never break the USSD endpoint
+            logger.error(f"Failed to record USSD trace: {e}")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def load_trace(path):
+    """
+    Read a trace file
+
+    Returns:
+        list: Trace entries in recorded order
+    """
+    with _open(path, 'r') as trace_file:
+        return [json.loads(line) for line in trace_file if line.strip()]
+
+
+def write_trace(path, entries):
+    """Write trace entries, e.g. a baseline produced by replay()"""
+    with _open(path, 'w') as trace_file:
+        for entry in entries:
+            trace_file.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+
+def reset_state():
+    """Reseed the in-memory database and drop all USSD sessions, cached responses and resumable flows"""
+    from models import init_db
+    from ussd_handler import sessions, responses, resumable
+    from write_behind import write_queue
+    write_queue.flush(include_delayed=True)
+    # init_db prints the seeded accounts
+    with contextlib.redirect_stdout(io.StringIO()):
+        init_db()
+    sessions.clear()
+    responses.clear()
+    resumable.clear()
+
+
+def replay(entries):
+    """
+    Feed trace entries through ussd_callback in order
+
+    Args:
+        entries (list): Entries from load_trace()
+
+    Returns:
+        dict: 'hops' (per-hop state, cpu seconds, response and whether it
+        matched the trace) and 'entries' (the trace rebased on the replayed
+        responses)
+    """
+    from ussd_handler import ussd_callback, sessions
+    from write_behind import write_queue
+
+    hops = []
+    rebased = []
+    for entry in entries:
+        session = sessions.get(entry['s'])
+        if entry['x'] == '' or session is None:
+            state = 'start'
+        else:
+            state = session['state']
+
+        start = time.thread_time()
+        response = ussd_callback(entry['s'], entry.get('c', ''), entry['p'], entry['x'])
+        cpu = time.thread_time() - start
+        # Apply queued side effects before the next hop so replays are deterministic
+        write_queue.flush()
+
+        replayed_hash = response_hash(response)
+        hops.append({
+            'state': state,
+            'cpu': cpu,
+            'text': entry['x'],
+            'response': response,
+            'matched': replayed_hash == entry.get('r')
+        })
+        rebased.append(dict(entry, r=replayed_hash))
+
+    return {'hops': hops, 'entries': rebased}
+
+
+def print_replay_report(hops, repeat, show_diffs=5):
+    """Print per-state CPU time and any response diffs"""
+    from metrics import percentile
+
+    by_state = {}
+    for hop in hops:
+        by_state.setdefault(hop['state'], []).append(hop['cpu'])
+
+    total_cpu = sum(hop['cpu'] for hop in hops)
+    print(f"Replayed {len(hops)} hops ({repeat} pass(es)), "
+          f"CPU {total_cpu * 1000:.1f} ms, {total_cpu / max(len(hops), 1) * 1e6:.1f} us/hop")
+    print(f"{'state':<30}{'hops':>8}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}{'total ms':>10}")
+    for state, values in sorted(by_state.items(), key=lambda item: -sum(item[1])):
+        values = sorted(values)
+        print(f"{state:<30}{len(values):>8}"
+              f"{percentile(values, 50) * 1e6:>10.1f}{percentile(values, 95) * 1e6:>10.1f}"
+              f"{percentile(values, 99) * 1e6:>10.1f}{sum(values) * 1000:>10.2f}")
+
+    diffs = [(i, hop) for i, hop in enumerate(hops) if not hop['matched']]
+    print(f"\nResponse diffs: {len(diffs)} of {len(hops)} hops")
+    for i, hop in diffs[:show_diffs]:
+        print(f"--- hop {i} in {hop['state']} (text={hop['text']!r})")
+        print(hop['response'])
+    return len(diffs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded USSD trace through ussd_callback")
+    parser.add_argument('trace', help="Trace file written by the recorder")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Replay the trace this many times for steadier CPU numbers (default: %(default)s)")
+    parser.add_argument('--rebase', metavar='PATH',
+                        help="Write the trace with the replayed responses, to use as a baseline")
+    parser.add_argument('--show-diffs', type=int, default=5,
+                        help="Number of differing responses to print (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    entries = load_trace(args.trace)
+
+    hops = []
+    result = None
+    for _ in range(args.repeat):
+        reset_state()
+        result = replay(entries)
+        hops.extend(result['hops'])
+
+    diffs = print_replay_report(hops, args.repeat, args.show_diffs)
+
+    if args.rebase and result is not None:
+        write_trace(args.rebase, result['entries'])
+        print(f"Baseline written to {args.rebase}")
+
+    return 1 if diffs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
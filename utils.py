@@ -3,6 +3,7 @@ Utility functions for role-based access control and department management
 """
 
 from functools import wraps
+from datetime import datetime
 from flask import abort, redirect, url_for, request
 from flask_login import current_user
 
@@ -239,4 +240,33 @@ def can_access_route(route_name):
         return False
     
     accessible_routes = get_user_accessible_routes()
-    return route_name in accessible_routes
\ No newline at end of file
+    return route_name in accessible_routes
+
+# Short weekday names used when showing dates on USSD screens
+WEEKDAY_NAMES = {
+    'en': ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'],
+    'sw': ['Jtatu', 'Jnne', 'Jtano', 'Alh', 'Ijm', 'Jmos', 'Jpili'],
+    'fr': ['Lun', 'Mar', 'Mer', 'Jeu', 'Ven', 'Sam', 'Dim'],
+    'om': ['Wix', 'Kib', 'Rob', 'Kam', 'Jim', 'San', 'Dil'],
+    'so': ['Isn', 'Tal', 'Arb', 'Kha', 'Jim', 'Sab', 'Axd'],
+    'am': ['ሰኞ', 'ማክሰ', 'ረቡዕ', 'ሐሙስ', 'ዓርብ', 'ቅዳሜ', 'እሑድ']
+}
+
+def format_date(date_str, language='en'):
+    """
+    Format a '%d-%m-%Y' date string for display on a USSD screen
+    
+    Args:
+        date_str (str): Date in '%d-%m-%Y' format
+        language (str): Language code for the weekday name
+        
+    Returns:
+        str: Date such as 'Tue 21-10-2025', or the input unchanged if it cannot be parsed
+    """
+    try:
+        date = datetime.strptime(date_str, '%d-%m-%Y')
+    except (TypeError, ValueError):
+        return date_str
+    
+    weekdays = WEEKDAY_NAMES.get(language, WEEKDAY_NAMES['en'])
+    return f"{weekdays[date.weekday()]} {date_str}"
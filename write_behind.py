@@ -0,0 +1,328 @@
+"""
+Write-behind queue for non-essential side effects
+
+USSD handlers must answer the gateway quickly, so writes that the caller does
+not need to see on the next screen (provider notifications, interaction logs)
+are enqueued here. Clinical data such as symptom history is not: it is
+written before the caller is answered. A background worker applies the
+queued writes in FIFO batches and retries failures with exponential backoff.
+
+With a journal file configured (WRITE_BEHIND_JOURNAL), every enqueued write
+is appended to the journal before it is acknowledged. Writes still pending
+at shutdown or crash are re-applied by recover() on the next start. The
+database may have been reseeded since, so a task can register a target
+function identifying what its write is for (e.g. the patient's phone
+number); recovered writes whose target is gone or is now something else
+are dropped instead of applied.
+
+Task payloads must be JSON-serializable: pass model IDs, not model objects.
+"""
+
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from models import Patient, Message, UserInteraction
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """
+    Background queue applying registered write tasks in batches
+
+    Args:
+        batch_size (int): Maximum writes applied per batch
+        flush_interval (float): Seconds to wait for a batch to fill up
+        max_retries (int): Retries before a write is moved to dead_letters
+        retry_backoff (float): Initial retry delay in seconds, doubled per attempt
+        journal_path (str, optional): JSON-lines journal for durable writes
+    """
+    def __init__(self, batch_size=50, flush_interval=0.2, max_retries=5, retry_backoff=0.5,
+                 journal_path=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.journal_path = journal_path
+        self.dead_letters = []
+        self.stats = {'enqueued': 0, 'applied': 0, 'retried': 0, 'dead': 0, 'batches': 0}
+
+        self._tasks = {}
+        self._targets = {}
+        self._ready = deque()
+        self._delayed = []  # heap of (due, id, item)
+        self._cond = threading.Condition()
+        self._apply_lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._worker = None
+        self._stopping = False
+        self._journal = open(journal_path, 'a', encoding='utf-8') if journal_path else None
+
+    def task(self, kind, target=None):
+        """
+        Decorator registering func(**payload) as the handler for a write kind
+
+        Args:
+            kind (str): Task name
+            target (callable, optional): target(**payload) returning a JSON
+                value identifying the record the write is for, or None if it
+                does not exist; journaled with the write and checked again
+                before the write is recovered
+        """
+        def register(func):
+            self._tasks[kind] = func
+            if target is not None:
+                self._targets[kind] = target
+            return func
+        return register
+
+    def enqueue(self, kind, **payload):
+        """
+        Queue a write to be applied in the background
+
+        Args:
+            kind (str): Registered task name
+            **payload: JSON-serializable task arguments
+
+        Returns:
+            int: Queue ID of the write
+        """
+        if kind not in self._tasks:
+            raise ValueError(f"Unknown write-behind task: {kind}")
+
+        item = {'id': next(self._ids), 'kind': kind, 'payload': payload, 'attempts': 0}
+        if self._journal:
+            record = {'op': 'enqueue', 'id': item['id'], 'kind': kind, 'payload': payload}
+            if kind in self._targets:
+                record['target'] = self._targets[kind](**payload)
+            self._write_journal([record])
+
+        with self._cond:
+            self._ready.append(item)
+            self.stats['enqueued'] += 1
+            self._cond.notify()
+        self._ensure_worker()
+        return item['id']
+
+    def pending(self):
+        """Number of writes not yet applied (including ones waiting to retry)"""
+        with self._cond:
+            return len(self._ready) + len(self._delayed)
+
+    def flush(self, include_delayed=False):
+        """
+        Apply every ready write in the calling thread
+
+        Args:
+            include_delayed (bool): Also retry writes that are backing off now
+        """
+        if include_delayed:
+            with self._cond:
+                while self._delayed:
+                    _, _, item = heapq.heappop(self._delayed)
+                    self._ready.append(item)
+        while self._apply_batch():
+            pass
+
+    def recover(self):
+        """
+        Re-queue writes the journal shows as never applied
+
+        Call once at startup, after all tasks are registered and the
+        database is loaded. Writes of unknown kinds, and writes whose target
+        (see task()) no longer matches, are dropped.
+
+        Returns:
+            int: Number of recovered writes
+        """
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return 0
+
+        pending = {}
+        with self._journal_lock:
+            with open(self.journal_path, encoding='utf-8') as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn write at crash time
+                    if record['op'] == 'enqueue':
+                        pending[record['id']] = record
+                    else:
+                        pending.pop(record['id'], None)
+
+            for record in list(pending.values()):
+                reason = self._unrecoverable(record)
+                if reason:
+                    logger.warning(f"Dropping journaled write-behind {record['kind']} #{record['id']}: {reason}")
+                    del pending[record['id']]
+
+            # Compact the journal to the writes that are still pending
+            self._journal.close()
+            with open(self.journal_path, 'w', encoding='utf-8') as journal:
+                for record in pending.values():
+                    journal.write(json.dumps(record) + '\n')
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+        highest = max(pending, default=0)
+        self._ids = itertools.count(max(highest + 1, next(self._ids)))
+        with self._cond:
+            for record in pending.values():
+                self._ready.append({'id': record['id'], 'kind': record['kind'],
+                                    'payload': record['payload'], 'attempts': 0})
+            self._cond.notify()
+        if pending:
+            logger.info(f"Recovered {len(pending)} pending write-behind writes")
+            self._ensure_worker()
+        return len(pending)
+
+    def _unrecoverable(self, record):
+        """Why a journaled write must not be re-applied, or None if it can be"""
+        if record['kind'] not in self._tasks:
+            return "unknown task"
+        target = self._targets.get(record['kind'])
+        if target is None:
+            return None
+        try:
+            current = target(**record['payload'])
+        except Exception as e:
+            return f"target check failed: {e}"
+        if current is None:
+            return "its target no longer exists"
+        if current != record.get('target'):
+            return "its target is now a different record"
+        return None
+
+    def close(self):
+        """Stop the worker after applying everything that is ready"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._worker:
+            self._worker.join(timeout=5)
+        self.flush()
+        if self._journal:
+            with self._journal_lock:
+                self._journal.close()
+                self._journal = None
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._cond:
+                if self._stopping or (self._worker is not None and self._worker.is_alive()):
+                    return
+                self._worker = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._worker.start()
+
+    def _write_journal(self, records):
+        if not self._journal:
+            return
+        lines = ''.join(json.dumps(record) + '\n' for record in records)
+        with self._journal_lock:
+            self._journal.write(lines)
+            self._journal.flush()
+
+    def _promote_due(self):
+        """Move retries whose backoff has expired to the ready queue (lock held)"""
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, item = heapq.heappop(self._delayed)
+            self._ready.append(item)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    self._promote_due()
+                    if self._ready:
+                        break
+                    timeout = self._delayed[0][0] - time.monotonic() if self._delayed else None
+                    self._cond.wait(timeout)
+                if self._stopping:
+                    return
+
+                # Give the batch a moment to fill up
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._ready) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            self._apply_batch()
+
+    def _apply_batch(self):
+        """Apply one batch of ready writes; returns the number of writes attempted"""
+        with self._apply_lock:
+            with self._cond:
+                self._promote_due()
+                count = min(self.batch_size, len(self._ready))
+                batch = [self._ready.popleft() for _ in range(count)]
+            if not batch:
+                return 0
+
+            finished = []
+            counts = {'applied': 0, 'retried': 0, 'dead': 0}
+            for item in batch:
+                try:
+                    self._tasks[item['kind']](**item['payload'])
+                    finished.append({'op': 'done', 'id': item['id']})
+                    counts['applied'] += 1
+                except Exception as e:
+                    item['attempts'] += 1
+                    if item['attempts'] > self.max_retries:
+                        logger.error(f"Write-behind {item['kind']} #{item['id']} failed permanently: {e}")
+                        finished.append({'op': 'dead', 'id': item['id'], 'error': str(e)})
+                        with self._cond:
+                            self.dead_letters.append(dict(item, error=str(e)))
+                        counts['dead'] += 1
+                    else:
+                        delay = self.retry_backoff * (2 ** (item['attempts'] - 1))
+                        logger.warning(f"Write-behind {item['kind']} #{item['id']} failed "
+                                       f"(attempt {item['attempts']}), retrying in {delay:.1f}s: {e}")
+                        with self._cond:
+                            heapq.heappush(self._delayed, (time.monotonic() + delay, item['id'], item))
+                        counts['retried'] += 1
+
+            self._write_journal(finished)
+            with self._cond:
+                for name, count in counts.items():
+                    self.stats[name] += count
+                self.stats['batches'] += 1
+            return len(batch)
+
+
+write_queue = WriteBehindQueue(journal_path=os.environ.get('WRITE_BEHIND_JOURNAL'))
+atexit.register(write_queue.close)
+
+
+# ============== TASKS ==============
+
+def patient_target(patient_id, **payload):
+    """Phone number of the patient a write is for, or None if there is no such patient"""
+    patient = Patient.get_by_id(patient_id)
+    return patient.phone_number if patient else None
+
+@write_queue.task('message', target=patient_target)
+def apply_message(provider_id, patient_id, content, sender_type):
+    """Deliver a message between a patient and a provider"""
+    Message.create(
+        provider_id=provider_id,
+        patient_id=patient_id,
+        content=content,
+        sender_type=sender_type
+    )
+
+@write_queue.task('interaction', target=patient_target)
+def apply_interaction(patient_id, interaction_type, description, metadata=None):
+    """Record a step in a patient's journey"""
+    UserInteraction.create(patient_id, interaction_type, description, metadata)